@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Accuracy vs Speed Evaluation - วัดว่าการเปลี่ยน model / backend / imgsz / confidence / sampling_fps
+เสียความแม่นยำเท่าไหร่ แลกกับความเร็วและ memory เท่าไหร่
+
+Dataset (YAML, path ของไฟล์ relative กับ manifest) - ดู eval/dataset.example.yaml:
+
+    frames:                       # ภาพนิ่ง + จำนวนคนที่นับด้วยมือ
+      - {image: frames/a01_1800.jpg, camera_id: LPG-A01-CC-01, count: 14}
+    clips:                        # คลิปสั้น (1 clip = 1 window) + จำนวนคน ณ วินาทีต่างๆ
+      - video: clips/b02_1800.mp4
+        camera_id: LPG-B02-CC-01
+        labels: {0: 10, 15: 12, 30: 11, 45: 13}
+
+ขั้นตอน:
+1. แต่ละ (model, backend, imgsz) รันใน worker subprocess แยก (memory ไม่ปนกัน):
+   decode ภาพ/frame ของคลิปที่ทุก sampling_fps ต้องใช้, สร้าง PeopleDetector ที่ confidence ต่ำสุด,
+   วัด frames/sec, p95 latency และ memory ที่เพิ่มขึ้น
+2. confidence / sampling_fps ไม่ต้อง infer ใหม่: กรอง score ของผลที่ confidence ต่ำสุด
+   (greedy NMS ของ box ที่ score สูงกว่าไม่ขึ้นกับ box ที่ score ต่ำกว่า จึงได้ผลเท่ากับ infer ที่ confidence นั้น)
+   และเลือก frame ตาม timestamp ของ sampling_fps นั้น
+   ยกเว้นเมื่อเปิด tiling (--config): density trigger และ NMS ข้าม tile ขึ้นกับ confidence จึง infer แยกทุก confidence
+3. error ต่อกล้อง: ภาพนิ่ง = count ต่อ frame, คลิป = avg ของ window เทียบ avg ของ label
+   MAE / MAPE ต่อกล้อง แล้วเฉลี่ยทุกกล้อง (กล้องละน้ำหนักเท่ากัน)
+4. ตาราง Pareto: MAE ต่ำ vs จำนวนกล้องที่ 1 process รับได้ (det fps / sampling_fps), ★ = ไม่มีตัวเลือกไหนดีกว่าทั้งสองด้าน
+
+ใช้:
+    python eval/run_eval.py --dataset eval/dataset.yaml --models yolov8n.pt yolov8s.pt \\
+        --backends predict lean --imgsz 480 640 --confidence 0.3 0.4 0.5 --sampling-fps 0.2 0.33 1 \\
+        --output eval.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import itertools
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import yaml
+
+HERE = Path(__file__).resolve().parent
+SRC = HERE.parent / "src"
+
+
+def load_dataset(path: str) -> dict:
+    """อ่าน manifest แล้วแปลง path ให้เป็น absolute"""
+    manifest = Path(path).expanduser().resolve()
+    data = yaml.safe_load(manifest.read_text()) or {}
+    root = manifest.parent
+    frames = [dict(item, image=str(root / item["image"])) for item in data.get("frames") or []]
+    clips = []
+    for item in data.get("clips") or []:
+        labels = {float(t): int(c) for t, c in (item.get("labels") or {}).items()}
+        if not labels:
+            raise ValueError(f"clip {item['video']} has no labels")
+        clips.append(dict(item, video=str(root / item["video"]), labels=labels))
+    if not frames and not clips:
+        raise ValueError(f"{path}: no frames or clips")
+    return {"frames": frames, "clips": clips}
+
+
+def sample_times(duration_s: float, sampling_fps: float) -> List[float]:
+    """timestamp ที่ service จะ sample จาก window ยาว duration_s"""
+    step = 1.0 / sampling_fps
+    return [k * step for k in range(max(1, int(np.ceil(duration_s * sampling_fps - 1e-9))))]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return 0.0
+
+
+def decode_clip(path: str, sampling: Sequence[float]) -> dict:
+    """
+    decode เฉพาะ frame ที่ sampling_fps ใดๆ ในกริดต้องใช้ (grab ข้าม frame อื่นโดยไม่ decode)
+
+    Returns:
+        {"duration_s", "times": {sampling_fps: [frame index]}, "frames": {frame index: BGR}}
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"cannot open clip {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    duration = total / fps
+    times = {s: [min(total - 1, int(round(t * fps))) for t in sample_times(duration, s)] for s in sampling}
+    wanted = sorted({i for idx in times.values() for i in idx})
+
+    frames, position = {}, 0
+    for index in wanted:
+        while position < index and cap.grab():
+            position += 1
+        ok, frame = cap.read()
+        position += 1
+        if ok:
+            frames[index] = frame
+    cap.release()
+    return {"duration_s": duration, "video_fps": fps, "times": times, "frames": frames}
+
+
+def run_worker(args, spec: dict) -> dict:
+    """ใน subprocess: detection ของ 1 (model, backend, imgsz) บนทุก frame ของ dataset"""
+    import cv2
+
+    sys.path.insert(0, str(SRC))
+    from main import ConfigLoader, PeopleDetector
+
+    dataset = load_dataset(args.dataset)
+    images = []
+    for item in dataset["frames"]:
+        image = cv2.imread(item["image"])
+        if image is None:
+            raise RuntimeError(f"cannot read image {item['image']}")
+        images.append(image)
+    clips = [decode_clip(item["video"], args.sampling_fps) for item in dataset["clips"]]
+
+    baseline_mb = rss_mb()
+    tiling = ConfigLoader(args.config).get_tiling_config() if args.config else None
+    detector = PeopleDetector(
+        model_path=spec["model"],
+        device=args.device,
+        confidence=min(args.confidence),
+        imgsz=spec["imgsz"],
+        tiling=tiling,
+        lean=spec["backend"] == "lean",
+    )
+    torch = sys.modules.get("torch")
+    cuda = torch is not None and args.device.startswith("cuda") and torch.cuda.is_available()
+    if cuda:
+        torch.cuda.reset_peak_memory_stats()
+
+    # tiling: จำนวน box ต่อ frame (density trigger) และ NMS ข้าม tile เปลี่ยนตาม confidence
+    # กรอง score ของผลที่ confidence ต่ำสุดจึงไม่เท่ากับ infer ที่ confidence นั้น → infer แยกทุกค่า
+    per_confidence = detector.tiling.enabled
+    confs = sorted(set(args.confidence)) if per_confidence else [min(args.confidence)]
+    jobs = [("frame", i, None, image) for i, image in enumerate(images)]
+    jobs += [("clip", i, index, frame) for i, clip in enumerate(clips) for index, frame in clip["frames"].items()]
+    detector.detect_boxes(jobs[0][3], confs[0], "eval")  # warm-up (shape แรก)
+
+    latencies, scores = [], {}
+    for conf in confs:
+        for kind, item, index, frame in jobs:
+            t0 = time.perf_counter()
+            _, frame_scores = detector.detect_boxes(frame, conf, "eval")
+            latencies.append(time.perf_counter() - t0)
+            # ไม่ปัด: ต้องเทียบกับ threshold ได้ตรง
+            scores.setdefault((kind, item, index), {})[str(conf)] = frame_scores.astype(np.float64).tolist()
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        **spec,
+        "backend_used": "lean" if detector.lean is not None else "predict",
+        "device": args.device,
+        "frames": len(jobs),
+        "per_confidence": per_confidence,
+        "fps": round(len(latencies) / sum(latencies), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 1),
+        "memory_mb": round(torch.cuda.max_memory_allocated() / 1e6 if cuda else max(0.0, peak_mb - baseline_mb), 1),
+        "images": [{"camera_id": item["camera_id"], "truth": int(item["count"]), "scores": scores[("frame", i, None)]}
+                   for i, item in enumerate(dataset["frames"])],
+        "clips": [{
+            "camera_id": item["camera_id"],
+            "labels": item["labels"],
+            "times": {str(s): idx for s, idx in clip["times"].items()},
+            "scores": {str(index): scores[("clip", i, index)] for index in clip["frames"]},
+        } for i, (item, clip) in enumerate(zip(dataset["clips"], clips))],
+    }
+
+
+def frame_count(scores: Dict[str, List[float]], conf: float) -> int:
+    """
+    จำนวนคนของ 1 frame ที่ confidence นี้: ผลที่ infer ที่ confidence นี้เอง (tiling)
+    หรือกรอง score ของผลที่ confidence ต่ำสุด (ไม่ tiling: worker infer ครั้งเดียว)
+    """
+    values = scores.get(str(conf))
+    if values is None:
+        values = scores[min(scores, key=float)]
+    return int(np.count_nonzero(np.asarray(values) > conf))
+
+
+def score_config(result: dict, conf: float, sampling_fps: float) -> dict:
+    """MAE / MAPE ต่อกล้องของ 1 (confidence, sampling_fps) จากผล worker"""
+    errors: Dict[str, List[tuple]] = {}
+    for item in result["images"]:
+        pred = frame_count(item["scores"], conf)
+        errors.setdefault(item["camera_id"], []).append((pred, item["truth"]))
+    for clip in result["clips"]:
+        indices = clip["times"][str(sampling_fps)]
+        counts = [frame_count(clip["scores"][str(i)], conf) for i in indices if str(i) in clip["scores"]]
+        if not counts:
+            continue
+        truth = float(np.mean(list(clip["labels"].values())))
+        errors.setdefault(clip["camera_id"], []).append((float(np.mean(counts)), truth))
+
+    per_camera = {}
+    for camera_id, pairs in sorted(errors.items()):
+        pred, truth = np.array(pairs, dtype=np.float64).T
+        abs_err = np.abs(pred - truth)
+        nonzero = truth > 0
+        per_camera[camera_id] = {
+            "mae": round(float(abs_err.mean()), 3),
+            "mape": round(float((abs_err[nonzero] / truth[nonzero]).mean() * 100), 1) if nonzero.any() else None,
+            "bias": round(float((pred - truth).mean()), 3),
+            "items": len(pairs),
+        }
+    mapes = [c["mape"] for c in per_camera.values() if c["mape"] is not None]
+    return {
+        "model": result["model"],
+        "backend": result["backend_used"],
+        "imgsz": result["imgsz"],
+        "confidence": conf,
+        "per_confidence": result["per_confidence"],
+        "sampling_fps": sampling_fps,
+        "mae": round(float(np.mean([c["mae"] for c in per_camera.values()])), 3) if per_camera else None,
+        "mape": round(float(np.mean(mapes)), 1) if mapes else None,
+        "fps": result["fps"],
+        "p95_ms": result["p95_ms"],
+        "memory_mb": result["memory_mb"],
+        # กล้องที่ 1 process ตามทันได้ (frame/วินาทีที่ infer ได้ ÷ frame/วินาทีที่แต่ละกล้องต้องการ)
+        "cameras_per_process": round(result["fps"] / sampling_fps, 1),
+        "per_camera": per_camera,
+    }
+
+
+def mark_pareto(rows: List[dict]) -> List[dict]:
+    """★ = ไม่มีแถวอื่นที่ MAE ≤ และรับกล้องได้ ≥ โดยดีกว่าอย่างน้อยหนึ่งด้าน"""
+    for row in rows:
+        row["pareto"] = row["mae"] is not None and not any(
+            other is not row and other["mae"] is not None
+            and other["mae"] <= row["mae"] and other["cameras_per_process"] >= row["cameras_per_process"]
+            and (other["mae"] < row["mae"] or other["cameras_per_process"] > row["cameras_per_process"])
+            for other in rows
+        )
+    return rows
+
+
+def print_table(rows: List[dict], only_pareto: bool = False):
+    header = (f"{'':1} {'model':<16} {'backend':<8} {'imgsz':>5} {'conf':>5} {'s.fps':>5} {'MAE':>7} {'MAPE%':>6} "
+              f"{'det fps':>8} {'p95 ms':>7} {'mem MB':>7} {'cams':>6}")
+    print("")
+    print("Accuracy vs speed" + (" (Pareto front)" if only_pareto else ""))
+    print(header)
+    print("-" * len(header))
+    for r in sorted(rows, key=lambda r: (r["mae"] if r["mae"] is not None else float("inf"), -r["cameras_per_process"])):
+        if only_pareto and not r["pareto"]:
+            continue
+        mae = f"{r['mae']:.2f}" if r["mae"] is not None else "-"
+        mape = f"{r['mape']:.1f}" if r["mape"] is not None else "-"
+        print(f"{'★' if r['pareto'] else ' '} {Path(r['model']).name[:16]:<16} {r['backend']:<8} {r['imgsz']:>5} "
+              f"{r['confidence']:>5g} {r['sampling_fps']:>5.2f} {mae:>7} {mape:>6} {r['fps']:>8.1f} "
+              f"{r['p95_ms']:>7.0f} {r['memory_mb']:>7.0f} {r['cameras_per_process']:>6.1f}")
+
+
+def print_cameras(row: dict):
+    print("")
+    print(f"Per camera: {Path(row['model']).name} {row['backend']} imgsz={row['imgsz']} "
+          f"conf={row['confidence']} sampling={row['sampling_fps']}")
+    for camera_id, c in row["per_camera"].items():
+        mape = f"{c['mape']:.1f}%" if c["mape"] is not None else "-"
+        print(f"  {camera_id:<24} MAE {c['mae']:>6.2f}  MAPE {mape:>7}  bias {c['bias']:+.2f}  ({c['items']} items)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Accuracy vs speed evaluation of PeopleDetector settings")
+    parser.add_argument("--dataset", required=True, help="annotation manifest (YAML)")
+    parser.add_argument("--models", nargs="+", default=["yolov8n.pt"])
+    parser.add_argument("--backends", nargs="+", default=["predict"], choices=["predict", "lean"])
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[640])
+    parser.add_argument("--confidence", type=float, nargs="+", default=[0.3, 0.4, 0.5])
+    parser.add_argument("--sampling-fps", type=float, nargs="+", default=[0.2, 0.33, 1.0])
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--config", default=None, help="config.yaml to take tiling settings from")
+    parser.add_argument("--output", default=None, help="write JSON results here")
+    # internal: worker mode
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
+
+    if args.worker is not None:
+        result = run_worker(args, json.loads(args.worker))
+        print("EVAL_RESULT " + json.dumps(result), flush=True)
+        return
+
+    load_dataset(args.dataset)  # ตรวจ manifest ก่อนเริ่ม worker
+    rows, failures = [], []
+    for model, backend, imgsz in itertools.product(args.models, args.backends, args.imgsz):
+        spec = {"model": model, "backend": backend, "imgsz": imgsz}
+        print(f"▶️  {model} {backend} imgsz={imgsz} ...", flush=True)
+        cmd = [sys.executable, __file__, *argv, "--worker", json.dumps(spec)]
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+        line = next((l for l in proc.stdout.splitlines() if l.startswith("EVAL_RESULT ")), None)
+        if line is None:
+            failures.append({**spec, "error": f"worker exited with {proc.returncode}"})
+            continue
+        result = json.loads(line[len("EVAL_RESULT "):])
+        if backend == "lean" and result["backend_used"] != "lean":
+            print(f"⚠️  lean path unavailable for {model}, measured model.predict instead")
+        rows.extend(score_config(result, conf, s) for conf in args.confidence for s in args.sampling_fps)
+
+    mark_pareto(rows)
+    print_table(rows)
+    print_table(rows, only_pareto=True)
+    best = min((r for r in rows if r["mae"] is not None), key=lambda r: r["mae"], default=None)
+    if best:
+        print_cameras(best)
+    for failure in failures:
+        print(f"❌ {failure['model']} {failure['backend']} imgsz={failure['imgsz']}: {failure['error']}")
+    if args.output:
+        Path(args.output).write_text(json.dumps({"rows": rows, "failures": failures}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+go2rtc Stand-in Server สำหรับ Load Test
+
+จำลอง endpoint ของ go2rtc จากไฟล์วิดีโอในเครื่อง เพื่อทดสอบ service กับกล้องจำนวนมาก
+โดยไม่ต้องใช้ NVR จริง:
+
+- GET /api/frame.jpeg?src=...   JPEG ของ frame ปัจจุบัน
+- GET /api/stream.ts?src=...    MPEG-TS แบบ realtime (pace ตาม bitrate, วนซ้ำไม่รู้จบ)
+- GET /api/stream.mp4?src=...   ส่ง MPEG-TS เหมือนกัน (ffmpeg ฝั่ง client probe format จาก content)
+- GET /api/stream.mjpeg?src=... multipart/x-mixed-replace JPEG ตาม fps ใน "#raw=-r N" ของ src
+                                (ไม่ย่อตาม #width - ส่ง JPEG ขนาดเดิมของ clip)
+- HEAD ทุก endpoint             สำหรับ liveness probe
+
+แต่ละ src (= กล้อง) ถูก map ไปที่วิดีโอ 1 ไฟล์แบบคงที่ (hash ของ src)
+
+Fault injection:
+- --latency-ms / --jitter-ms   หน่วงก่อนตอบ (+ jitter ต่อ chunk ของ stream)
+- --stall-prob / --stall-s     โอกาสที่ stream/snapshot จะค้างกลางทาง
+- --black-prob                 โอกาสแทรก black frame / black clip
+- --error-rate                 โอกาสตอบ HTTP 500
+- --dead-fraction              สัดส่วนกล้องที่ "ดับ" ถาวร (ตอบ 500 หลังหน่วง stall_s)
+
+ใช้:
+    python loadtest/go2rtc_standin.py --port 18085 --video market.mp4 --latency-ms 80 --black-prob 0.05
+"""
+import time
+import random
+import hashlib
+import argparse
+import logging
+import tempfile
+import threading
+import urllib.parse
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)-7s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger("go2rtc-standin")
+
+TS_PACKET = 188
+CHUNK_BYTES = TS_PACKET * 348  # ~64 KB, ขนาดเต็ม packet เสมอ
+
+
+@dataclass
+class FaultConfig:
+    """Fault injection settings"""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    stall_prob: float = 0.0
+    stall_s: float = 5.0
+    black_prob: float = 0.0
+    error_rate: float = 0.0
+    dead_fraction: float = 0.0
+    max_stream_s: float = 900.0
+
+
+@dataclass
+class MediaClip:
+    """วิดีโอ 1 ไฟล์ที่เตรียมไว้แล้ว"""
+    name: str
+    ts_bytes: bytes
+    jpeg_frames: List[bytes]   # 1 frame ต่อวินาที
+    duration_s: float
+
+    @property
+    def bytes_per_second(self) -> float:
+        return len(self.ts_bytes) / max(self.duration_s, 0.1)
+
+
+def _encode_ts(frames: List[np.ndarray], fps: float, path: Path) -> bytes:
+    """Encode frames เป็น MPEG-TS (MPEG-4 Part 2) ด้วย OpenCV/FFmpeg"""
+    h, w = frames[0].shape[:2]
+    writer = cv2.VideoWriter(str(path), cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+    if not writer.isOpened():
+        raise RuntimeError(f"cannot open MPEG-TS writer for {path}")
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    return path.read_bytes()
+
+
+def _synthetic_frames(seconds: int, fps: float, width: int, height: int, seed: int) -> List[np.ndarray]:
+    """วิดีโอสังเคราะห์: พื้นหลัง + วัตถุเคลื่อนที่ (ใช้เมื่อไม่มีไฟล์วิดีโอ)"""
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), 90, dtype=np.uint8)
+    background[height // 2:] = 120
+    n = 12
+    pos = rng.uniform([0, height * 0.3], [width, height * 0.9], size=(n, 2))
+    vel = rng.uniform(-3, 3, size=(n, 2))
+    frames = []
+    for _ in range(int(seconds * fps)):
+        frame = background.copy()
+        pos = (pos + vel) % [width, height]
+        for x, y in pos.astype(int):
+            cv2.rectangle(frame, (x, y), (x + 18, y + 48), (40, 40, 160), -1)
+            cv2.circle(frame, (x + 9, y - 8), 8, (80, 120, 200), -1)
+        frames.append(frame)
+    return frames
+
+
+def _read_video(path: str, max_seconds: int, width: int, height: int):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    if fps <= 0 or fps > 60:
+        fps = 25
+    frames = []
+    while len(frames) < max_seconds * fps:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+    cap.release()
+    if not frames:
+        raise RuntimeError(f"no frames in {path}")
+    return frames, fps
+
+
+class MediaLibrary:
+    """
+    เตรียม clip ทั้งหมดครั้งเดียวตอน start (re-encode เป็น TS + JPEG 1 fps)
+    เพื่อให้การเสิร์ฟกล้องหลายร้อยตัวใช้แค่ memcpy
+    """
+
+    def __init__(self, videos: List[str], seconds: int = 30, width: int = 960, height: int = 540,
+                 fps: float = 25, synthetic_clips: int = 3):
+        self.clips: List[MediaClip] = []
+        workdir = Path(tempfile.mkdtemp(prefix="go2rtc-standin-"))
+
+        sources = []
+        for path in videos:
+            frames, src_fps = _read_video(path, seconds, width, height)
+            sources.append((Path(path).name, frames, src_fps))
+        if not sources:
+            for i in range(synthetic_clips):
+                sources.append((f"synthetic-{i}", _synthetic_frames(seconds, fps, width, height, seed=i), fps))
+
+        for name, frames, src_fps in sources:
+            ts = _encode_ts(frames, src_fps, workdir / f"{len(self.clips)}.ts")
+            step = max(1, int(round(src_fps)))
+            jpegs = [cv2.imencode('.jpg', f, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes() for f in frames[::step]]
+            self.clips.append(MediaClip(name=name, ts_bytes=ts, jpeg_frames=jpegs, duration_s=len(frames) / src_fps))
+            logger.info(f"🎞️ Prepared {name}: {len(frames)} frames, {len(ts) / 1e6:.1f} MB TS")
+
+        black = [np.zeros((height, width, 3), dtype=np.uint8)] * int(2 * fps)
+        self.black_ts = _encode_ts(black, fps, workdir / "black.ts")
+        self.black_jpeg = cv2.imencode('.jpg', black[0])[1].tobytes()
+
+    def clip_for(self, src: str) -> MediaClip:
+        digest = int(hashlib.md5(src.encode()).hexdigest(), 16)
+        return self.clips[digest % len(self.clips)]
+
+
+def is_dead(src: str, fraction: float) -> bool:
+    """กล้องที่ดับถาวร - เลือกจาก hash ของ src (คงที่ข้ามการรัน)"""
+    if fraction <= 0:
+        return False
+    digest = int(hashlib.sha1(src.encode()).hexdigest(), 16)
+    return (digest % 10000) < fraction * 10000
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    library: MediaLibrary = None
+    faults: FaultConfig = FaultConfig()
+    started = time.time()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        f = self.faults
+        delay = f.latency_ms + (random.uniform(0, f.jitter_ms) if f.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _parse(self):
+        url = urllib.parse.urlsplit(self.path)
+        src = urllib.parse.parse_qs(url.query).get('src', [''])[0]
+        return url.path, src
+
+    @staticmethod
+    def _source(src: str) -> Tuple[str, float]:
+        """"ffmpeg:<rtsp>#video=mjpeg#raw=-r N" → (<rtsp>, N) ให้ map ไปกล้องเดียวกับ stream.ts"""
+        base, *params = src.split("#")
+        fps = 1.0
+        for param in params:
+            if param.startswith("raw=") and "-r " in param:
+                try:
+                    fps = float(param.split("-r ", 1)[1].split()[0])
+                except (ValueError, IndexError):
+                    pass
+        return base[len("ffmpeg:"):] if base.startswith("ffmpeg:") else base, fps
+
+    def _fail(self, src: str) -> bool:
+        """ตอบ error ถ้ากล้องดับ/สุ่มได้ error (คืน True ถ้าตอบไปแล้ว)"""
+        if is_dead(src, self.faults.dead_fraction):
+            time.sleep(self.faults.stall_s)
+            self._send_status(500)
+            return True
+        if self.faults.error_rate and random.random() < self.faults.error_rate:
+            self._send_status(500)
+            return True
+        return False
+
+    def _send_status(self, status: int, length: int = 0, content_type: str = "text/plain"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+
+    def do_HEAD(self):
+        path, src = self._parse()
+        self._delay()
+        if path not in ("/api/frame.jpeg", "/api/stream.ts", "/api/stream.mp4", "/api/stream.mjpeg"):
+            self._send_status(404)
+        elif is_dead(self._source(src)[0], self.faults.dead_fraction):
+            self._send_status(500)
+        elif path == "/api/stream.mjpeg":
+            self._send_status(200, content_type="multipart/x-mixed-replace; boundary=frame")
+        else:
+            self._send_status(200, content_type="video/mp2t" if "stream" in path else "image/jpeg")
+
+    def do_GET(self):
+        path, src = self._parse()
+        self._delay()
+        if path == "/api/frame.jpeg":
+            self._serve_jpeg(src)
+        elif path in ("/api/stream.ts", "/api/stream.mp4"):
+            self._serve_stream(src)
+        elif path == "/api/stream.mjpeg":
+            self._serve_mjpeg(*self._source(src))
+        elif path == "/api/streams":
+            body = b"{}"
+            self._send_status(200, len(body), "application/json")
+            self.wfile.write(body)
+        else:
+            self._send_status(404)
+
+    def _serve_jpeg(self, src: str):
+        if self._fail(src):
+            return
+        if self.faults.stall_prob and random.random() < self.faults.stall_prob:
+            time.sleep(self.faults.stall_s)
+        clip = self.library.clip_for(src)
+        if self.faults.black_prob and random.random() < self.faults.black_prob:
+            data = self.library.black_jpeg
+        else:
+            second = int(time.time() - self.started) % len(clip.jpeg_frames)
+            data = clip.jpeg_frames[second]
+        self._send_status(200, len(data), "image/jpeg")
+        self.wfile.write(data)
+
+    def _serve_stream(self, src: str):
+        if self._fail(src):
+            return
+        clip = self.library.clip_for(src)
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp2t")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        f = self.faults
+        rate = clip.bytes_per_second
+        sent = 0
+        start = time.monotonic()
+        # เริ่มกลาง clip (ตรง packet boundary) ให้กล้องต่างๆ ไม่ซิงก์กัน
+        offset = (random.randrange(len(clip.ts_bytes)) // TS_PACKET) * TS_PACKET
+        try:
+            while time.monotonic() - start < f.max_stream_s:
+                if f.black_prob and random.random() < f.black_prob / 10:
+                    payload = memoryview(self.library.black_ts)
+                else:
+                    payload = memoryview(clip.ts_bytes)[offset:]
+                    offset = 0
+                for i in range(0, len(payload), CHUNK_BYTES):
+                    chunk = payload[i:i + CHUNK_BYTES]
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+                    if f.stall_prob and random.random() < f.stall_prob / 10:
+                        time.sleep(f.stall_s)
+                    # pace ให้ใกล้ realtime (+ jitter)
+                    ahead = sent / rate - (time.monotonic() - start)
+                    if f.jitter_ms:
+                        ahead += random.uniform(0, f.jitter_ms) / 1000
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _serve_mjpeg(self, src: str, fps: float):
+        """JPEG ทีละ part ตาม fps ที่ขอ (เหมือน go2rtc + ffmpeg -r); ภาพตามเวลาที่ผ่านไปใน clip"""
+        if self._fail(src):
+            return
+        clip = self.library.clip_for(src)
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        f = self.faults
+        period = 1.0 / max(fps, 0.01)
+        offset = random.randrange(len(clip.jpeg_frames))
+        start = time.monotonic()
+        sent = 0
+        try:
+            while time.monotonic() - start < f.max_stream_s:
+                if f.black_prob and random.random() < f.black_prob:
+                    data = self.library.black_jpeg
+                else:
+                    second = (offset + int(time.monotonic() - start)) % len(clip.jpeg_frames)
+                    data = clip.jpeg_frames[second]
+                self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n"
+                                 b"Content-Length: %d\r\n\r\n" % len(data))
+                self.wfile.write(data)
+                self.wfile.write(b"\r\n")
+                sent += 1
+                if f.stall_prob and random.random() < f.stall_prob / 10:
+                    time.sleep(f.stall_s)
+                ahead = sent * period - (time.monotonic() - start)
+                if f.jitter_ms:
+                    ahead += random.uniform(0, f.jitter_ms) / 1000
+                if ahead > 0:
+                    time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_standin(port: int, library: MediaLibrary, faults: FaultConfig, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """เปิด stand-in server ใน background thread"""
+    handler = type("Handler", (StandinHandler,), {"library": library, "faults": faults, "started": time.time()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Local go2rtc stand-in for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18085)
+    parser.add_argument("--video", action="append", default=[], help="local video file (repeatable)")
+    parser.add_argument("--seconds", type=int, default=30, help="seconds of each video to loop")
+    parser.add_argument("--width", type=int, default=960)
+    parser.add_argument("--height", type=int, default=540)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--stall-prob", type=float, default=0.0)
+    parser.add_argument("--stall-s", type=float, default=5.0)
+    parser.add_argument("--black-prob", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--dead-fraction", type=float, default=0.0)
+    return parser
+
+
+def faults_from_args(args) -> FaultConfig:
+    return FaultConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        stall_prob=args.stall_prob,
+        stall_s=args.stall_s,
+        black_prob=args.black_prob,
+        error_rate=args.error_rate,
+        dead_fraction=args.dead_fraction
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    library = MediaLibrary(args.video, seconds=args.seconds, width=args.width, height=args.height)
+    start_standin(args.port, library, faults_from_args(args), host=args.host)
+    logger.info(f"📡 go2rtc stand-in on http://{args.host}:{args.port} ({len(library.clips)} clip(s))")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
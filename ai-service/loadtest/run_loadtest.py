@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Load Test Driver - รัน PeopleCountingService กับกล้องจำลองหลายขนาด
+
+ขั้นตอน:
+1. เปิด go2rtc stand-in (subprocess แยก ไม่ให้ CPU/memory ปนกับ service)
+2. สำหรับแต่ละจำนวนกล้อง (เช่น 10/50/200) รัน worker subprocess ใหม่:
+   - สร้าง config.yaml ชี้ไปที่ stand-in พร้อมกล้อง N ตัว
+   - สร้าง PeopleCountingService, รอ model พร้อม, รัน run_once() หลายรอบ
+   - วัด cycle time, missed windows, CPU, RSS
+3. สรุปเป็นตาราง (และ JSON ถ้าระบุ --output)
+
+ใช้:
+    python loadtest/run_loadtest.py --cameras 10 50 200 --cycles 2 --window-seconds 30
+    python loadtest/run_loadtest.py --cameras 50 --acquisition-mode snapshot --dead-fraction 0.1
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+
+import yaml
+
+HERE = Path(__file__).resolve().parent
+SRC = HERE.parent / "src"
+STANDIN = HERE / "go2rtc_standin.py"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 300) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def build_config(num_cameras: int, standin_url: str, args) -> dict:
+    """config.yaml สำหรับกล้องจำลอง N ตัว (ip/track ต่างกัน → src ต่างกัน)"""
+    cameras = []
+    for i in range(num_cameras):
+        cameras.append({
+            "camera_id": f"LOAD-{i + 1:04d}",
+            "name": f"Simulated camera {i + 1}",
+            "rtsp_ip": f"10.200.{i // 250}.{i % 250 + 1}",
+            "rtsp_port": 554,
+            "rtsp_username": "admin",
+            "rtsp_password": "loadtest",
+            "track_id": str(101 + (i % 8) * 100),
+            "confidence": 0.4,
+            "enabled": True,
+        })
+    return {
+        "service": {
+            "model": args.model,
+            "device": args.device,
+            "confidence": 0.4,
+            "backend_endpoint": "",
+            "background_warmup": False,
+        },
+        "playback": {
+            "enabled": True,
+            "go2rtc_base_url": standin_url,
+            "window_duration_minutes": args.window_seconds / 60,
+            "delay_minutes": 0,
+            "interval_minutes": args.interval_seconds / 60,
+            "sampling_fps": args.sampling_fps,
+            "timeout_seconds": args.timeout_seconds,
+            "verify_ssl": False,
+            "acquisition_mode": args.acquisition_mode,
+            "ingest": args.ingest,
+        },
+        "hikvision": {"enabled": False},
+        "resources": {"enabled": True, "decode_workers": args.decode_workers},
+        "adaptive_sampling": {"enabled": args.adaptive_sampling},
+        "ondemand": {"enabled": False},
+        "cameras": cameras,
+    }
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return 0.0
+
+
+def run_worker(config_path: str, num_cameras: int, cycles: int, interval_s: float) -> dict:
+    """รันใน subprocess: วัด service จริงกับกล้อง N ตัว"""
+    os.environ["CONFIG_PATH"] = config_path
+    os.environ["PORT"] = str(free_port())
+    sys.path.insert(0, str(SRC))
+    from main import PeopleCountingService
+
+    service = PeopleCountingService()
+    service.processor.detector.wait_until_ready()
+
+    decoders = service.processor.decoders  # decode ใน process แยก: นับ CPU / RSS ของ worker ด้วย
+    cycles_out = []
+    for _ in range(cycles):
+        decoder_cpu0 = decoders.cpu_seconds if decoders else 0.0
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        results = service.run_once()
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() - cpu0 + (decoders.cpu_seconds - decoder_cpu0 if decoders else 0.0)
+        cycles_out.append({
+            "cycle_s": round(wall, 2),
+            "windows_ok": len(results),
+            "missed_windows": num_cameras - len(results),
+            "overrun": wall > interval_s,
+            "frames": sum(r.frames_processed for r in results),
+            "cpu_percent": round(100 * cpu / wall, 1) if wall > 0 else 0.0,
+            "rss_mb": round(rss_mb(), 1),
+            "decoder_rss_mb": round(decoders.rss_bytes() / 1e6, 1) if decoders else 0.0,
+        })
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "cameras": num_cameras,
+        "cycles": cycles_out,
+        "avg_cycle_s": round(sum(c["cycle_s"] for c in cycles_out) / len(cycles_out), 2),
+        "max_cycle_s": max(c["cycle_s"] for c in cycles_out),
+        "missed_windows": sum(c["missed_windows"] for c in cycles_out),
+        "overruns": sum(1 for c in cycles_out if c["overrun"]),
+        "avg_cpu_percent": round(sum(c["cpu_percent"] for c in cycles_out) / len(cycles_out), 1),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def print_table(rows: List[dict], interval_s: float):
+    header = f"{'cameras':>8} {'avg cycle':>10} {'max cycle':>10} {'missed':>7} {'overruns':>9} {'CPU %':>7} {'peak RSS':>10}"
+    print("")
+    print(f"Load test summary (interval {interval_s:.0f}s)")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        if "error" in r:
+            print(f"{r['cameras']:>8} {'ERROR: ' + r['error']}")
+            continue
+        print(f"{r['cameras']:>8} {r['avg_cycle_s']:>9.1f}s {r['max_cycle_s']:>9.1f}s {r['missed_windows']:>7} "
+              f"{r['overruns']:>9} {r['avg_cpu_percent']:>7.1f} {r['peak_rss_mb']:>8.0f}MB")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Scale test PeopleCountingService against simulated cameras")
+    parser.add_argument("--cameras", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--cycles", type=int, default=2)
+    parser.add_argument("--window-seconds", type=float, default=30)
+    parser.add_argument("--interval-seconds", type=float, default=120,
+                        help="target cycle interval used to flag overruns")
+    parser.add_argument("--sampling-fps", type=float, default=0.33)
+    parser.add_argument("--timeout-seconds", type=float, default=90)
+    parser.add_argument("--acquisition-mode", default="stream", choices=["stream", "snapshot", "auto"])
+    parser.add_argument("--ingest", default="ts", choices=["ts", "mjpeg"])
+    parser.add_argument("--decode-workers", default="auto")
+    parser.add_argument("--adaptive-sampling", action="store_true",
+                        help="stop each window early once avg/max estimates converge")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", default=None, help="write JSON results here")
+    # stand-in options (ส่งต่อให้ go2rtc_standin.py)
+    parser.add_argument("--video", action="append", default=[])
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--stall-prob", type=float, default=0.0)
+    parser.add_argument("--stall-s", type=float, default=5.0)
+    parser.add_argument("--black-prob", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--dead-fraction", type=float, default=0.0)
+    # internal: worker mode
+    parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-config", default=None, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+
+    if args.worker is not None:
+        result = run_worker(args.worker_config, args.worker, args.cycles, args.interval_seconds)
+        print("LOADTEST_RESULT " + json.dumps(result), flush=True)
+        return
+
+    port = free_port()
+    standin_cmd = [sys.executable, str(STANDIN), "--port", str(port),
+                   "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+                   "--stall-prob", str(args.stall_prob), "--stall-s", str(args.stall_s),
+                   "--black-prob", str(args.black_prob), "--error-rate", str(args.error_rate),
+                   "--dead-fraction", str(args.dead_fraction)]
+    for video in args.video:
+        standin_cmd += ["--video", video]
+    standin = subprocess.Popen(standin_cmd)
+
+    rows = []
+    try:
+        if not wait_for_port(port):
+            raise RuntimeError("go2rtc stand-in did not start")
+
+        workdir = Path(tempfile.mkdtemp(prefix="loadtest-"))
+        for n in args.cameras:
+            config_path = workdir / f"config-{n}.yaml"
+            config_path.write_text(yaml.safe_dump(build_config(n, f"http://127.0.0.1:{port}", args),
+                                                  allow_unicode=True))
+            print(f"▶️  {n} cameras ...", flush=True)
+            cmd = [sys.executable, __file__, "--worker", str(n), "--worker-config", str(config_path),
+                   "--cycles", str(args.cycles), "--interval-seconds", str(args.interval_seconds)]
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+            line = next((l for l in proc.stdout.splitlines() if l.startswith("LOADTEST_RESULT ")), None)
+            if line is None:
+                rows.append({"cameras": n, "error": f"worker exited with {proc.returncode}"})
+            else:
+                rows.append(json.loads(line[len("LOADTEST_RESULT "):]))
+    finally:
+        standin.terminate()
+        standin.wait(timeout=10)
+
+    print_table(rows, args.interval_seconds)
+    if args.output:
+        Path(args.output).write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Crowd Alert Fast Path - แจ้งเตือนความหนาแน่นจาก count ราย frame โดยไม่รอจบ window
+
+เดิม crowd alert (crowd_alerts / earlyWarningService.js) เกิดหลัง window ถูกสรุปแล้ว POST ไป backend
+→ latency = ความยาว window + delay + รอบ ingest ของ backend
+
+ที่นี่ตรวจ threshold ต่อกล้องทุก batch ของ inference:
+- threshold 2 ระดับ (warning / critical) ต่อกล้อง (ค่า default + override รายกล้อง)
+- min_duration_s: count ต้องอยู่เหนือ threshold ต่อเนื่องนานพอ (ตามเวลา frame) ถึงจะ raise
+- hysteresis: clear เมื่อ count ต่ำกว่า threshold x (1 - hysteresis) ต่อเนื่อง clear_duration_s
+  (count ที่แกว่งรอบ threshold ไม่ทำให้แจ้งเตือนซ้ำ)
+- event ถูกส่งทันทีผ่าน channel แยก (thread + HTTP session + queue ของตัวเอง)
+  ไม่ต่อคิวกับผลของ window ใน BackendSender
+"""
+import time
+import queue
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("warning", "critical")
+RAISED = "raised"
+CLEARED = "cleared"
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+CROWD_ALERT_ACTIVE = None
+CROWD_ALERT_EVENTS = None
+CROWD_ALERT_LATENCY = None
+CROWD_ALERT_DROPPED = None
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+    PROMETHEUS_AVAILABLE = True
+    CROWD_ALERT_ACTIVE = Gauge('crowd_alert_active', 'Crowd alert currently raised (1) or not (0)', ['camera_id', 'level'])
+    CROWD_ALERT_EVENTS = Counter('crowd_alert_events_total', 'Crowd alert events pushed to backend', ['camera_id', 'level', 'state', 'outcome'])
+    CROWD_ALERT_LATENCY = Histogram('crowd_alert_latency_seconds', 'Detection → backend acknowledged latency of crowd alerts',
+                                    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30))
+    CROWD_ALERT_DROPPED = Counter('crowd_alert_dropped_total', 'Crowd alert events dropped (queue full / retries exhausted)')
+except ImportError:
+    pass
+
+
+@dataclass
+class CrowdAlertConfig:
+    """Configuration สำหรับ crowd alert fast path"""
+    enabled: bool = False
+    warning: int = 0                  # threshold default ต่อกล้อง (0 = ไม่ตรวจระดับนี้)
+    critical: int = 0
+    cameras: Dict[str, Dict[str, int]] = field(default_factory=dict)  # {camera_id: {warning: N, critical: M}}
+    hysteresis: float = 0.1           # clear เมื่อ count < threshold x (1 - hysteresis)
+    min_duration_s: float = 10.0      # อยู่เหนือ threshold นานเท่านี้ถึง raise
+    clear_duration_s: float = 30.0    # อยู่ต่ำกว่าระดับ clear นานเท่านี้ถึง clear
+    max_gap_s: float = 60.0           # frame ห่างกันเกินนี้ (window ไม่ต่อกัน) = เริ่มนับใหม่
+    endpoint: str = ""                # ว่าง = <backend>/api/ai/crowd-alert
+    timeout_s: float = 5.0
+    retries: int = 3
+    queue_size: int = 256
+
+    def thresholds(self, camera_id: str) -> Dict[str, int]:
+        """threshold ของกล้อง (เฉพาะระดับที่ > 0)"""
+        merged = {"warning": self.warning, "critical": self.critical}
+        merged.update(self.cameras.get(camera_id) or {})
+        return {level: int(merged[level]) for level in LEVELS if merged.get(level)}
+
+
+@dataclass
+class AlertEvent:
+    """event ที่ส่งไป backend (1 ครั้งต่อการ raise / clear)"""
+    camera_id: str
+    level: str
+    state: str                        # raised | cleared
+    people_count: int                 # count ที่ทำให้เปลี่ยนสถานะ
+    peak_count: int                   # count สูงสุดระหว่างช่วงนั้น
+    threshold: int
+    frame_time: datetime              # เวลาของ frame (UTC, naive) ที่ทำให้เปลี่ยนสถานะ
+    since: datetime                   # เวลาที่เริ่มเกิน (raised) / เริ่มต่ำกว่า (cleared)
+    detected_monotonic: float = field(default_factory=time.monotonic)
+
+    def to_payload(self) -> dict:
+        return {
+            "camera_id": self.camera_id,
+            "level": self.level,
+            "state": self.state,
+            "people_count": self.people_count,
+            "peak_count": self.peak_count,
+            "threshold": self.threshold,
+            "frame_time": self.frame_time.isoformat() + "Z",
+            "since": self.since.isoformat() + "Z",
+            "detected_at": datetime.now(timezone.utc).replace(tzinfo=None).isoformat() + "Z",
+        }
+
+
+@dataclass
+class _LevelState:
+    active: bool = False
+    since: Optional[datetime] = None  # เริ่มเกิน threshold (ยังไม่ active) / เริ่มต่ำกว่าระดับ clear (active)
+    peak: int = 0
+
+
+class CrowdAlertMonitor:
+    """
+    state machine ต่อ (กล้อง, ระดับ) ป้อนด้วย count ราย frame ตามลำดับเวลา (thread-safe)
+
+        idle ──count ≥ T นาน min_duration_s──▶ raised ──count < T x (1-h) นาน clear_duration_s──▶ idle
+    """
+
+    def __init__(self, config: CrowdAlertConfig, emit: Callable[[AlertEvent], None]):
+        self.config = config
+        self.emit = emit
+        self._states: Dict[Tuple[str, str], _LevelState] = {}
+        self._last_time: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def observe(self, camera_id: str, samples: Sequence[Tuple[datetime, int]]) -> List[AlertEvent]:
+        """
+        ป้อน (เวลา frame, count) ของกล้อง คืน event ที่เกิด (ถูกส่งผ่าน emit แล้ว)
+
+        sample ที่เก่ากว่าที่เคยเห็น (window ย้อนหลัง / ลำดับสลับ) ถูกข้าม
+        """
+        thresholds = self.config.thresholds(camera_id)
+        if not self.enabled or not thresholds:
+            return []
+
+        events = []
+        with self._lock:
+            for t, count in samples:
+                last = self._last_time.get(camera_id)
+                if last is not None and t <= last:
+                    continue
+                gap = last is not None and (t - last).total_seconds() > self.config.max_gap_s
+                self._last_time[camera_id] = t
+                for level, threshold in thresholds.items():
+                    state = self._states.setdefault((camera_id, level), _LevelState())
+                    event = self._step(camera_id, level, threshold, state, t, count, gap)
+                    if event is not None:
+                        events.append(event)
+
+        for event in events:
+            if PROMETHEUS_AVAILABLE:
+                CROWD_ALERT_ACTIVE.labels(camera_id=event.camera_id, level=event.level).set(
+                    1 if event.state == RAISED else 0)
+            self.emit(event)
+        return events
+
+    def _step(self, camera_id: str, level: str, threshold: int, state: _LevelState,
+              t: datetime, count: int, gap: bool) -> Optional[AlertEvent]:
+        if gap:
+            # ไม่มีข้อมูลช่วงนั้น: ช่วงที่กำลังนับต่อเนื่องไม่นับรวมข้าม gap
+            state.since = None
+        if not state.active:
+            if count < threshold:
+                state.since = None
+                return None
+            if state.since is None:
+                state.since, state.peak = t, count
+            state.peak = max(state.peak, count)
+            if (t - state.since).total_seconds() < self.config.min_duration_s:
+                return None
+            state.active = True
+            since, state.since = state.since, None
+            logger.warning(f"[{camera_id}] 🚨 Crowd {level}: {count} people ≥ {threshold} "
+                           f"for {(t - since).total_seconds():.0f}s")
+            return AlertEvent(camera_id, level, RAISED, count, state.peak, threshold, t, since)
+
+        state.peak = max(state.peak, count)
+        if count >= threshold * (1 - self.config.hysteresis):
+            state.since = None
+            return None
+        if state.since is None:
+            state.since = t
+        if (t - state.since).total_seconds() < self.config.clear_duration_s:
+            return None
+        state.active = False
+        since, state.since = state.since, None
+        peak, state.peak = state.peak, 0
+        logger.info(f"[{camera_id}] ✅ Crowd {level} cleared: {count} people (peak {peak})")
+        return AlertEvent(camera_id, level, CLEARED, count, peak, threshold, t, since)
+
+    def observe_window(self, camera_id: str, start: datetime, offsets: Sequence[float],
+                       counts: Sequence[int]) -> List[AlertEvent]:
+        """
+        ป้อน count ของ frame ใน window ที่เริ่ม start พร้อมเวลาจริงของแต่ละ frame (วินาทีจาก start)
+        - fetch ที่ถูกตัด / snapshot ที่หายไป ไม่ยืดนาฬิกาของ min_duration_s / clear_duration_s
+        """
+        if len(offsets) != len(counts):
+            raise ValueError(f"{len(counts)} counts but {len(offsets)} offsets")
+        return self.observe(camera_id, [(start + timedelta(seconds=t), count) for t, count in zip(offsets, counts)])
+
+    def active(self) -> List[dict]:
+        with self._lock:
+            return [{"camera_id": camera_id, "level": level, "peak_count": state.peak}
+                    for (camera_id, level), state in sorted(self._states.items()) if state.active]
+
+
+class AlertSender:
+    """
+    channel ความสำคัญสูงสำหรับ alert: thread + HTTP session ของตัวเอง
+    (ไม่รอ connection / timeout 30s ของ BackendSender ที่ส่งผล window)
+
+    push() ไม่ block; ส่งไม่ได้ลองใหม่แบบ backoff สั้นๆ ถึง retries ครั้ง
+    """
+
+    def __init__(self, config: CrowdAlertConfig, endpoint: str, api_key: str = ""):
+        self.config = config
+        self.url = config.endpoint or (endpoint.rsplit('/people-count', 1)[0] + '/crowd-alert' if endpoint else "")
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'User-Agent': 'AI-PeopleCount-Service/2.0'
+        })
+        if api_key:
+            self.session.headers['X-API-Key'] = api_key
+        self._queue: "queue.Queue[AlertEvent]" = queue.Queue(maxsize=config.queue_size)
+        self._thread = threading.Thread(target=self._run, name="crowd-alerts", daemon=True)
+        self._thread.start()
+
+    def push(self, event: AlertEvent):
+        if not self.url:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            logger.error(f"[{event.camera_id}] ❌ Crowd alert queue full, dropping {event.level} {event.state}")
+            if PROMETHEUS_AVAILABLE:
+                CROWD_ALERT_DROPPED.inc()
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            try:
+                self._send(event)
+            except Exception as e:
+                logger.error(f"[{event.camera_id}] ❌ Crowd alert sender error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _send(self, event: AlertEvent) -> bool:
+        payload = event.to_payload()
+        delay = 0.5
+        for attempt in range(self.config.retries + 1):
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.config.timeout_s)
+                if response.status_code == 200:
+                    latency = time.monotonic() - event.detected_monotonic
+                    logger.info(f"[{event.camera_id}] 🚨 Crowd alert pushed: {event.level} {event.state} "
+                                f"({event.people_count} people, {latency * 1000:.0f} ms)")
+                    if PROMETHEUS_AVAILABLE:
+                        CROWD_ALERT_LATENCY.observe(latency)
+                        CROWD_ALERT_EVENTS.labels(camera_id=event.camera_id, level=event.level,
+                                                  state=event.state, outcome='sent').inc()
+                    return True
+                if 400 <= response.status_code < 500:
+                    logger.error(f"[{event.camera_id}] ❌ Crowd alert rejected: {response.status_code} - {response.text[:100]}")
+                    break
+                logger.warning(f"[{event.camera_id}] ⚠️ Crowd alert push failed: {response.status_code}")
+            except requests.RequestException as e:
+                logger.warning(f"[{event.camera_id}] ⚠️ Crowd alert push failed: {e}")
+            if attempt < self.config.retries:
+                time.sleep(delay)
+                delay *= 2
+        if PROMETHEUS_AVAILABLE:
+            CROWD_ALERT_EVENTS.labels(camera_id=event.camera_id, level=event.level,
+                                      state=event.state, outcome='failed').inc()
+            CROWD_ALERT_DROPPED.inc()
+        return False
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """รอให้ event ในคิวถูกส่งหมด (ใช้ตอน shutdown / --once)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._queue.unfinished_tasks
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Analytics Stages - metric เพิ่มเติมต่อ window ที่ใช้ decode และ forward pass ร่วมกับการนับคน
+
+- model เป็น COCO อยู่แล้ว: stage ประกาศ class ที่ต้องการ (เช่นรถ) แล้ว forward pass เดียวของ window
+  ขยาย classes ครั้งเดียว (person + union ของทุก stage) ไม่ต้อง decode / infer ซ้ำต่อ metric
+- แต่ละ stage ได้ FrameContext เดียวกันทุก frame: ภาพที่ decode แล้ว, คนที่กล้องนั้นนับ
+  (confidence + ROI แล้ว) และ object class อื่นในพื้นที่ ROI
+- finish() คืน field ที่รวมเข้า payload ของ window; เวลาที่แต่ละ stage ใช้เก็บเป็น metric
+
+เพิ่ม stage ใหม่:
+
+    @register_stage
+    class QueueStage(AnalyticsStage):
+        name = "queue"
+        def start(self, camera_id, window): ...
+        def observe(self, state, frame): ...
+        def finish(self, state): return {"queue_length": ...}
+
+แล้วใส่ชื่อใน analytics.stages ของ config.yaml
+"""
+import time
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+
+from heatmap import foot_points
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+ANALYTICS_STAGE_TIME = None
+ANALYTICS_STAGE_ERRORS = None
+
+try:
+    from prometheus_client import Counter, Histogram
+    PROMETHEUS_AVAILABLE = True
+    ANALYTICS_STAGE_TIME = Histogram('analytics_stage_seconds', 'Time spent in an analytics stage per window', ['stage'])
+    ANALYTICS_STAGE_ERRORS = Counter('analytics_stage_errors_total', 'Analytics stage failures', ['stage'])
+except ImportError:
+    pass
+
+COCO_VEHICLES = {2: "car", 3: "motorcycle", 5: "bus", 7: "truck"}
+
+
+@dataclass
+class AnalyticsConfig:
+    """Configuration สำหรับ analytics stages"""
+    stages: List[str] = field(default_factory=list)  # ชื่อ stage ตามลำดับ เช่น ["vehicles", "occupancy", "dwell"]
+    vehicle_classes: Dict[int, str] = field(default_factory=lambda: dict(COCO_VEHICLES))
+    vehicle_confidence: float = 0.4
+    capacity: Dict[str, int] = field(default_factory=dict)  # camera_id → จำนวนคนที่พื้นที่รับได้
+    default_capacity: int = 0                               # 0 = ไม่คำนวณ occupancy %
+    dwell_match_distance: float = 0.08  # ระยะจุดเท้า (สัดส่วนของภาพ) ที่ถือว่าเป็นคนเดิมใน frame ถัดไป
+    dwell_max_gap_s: float = 10.0       # หายไปนานกว่านี้ถือว่าออกจากพื้นที่แล้ว
+    dwell_min_frames: int = 2           # track สั้นกว่านี้ไม่นับ (detection กระพริบ)
+
+
+@dataclass
+class WindowInfo:
+    """ช่วงเวลาของ window ที่กำลังวิเคราะห์"""
+    start: datetime
+    end: datetime
+    frames: int
+
+    @property
+    def duration_s(self) -> float:
+        return max(0.0, (self.end - self.start).total_seconds())
+
+    @property
+    def frame_interval_s(self) -> float:
+        """ระยะห่างระหว่าง frame (frame กระจายเท่าๆ กันทั้ง window)"""
+        return self.duration_s / self.frames if self.frames else 0.0
+
+
+@dataclass
+class FrameContext:
+    """ผลของ 1 frame ที่ทุก stage ของกล้อง 1 ตัวใช้ร่วมกัน (ห้ามแก้ array)"""
+    index: int
+    t: float                   # วินาทีนับจากต้น window (เวลาจริงของ frame ตาม footage / snapshot)
+    image: np.ndarray          # BGR ที่ decode แล้ว
+    people_xyxy: np.ndarray    # (N, 4) คนที่กล้องนี้นับ
+    people_scores: np.ndarray  # (N,)
+    object_xyxy: np.ndarray    # (M, 4) class อื่นที่ stage ขอ (ใน ROI, confidence ≥ ต่ำสุดของกลุ่ม)
+    object_scores: np.ndarray  # (M,)
+    object_classes: np.ndarray  # (M,) COCO class id
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.image.shape[:2]
+
+
+class AnalyticsStage:
+    """
+    Base class ของ stage: สร้างครั้งเดียวตอน startup, state แยกต่อกล้องต่อ window
+
+    classes = COCO class (นอกจาก person) ที่ต้องการจาก forward pass
+    """
+    name = ""
+    classes: Tuple[int, ...] = ()
+
+    def __init__(self, config: AnalyticsConfig):
+        self.config = config
+
+    def start(self, camera_id: str, window: WindowInfo) -> Any:
+        """state เริ่มต้นของกล้อง 1 ตัวใน 1 window"""
+        return {}
+
+    def observe(self, state: Any, frame: FrameContext):
+        """สะสมผลของ 1 frame"""
+
+    def finish(self, state: Any) -> Dict[str, Any]:
+        """field ที่รวมเข้า payload ของ window"""
+        return {}
+
+
+STAGES: Dict[str, Type[AnalyticsStage]] = {}
+
+
+def register_stage(cls: Type[AnalyticsStage]) -> Type[AnalyticsStage]:
+    """decorator ลงทะเบียน stage ตาม cls.name"""
+    if not cls.name:
+        raise ValueError(f"{cls.__name__} has no name")
+    STAGES[cls.name] = cls
+    return cls
+
+
+@register_stage
+class VehicleStage(AnalyticsStage):
+    """จำนวนรถต่อ frame (รวมและแยกประเภท) → max / avg ของ window"""
+    name = "vehicles"
+
+    def __init__(self, config: AnalyticsConfig):
+        super().__init__(config)
+        self.labels = {int(k): v for k, v in config.vehicle_classes.items()}
+        self.classes = tuple(sorted(self.labels))
+        self._wanted = np.array(self.classes, dtype=np.int64)
+
+    def start(self, camera_id: str, window: WindowInfo) -> Any:
+        return {"totals": [], "by_type": {label: 0 for label in self.labels.values()}}
+
+    def observe(self, state: Any, frame: FrameContext):
+        mask = (frame.object_scores >= self.config.vehicle_confidence) & np.isin(frame.object_classes, self._wanted)
+        classes = frame.object_classes[mask]
+        state["totals"].append(int(len(classes)))
+        for class_id, n in zip(*np.unique(classes, return_counts=True)):
+            label = self.labels[int(class_id)]
+            state["by_type"][label] = max(state["by_type"][label], int(n))
+
+    def finish(self, state: Any) -> Dict[str, Any]:
+        totals = state["totals"]
+        return {
+            "max_vehicles": max(totals) if totals else 0,
+            "avg_vehicles": round(sum(totals) / len(totals), 1) if totals else 0.0,
+            "max_vehicles_by_type": state["by_type"],
+        }
+
+
+@register_stage
+class OccupancyStage(AnalyticsStage):
+    """
+    สัดส่วน frame ที่มีคน และ occupancy % เทียบ capacity ของพื้นที่ (ถ้าตั้งไว้)
+    """
+    name = "occupancy"
+
+    def start(self, camera_id: str, window: WindowInfo) -> Any:
+        capacity = self.config.capacity.get(camera_id, self.config.default_capacity)
+        return {"capacity": int(capacity or 0), "counts": []}
+
+    def observe(self, state: Any, frame: FrameContext):
+        state["counts"].append(int(len(frame.people_scores)))
+
+    def finish(self, state: Any) -> Dict[str, Any]:
+        counts = np.asarray(state["counts"], dtype=np.float64)
+        fields: Dict[str, Any] = {
+            "occupied_ratio": round(float(np.count_nonzero(counts) / len(counts)), 3) if len(counts) else 0.0,
+        }
+        if state["capacity"] > 0 and len(counts):
+            fields["occupancy_avg_pct"] = round(float(counts.mean() / state["capacity"] * 100), 1)
+            fields["occupancy_max_pct"] = round(float(counts.max() / state["capacity"] * 100), 1)
+        return fields
+
+
+@register_stage
+class DwellStage(AnalyticsStage):
+    """
+    เวลาที่คนอยู่ในพื้นที่ (dwell) จากการจับคู่จุดเท้าระหว่าง frame ที่ sample
+
+    greedy nearest-neighbour บนจุดเท้า normalized (ไม่มี appearance model) จึงเป็นค่าประมาณ
+    เหมาะกับ sampling ≥ 1 fps; ยิ่ง frame ห่าง คนเดินผ่านเร็วยิ่งจับคู่ไม่ได้
+    """
+    name = "dwell"
+
+    def start(self, camera_id: str, window: WindowInfo) -> Any:
+        # fallback = frame กระจายทั้ง window ใช้เมื่อเห็น frame เดียว (ไม่มีระยะห่างจริงให้วัด)
+        return {"fallback_interval": window.frame_interval_s, "last_t": None, "gaps": [], "active": [], "done": []}
+
+    def observe(self, state: Any, frame: FrameContext):
+        if state["last_t"] is not None and frame.t > state["last_t"]:
+            state["gaps"].append(frame.t - state["last_t"])
+        state["last_t"] = frame.t
+        h, w = frame.shape
+        points = foot_points(frame.people_xyxy) / np.array([w, h], dtype=np.float32) \
+            if len(frame.people_xyxy) else np.empty((0, 2), dtype=np.float32)
+
+        active = state["active"]
+        matched_tracks, matched_points = set(), set()
+        if active and len(points):
+            last = np.array([track["point"] for track in active], dtype=np.float32)
+            dist = np.linalg.norm(last[:, None, :] - points[None, :, :], axis=2)
+            for flat in np.argsort(dist, axis=None):
+                ti, pi = divmod(int(flat), len(points))
+                if dist[ti, pi] > self.config.dwell_match_distance:
+                    break
+                if ti in matched_tracks or pi in matched_points:
+                    continue
+                matched_tracks.add(ti)
+                matched_points.add(pi)
+                active[ti].update(point=points[pi], last=frame.t, frames=active[ti]["frames"] + 1)
+
+        still_active = []
+        for ti, track in enumerate(active):
+            if ti in matched_tracks or frame.t - track["last"] <= self.config.dwell_max_gap_s:
+                still_active.append(track)
+            else:
+                state["done"].append(track)
+        for pi, point in enumerate(points):
+            if pi not in matched_points:
+                still_active.append({"point": point, "first": frame.t, "last": frame.t, "frames": 1})
+        state["active"] = still_active
+
+    def finish(self, state: Any) -> Dict[str, Any]:
+        tracks = [t for t in state["done"] + state["active"] if t["frames"] >= self.config.dwell_min_frames]
+        # คนที่เห็นใน k frame อยู่ประมาณ k ช่วงของ frame - ช่วงจริงจาก median ของระยะห่าง frame.t
+        # (fetch ที่ถูกตัด / snapshot ที่หายไป ไม่ยืดช่วงเหมือน duration / frames ของ window)
+        interval = float(np.median(state["gaps"])) if state["gaps"] else state["fallback_interval"]
+        dwell = [t["last"] - t["first"] + interval for t in tracks]
+        return {
+            "dwell_tracks": len(dwell),
+            "dwell_avg_s": round(float(np.mean(dwell)), 1) if dwell else 0.0,
+            "dwell_max_s": round(float(np.max(dwell)), 1) if dwell else 0.0,
+        }
+
+
+class WindowAnalytics:
+    """state ของทุก stage ของกล้องทุกตัวใน 1 window + เวลาที่แต่ละ stage ใช้"""
+
+    def __init__(self, stages: Sequence[AnalyticsStage], camera_ids: Sequence[str], window: WindowInfo):
+        self.stages = list(stages)
+        self.window = window
+        self.timings: Dict[str, float] = {stage.name: 0.0 for stage in self.stages}
+        self.failed: Dict[str, str] = {}
+        self.states: Dict[str, List[Any]] = {}
+        for camera_id in camera_ids:
+            self.states[camera_id] = [self._run(stage, stage.start, camera_id, window) for stage in self.stages]
+
+    def _run(self, stage: AnalyticsStage, fn, *args):
+        """เรียก stage จับเวลา; stage ที่ error ถูกข้ามตลอด window นี้ (การนับคนไม่ล้มตาม)"""
+        if stage.name in self.failed:
+            return None
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception as e:
+            self.failed[stage.name] = str(e)
+            logger.warning(f"⚠️ Analytics stage '{stage.name}' failed: {e}")
+            if PROMETHEUS_AVAILABLE:
+                ANALYTICS_STAGE_ERRORS.labels(stage=stage.name).inc()
+            return None
+        finally:
+            self.timings[stage.name] += time.perf_counter() - t0
+
+    def frame_time(self, index: int) -> float:
+        """เวลาโดยประมาณของ frame ที่ index เมื่อไม่รู้เวลาจริง (กระจายเท่าๆ กันทั้ง window)"""
+        return index * self.window.frame_interval_s
+
+    def observe(self, camera_id: str, frame: FrameContext):
+        for stage, state in zip(self.stages, self.states[camera_id]):
+            self._run(stage, stage.observe, state, frame)
+
+    def finish(self, camera_id: str) -> Dict[str, Any]:
+        """field ของทุก stage ที่สำเร็จของกล้องนี้"""
+        fields: Dict[str, Any] = {}
+        for stage, state in zip(self.stages, self.states[camera_id]):
+            result = self._run(stage, stage.finish, state)
+            if result:
+                fields.update(result)
+        return fields
+
+    def timings_ms(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 2) for name, seconds in self.timings.items()}
+
+    def record(self):
+        """ส่งเวลาของแต่ละ stage ใน window นี้เข้า metric (เรียกครั้งเดียวหลัง finish ทุกกล้อง)"""
+        if PROMETHEUS_AVAILABLE:
+            for name, seconds in self.timings.items():
+                ANALYTICS_STAGE_TIME.labels(stage=name).observe(seconds)
+
+
+class AnalyticsPipeline:
+    """ชุด stage ที่เปิดใน config (สร้างครั้งเดียว ใช้ทุก window)"""
+
+    def __init__(self, config: Optional[AnalyticsConfig] = None):
+        self.config = config or AnalyticsConfig()
+        unknown = [name for name in self.config.stages if name not in STAGES]
+        if unknown:
+            raise ValueError(f"unknown analytics stage(s): {', '.join(unknown)} (available: {', '.join(STAGES)})")
+        self.stages = [STAGES[name](self.config) for name in self.config.stages]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.stages)
+
+    @property
+    def classes(self) -> Tuple[int, ...]:
+        """union ของ class ที่ทุก stage ต้องการ (ขยาย classes ของ forward pass ครั้งเดียว)"""
+        return tuple(sorted({int(c) for stage in self.stages for c in stage.classes}))
+
+    def begin(self, camera_ids: Sequence[str], start: datetime, end: datetime, frames: int) -> WindowAnalytics:
+        return WindowAnalytics(self.stages, camera_ids, WindowInfo(start, end, frames))
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Startup Autotuner - เลือก imgsz / batch size / torch threads ที่เร็วที่สุดบนเครื่องจริง
+
+ค่าที่ดีที่สุดต่างกันมากระหว่าง Railway CPU slice กับเครื่อง on-prem จึงวัดบนเครื่องจริง:
+
+1. sweep ทุก combination (threads x imgsz x batch) ด้วย sample frames หรือภาพสังเคราะห์
+2. ตัด combination ที่ latency ต่อ batch หรือ memory เกิน budget
+3. เลือก frames/sec สูงสุด แล้ว cache ผลตาม hardware fingerprint + model (sha1) + sweep config
+4. startup ครั้งถัดไปใช้ค่าจาก cache ทันที (ไม่ sweep ซ้ำ) จนกว่าจะสั่ง re-tune
+
+หมายเหตุ: imgsz เล็กลงเร็วขึ้นแต่แม่นยำลดลง จึง sweep เฉพาะ imgsz ที่ระบุใน config
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import platform
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, List, Optional, Union
+
+import numpy as np
+
+from resources import detect_cpus
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AutotuneConfig:
+    """Configuration สำหรับ autotune"""
+    enabled: bool = False
+    imgsz: List[int] = field(default_factory=lambda: [640])
+    batch_sizes: List[int] = field(default_factory=lambda: [1, 2, 4, 8])
+    threads: Union[str, List[int]] = "auto"     # "auto" = 1, 2, 4, ... จนถึงจำนวน core
+    max_batch_latency_ms: float = 2000.0        # latency ต่อ batch สูงสุด (p95)
+    max_memory_mb: float = 0.0                  # RSS (หรือ CUDA memory) สูงสุด, 0 = ไม่จำกัด
+    iterations: int = 5
+    sample_dir: str = ""                        # โฟลเดอร์ภาพตัวอย่าง (ว่าง = ภาพ asset ของ ultralytics / สังเคราะห์)
+    cache_path: str = "~/.cache/ultralytics/autotune.json"
+    force: bool = False                         # sweep ใหม่แม้มี cache (env AUTOTUNE=force)
+
+
+@dataclass
+class TuneResult:
+    """ผลของ 1 combination"""
+    imgsz: int
+    batch_size: int
+    threads: int
+    fps: float = 0.0
+    latency_ms: float = 0.0
+    memory_mb: float = 0.0
+    within_budget: bool = True
+
+
+def _cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def model_digest(model_file: Path) -> str:
+    """sha1 ของไฟล์ model (weights ต่างกันแต่ชื่อ/ขนาดเท่ากัน → cache คนละ key)"""
+    if not model_file.is_file():
+        return ""
+    digest = hashlib.sha1()
+    with open(model_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hardware_fingerprint(model_path: str, device: str, torch_module=None) -> dict:
+    """ข้อมูลที่ทำให้ผล tune เปลี่ยน: CPU, จำนวน core ที่ใช้ได้, RAM, GPU, torch, model"""
+    model_file = Path(model_path)
+    info = {
+        "machine": platform.machine(),
+        "cpu": _cpu_model(),
+        "cpus": len(detect_cpus()),
+        "memory_gb": round(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1e9, 1)
+        if hasattr(os, "sysconf") else 0,
+        "device": device,
+        "model": model_file.name,
+        "model_path": str(model_file.expanduser().resolve()) if model_file.is_file() else str(model_path),
+        "model_bytes": model_file.stat().st_size if model_file.is_file() else 0,
+        "model_sha1": model_digest(model_file),
+    }
+    if torch_module is not None:
+        info["torch"] = torch_module.__version__
+        if device.startswith("cuda") and torch_module.cuda.is_available():
+            info["gpu"] = torch_module.cuda.get_device_name(0)
+    return info
+
+
+def sweep_signature(config: AutotuneConfig) -> dict:
+    """ค่าใน config ที่กำหนดผล sweep: candidates + budget (แก้ config แล้วต้อง sweep ใหม่)"""
+    return {
+        "imgsz": sorted({int(s) for s in config.imgsz}),
+        "batch_sizes": sorted({int(b) for b in config.batch_sizes}),
+        "threads": thread_candidates(config.threads),
+        "max_batch_latency_ms": float(config.max_batch_latency_ms),
+        "max_memory_mb": float(config.max_memory_mb),
+        "sample_dir": config.sample_dir,
+    }
+
+
+def fingerprint_key(info: dict, sweep: Optional[dict] = None) -> str:
+    payload = dict(info, sweep=sweep) if sweep is not None else info
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def thread_candidates(setting: Union[str, List[int]]) -> List[int]:
+    if setting != "auto":
+        return sorted({int(t) for t in setting})
+    cores = len(detect_cpus())
+    candidates, t = [], 1
+    while t < cores:
+        candidates.append(t)
+        t *= 2
+    candidates.append(cores)
+    return candidates
+
+
+def sample_frames(sample_dir: str, count: int = 8, size=(1280, 720)) -> List[np.ndarray]:
+    """
+    ภาพสำหรับ sweep: sample_dir → ภาพ asset ของ ultralytics (มีคน) → noise สังเคราะห์
+
+    ภาพที่มีคนจริงสำคัญ เพราะ NMS/post-process แปรตามจำนวน box
+    """
+    import cv2
+
+    paths = []
+    if sample_dir:
+        paths = sorted(p for p in Path(sample_dir).expanduser().glob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if not paths:
+        try:
+            from ultralytics.utils import ASSETS
+            paths = sorted(Path(ASSETS).glob("*.jpg"))
+        except Exception:
+            paths = []
+
+    frames = []
+    for path in paths[:count]:
+        image = cv2.imread(str(path))
+        if image is not None:
+            frames.append(image)
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8) for _ in range(2)]
+    while len(frames) < count:
+        frames.append(frames[len(frames) % len(frames)])
+    return frames[:count]
+
+
+def _memory_mb(torch_module, device: str) -> float:
+    if torch_module is not None and device.startswith("cuda") and torch_module.cuda.is_available():
+        return torch_module.cuda.max_memory_allocated() / 1e6
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return 0.0
+
+
+class Autotuner:
+    """
+    sweep + cache
+
+    predict(frames, imgsz) ต้องรัน inference ของ batch นั้นจริง (เหมือนตอนใช้งาน)
+    """
+
+    def __init__(self, config: AutotuneConfig, fingerprint: dict):
+        self.config = config
+        self.fingerprint = fingerprint
+        self.sweep_config = sweep_signature(config)
+        self.key = fingerprint_key(fingerprint, self.sweep_config)
+        self.cache_path = Path(config.cache_path).expanduser()
+
+    def load_cached(self) -> Optional[TuneResult]:
+        try:
+            cache = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            return None
+        entry = cache.get(self.key)
+        if not entry:
+            return None
+        try:
+            result = TuneResult(**entry["result"])
+        except (KeyError, TypeError):
+            return None
+        reason = self.reject_reason(result)
+        if reason:
+            logger.info(f"🔧 Autotune cache {self.key} ignored: {reason}")
+            return None
+        return result
+
+    def reject_reason(self, result: TuneResult) -> Optional[str]:
+        """ผลใน cache ต้องอยู่ใน candidates/budget ปัจจุบัน (กัน cache เก่าหรือแก้ไฟล์มือ)"""
+        c = self.sweep_config
+        if result.imgsz not in c["imgsz"]:
+            return f"imgsz {result.imgsz} not in {c['imgsz']}"
+        if result.batch_size not in c["batch_sizes"]:
+            return f"batch {result.batch_size} not in {c['batch_sizes']}"
+        if result.threads not in c["threads"]:
+            return f"threads {result.threads} not in {c['threads']}"
+        if result.latency_ms > c["max_batch_latency_ms"]:
+            return f"p95 {result.latency_ms:.0f} ms over {c['max_batch_latency_ms']:.0f} ms budget"
+        if c["max_memory_mb"] > 0 and result.memory_mb > c["max_memory_mb"]:
+            return f"{result.memory_mb:.0f} MB over {c['max_memory_mb']:.0f} MB budget"
+        return None
+
+    def save(self, result: TuneResult, trials: List[TuneResult]):
+        try:
+            cache = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            cache = {}
+        cache[self.key] = {
+            "fingerprint": self.fingerprint,
+            "sweep": self.sweep_config,
+            "tuned_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "result": asdict(result),
+            "trials": [asdict(t) for t in trials],
+        }
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(cache, indent=2))
+        tmp.replace(self.cache_path)
+
+    def sweep(self, predict: Callable[[List[np.ndarray], int], object], set_threads: Callable[[int], None],
+              frames: List[np.ndarray], torch_module=None, device: str = "cpu") -> List[TuneResult]:
+        c = self.config
+        trials = []
+        for threads in thread_candidates(c.threads):
+            set_threads(threads)
+            for imgsz in c.imgsz:
+                for batch_size in sorted(c.batch_sizes):
+                    batch = [frames[i % len(frames)] for i in range(batch_size)]
+                    if torch_module is not None and device.startswith("cuda") and torch_module.cuda.is_available():
+                        torch_module.cuda.reset_peak_memory_stats()
+                    predict(batch, imgsz)  # warm-up (shape ใหม่)
+
+                    latencies = []
+                    for _ in range(max(1, c.iterations)):
+                        t0 = time.perf_counter()
+                        predict(batch, imgsz)
+                        latencies.append(time.perf_counter() - t0)
+
+                    p95 = float(np.percentile(latencies, 95)) * 1000
+                    trial = TuneResult(
+                        imgsz=imgsz,
+                        batch_size=batch_size,
+                        threads=threads,
+                        fps=round(batch_size * len(latencies) / sum(latencies), 2),
+                        latency_ms=round(p95, 1),
+                        memory_mb=round(_memory_mb(torch_module, device), 1)
+                    )
+                    trial.within_budget = (p95 <= c.max_batch_latency_ms
+                                           and (c.max_memory_mb <= 0 or trial.memory_mb <= c.max_memory_mb))
+                    trials.append(trial)
+                    logger.info(f"   🔧 threads={threads} imgsz={imgsz} batch={batch_size}: "
+                                f"{trial.fps:.1f} fps, p95 {trial.latency_ms:.0f} ms, {trial.memory_mb:.0f} MB"
+                                f"{'' if trial.within_budget else ' (over budget)'}")
+                    if not trial.within_budget:
+                        break  # batch ใหญ่กว่านี้เกิน budget แน่นอน
+        return trials
+
+    @staticmethod
+    def choose(trials: List[TuneResult]) -> Optional[TuneResult]:
+        """frames/sec สูงสุดใน budget (เท่ากันเลือก imgsz ใหญ่กว่า แล้ว batch เล็กกว่า)"""
+        ok = [t for t in trials if t.within_budget]
+        if not ok:
+            return None
+        return max(ok, key=lambda t: (t.fps, t.imgsz, -t.batch_size))
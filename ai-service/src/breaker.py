@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Camera Circuit Breaker - ไม่ให้กล้องที่ดับกินเวลาทุกรอบ
+
+กล้อง/ช่อง NVR ที่ดับ ทำให้ทุกรอบเสียเวลาถึง timeout_seconds (แล้วเสียซ้ำใน fallback)
+breaker ต่อกล้องมี 3 สถานะ:
+
+- closed    : ปกติ ประมวลผลทุกรอบ; ล้มเหลวติดกัน failure_threshold ครั้ง → open
+- open      : ข้ามกล้องนี้ จนครบ cooldown แล้วตรวจด้วย probe ราคาถูก (snapshot/HEAD)
+              probe ไม่ผ่าน → open ต่อ (cooldown เพิ่มเป็น 2 เท่า สูงสุด max_open_seconds)
+- half_open : probe ผ่าน → ลองประมวลผลจริง 1 window; สำเร็จ → closed, ล้มเหลว → open
+"""
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+CIRCUIT_STATE = None
+CIRCUIT_TRANSITIONS = None
+CIRCUIT_PROBES = None
+
+try:
+    from prometheus_client import Counter, Gauge
+    PROMETHEUS_AVAILABLE = True
+    CIRCUIT_STATE = Gauge('camera_circuit_state', 'Camera circuit breaker state (0=closed, 1=half_open, 2=open)', ['camera_id'])
+    CIRCUIT_TRANSITIONS = Counter('camera_circuit_transitions_total', 'Camera circuit breaker transitions', ['camera_id', 'state'])
+    CIRCUIT_PROBES = Counter('camera_probes_total', 'Liveness probes of open cameras', ['camera_id', 'outcome'])
+except ImportError:
+    pass
+
+T = TypeVar("T")
+
+
+@dataclass
+class BreakerConfig:
+    """Configuration สำหรับ circuit breaker ต่อกล้อง"""
+    enabled: bool = True
+    failure_threshold: int = 2        # ล้มเหลวติดกันกี่ window ถึง open
+    open_seconds: float = 300.0       # cooldown แรกก่อน probe
+    max_open_seconds: float = 1800.0  # cooldown สูงสุด (exponential backoff)
+    probe: str = "snapshot"           # "snapshot" (ดึง 1 ภาพ) | "head" (HTTP HEAD)
+    probe_timeout: float = 5.0
+    probe_workers: int = 8
+    report_status: bool = True        # ส่งสถานะกล้องไป backend (ai_camera_status)
+
+
+@dataclass
+class CameraCircuit:
+    """สถานะ breaker ของกล้อง 1 ตัว"""
+    camera_id: str
+    state: str = CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    cooldown_s: float = 0.0
+    last_error: str = ""
+    last_success_at: Optional[datetime] = None
+    last_count: Optional[int] = None
+
+    def probe_due(self, now: float) -> bool:
+        return self.state == OPEN and now - self.opened_at >= self.cooldown_s
+
+    def to_dict(self) -> dict:
+        return {
+            "camera_id": self.camera_id,
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_s": round(max(0.0, self.opened_at + self.cooldown_s - time.monotonic()), 1)
+            if self.state == OPEN else 0.0,
+            "last_error": self.last_error or None,
+            "last_success_at": self.last_success_at.isoformat().replace("+00:00", "Z")
+            if self.last_success_at else None,
+        }
+
+
+class CameraBreakers:
+    """
+    Registry ของ breaker ทุกกล้อง (thread-safe)
+
+    รอบประมวลผลเรียก admit() ก่อน fetch แล้ว record_success()/record_failure() หลัง analyze
+    """
+
+    def __init__(self, config: BreakerConfig):
+        self.config = config
+        self._circuits: Dict[str, CameraCircuit] = {}
+        self._lock = threading.Lock()
+
+    def circuit(self, camera_id: str) -> CameraCircuit:
+        with self._lock:
+            if camera_id not in self._circuits:
+                self._circuits[camera_id] = CameraCircuit(camera_id=camera_id)
+                self._export(self._circuits[camera_id])
+            return self._circuits[camera_id]
+
+    def is_open(self, camera_id: str) -> bool:
+        return self.circuit(camera_id).state == OPEN
+
+    def admit(self, cameras: List[T], key: Callable[[T], str], probe: Callable[[T, float], bool]) -> List[T]:
+        """
+        คืนกล้องที่ควรประมวลผลรอบนี้
+
+        - closed / half_open → ผ่าน
+        - open ที่ยังไม่ครบ cooldown → ข้าม
+        - open ที่ครบ cooldown → probe พร้อมกัน; ผ่าน → half_open (ลองรอบนี้)
+        """
+        if not self.config.enabled:
+            return list(cameras)
+
+        now = time.monotonic()
+        admitted, due = [], []
+        for camera in cameras:
+            circuit = self.circuit(key(camera))
+            if circuit.state != OPEN:
+                admitted.append(camera)
+            elif circuit.probe_due(now):
+                due.append(camera)
+
+        if due:
+            workers = max(1, min(self.config.probe_workers, len(due)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="probe") as pool:
+                outcomes = list(pool.map(lambda cam: self._probe(cam, key, probe), due))
+            admitted.extend(cam for cam, alive in zip(due, outcomes) if alive)
+
+        skipped = len(cameras) - len(admitted)
+        if skipped:
+            logger.info(f"⛔ Circuit breaker: skipping {skipped} offline camera(s) this cycle")
+        return admitted
+
+    def _probe(self, camera, key, probe) -> bool:
+        camera_id = key(camera)
+        try:
+            alive = bool(probe(camera, self.config.probe_timeout))
+        except Exception as e:
+            logger.debug(f"[{camera_id}] probe error: {e}")
+            alive = False
+        if PROMETHEUS_AVAILABLE:
+            CIRCUIT_PROBES.labels(camera_id=camera_id, outcome='alive' if alive else 'dead').inc()
+
+        with self._lock:
+            circuit = self._circuits[camera_id]
+            if alive:
+                self._transition(circuit, HALF_OPEN)
+                logger.info(f"[{camera_id}] 🟡 Probe OK, trying camera again (half-open)")
+            else:
+                self._open(circuit, circuit.cooldown_s * 2)
+        return alive
+
+    def record_success(self, camera_id: str, count: Optional[int] = None):
+        circuit = self.circuit(camera_id)
+        with self._lock:
+            circuit.failures = 0
+            circuit.last_error = ""
+            circuit.last_success_at = datetime.now(timezone.utc)
+            circuit.last_count = count
+            if circuit.state != CLOSED:
+                logger.info(f"[{camera_id}] 🟢 Camera recovered (circuit closed)")
+                self._transition(circuit, CLOSED)
+
+    def record_failure(self, camera_id: str, error: str = "no frames"):
+        if not self.config.enabled:
+            return
+        circuit = self.circuit(camera_id)
+        with self._lock:
+            circuit.failures += 1
+            circuit.last_error = error
+            if circuit.state == HALF_OPEN:
+                self._open(circuit, circuit.cooldown_s * 2)
+            elif circuit.state == CLOSED and circuit.failures >= self.config.failure_threshold:
+                self._open(circuit, self.config.open_seconds)
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return [c.to_dict() for c in self._circuits.values()]
+
+    def circuits(self) -> List[CameraCircuit]:
+        with self._lock:
+            return list(self._circuits.values())
+
+    def _open(self, circuit: CameraCircuit, cooldown_s: float):
+        circuit.cooldown_s = min(max(cooldown_s, self.config.open_seconds), self.config.max_open_seconds)
+        circuit.opened_at = time.monotonic()
+        if circuit.state != OPEN:
+            logger.warning(f"[{circuit.camera_id}] 🔴 Camera offline ({circuit.last_error}), "
+                           f"circuit open for {circuit.cooldown_s:.0f}s")
+        self._transition(circuit, OPEN)
+
+    def _transition(self, circuit: CameraCircuit, state: str):
+        if circuit.state != state and PROMETHEUS_AVAILABLE:
+            CIRCUIT_TRANSITIONS.labels(camera_id=circuit.camera_id, state=state).inc()
+        circuit.state = state
+        self._export(circuit)
+
+    @staticmethod
+    def _export(circuit: CameraCircuit):
+        if PROMETHEUS_AVAILABLE:
+            CIRCUIT_STATE.labels(camera_id=circuit.camera_id).set(STATE_VALUES[circuit.state])
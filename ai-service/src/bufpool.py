@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Buffer Pool - NumPy buffer ที่จองไว้ใช้ซ้ำสำหรับ frame ที่ decode และ input ของ model
+
+service รัน 24/7 และทุก window จองก้อนใหม่หลาย MB ต่อ frame (decode, copy, letterbox)
+แล้วทิ้งเมื่อจบ window → allocator churn, page fault ทุกครั้งที่แตะ page ใหม่ และ RSS โตจาก fragmentation
+ที่นี่ buffer แยกตาม (shape, dtype) = ความละเอียดของกล้อง / shape ของ input tensor:
+
+- lease(shape, dtype): ยืมแบบมีขอบเขต (with pool.lease(...) as buf: ...) คืนอัตโนมัติ
+- acquire(shape, dtype) / release(arrays): สำหรับ frame ที่ส่งต่อข้าม thread เป็น ndarray ธรรมดา
+  (เช่นคืนทั้ง window เมื่อ FrameLease ของ memory budget ถูกคืน)
+- release() รับเฉพาะ array ที่ pool นี้สร้าง (ตามด้วย weakref) array อื่น / คืนซ้ำถูกข้าม
+- buffer ว่างรวมไม่เกิน max_free_mb (เกิน = ปล่อยให้ GC) และ hit / miss นับต่อ pool
+- pickle ได้ (ส่งให้ decoder process): ได้ pool ว่างของ process นั้นตาม config เดิม
+"""
+import logging
+import threading
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+BUFFER_POOL_REQUESTS = None
+BUFFER_POOL_FREE_BYTES = None
+
+try:
+    from prometheus_client import Counter, Gauge
+    PROMETHEUS_AVAILABLE = True
+    BUFFER_POOL_REQUESTS = Counter('buffer_pool_requests_total', 'Buffer requests served from the pool or allocated',
+                                   ['pool', 'outcome'])
+    BUFFER_POOL_FREE_BYTES = Gauge('buffer_pool_free_bytes', 'Bytes of idle buffers kept for reuse', ['pool'])
+except ImportError:
+    pass
+
+Key = Tuple[Tuple[int, ...], str]
+
+
+@dataclass
+class BufferPoolConfig:
+    """Configuration สำหรับ buffer pool ของ frame / model input"""
+    enabled: bool = True
+    max_free_mb: float = 256.0  # byte รวมของ buffer ว่างที่เก็บไว้ต่อ pool (ต่อ process)
+
+
+class BufferLease:
+    """buffer ที่ยืมจาก pool; ใช้เป็น context manager เพื่อคืนเมื่อจบ"""
+
+    __slots__ = ("pool", "array")
+
+    def __init__(self, pool: "BufferPool", array: np.ndarray):
+        self.pool = pool
+        self.array = array
+
+    def release(self):
+        if self.array is not None:
+            self.pool.release([self.array])
+            self.array = None
+
+    def __enter__(self) -> np.ndarray:
+        return self.array
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class BufferPool:
+    """free list ของ ndarray ต่อ (shape, dtype) (thread-safe)"""
+
+    def __init__(self, name: str, config: Optional[BufferPoolConfig] = None):
+        self.name = name
+        self.config = config or BufferPoolConfig()
+        self.max_free_bytes = int(self.config.max_free_mb * 1e6)
+        self._lock = threading.Lock()
+        self._free: Dict[Key, List[np.ndarray]] = defaultdict(list)
+        self._free_ids: set = set()
+        self._owned: Dict[int, weakref.ref] = {}
+        self.free_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0
+
+    def __reduce__(self):
+        return BufferPool, (self.name, self.config)
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def acquire(self, shape: Sequence[int], dtype: Any = np.uint8) -> np.ndarray:
+        """buffer ขนาด shape (เนื้อหาเดิมค้างอยู่ ผู้ยืมต้องเขียนทับเอง) คืนด้วย release()"""
+        shape, dtype = tuple(int(n) for n in shape), np.dtype(dtype)
+        if not self.config.enabled:
+            return np.empty(shape, dtype=dtype)
+        with self._lock:
+            free = self._free.get((shape, dtype.str))
+            if free:
+                array = free.pop()
+                self._free_ids.discard(id(array))
+                self.free_bytes -= array.nbytes
+                self.hits += 1
+                hit = True
+            else:
+                self.misses += 1
+                hit = False
+        if PROMETHEUS_AVAILABLE:
+            BUFFER_POOL_REQUESTS.labels(pool=self.name, outcome="hit" if hit else "miss").inc()
+        if hit:
+            return array
+        array = np.empty(shape, dtype=dtype)
+        key = id(array)
+        self._owned[key] = weakref.ref(array, lambda _, key=key: self._owned.pop(key, None))
+        return array
+
+    def lease(self, shape: Sequence[int], dtype: Any = np.uint8) -> BufferLease:
+        return BufferLease(self, self.acquire(shape, dtype))
+
+    def owns(self, array: np.ndarray) -> bool:
+        ref = self._owned.get(id(array))
+        return ref is not None and ref() is array
+
+    def release(self, arrays: Iterable[np.ndarray]):
+        """คืน buffer (ผู้คืนต้องไม่ใช้ array นั้นต่อ) - array ที่ไม่ใช่ของ pool นี้ถูกข้าม"""
+        if not self.config.enabled:
+            return
+        dropped = 0
+        with self._lock:
+            for array in arrays:
+                if id(array) in self._free_ids or not self.owns(array):
+                    continue
+                if self.free_bytes + array.nbytes > self.max_free_bytes:
+                    dropped += 1
+                    continue
+                self._free[(array.shape, array.dtype.str)].append(array)
+                self._free_ids.add(id(array))
+                self.free_bytes += array.nbytes
+            self.dropped += dropped
+            free_bytes = self.free_bytes
+        if PROMETHEUS_AVAILABLE:
+            if dropped:
+                BUFFER_POOL_REQUESTS.labels(pool=self.name, outcome="dropped").inc(dropped)
+            BUFFER_POOL_FREE_BYTES.labels(pool=self.name).set(free_bytes)
+
+    def clear(self):
+        """ทิ้ง buffer ว่างทั้งหมด (เช่นกล้องเปลี่ยนความละเอียด / ลด RSS)"""
+        with self._lock:
+            self._free.clear()
+            self._free_ids.clear()
+            self.free_bytes = 0
+        if PROMETHEUS_AVAILABLE:
+            BUFFER_POOL_FREE_BYTES.labels(pool=self.name).set(0)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "enabled": self.config.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 3) if requests else None,
+                "dropped": self.dropped,
+                "free_buffers": sum(len(free) for free in self._free.values()),
+                "free_mb": round(self.free_bytes / 1e6, 1),
+                "max_free_mb": self.config.max_free_mb,
+                "shapes": sorted(f"{'x'.join(map(str, shape))}:{np.dtype(dtype).name}"
+                                 for (shape, dtype), free in self._free.items() if free),
+            }
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Decoder Workers - decode stream ใน process แยกที่มี watchdog คุม
+
+ปัญหาของการ decode ใน thread ของ service:
+- fetch_frames_via_snapshots เช็ค timeout_seconds หลัง cap.read() คืนค่าเท่านั้น
+  read ที่ค้างใน FFmpeg จึงค้างได้นานกว่านั้นมาก (และ kill thread ไม่ได้)
+- handle ของ OpenCV/FFmpeg ที่เปิดปิดนานๆ memory รั่วสะสมใน process หลัก
+
+แนวทาง:
+- แต่ละ decode worker เป็น process (spawn) ที่สร้าง PlaybackFetcher ของตัวเอง
+- worker เขียน heartbeat (CLOCK_MONOTONIC ใช้ร่วมกันข้าม process) ทุก read
+  ผู้ส่งงานเป็น watchdog: ไม่มี heartbeat เกิน read_deadline_s หรือเกินเวลารวม → kill + spawn ใหม่
+  แล้วลอง window เดิมอีกครั้งกับ worker ใหม่ (retries)
+- recycle worker หลังครบ max_windows หรือ RSS เกิน max_rss_mb ระหว่าง window เท่านั้น
+  (ตัวแทนถูก spawn ทันที งานที่รันอยู่ไม่ถูกตัด → ไม่มี window หาย)
+- frame กลับมาทาง pipe ทีละภาพทันทีที่เก็บ เป็น raw buffer (send_bytes / recv_bytes_into
+  ลง buffer ของ frame pool) ไม่ pickle; ผู้ส่งงานสั่ง ("cancel",) ให้หยุดดึง window นั้นได้ (adaptive sampling)
+"""
+import os
+import time
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+from collections import Counter as CountMap
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bufpool import BufferPool
+from resources import pin_current_thread
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+DECODER_RESTARTS = None
+DECODER_WORKERS_ALIVE = None
+DECODER_WORKER_RSS = None
+
+try:
+    from prometheus_client import Counter, Gauge
+    PROMETHEUS_AVAILABLE = True
+    DECODER_RESTARTS = Counter('decoder_worker_restarts_total', 'Decoder worker processes replaced', ['reason'])
+    DECODER_WORKERS_ALIVE = Gauge('decoder_workers_alive', 'Running decoder worker processes')
+    DECODER_WORKER_RSS = Gauge('decoder_worker_rss_bytes', 'RSS of a decoder worker after its last window', ['slot'])
+except ImportError:
+    pass
+
+# เหตุผลที่ worker ถูกแทนที่
+HANG = "hang"            # ไม่มี heartbeat เกิน read_deadline_s
+DEADLINE = "deadline"    # window เดียวนานเกิน timeout_seconds + read_deadline_s
+CRASH = "crash"          # process ตาย / pipe ขาด
+RECYCLE_WINDOWS = "recycle_windows"
+RECYCLE_RSS = "recycle_rss"
+
+POLL_INTERVAL_S = 0.25
+
+
+@dataclass
+class DecoderWorkerConfig:
+    """Configuration สำหรับ decode worker processes"""
+    enabled: bool = True
+    read_deadline_s: float = 30.0   # ไม่มี read สำเร็จนานเท่านี้ = ค้าง (รวมเวลาเปิด stream)
+    max_windows: int = 50           # recycle หลังประมวลผลครบจำนวน window นี้ (0 = ไม่จำกัด)
+    max_rss_mb: float = 1024.0      # recycle เมื่อ RSS หลังจบ window เกินนี้ (0 = ไม่จำกัด)
+    retries: int = 1                # ลอง window เดิมซ้ำกับ worker ใหม่หลังค้าง/ตาย
+
+
+class WorkerLost(Exception):
+    """worker ค้างหรือตายระหว่าง window (reason = HANG / DEADLINE / CRASH)"""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+        self.detail = detail
+
+
+def process_rss_bytes(pid: int) -> int:
+    """RSS ของ process จาก /proc (0 ถ้าอ่านไม่ได้)"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _worker_main(conn, heartbeat, factory: Callable[[], Any], cpus: List[int]):
+    """
+    loop ของ worker process: รับ ("fetch", args, kwargs) → fetcher.fetch_frames(*args, **kwargs)
+    ส่ง ("frame", shape, dtype) + raw bytes ทุก frame ที่เก็บ แล้วจบด้วย ("done", cpu_s)
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # service หลักเป็นคนสั่งหยุด
+    pin_current_thread(cpus)
+    fetcher = factory()
+
+    def beat():
+        heartbeat.value = time.monotonic()
+
+    def send_frame(frame: np.ndarray) -> bool:
+        frame = np.ascontiguousarray(frame)
+        conn.send(("frame", frame.shape, frame.dtype.str))
+        conn.send_bytes(memoryview(frame).cast("B"))
+        while conn.poll():
+            if conn.recv()[0] == "cancel":
+                return False
+        return True
+
+    fetcher.progress = beat
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message[0] == "cancel":  # มาถึงหลัง window นั้นจบแล้ว
+            continue
+        if message[0] != "fetch":
+            return
+        beat()
+        cpu_start = time.process_time()
+        try:
+            frames = fetcher.fetch_frames(*message[1], on_frame=send_frame, **message[2])
+        except Exception as e:
+            conn.send(("error", str(e), time.process_time() - cpu_start))
+            continue
+        fetcher.release_frames(frames)  # ส่งแล้ว: buffer ใช้ซ้ำกับ window ถัดไปของ process นี้
+        conn.send(("done", time.process_time() - cpu_start))
+
+
+class DecoderWorker:
+    """process 1 ตัว + ปลาย pipe ฝั่ง service + heartbeat"""
+
+    def __init__(self, context, slot: int, factory: Callable[[], Any], cpus: List[int]):
+        self.slot = slot
+        self.windows = 0
+        self.started = time.monotonic()
+        self.heartbeat = context.Value('d', time.monotonic(), lock=False)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, self.heartbeat, factory, cpus),
+                                       name=f"decoder-{slot}", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid
+
+    def rss_bytes(self) -> int:
+        return process_rss_bytes(self.process.pid) if self.process.pid else 0
+
+    def _wait(self, started: float, read_deadline_s: float, hard_limit_s: float):
+        """รอข้อความถัดไปจาก worker ระหว่างเฝ้า heartbeat"""
+        while not self.conn.poll(POLL_INTERVAL_S):
+            now = time.monotonic()
+            if not self.process.is_alive():
+                raise WorkerLost(CRASH, f"exit code {self.process.exitcode}")
+            if now - self.heartbeat.value > read_deadline_s:
+                raise WorkerLost(HANG, f"no read for {now - self.heartbeat.value:.0f}s")
+            if now - started > hard_limit_s:
+                raise WorkerLost(DEADLINE, f"window running for {now - started:.0f}s")
+
+    def fetch(self, args: tuple, kwargs: Dict[str, Any], read_deadline_s: float, hard_limit_s: float,
+              on_frame: Callable[[np.ndarray], bool], allocate: Callable[..., np.ndarray] = np.empty) -> float:
+        """
+        ส่งงาน 1 window แล้วเฝ้า heartbeat ระหว่างรับ frame (raise WorkerLost ถ้าค้าง/ตาย)
+        on_frame(frame) คืน False → สั่ง worker หยุดดึง; allocate(shape, dtype) = array ที่รับ frame
+        คืน CPU seconds ที่ worker ใช้
+        """
+        started = time.monotonic()
+        self.heartbeat.value = started
+        cancelled = False
+        try:
+            self.conn.send(("fetch", args, kwargs))
+            while True:
+                self._wait(started, read_deadline_s, hard_limit_s)
+                message = self.conn.recv()
+                if message[0] == "frame":
+                    frame = allocate(message[1], np.dtype(message[2]))
+                    self.conn.recv_bytes_into(memoryview(frame).cast("B"))
+                    if not on_frame(frame) and not cancelled:
+                        cancelled = True
+                        self.conn.send(("cancel",))
+                    continue
+                self.windows += 1
+                if message[0] == "error":
+                    logger.error(f"❌ Decoder worker {self.slot} fetch error: {message[1]}")
+                    return message[2]
+                return message[1]
+        except (EOFError, OSError, BrokenPipeError) as e:
+            raise WorkerLost(CRASH, str(e) or type(e).__name__)
+
+    def stop(self, timeout: float = 5.0):
+        """ขอให้หยุดหลังงานปัจจุบัน (ถ้าไม่หยุดใน timeout → kill)"""
+        try:
+            self.conn.send(("stop",))
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(5)
+
+
+class DecoderPool:
+    """
+    decode worker processes จำนวนคงที่ ใช้จาก decode threads ของ service
+
+        pool = DecoderPool(config, partial(PlaybackFetcher, playback, hikvision), workers=4,
+                           timeout_s=playback.timeout_seconds)
+        frames, cpu_s = pool.fetch(camera.camera_id, (camera, start, end, use_playback))
+    """
+
+    def __init__(self, config: DecoderWorkerConfig, factory: Callable[[], Any], workers: int,
+                 timeout_s: float, cpus: Optional[List[int]] = None, buffers: Optional[BufferPool] = None):
+        self.config = config
+        self.factory = factory
+        self.buffers = buffers
+        self.size = max(1, int(workers))
+        self.hard_limit_s = timeout_s + config.read_deadline_s
+        self.cpus = list(cpus or [])
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[DecoderWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers: Dict[int, DecoderWorker] = {}
+        self.restarts: CountMap = CountMap()
+        self.last_restart: Optional[Dict[str, Any]] = None
+        self.windows = 0
+        self.cpu_seconds = 0.0
+        self.closed = False
+        for slot in range(self.size):
+            self._idle.put(self._spawn(slot))
+
+    def _spawn(self, slot: int) -> DecoderWorker:
+        worker = DecoderWorker(self._context, slot, self.factory, self.cpus)
+        with self._lock:
+            self._workers[slot] = worker
+        if PROMETHEUS_AVAILABLE:
+            DECODER_WORKERS_ALIVE.set(len(self._workers))
+        return worker
+
+    def _replace(self, worker: DecoderWorker, reason: str, detail: str = "") -> DecoderWorker:
+        """spawn ตัวแทนก่อน แล้วค่อยหยุดตัวเดิม (recycle: รอจบเอง, ค้าง/ตาย: kill)"""
+        replacement = self._spawn(worker.slot)
+        if reason in (RECYCLE_WINDOWS, RECYCLE_RSS):
+            threading.Thread(target=worker.stop, name=f"decoder-{worker.slot}-stop", daemon=True).start()
+        else:
+            worker.kill()
+        with self._lock:
+            self.restarts[reason] += 1
+            self.last_restart = {"slot": worker.slot, "pid": worker.pid, "reason": reason, "detail": detail,
+                                 "windows": worker.windows, "at": time.time()}
+        if PROMETHEUS_AVAILABLE:
+            DECODER_RESTARTS.labels(reason=reason).inc()
+        return replacement
+
+    def _release(self, worker: DecoderWorker):
+        """คืน worker เข้า pool (recycle ถ้าครบ max_windows / RSS เกิน)"""
+        rss = worker.rss_bytes()
+        if PROMETHEUS_AVAILABLE:
+            DECODER_WORKER_RSS.labels(slot=str(worker.slot)).set(rss)
+        if self.config.max_windows and worker.windows >= self.config.max_windows:
+            logger.info(f"♻️ Recycling decoder worker {worker.slot} (pid {worker.pid}) after {worker.windows} windows")
+            worker = self._replace(worker, RECYCLE_WINDOWS, f"{worker.windows} windows")
+        elif self.config.max_rss_mb and rss > self.config.max_rss_mb * 1e6:
+            logger.info(f"♻️ Recycling decoder worker {worker.slot} (pid {worker.pid}) at RSS {rss / 1e6:.0f} MB")
+            worker = self._replace(worker, RECYCLE_RSS, f"{rss / 1e6:.0f} MB")
+        self._idle.put(worker)
+
+    def fetch(self, label: str, args: tuple, kwargs: Optional[Dict[str, Any]] = None,
+              on_frame: Optional[Callable[[np.ndarray], bool]] = None) -> Tuple[List[np.ndarray], float]:
+        """
+        ดึง frames ของ 1 window ใน worker ที่ว่าง (รอถ้าทุกตัวไม่ว่าง)
+
+        on_frame ได้ frame ทันทีที่มาถึง (คืน False = หยุดดึง) ถ้า worker ตายหลังส่ง frame ไปแล้ว
+        จะไม่ลองซ้ำ (on_frame จะได้ frame ซ้ำ) คืนเท่าที่ได้แทน
+
+        Returns:
+            (frames, CPU seconds ที่ worker ใช้) - ค้าง/ตายเกิน retries → ([], 0)
+        """
+        frames: List[np.ndarray] = []
+
+        def receive(frame: np.ndarray) -> bool:
+            frames.append(frame)
+            return on_frame is None or on_frame(frame)
+
+        for attempt in range(self.config.retries + 1):
+            worker = self._idle.get()
+            try:
+                used = worker.fetch(args, kwargs or {}, self.config.read_deadline_s, self.hard_limit_s, receive,
+                                    self.buffers.acquire if self.buffers is not None else np.empty)
+            except WorkerLost as e:
+                retry = attempt < self.config.retries and not frames
+                logger.warning(f"[{label}] 💀 Decoder worker {worker.slot} (pid {worker.pid}) lost ({e}), respawning"
+                               + (", retrying window" if retry else ""))
+                self._idle.put(self._replace(worker, e.reason, e.detail))
+                if frames:
+                    return frames, 0.0
+                if retry:
+                    continue
+                break
+            except BaseException:
+                self._idle.put(self._replace(worker, CRASH, "interrupted"))
+                raise
+            with self._lock:
+                self.windows += 1
+                self.cpu_seconds += used
+            self._release(worker)
+            return frames, used
+        logger.error(f"[{label}] ❌ Window dropped after {self.config.retries + 1} decoder attempt(s)")
+        return [], 0.0
+
+    def rss_bytes(self) -> int:
+        """RSS รวมของ worker ที่รันอยู่"""
+        with self._lock:
+            return sum(worker.rss_bytes() for worker in self._workers.values())
+
+    def close(self):
+        """หยุด worker ทุกตัว (ตอน service หยุด)"""
+        self.closed = True
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            worker.stop(timeout=2)
+        if PROMETHEUS_AVAILABLE:
+            DECODER_WORKERS_ALIVE.set(0)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            workers = [{
+                "slot": w.slot,
+                "pid": w.pid,
+                "alive": w.process.is_alive(),
+                "windows": w.windows,
+                "rss_mb": round(w.rss_bytes() / 1e6, 1),
+                "uptime_s": round(time.monotonic() - w.started, 1),
+            } for w in sorted(self._workers.values(), key=lambda w: w.slot)]
+            return {
+                "enabled": True,
+                "workers": workers,
+                "windows": self.windows,
+                "cpu_seconds": round(self.cpu_seconds, 1),
+                "restarts": dict(self.restarts),
+                "last_restart": self.last_restart,
+                "read_deadline_s": self.config.read_deadline_s,
+                "max_windows": self.config.max_windows,
+                "max_rss_mb": self.config.max_rss_mb,
+            }
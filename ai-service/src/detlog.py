@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Detection Log - บันทึก box / score ราย frame ของทุก window เป็นไฟล์ columnar สำหรับวิเคราะห์ย้อนหลัง
+
+เดิมสิ่งที่ออกจาก service มีแค่ max/avg/min ต่อ window; box และ confidence ราย frame ถูกทิ้งหลัง
+detect ทำให้การลอง threshold / ROI ใหม่ต้องดึงวิดีโอและ infer ซ้ำทั้งหมด ที่นี่เก็บผล detection ไว้:
+
+- 1 ไฟล์ต่อ window ต่อกล้อง แบ่ง partition แบบ hive:
+  <directory>/camera_id=<id>/date=YYYY-MM-DD/hour=HH/<window_start>Z.npz (หรือ .parquet)
+- คอลัมน์ระดับ frame: ts (epoch), count, height, width, box_offsets (CSR: box ของ frame i คือ
+  offsets[i]:offsets[i+1]) และระดับ box: x1, y1, x2, y2, score (float32)
+- box เป็นพิกัดเต็ม frame ก่อนกรอง ROI ที่ confidence ของ inference (ต่ำสุดของกลุ่ม stream)
+  → คำนวณใหม่ได้ที่ confidence ≥ ค่านั้น และ ROI ใดก็ได้ (recount)
+- เขียนใน thread ของตัวเอง: submit() ไม่ block (คิวเต็ม = ทิ้ง window นั้นและนับ metric)
+  เขียนลงไฟล์ชั่วคราวแล้ว rename (reader ไม่เห็นไฟล์ครึ่งๆ)
+- partition ชั่วโมงที่เก่ากว่า retention_hours ถูกลบเป็นระยะ
+- format "parquet" ต้องมี pyarrow (ไม่มี → ใช้ npz) reader อ่านได้ทั้งสองแบบ
+
+ใช้ (คำนวณ max/avg/min ใหม่จาก log โดยไม่ infer):
+    python src/detlog.py --camera CAM-001 --start 2024-01-01T08:00 --confidence 0.5 \\
+        --roi '[[0.1,0.2],[0.9,0.2],[0.9,1],[0.1,1]]'
+"""
+import os
+import re
+import sys
+import json
+import queue
+import shutil
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from framestore import Timestamp, to_epoch
+from heatmap import foot_points
+from sources import points_in_polygon
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+PRUNE_INTERVAL_S = 600
+BOX_COLUMNS = ("x1", "y1", "x2", "y2")
+
+# Parquet (optional)
+PARQUET_AVAILABLE = False
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    pass
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+DETECTION_LOG_WINDOWS = None
+DETECTION_LOG_BYTES = None
+
+try:
+    from prometheus_client import Counter
+    PROMETHEUS_AVAILABLE = True
+    DETECTION_LOG_WINDOWS = Counter('detection_log_windows_total', 'Windows handed to the detection log',
+                                    ['outcome'])
+    DETECTION_LOG_BYTES = Counter('detection_log_bytes_total', 'Bytes written by the detection log')
+except ImportError:
+    pass
+
+FrameDetections = Tuple[np.ndarray, np.ndarray, Tuple[int, int]]  # (xyxy, scores, (h, w)) ของ 1 frame
+
+
+@dataclass
+class DetectionLogConfig:
+    """Configuration สำหรับ detection log (columnar บนดิสก์)"""
+    enabled: bool = False
+    directory: str = "~/.cache/forlp/detections"
+    format: str = "npz"            # npz | parquet (ต้องมี pyarrow)
+    retention_hours: float = 168.0  # ลบ partition ชั่วโมงที่เก่ากว่านี้ (0 = เก็บตลอด)
+    queue_windows: int = 256        # window ที่รอเขียนได้สูงสุด (เกิน = ทิ้ง)
+
+
+@dataclass
+class WindowDetections:
+    """ผล detection ราย frame ของกล้อง 1 ตัวใน 1 window (รูปแบบเดียวกับที่อยู่บนดิสก์)"""
+    camera_id: str
+    window_start: float  # epoch seconds
+    window_end: float
+    ts: np.ndarray        # float64 [F] เวลาของแต่ละ frame
+    count: np.ndarray     # int32 [F] จำนวนคนที่กล้องนับตอนรัน (confidence / ROI ของกล้อง)
+    height: np.ndarray    # int32 [F]
+    width: np.ndarray     # int32 [F]
+    box_offsets: np.ndarray  # int64 [F + 1]
+    boxes: np.ndarray     # float32 [N, 4] x1, y1, x2, y2 (พิกัด pixel ของ frame)
+    score: np.ndarray     # float32 [N]
+    meta: Dict[str, Any]
+
+    @classmethod
+    def from_frames(cls, camera_id: str, start: Timestamp, end: Timestamp, offsets: Sequence[float],
+                    frames: Sequence[FrameDetections], counts: Sequence[int],
+                    meta: Optional[Dict[str, Any]] = None) -> "WindowDetections":
+        """
+        รวม detection ราย frame เป็นคอลัมน์ (frame i อยู่ที่เวลา start + offsets[i] - เวลาจริงตาม footage
+        แบบเดียวกับ frame store: fetch ที่ถูกตัดครอบคลุมเฉพาะช่วงต้น window ไม่ได้กระจายทั้ง window)
+        """
+        if len(offsets) != len(frames):
+            raise ValueError(f"{len(frames)} frames but {len(offsets)} offsets")
+        t0, t1 = to_epoch(start), to_epoch(end)
+        sizes = np.fromiter((len(scores) for _, scores, _ in frames), dtype=np.int64, count=len(frames))
+        box_offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=box_offsets[1:])
+        shapes = np.array([shape for _, _, shape in frames], dtype=np.int32).reshape(-1, 2)
+        boxes = (np.concatenate([xyxy for xyxy, _, _ in frames]).astype(np.float32, copy=False)
+                 if frames else np.empty((0, 4), dtype=np.float32))
+        scores = (np.concatenate([scores for _, scores, _ in frames]).astype(np.float32, copy=False)
+                  if frames else np.empty(0, dtype=np.float32))
+        return cls(
+            camera_id=camera_id, window_start=t0, window_end=t1,
+            ts=t0 + np.asarray(offsets, dtype=np.float64).reshape(-1),
+            count=np.asarray(counts, dtype=np.int32),
+            height=shapes[:, 0].copy(), width=shapes[:, 1].copy(),
+            box_offsets=box_offsets, boxes=boxes.reshape(-1, 4), score=scores,
+            meta={"version": FORMAT_VERSION, "camera_id": camera_id, "window_start": _iso(t0),
+                  "window_end": _iso(t1), **(meta or {})}
+        )
+
+    @property
+    def frames(self) -> int:
+        return len(self.ts)
+
+    def frame_boxes(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(xyxy, scores) ของ frame ที่ index"""
+        sl = slice(self.box_offsets[index], self.box_offsets[index + 1])
+        return self.boxes[sl], self.score[sl]
+
+    def stats(self, counts: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        counts = self.count if counts is None else counts
+        if not len(counts):
+            return {"frames": 0, "max": 0, "avg": 0.0, "min": 0}
+        return {"frames": int(len(counts)), "max": int(counts.max()), "avg": round(float(counts.mean()), 2),
+                "min": int(counts.min())}
+
+
+def recount(window: WindowDetections, confidence: Optional[float] = None,
+            roi: Optional[Sequence[Sequence[float]]] = None) -> np.ndarray:
+    """
+    จำนวนคนต่อ frame ที่ confidence / ROI ใหม่ (vectorized ทั้ง window, กติกาเดียวกับ CameraView.select)
+
+    confidence: ค่าเริ่มต้น = ของกล้องตอนรัน; ต่ำกว่า confidence ของ inference ที่บันทึกไว้ไม่ได้
+    (box ที่ต่ำกว่านั้นไม่ได้ถูกเก็บ)
+    roi: polygon พิกัด normalized 0-1 ([] = ทั้งภาพ, None = ROI ของกล้องตอนรัน)
+    """
+    if confidence is None:
+        confidence = window.meta.get("camera_confidence", window.meta.get("infer_confidence", 0.0))
+    logged = window.meta.get("infer_confidence")
+    if logged is not None and confidence < logged - 1e-9:
+        logger.warning(f"[{window.camera_id}] ⚠️ confidence {confidence:g} is below the logged inference "
+                       f"threshold {logged:g}; boxes under {logged:g} were never recorded")
+    if roi is None:
+        roi = window.meta.get("roi") or []
+    mask = window.score >= confidence
+    frame_of_box = np.repeat(np.arange(window.frames), np.diff(window.box_offsets))
+    if len(roi) >= 3 and len(window.boxes):
+        size = np.stack((window.width, window.height), axis=1).astype(np.float32)[frame_of_box]
+        mask &= points_in_polygon(foot_points(window.boxes) / size, np.asarray(roi, dtype=np.float32))
+    return np.bincount(frame_of_box[mask], minlength=window.frames).astype(np.int32)
+
+
+# ==================== On-disk format ====================
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _partition_name(camera_id: str) -> str:
+    return "camera_id=" + re.sub(r"[^A-Za-z0-9._-]", "_", camera_id)
+
+
+def window_path(directory: Path, window: WindowDetections, suffix: str) -> Path:
+    start = datetime.fromtimestamp(window.window_start, timezone.utc)
+    return (directory / _partition_name(window.camera_id) / f"date={start:%Y-%m-%d}" / f"hour={start:%H}"
+            / f"{start:%Y%m%dT%H%M%S}Z{suffix}")
+
+
+def _write_npz(window: WindowDetections, f):
+    np.savez_compressed(
+        f, ts=window.ts, count=window.count, height=window.height, width=window.width,
+        box_offsets=window.box_offsets, score=window.score,
+        **{name: window.boxes[:, i] for i, name in enumerate(BOX_COLUMNS)},
+        meta=np.array(json.dumps(window.meta))
+    )
+
+
+def _write_parquet(window: WindowDetections, f):
+    """1 row ต่อ frame; x1..score เป็น list column (offsets เดียวกับ box_offsets)"""
+    offsets = pa.array(window.box_offsets.astype(np.int32))
+    columns = {"ts": pa.array(window.ts), "count": pa.array(window.count),
+               "height": pa.array(window.height), "width": pa.array(window.width)}
+    for i, name in enumerate(BOX_COLUMNS):
+        columns[name] = pa.ListArray.from_arrays(offsets, pa.array(np.ascontiguousarray(window.boxes[:, i])))
+    columns["score"] = pa.ListArray.from_arrays(offsets, pa.array(window.score))
+    table = pa.table(columns).replace_schema_metadata({"forlp.detections": json.dumps(window.meta)})
+    pq.write_table(table, f, compression="zstd")
+
+
+def load_window(path: Path) -> WindowDetections:
+    """อ่านไฟล์ของ 1 window (.npz หรือ .parquet)"""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        if not PARQUET_AVAILABLE:
+            raise RuntimeError(f"{path.name}: reading Parquet requires pyarrow")
+        table = pq.read_table(path)
+        meta = json.loads(table.schema.metadata[b"forlp.detections"])
+        lists = {name: table.column(name).combine_chunks() for name in BOX_COLUMNS + ("score",)}
+        raw = lists["score"].offsets.to_numpy()
+        columns = {name: table.column(name).to_numpy() for name in ("ts", "count", "height", "width")}
+        columns.update({name: column.flatten().to_numpy() for name, column in lists.items()})
+        columns["box_offsets"] = (raw - raw[0]).astype(np.int64)
+    else:
+        with np.load(path) as data:
+            columns = {name: data[name] for name in data.files if name != "meta"}
+            meta = json.loads(str(data["meta"]))
+    return WindowDetections(
+        camera_id=meta["camera_id"], window_start=to_epoch(_parse_iso(meta["window_start"])),
+        window_end=to_epoch(_parse_iso(meta["window_end"])),
+        ts=columns["ts"].astype(np.float64), count=columns["count"].astype(np.int32),
+        height=columns["height"].astype(np.int32), width=columns["width"].astype(np.int32),
+        box_offsets=columns["box_offsets"].astype(np.int64),
+        boxes=np.stack([columns[name] for name in BOX_COLUMNS], axis=1).astype(np.float32).reshape(-1, 4),
+        score=columns["score"].astype(np.float32), meta=meta
+    )
+
+
+def _parse_iso(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def read_detections(directory: str, camera_id: str, start: Optional[Timestamp] = None,
+                    end: Optional[Timestamp] = None) -> Iterator[WindowDetections]:
+    """window ของกล้องที่เริ่มในช่วง [start, end) เรียงตามเวลา (ข้าม partition ชั่วโมงนอกช่วงโดยไม่เปิดไฟล์)"""
+    root = Path(directory).expanduser() / _partition_name(camera_id)
+    t0 = to_epoch(start) if start is not None else -np.inf
+    t1 = to_epoch(end) if end is not None else np.inf
+    for hour_dir in sorted(root.glob("date=*/hour=*")):
+        hour = _parse_hour(hour_dir)
+        if hour is None or hour.timestamp() + 3600 <= t0 or hour.timestamp() >= t1:
+            continue
+        for path in sorted(p for p in hour_dir.iterdir() if p.suffix in (".npz", ".parquet")):
+            try:
+                stamp = datetime.strptime(path.stem, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc).timestamp()
+            except ValueError:
+                continue
+            if t0 <= stamp < t1:
+                yield load_window(path)
+
+
+def _parse_hour(hour_dir: Path) -> Optional[datetime]:
+    try:
+        day = hour_dir.parent.name.split("=", 1)[1]
+        return datetime.strptime(f"{day} {hour_dir.name.split('=', 1)[1]}", "%Y-%m-%d %H").replace(tzinfo=timezone.utc)
+    except (IndexError, ValueError):
+        return None
+
+
+# ==================== Writer ====================
+class DetectionLog:
+    """
+    writer แบบ asynchronous ของ detection log
+
+    submit() ไม่ block (คิวเต็ม → ทิ้ง window นั้น); thread ของ log เขียนไฟล์และลบ partition เก่า
+    """
+
+    def __init__(self, config: DetectionLogConfig):
+        self.config = config
+        self.directory = Path(config.directory).expanduser()
+        self.format = config.format.lower()
+        if self.format == "parquet" and not PARQUET_AVAILABLE:
+            logger.warning("⚠️ Detection log: pyarrow not installed, writing .npz instead of Parquet")
+            self.format = "npz"
+        elif self.format not in ("npz", "parquet"):
+            logger.warning(f"⚠️ Detection log: unknown format '{config.format}', using npz")
+            self.format = "npz"
+        self.suffix = f".{self.format}"
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.pruned = 0
+        self._last_prune = 0.0
+        self._queue: "queue.Queue[WindowDetections]" = queue.Queue(maxsize=max(1, config.queue_windows))
+        self._thread = threading.Thread(target=self._run, name="detection-log", daemon=True)
+        self._thread.start()
+
+    def submit(self, window: WindowDetections) -> bool:
+        try:
+            self._queue.put_nowait(window)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"[{window.camera_id}] ⚠️ Detection log queue full, dropping window")
+            if PROMETHEUS_AVAILABLE:
+                DETECTION_LOG_WINDOWS.labels(outcome='dropped').inc()
+            return False
+
+    def _run(self):
+        while True:
+            try:
+                window = self._queue.get(timeout=PRUNE_INTERVAL_S)
+            except queue.Empty:
+                window = None
+            try:
+                if window is not None:
+                    self.write(window)
+                if time.monotonic() - self._last_prune >= PRUNE_INTERVAL_S:
+                    self._last_prune = time.monotonic()
+                    self.prune()
+            except Exception as e:
+                logger.error(f"❌ Detection log error: {e}")
+            finally:
+                if window is not None:
+                    self._queue.task_done()
+
+    def write(self, window: WindowDetections) -> Optional[Path]:
+        """เขียน window ลงไฟล์ (ไฟล์ชั่วคราว → rename) คืน path หรือ None ถ้าเขียนไม่ได้"""
+        path = window_path(self.directory, window, self.suffix)
+        tmp = path.with_name(f".{path.name}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "wb") as f:
+                (_write_parquet if self.format == "parquet" else _write_npz)(window, f)
+            os.replace(tmp, path)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"[{window.camera_id}] ⚠️ Could not write detection log: {e}")
+            if PROMETHEUS_AVAILABLE:
+                DETECTION_LOG_WINDOWS.labels(outcome='failed').inc()
+            tmp.unlink(missing_ok=True)
+            return None
+        size = path.stat().st_size
+        self.written += 1
+        self.bytes += size
+        if PROMETHEUS_AVAILABLE:
+            DETECTION_LOG_WINDOWS.labels(outcome='written').inc()
+            DETECTION_LOG_BYTES.inc(size)
+        return path
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """ลบ partition ชั่วโมงที่จบก่อน now - retention_hours; คืนจำนวน partition ที่ลบ"""
+        if self.config.retention_hours <= 0 or not self.directory.is_dir():
+            return 0
+        cutoff = (time.time() if now is None else now) - self.config.retention_hours * 3600
+        removed = 0
+        for hour_dir in self.directory.glob("camera_id=*/date=*/hour=*"):
+            hour = _parse_hour(hour_dir)
+            if hour is not None and hour.timestamp() + 3600 <= cutoff:
+                shutil.rmtree(hour_dir, ignore_errors=True)
+                removed += 1
+        for date_dir in self.directory.glob("camera_id=*/date=*"):
+            if not any(date_dir.iterdir()):
+                date_dir.rmdir()
+        if removed:
+            self.pruned += removed
+            logger.info(f"🧹 Detection log: removed {removed} hour partition(s) older than "
+                        f"{self.config.retention_hours:g}h")
+        return removed
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """รอให้ window ในคิวถูกเขียนหมด (ใช้ตอน shutdown / --once)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._queue.unfinished_tasks
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "format": self.format,
+            "directory": str(self.directory),
+            "retention_hours": self.config.retention_hours,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "written_mb": round(self.bytes / 1e6, 2),
+            "pruned_partitions": self.pruned,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recompute window max/avg/min from the detection log")
+    parser.add_argument("--directory", default=os.environ.get("DETECTION_LOG_DIR", DetectionLogConfig.directory))
+    parser.add_argument("--camera", required=True)
+    parser.add_argument("--start", default=None, help="ISO time (naive = UTC)")
+    parser.add_argument("--end", default=None, help="ISO time (naive = UTC)")
+    parser.add_argument("--confidence", type=float, default=None, help="default: camera confidence at run time")
+    parser.add_argument("--roi", default=None, help="JSON polygon [[x,y],...] normalized 0-1 ('[]' = full frame)")
+    parser.add_argument("--json", action="store_true", help="one JSON object per window")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    roi = json.loads(args.roi) if args.roi is not None else None
+
+    windows = 0
+    for window in read_detections(args.directory, args.camera, args.start and _parse_iso(args.start),
+                                  args.end and _parse_iso(args.end)):
+        windows += 1
+        logged, again = window.stats(), window.stats(recount(window, args.confidence, roi))
+        start = _iso(window.window_start)
+        if args.json:
+            print(json.dumps({"window_start": start, "logged": logged, "recount": again}))
+        else:
+            logger.info(f"{start}  frames {logged['frames']:>4}  logged {logged['max']}/{logged['avg']}/{logged['min']}"
+                        f"  →  recount {again['max']}/{again['avg']}/{again['min']}  (max/avg/min)")
+    if not windows:
+        logger.info(f"No logged windows for {args.camera} in {Path(args.directory).expanduser()}")
+    return 0 if windows else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Frame Store - ring buffer บนดิสก์ (memory-mapped) ของ frame ที่ sample แล้วต่อกล้อง
+
+frame ที่ดึงจาก NVR ถูกทิ้งหลัง detection ทำให้การตรวจ count ที่น่าสงสัย / ลอง model ใหม่ /
+audit ต้องดึงจาก NVR ซ้ำ (ช้าเท่าความเร็ว stream) ring buffer นี้เก็บ N ชั่วโมงล่าสุดไว้ในเครื่อง:
+
+- 1 ring ต่อ physical stream: <camera_id>.frames (uint8 [capacity, H, W, 3]) + <camera_id>.index
+- เก็บที่ความละเอียด inference (ย่อให้พอดี slot เช่น 640x360, รักษาสัดส่วน)
+- index เป็น structured array (seq, timestamp, h, w) ค้นตามช่วงเวลาแบบ vectorized
+- เขียนทับ slot เก่าสุดเมื่อเต็ม; seq ต่อเนื่องหลัง restart (หา head จาก seq สูงสุด)
+- reader ได้ NumPy view บน memmap โดยตรง (zero-copy) อ่านข้าม process ได้ (mode='r')
+
+หมายเหตุ: view ของ slot ที่เก่ามากอาจถูกเขียนทับระหว่างใช้งาน ใช้ read(copy=True) ถ้าต้องการ
+snapshot ที่แน่นอน (ตรวจ seq ก่อน/หลัง copy แล้วตัด frame ที่ถูกเขียนทับออก)
+"""
+import re
+import json
+import math
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_DTYPE = np.dtype([("seq", "<i8"), ("ts", "<f8"), ("h", "<u2"), ("w", "<u2")])
+FORMAT_VERSION = 1
+
+Timestamp = Union[datetime, float]
+
+
+@dataclass
+class FrameStoreConfig:
+    """Configuration สำหรับ ring buffer ของ frame"""
+    enabled: bool = False
+    directory: str = "~/.cache/forlp/frames"
+    retention_hours: float = 6.0       # ความจุ = retention_hours x sampling_fps
+    max_frames_per_camera: int = 0     # เพดานจำนวน frame ต่อกล้อง (0 = ตาม retention)
+    frame_width: int = 640             # ขนาด slot (frame ใหญ่กว่านี้ถูกย่อ รักษาสัดส่วน)
+    frame_height: int = 360
+
+
+def to_epoch(ts: Timestamp) -> float:
+    """datetime (naive = UTC) หรือ epoch seconds → epoch seconds"""
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts.timestamp()
+    return float(ts)
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _safe_name(camera_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", camera_id)
+
+
+def fit_frame(frame: np.ndarray, max_h: int, max_w: int) -> np.ndarray:
+    """ย่อ frame ให้พอดี slot (ไม่ขยาย) รักษาสัดส่วน"""
+    h, w = frame.shape[:2]
+    scale = min(max_h / h, max_w / w, 1.0)
+    if scale >= 1.0:
+        return frame
+    import cv2
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+class FrameRing:
+    """
+    Ring buffer ของกล้อง 1 ตัวบนไฟล์ memmap
+
+    writer 1 ตัวต่อ ring (thread-safe ด้วย lock); reader ใน process อื่นเปิดด้วย readonly=True
+    """
+
+    def __init__(self, directory: Path, camera_id: str, capacity: int, height: int, width: int,
+                 readonly: bool = False):
+        self.camera_id = camera_id
+        base = directory / _safe_name(camera_id)
+        self.meta_path = base.with_suffix(".json")
+        self.index_path = base.with_suffix(".index")
+        self.frames_path = base.with_suffix(".frames")
+        self.readonly = readonly
+        self._lock = threading.Lock()
+
+        meta = {"version": FORMAT_VERSION, "camera_id": camera_id, "capacity": int(capacity),
+                "height": int(height), "width": int(width)}
+        existing = self._read_meta()
+        if readonly:
+            if existing is None:
+                raise FileNotFoundError(f"No frame ring for camera {camera_id} in {directory}")
+            meta = existing
+        elif existing != meta:
+            if existing is not None:
+                logger.info(f"[{camera_id}] 🗃️ Frame ring layout changed, recreating {self.frames_path.name}")
+            directory.mkdir(parents=True, exist_ok=True)
+            self._create(meta)
+
+        self.capacity = meta["capacity"]
+        self.height, self.width = meta["height"], meta["width"]
+        mode = "r" if readonly else "r+"
+        self.index = np.memmap(self.index_path, dtype=INDEX_DTYPE, mode=mode, shape=(self.capacity,))
+        self.frames = np.memmap(self.frames_path, dtype=np.uint8, mode=mode,
+                                shape=(self.capacity, self.height, self.width, 3))
+        seq = self.index["seq"]
+        self._next_seq = int(seq.max()) + 1 if len(seq) and seq.max() >= 0 else 0
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            return json.loads(self.meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _create(self, meta: dict):
+        """สร้างไฟล์ใหม่ (sparse: ใช้ดิสก์จริงเท่าที่เขียน)"""
+        capacity = meta["capacity"]
+        index = np.memmap(self.index_path, dtype=INDEX_DTYPE, mode="w+", shape=(capacity,))
+        index["seq"] = -1
+        index.flush()
+        del index
+        with open(self.frames_path, "wb") as f:
+            f.truncate(capacity * meta["height"] * meta["width"] * 3)
+        tmp = self.meta_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(meta))
+        tmp.replace(self.meta_path)
+
+    @property
+    def nbytes(self) -> int:
+        return self.frames.nbytes + self.index.nbytes
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.index["seq"] >= 0))
+
+    def append(self, frame: np.ndarray, ts: Timestamp) -> int:
+        """เขียน frame ลง slot ถัดไป คืน seq"""
+        return self.extend([frame], [ts])[0]
+
+    def extend(self, frames: Sequence[np.ndarray], timestamps: Sequence[Timestamp]) -> List[int]:
+        if self.readonly:
+            raise PermissionError("frame ring opened read-only")
+        seqs = []
+        with self._lock:
+            for frame, ts in zip(frames, timestamps):
+                frame = fit_frame(frame, self.height, self.width)
+                h, w = frame.shape[:2]
+                seq = self._next_seq
+                slot = seq % self.capacity
+                # ลำดับการเขียน: invalidate → pixels → metadata → seq (reader ไม่เห็น slot ครึ่งๆ กลางๆ)
+                self.index["seq"][slot] = -1
+                self.frames[slot, :h, :w] = frame
+                self.index["ts"][slot] = to_epoch(ts)
+                self.index["h"][slot] = h
+                self.index["w"][slot] = w
+                self.index["seq"][slot] = seq
+                self._next_seq += 1
+                seqs.append(seq)
+        return seqs
+
+    def flush(self):
+        if not self.readonly:
+            self.frames.flush()
+            self.index.flush()
+
+    def slots(self, start: Optional[Timestamp] = None, end: Optional[Timestamp] = None) -> np.ndarray:
+        """slot ที่ timestamp อยู่ใน [start, end) เรียงตามเวลา"""
+        index = np.array(self.index)  # snapshot ของ index (เล็ก) ให้ mask/sort สอดคล้องกัน
+        mask = index["seq"] >= 0
+        if start is not None:
+            mask &= index["ts"] >= to_epoch(start)
+        if end is not None:
+            mask &= index["ts"] < to_epoch(end)
+        slots = np.flatnonzero(mask)
+        return slots[np.argsort(index["ts"][slots], kind="stable")]
+
+    def view(self, slot: int) -> np.ndarray:
+        """zero-copy view ของ frame ใน slot (H, W, 3 ตามขนาดที่เก็บจริง)"""
+        return self.frames[slot, :self.index["h"][slot], :self.index["w"][slot]]
+
+    def read(self, start: Optional[Timestamp] = None, end: Optional[Timestamp] = None,
+             copy: bool = False) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """
+        frame ในช่วงเวลา → (timestamps epoch float64, [frame])
+
+        copy=False คืน view บน memmap (อ่านจากดิสก์/page cache ตอนใช้งาน)
+        copy=True  copy ออกมาแล้วตัด frame ที่ถูกเขียนทับระหว่างอ่านทิ้ง
+        """
+        slots = self.slots(start, end)
+        seqs = np.array(self.index["seq"][slots])
+        timestamps = np.array(self.index["ts"][slots])
+        frames = [self.view(slot) for slot in slots]
+        if copy:
+            frames = [np.array(frame) for frame in frames]
+            intact = np.array(self.index["seq"][slots]) == seqs
+            timestamps = timestamps[intact]
+            frames = [frame for frame, ok in zip(frames, intact) if ok]
+        return timestamps, frames
+
+    def latest(self) -> Optional[Tuple[float, np.ndarray]]:
+        seq = self.index["seq"]
+        if not len(seq) or seq.max() < 0:
+            return None
+        slot = int(np.argmax(seq))
+        return float(self.index["ts"][slot]), self.view(slot)
+
+    def summary(self) -> dict:
+        slots = self.slots()
+        ts = self.index["ts"][slots]
+        return {
+            "camera_id": self.camera_id,
+            "frames": int(len(slots)),
+            "capacity": self.capacity,
+            "slot": [self.height, self.width],
+            "oldest": _iso(float(ts[0])) if len(ts) else None,
+            "newest": _iso(float(ts[-1])) if len(ts) else None,
+            "reserved_mb": round(self.nbytes / 1e6, 1),  # ไฟล์ sparse: ใช้ดิสก์จริงเท่าที่เขียน
+        }
+
+
+class FrameStore:
+    """
+    Ring buffer ของทุกกล้อง (เปิด ring ตอนเขียน/อ่านครั้งแรก)
+
+    กล้อง logical ที่ใช้ stream เดียวกันเก็บ frame ครั้งเดียวใน ring ของกล้องตัวแรก
+    กล้องอื่นในกลุ่มอ่านผ่าน alias
+    """
+
+    def __init__(self, config: FrameStoreConfig, sampling_fps: float = 1.0, readonly: bool = False):
+        self.config = config
+        self.directory = Path(config.directory).expanduser()
+        self.readonly = readonly
+        capacity = math.ceil(config.retention_hours * 3600 * max(sampling_fps, 1e-6))
+        if config.max_frames_per_camera > 0:
+            capacity = min(capacity, config.max_frames_per_camera)
+        self.capacity = max(1, capacity)
+        self._rings: Dict[str, FrameRing] = {}
+        self._aliases: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def bytes_per_camera(self) -> int:
+        return self.capacity * (self.config.frame_height * self.config.frame_width * 3 + INDEX_DTYPE.itemsize)
+
+    def alias(self, camera_id: str, source_camera_id: str):
+        """กล้อง camera_id อ่าน frame จาก ring ของ source_camera_id (บันทึกลงดิสก์ให้ reader process อื่นเห็น)"""
+        if camera_id == source_camera_id or self._aliases.get(camera_id) == source_camera_id:
+            return
+        self._aliases[camera_id] = source_camera_id
+        if not self.readonly:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{_safe_name(camera_id)}.json"
+            path.write_text(json.dumps({"version": FORMAT_VERSION, "camera_id": camera_id,
+                                        "alias_of": source_camera_id}))
+
+    def _resolve(self, camera_id: str) -> str:
+        if camera_id not in self._aliases and self.readonly:
+            try:
+                meta = json.loads((self.directory / f"{_safe_name(camera_id)}.json").read_text())
+                if meta.get("alias_of"):
+                    self._aliases[camera_id] = meta["alias_of"]
+            except (OSError, ValueError):
+                pass
+        return self._aliases.get(camera_id, camera_id)
+
+    def ring(self, camera_id: str) -> Optional[FrameRing]:
+        """ring ของกล้อง (None ถ้าเปิดแบบ readonly แล้วยังไม่มีไฟล์)"""
+        camera_id = self._resolve(camera_id)
+        with self._lock:
+            if camera_id not in self._rings:
+                try:
+                    self._rings[camera_id] = FrameRing(
+                        self.directory, camera_id, self.capacity,
+                        self.config.frame_height, self.config.frame_width, readonly=self.readonly
+                    )
+                except (FileNotFoundError, KeyError):
+                    return None
+            return self._rings[camera_id]
+
+    def record(self, camera_ids: Sequence[str], frames: Sequence[np.ndarray], timestamps: Sequence[Timestamp]):
+        """
+        เก็บ frame ของ 1 window พร้อมเวลาจริงของแต่ละ frame (ตาม footage ไม่ใช่กระจายเท่าๆ กันทั้ง window:
+        fetch ที่ถูกตัดด้วย max_frames / timeout ครอบคลุมเฉพาะช่วงต้น) ลง ring ของกล้องตัวแรก
+        แล้ว alias กล้องที่เหลือ
+        """
+        if not frames or not camera_ids:
+            return
+        if len(timestamps) != len(frames):
+            raise ValueError(f"{len(frames)} frames but {len(timestamps)} timestamps")
+        primary = camera_ids[0]
+        for camera_id in camera_ids[1:]:
+            self.alias(camera_id, primary)
+        ring = self.ring(primary)
+        ring.extend(frames, timestamps)
+        ring.flush()
+
+    def read(self, camera_id: str, start: Optional[Timestamp] = None, end: Optional[Timestamp] = None,
+             copy: bool = False) -> Tuple[np.ndarray, List[np.ndarray]]:
+        ring = self.ring(camera_id)
+        if ring is None:
+            return np.empty(0), []
+        return ring.read(start, end, copy=copy)
+
+    def camera_ids(self) -> List[str]:
+        """กล้องที่มี ring บนดิสก์ (รวม alias ที่รู้จัก)"""
+        on_disk = set()
+        if self.directory.is_dir():
+            for meta_path in self.directory.glob("*.json"):
+                try:
+                    on_disk.add(json.loads(meta_path.read_text())["camera_id"])
+                except (OSError, ValueError, KeyError):
+                    continue
+        return sorted(on_disk | set(self._aliases))
+
+    def summary(self, camera_id: str) -> Optional[dict]:
+        ring = self.ring(camera_id)
+        if ring is None:
+            return None
+        body = ring.summary()
+        body["camera_id"] = camera_id
+        if self._resolve(camera_id) != camera_id:
+            body["source_camera_id"] = self._aliases[camera_id]
+        return body
@@ -4,21 +4,70 @@ Health Check Server สำหรับ Railway
 """
 import os
 import json
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from threading import Thread
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 # Global status
 service_status = {
     "status": "starting",
     "last_process": None,
     "cameras_active": 0,
-    "total_processed": 0
+    "total_processed": 0,
+    "ready": False,
+    "startup_phases": {}
 }
 
+# Extra routes: method → prefix → handler(subpath, query, headers) -> (status, body)
+RouteHandler = Callable[[str, Dict[str, List[str]], object], Tuple[int, dict]]
+_routes: Dict[str, Dict[str, RouteHandler]] = {"GET": {}, "POST": {}}
+
+# /metrics ของ Prometheus บน health server (เมื่อ metrics_port ชนกับ PORT)
+_serve_metrics = False
+
+def serve_metrics():
+    """ให้ health server ตอบ GET /metrics แทน metrics server แยก port"""
+    global _serve_metrics
+    _serve_metrics = True
+
+def register_route(prefix: str, handler: RouteHandler, method: str = "GET"):
+    """เพิ่ม endpoint (เช่น GET /count/, POST /model) ให้ health server"""
+    _routes[method][prefix] = handler
+
 class HealthHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status: int, body: dict):
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body, ensure_ascii=False).encode())
+    
+    def _dispatch(self, method: str, query: Dict[str, List[str]]) -> bool:
+        url = urllib.parse.urlsplit(self.path)
+        for prefix, handler in _routes[method].items():
+            if url.path.startswith(prefix):
+                try:
+                    status, body = handler(url.path[len(prefix):], query, self.headers)
+                except Exception as e:
+                    status, body = 500, {"error": str(e)}
+                self._send_json(status, body)
+                return True
+        return False
+    
     def do_GET(self):
+        if self._dispatch("GET", urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)):
+            return
+        
+        if _serve_metrics and urllib.parse.urlsplit(self.path).path == "/metrics":
+            from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+            output = generate_latest()
+            self.send_response(200)
+            self.send_header('Content-type', CONTENT_TYPE_LATEST)
+            self.end_headers()
+            self.wfile.write(output)
+            return
+        
         if self.path == "/health" or self.path == "/":
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
@@ -32,10 +81,32 @@ class HealthHandler(BaseHTTPRequestHandler):
                 **service_status
             }
             self.wfile.write(json.dumps(response).encode())
+        elif self.path == "/ready":
+            # 503 จนกว่า model จะโหลด + warm-up เสร็จ
+            ready = service_status["ready"]
+            self.send_response(200 if ready else 503)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                "ready": ready,
+                "status": service_status["status"],
+                "startup_phases": service_status["startup_phases"]
+            }).encode())
         else:
             self.send_response(404)
             self.end_headers()
     
+    def do_POST(self):
+        # query string + form body (application/x-www-form-urlencoded) รวมกัน
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(min(length, 64 * 1024)).decode('utf-8', 'replace')
+            for key, values in urllib.parse.parse_qs(body).items():
+                query.setdefault(key, []).extend(values)
+        if not self._dispatch("POST", query):
+            self._send_json(404, {"error": "Not found"})
+    
     def log_message(self, format, *args):
         pass  # Suppress logs
 
@@ -45,16 +116,25 @@ def start_health_server(port: Optional[int] = None):
     if port is None:
         port = int(os.environ.get('PORT', 8080))
     
-    server = HTTPServer(('0.0.0.0', port), HealthHandler)
+    # Threading: /count requests ที่รอ inference ต้องไม่ block /health
+    server = ThreadingHTTPServer(('0.0.0.0', port), HealthHandler)
+    server.daemon_threads = True
     thread = Thread(target=server.serve_forever, daemon=True)
     thread.start()
     print(f"🏥 Health server running on port {port}")
     return server
 
-def update_status(status: Optional[str] = None, cameras: Optional[int] = None, processed: Optional[int] = None):
+def record_startup_phase(name: str, seconds: float):
+    """บันทึกเวลาที่ใช้ในแต่ละ phase ตอน startup"""
+    service_status["startup_phases"][name] = round(seconds, 3)
+
+def update_status(status: Optional[str] = None, cameras: Optional[int] = None, processed: Optional[int] = None,
+                  ready: Optional[bool] = None):
     """Update service status"""
     if status:
         service_status["status"] = status
+    if ready is not None:
+        service_status["ready"] = ready
     if cameras is not None:
         service_status["cameras_active"] = cameras
     if processed is not None:
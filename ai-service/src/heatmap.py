@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Occupancy Heatmap - ตำแหน่งที่คนยืน/เดินต่อกล้อง สะสมเป็น grid ขนาดคงที่
+
+- ใช้จุดเท้า (กึ่งกลางขอบล่างของ box) แทนตำแหน่งคน
+- binning แบบ vectorized ด้วย np.bincount ไม่มี loop ต่อ box
+- เก็บเป็น uint16 (จำนวนครั้งที่พบคนในแต่ละ cell) ต่อ window
+- ส่งเป็น payload บีบอัด (zlib + base64) หรือดึงจาก /heatmap/<camera_id>
+"""
+import zlib
+import base64
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+UINT16_MAX = np.iinfo(np.uint16).max
+
+
+@dataclass
+class HeatmapConfig:
+    """Configuration สำหรับ occupancy heatmap"""
+    enabled: bool = False
+    grid_width: int = 32    # จำนวน cell แนวนอน
+    grid_height: int = 18   # จำนวน cell แนวตั้ง (16:9 เหมือนภาพกล้อง)
+    send: bool = True       # แนบ heatmap ไปกับ payload ที่ส่ง backend
+
+
+def foot_points(xyxy: np.ndarray) -> np.ndarray:
+    """จุดเท้าของแต่ละ box: (x กึ่งกลาง, y ขอบล่าง) shape (N, 2)"""
+    return np.stack(((xyxy[:, 0] + xyxy[:, 2]) * 0.5, xyxy[:, 3]), axis=1)
+
+
+def bin_points(points: np.ndarray, frame_shape: Tuple[int, int], grid_shape: Tuple[int, int]) -> np.ndarray:
+    """
+    นับจุดลง grid (rows, cols) ด้วย np.bincount
+
+    จุดที่อยู่นอกภาพถูก clip เข้าขอบ (box ที่ล้นขอบล่างยังนับเป็นแถวล่างสุด)
+    """
+    rows, cols = grid_shape
+    if len(points) == 0:
+        return np.zeros(grid_shape, dtype=np.int64)
+    h, w = frame_shape
+    col = np.clip((points[:, 0] * (cols / w)).astype(np.int64), 0, cols - 1)
+    row = np.clip((points[:, 1] * (rows / h)).astype(np.int64), 0, rows - 1)
+    return np.bincount(row * cols + col, minlength=rows * cols).reshape(grid_shape)
+
+
+class OccupancyHeatmap:
+    """heatmap ของกล้อง 1 ตัวใน 1 window"""
+
+    def __init__(self, grid_width: int = 32, grid_height: int = 18):
+        self.counts = np.zeros((grid_height, grid_width), dtype=np.uint16)
+        self.frames = 0
+        self.window_start: Optional[datetime] = None
+        self.window_end: Optional[datetime] = None
+
+    @classmethod
+    def from_config(cls, config: HeatmapConfig) -> "OccupancyHeatmap":
+        return cls(config.grid_width, config.grid_height)
+
+    def add(self, xyxy: np.ndarray, frame_shape: Tuple[int, int]):
+        """สะสม box ของ 1 frame (xyxy พิกัดภาพเต็ม)"""
+        self.frames += 1
+        if len(xyxy) == 0:
+            return
+        binned = bin_points(foot_points(xyxy), frame_shape, self.counts.shape)
+        # saturate แทน overflow (cell เดียวเกิน 65535 ครั้งต่อ window แทบไม่เกิด)
+        np.minimum(self.counts + binned, UINT16_MAX, out=binned)
+        self.counts[...] = binned
+
+    def density(self) -> np.ndarray:
+        """จำนวนคนเฉลี่ยต่อ frame ในแต่ละ cell (float32)"""
+        if self.frames == 0:
+            return np.zeros(self.counts.shape, dtype=np.float32)
+        return self.counts.astype(np.float32) / np.float32(self.frames)
+
+    def to_payload(self) -> dict:
+        """
+        Payload แบบกะทัดรัด: counts เป็น uint16 little-endian row-major → zlib → base64
+
+        ฝั่งรับ decode ได้ด้วย
+        np.frombuffer(zlib.decompress(b64decode(data)), '<u2').reshape(rows, cols)
+        """
+        raw = self.counts.astype('<u2', copy=False).tobytes()
+        peak_row, peak_col = np.unravel_index(int(np.argmax(self.counts)), self.counts.shape)
+        payload = {
+            "rows": int(self.counts.shape[0]),
+            "cols": int(self.counts.shape[1]),
+            "frames": self.frames,
+            "dtype": "uint16",
+            "encoding": "zlib+base64",
+            "data": base64.b64encode(zlib.compress(raw, 6)).decode('ascii'),
+            "peak_cell": [int(peak_row), int(peak_col)],
+        }
+        if self.window_start and self.window_end:
+            payload["window_start"] = self.window_start.isoformat() + "Z"
+            payload["window_end"] = self.window_end.isoformat() + "Z"
+        return payload
+
+
+def decode_payload(payload: dict) -> np.ndarray:
+    """แปลง payload กลับเป็น uint16 grid (ใช้ฝั่ง consumer / debug)"""
+    raw = zlib.decompress(base64.b64decode(payload["data"]))
+    return np.frombuffer(raw, dtype='<u2').reshape(payload["rows"], payload["cols"])
+
+
+class HeatmapStore:
+    """heatmap ล่าสุดของแต่ละกล้อง (อ่านจาก HTTP thread ได้)"""
+
+    def __init__(self):
+        self._latest: Dict[str, OccupancyHeatmap] = {}
+        self._lock = threading.Lock()
+
+    def put(self, camera_id: str, heatmap: OccupancyHeatmap):
+        with self._lock:
+            self._latest[camera_id] = heatmap
+
+    def get(self, camera_id: str) -> Optional[OccupancyHeatmap]:
+        with self._lock:
+            return self._latest.get(camera_id)
+
+    def camera_ids(self):
+        with self._lock:
+            return sorted(self._latest)
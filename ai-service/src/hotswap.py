@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Model Hot Swap - เปลี่ยน model / inference backend โดยไม่ restart service
+
+เดิมเปลี่ยน service.model หรือ lean_inference ต้อง restart: โหลด model ใหม่แบบ cold + warm-up
+และ window ระหว่างนั้นหายไป ที่นี่:
+
+1. โหลด model ใหม่ + warm-up ใน background thread (model เดิมยังประมวลผลต่อ)
+2. ตรวจกับ frame ล่าสุดที่ service เพิ่งวิเคราะห์ เทียบกับ model เดิม
+   (error / count ต่างกันเกิน max_count_delta / ช้ากว่าเกิน max_slowdown เท่า → ไม่สลับ)
+3. สลับ reference ของ detector ใน lock เดียว - window ที่กำลังรันใช้ detector เดิมจนจบ
+   (processor อ่าน detector ครั้งเดียวต่อ window) → สลับระหว่าง window เสมอ
+4. model เดิมเก็บไว้ได้ (keep_previous, ปิดเป็นค่า default เพราะใช้ memory 2 model) เพื่อ rollback ทันที
+"""
+import re
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+MODEL_SWAPS = None
+MODEL_SWAP_TIME = None
+
+try:
+    from prometheus_client import Counter, Histogram
+    PROMETHEUS_AVAILABLE = True
+    MODEL_SWAPS = Counter('model_swaps_total', 'Model hot swap attempts', ['outcome'])
+    MODEL_SWAP_TIME = Histogram('model_swap_seconds', 'Background load + warm-up + validation time of a hot swap',
+                                buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300))
+except ImportError:
+    pass
+
+
+@dataclass
+class HotSwapConfig:
+    """Configuration สำหรับ model hot swap"""
+    enabled: bool = True
+    validation_frames: int = 8        # frame ล่าสุดที่เก็บไว้ตรวจ model ใหม่ (1 frame ต่อ window)
+    max_count_delta: float = 0.5      # mean |count ใหม่ - เดิม| / max(1, mean count เดิม) ที่ยอมรับได้
+    max_slowdown: float = 3.0         # latency ต่อ frame ของ model ใหม่ / เดิม ที่ยอมรับได้
+    keep_previous: bool = False       # เก็บ model เดิมไว้ rollback (ใช้ memory 2 model)
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """model + backend ที่ใช้ inference"""
+    model: str
+    lean: bool = False
+    device: str = "cpu"
+    imgsz: int = 640
+
+    def describe(self) -> str:
+        return f"{self.model} ({'lean' if self.lean else 'predict'}, {self.device}, imgsz {self.imgsz})"
+
+
+class RecentFrames:
+    """frame ล่าสุดที่วิเคราะห์แล้วสำหรับตรวจ model ใหม่ (copy 1 ภาพต่อ window: buffer ของ frame ถูกใช้ซ้ำ)"""
+
+    def __init__(self, size: int):
+        self._frames: Deque[np.ndarray] = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+
+    def add(self, frames: List[np.ndarray]):
+        """เก็บ frame กลาง window (1 ภาพต่อ window)"""
+        if frames:
+            with self._lock:
+                self._frames.append(frames[len(frames) // 2].copy())
+
+    def snapshot(self) -> List[np.ndarray]:
+        with self._lock:
+            return list(self._frames)
+
+
+def compare_detectors(candidate, baseline, frames: List[np.ndarray], conf: float) -> Dict[str, Any]:
+    """
+    นับคนด้วยทั้งสอง detector บน frame เดียวกัน (สลับกันทีละ frame ให้ load ของเครื่องเท่ากัน)
+
+    แต่ละตัวถือ inference lock ของตัวเองระหว่าง forward pass: baseline กำลังใช้งานจริงอยู่ และ candidate
+    ที่ใช้ model ร่วมกับ baseline (เช่น model ใหญ่ของ cascade) ใช้ lock ตัวเดียวกับ baseline
+    จึงไม่ forward pass ซ้อนกับ window ที่กำลังรัน
+    """
+    new_counts, old_counts, new_s, old_s = [], [], 0.0, 0.0
+    for frame in frames:
+        with candidate.inference_lock.hold(priority=False):
+            t0 = time.perf_counter()
+            new_counts.append(len(candidate.detect_boxes(frame, conf, "hotswap")[0]))
+            new_s += time.perf_counter() - t0
+        with baseline.inference_lock.hold(priority=False):
+            t0 = time.perf_counter()
+            old_counts.append(len(baseline.detect_boxes(frame, conf, "hotswap")[0]))
+            old_s += time.perf_counter() - t0
+    mean_old = float(np.mean(old_counts)) if old_counts else 0.0
+    delta = float(np.mean(np.abs(np.subtract(new_counts, old_counts)))) if frames else 0.0
+    return {
+        "frames": len(frames),
+        "counts": new_counts,
+        "baseline_counts": old_counts,
+        "count_delta": round(delta / max(1.0, mean_old), 3),
+        "latency_ms": round(1000 * new_s / len(frames), 1) if frames else None,
+        "baseline_latency_ms": round(1000 * old_s / len(frames), 1) if frames else None,
+        "slowdown": round(new_s / old_s, 2) if old_s > 0 else None,
+    }
+
+
+class ModelSwapper:
+    """
+    ถือ detector ที่ใช้อยู่ + ตัวก่อนหน้า (rollback) และโหลดตัวใหม่ใน background
+
+        swapper.request(replace(swapper.spec, model="yolov8s.pt"))   # คืนทันที
+        detector = swapper.current                                    # อ่านครั้งเดียวต่อ window
+    """
+
+    def __init__(self, config: HotSwapConfig, build: Callable[[ModelSpec], Any], current: Any, spec: ModelSpec,
+                 fallback_frames: Optional[Callable[[], List[np.ndarray]]] = None):
+        self.config = config
+        self.build = build
+        self.fallback_frames = fallback_frames
+        self.recent = RecentFrames(config.validation_frames)
+        self._current, self._spec = current, spec
+        self._previous: Optional[Any] = None
+        self._previous_spec: Optional[ModelSpec] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.pending: Optional[ModelSpec] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def spec(self) -> ModelSpec:
+        return self._spec
+
+    @property
+    def busy(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def request(self, spec: ModelSpec) -> bool:
+        """เริ่มโหลด spec ใน background (False ถ้ามี swap กำลังรัน หรือ spec เดิม)"""
+        with self._lock:
+            if self.busy or spec == self._spec:
+                return False
+            self.pending = spec
+            self._thread = threading.Thread(target=self._swap, args=(spec,), name="model-swap", daemon=True)
+            self._thread.start()
+        logger.info(f"🔁 Model hot swap: loading {spec.describe()} in background "
+                    f"(still serving {self._spec.describe()})")
+        return True
+
+    def _swap(self, spec: ModelSpec):
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"spec": asdict(spec), "from": asdict(self._spec)}
+        try:
+            candidate = self.build(spec)
+            if not candidate.ready:
+                raise RuntimeError(f"model did not load: {candidate.load_error}")
+            frames = self.recent.snapshot() or (self.fallback_frames() if self.fallback_frames else [])
+            report = compare_detectors(candidate, self._current, frames, self._current.confidence)
+            result["validation"] = report
+            reason = self._reject_reason(report)
+            if reason:
+                result.update(outcome="rejected", reason=reason)
+                logger.error(f"❌ Model hot swap rejected ({reason}), keeping {self._spec.describe()}")
+            else:
+                self._commit(candidate, spec)
+                result["outcome"] = "switched"
+                logger.info(f"✅ Model hot swap: now serving {spec.describe()} "
+                            f"(Δcount {report['count_delta']}, {report['latency_ms']} ms/frame "
+                            f"vs {report['baseline_latency_ms']} ms)")
+        except Exception as e:
+            result.update(outcome="failed", reason=str(e))
+            logger.error(f"❌ Model hot swap failed: {e}, keeping {self._spec.describe()}")
+        finally:
+            elapsed = time.perf_counter() - started
+            result["seconds"] = round(elapsed, 2)
+            self.last_result = result
+            self.pending = None
+            if PROMETHEUS_AVAILABLE:
+                MODEL_SWAPS.labels(outcome=result.get("outcome", "failed")).inc()
+                MODEL_SWAP_TIME.observe(elapsed)
+
+    def _reject_reason(self, report: Dict[str, Any]) -> Optional[str]:
+        if report["frames"] == 0:
+            return None
+        if report["count_delta"] > self.config.max_count_delta:
+            return (f"counts differ by {report['count_delta']:.0%} on {report['frames']} recent frames "
+                    f"(max {self.config.max_count_delta:.0%})")
+        if report["slowdown"] is not None and report["slowdown"] > self.config.max_slowdown:
+            return f"{report['slowdown']:.1f}x slower (max {self.config.max_slowdown:g}x)"
+        return None
+
+    def _commit(self, detector: Any, spec: ModelSpec):
+        """สลับ reference (window ถัดไปได้ model ใหม่; window ที่กำลังรันใช้ตัวเดิมจนจบ)"""
+        with self._lock:
+            previous, previous_spec = self._current, self._spec
+            self._current, self._spec = detector, spec
+            if self.config.keep_previous:
+                self._previous, self._previous_spec = previous, previous_spec
+            else:
+                self._previous, self._previous_spec = None, None
+
+    def rollback(self) -> bool:
+        """กลับไปใช้ model ก่อนหน้า (ที่ยังโหลดค้างอยู่) ทันที"""
+        with self._lock:
+            if self.busy or self._previous is None:
+                return False
+            self._current, self._previous = self._previous, self._current
+            self._spec, self._previous_spec = self._previous_spec, self._spec
+        logger.warning(f"↩️ Model rollback: now serving {self._spec.describe()}")
+        self.last_result = {"outcome": "rolled_back", "spec": asdict(self._spec)}
+        if PROMETHEUS_AVAILABLE:
+            MODEL_SWAPS.labels(outcome="rolled_back").inc()
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "current": asdict(self._spec),
+            "ready": bool(self._current.ready),
+            "previous": asdict(self._previous_spec) if self._previous_spec else None,
+            "pending": asdict(self.pending) if self.pending else None,
+            "last_result": self.last_result,
+            "recent_frames": len(self.recent.snapshot()),
+        }
+
+
+def spec_with(spec: ModelSpec, **changes) -> ModelSpec:
+    """spec ใหม่จากค่าเดิม (ข้ามค่า None)"""
+    return replace(spec, **{k: v for k, v in changes.items() if v is not None})
+
+
+def model_allowed(model: str, cache_dir: Path) -> bool:
+    """
+    model ที่สั่ง swap ผ่าน HTTP ได้: ชื่อไฟล์เปล่า (เช่น yolov8s.pt - weights ของ service / cache
+    หรือดาวน์โหลดจาก hub) หรือ path ใต้ model cache dir เท่านั้น ไม่ใช่ path ใดๆ ในเครื่อง
+    """
+    if re.fullmatch(r"[A-Za-z0-9][\w.-]*", model) and ".." not in model:
+        return True
+    try:
+        Path(model).expanduser().resolve().relative_to(Path(cache_dir).expanduser().resolve())
+    except (ValueError, OSError):
+        return False
+    return True
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Lean Count-Only Inference - นับคนโดยไม่ผ่าน predictor / Results ของ ultralytics
+
+model.predict() สร้าง predictor pipeline, LetterBox ทีละภาพ, Results + Boxes ต่อ frame
+ซึ่งเป็น overhead ที่ไม่จำเป็นเมื่อต้องการแค่จำนวนคน (และ box) ต่อ frame:
+
+1. letterbox แบบเดียวกับ ultralytics (padding 114, rect ตาม stride) resize ลง canvas จาก buffer pool โดยตรง
+2. แปลง uint8 BHWC → float BCHW / 255 ลง input tensor ที่จองไว้ (ไม่ allocate ใหม่ทุก frame)
+3. forward pass ของ nn.Module ตรงๆ ใต้ torch.inference_mode()
+4. กรองเฉพาะ person (class ที่ดีที่สุดต้องเป็น person และ > conf) แล้ว NMS บน raw output
+   (infer_labeled เก็บ class อื่นที่ analytics stage ขอได้ใน forward pass เดียวกัน)
+5. คืน (xyxy, conf) เป็น NumPy หรือแค่จำนวน
+
+กฎการกรอง/NMS ตรงกับ ultralytics.utils.nms.non_max_suppression (classes=[0], iou=0.7, max_det=300)
+จึงได้จำนวนคนเท่ากับ predict — ตรวจด้วย validate_against_predict() หรือ
+
+    python src/lean.py --model yolov8n.pt --validate --bench
+"""
+import sys
+import time
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bufpool import BufferPool
+
+logger = logging.getLogger(__name__)
+
+PAD_VALUE = 114
+Detections = Tuple[np.ndarray, np.ndarray]  # xyxy (N, 4) float32, conf (N,) float32
+Labeled = Tuple[np.ndarray, np.ndarray, np.ndarray]  # + class id (N,) int64
+
+
+def letterbox_params(shape: Tuple[int, int], imgsz: int, stride: int, auto: bool) -> dict:
+    """
+    ขนาด resize + padding แบบเดียวกับ ultralytics LetterBox (scaleup, center)
+
+    auto=True = rect ขั้นต่ำที่หาร stride ลงตัว (ใช้เมื่อทุก frame ใน batch ขนาดเท่ากัน)
+    """
+    h, w = shape
+    r = min(imgsz / h, imgsz / w)
+    new_w, new_h = round(w * r), round(h * r)
+    dw, dh = imgsz - new_w, imgsz - new_h
+    if auto:
+        dw, dh = np.mod(dw, stride), np.mod(dh, stride)
+    dw, dh = dw / 2, dh / 2
+    top, bottom = round(dh - 0.1), round(dh + 0.1)
+    left, right = round(dw - 0.1), round(dw + 0.1)
+    return {
+        "new_unpad": (new_w, new_h),
+        "top": top,
+        "left": left,
+        "input_shape": (new_h + top + bottom, new_w + left + right),
+        "gain": (new_w / w, new_h / h),
+    }
+
+
+def letterbox_into(dst: np.ndarray, frame: np.ndarray, p: dict):
+    """
+    letterbox frame ลง dst (H, W, 3) ที่ใช้ซ้ำ: เขียนทุก pixel ทุกครั้ง
+
+    dst ใช้ซ้ำข้าม batch จึงมีข้อมูลเก่า - padding 4 ด้านต้องเติมใหม่ทุก call ไม่ใช่แค่ตอนจอง
+    ไม่งั้นภาพ shape ก่อนหน้าที่ได้ input shape เดียวกัน (เช่น 1280x740 แล้ว 1280x720) ค้างอยู่ในแถบ padding
+    """
+    import cv2
+
+    new_w, new_h = p["new_unpad"]
+    top, left = p["top"], p["left"]
+    if dst.shape[:2] != tuple(p["input_shape"]):
+        raise ValueError(f"letterbox canvas {dst.shape[:2]} does not match input shape {p['input_shape']}")
+    dst[:top] = PAD_VALUE
+    dst[top + new_h:] = PAD_VALUE
+    dst[top:top + new_h, :left] = PAD_VALUE
+    dst[top:top + new_h, left + new_w:] = PAD_VALUE
+    region = dst[top:top + new_h, left:left + new_w]
+    if frame.shape[1::-1] == (new_w, new_h):
+        region[...] = frame
+    else:
+        cv2.resize(frame, (new_w, new_h), dst=region, interpolation=cv2.INTER_LINEAR)
+
+
+class LeanCounter:
+    """
+    Person inference (และ class อื่นผ่าน infer_labeled) บน DetectionModel ของ ultralytics โดยตรง
+
+    uint8 canvas ยืมจาก buffer pool ต่อ batch, float input tensor cache ตาม (batch, H, W) ของ input
+    ใช้ซ้ำทุก frame; ไม่ thread-safe (PeopleDetector เรียกภายใต้ inference_lock อยู่แล้ว)
+    """
+
+    MAX_NMS = 30000  # เหมือน ultralytics: box เกินนี้ตัดด้วย conf ก่อน NMS
+    MAX_WH = 7680    # offset ต่อ class ให้ NMS ไม่ตัด box ต่าง class กัน (เหมือน ultralytics)
+
+    def __init__(self, net, device: str = "cpu", class_id: int = 0, iou: float = 0.7, max_det: int = 300,
+                 buffers: Optional[BufferPool] = None):
+        import torch
+        self.torch = torch
+        self.device = torch.device(device)
+        self.class_id = class_id
+        self.iou = iou
+        self.max_det = max_det
+        self.net = net.to(self.device).eval()
+        self.stride = int(max(int(net.stride.max()), 32)) if hasattr(net, "stride") else 32
+        self.end2end = bool(getattr(net, "end2end", False))
+        self.buffers = buffers or BufferPool("inputs")
+        self._inputs: Dict[Tuple[int, int, int], object] = {}
+        try:
+            import torchvision
+            self._nms = torchvision.ops.nms
+        except ImportError:  # fallback: greedy NMS ของ tiling (ผลเหมือนกัน ช้ากว่า)
+            self._nms = None
+
+    @classmethod
+    def from_yolo(cls, yolo, device: str = "cpu", **kwargs) -> "LeanCounter":
+        """
+        ใช้ nn.Module ของ YOLO object
+
+        ถ้าเคย predict แล้ว ใช้ module ตัวเดียวกับ predictor (fuse แล้ว, weights ชุดเดียวกันแน่นอน)
+        ไม่งั้น fuse Conv+BN เองแบบที่ predictor ทำ
+        """
+        backend = getattr(getattr(yolo, "predictor", None), "model", None)
+        native = getattr(backend, "pt", False) or getattr(backend, "format", "") == "pt"
+        net = backend.model if native else yolo.model
+        if hasattr(net, "is_fused") and not net.is_fused():
+            net = net.fuse(verbose=False)
+        return cls(net, device=device, **kwargs)
+
+    def _input(self, batch: int, shape: Tuple[int, int]):
+        key = (batch, shape[0], shape[1])
+        if key not in self._inputs:
+            torch = self.torch
+            self._inputs[key] = torch.empty((batch, 3, shape[0], shape[1]), dtype=torch.float32, device=self.device)
+        return self._inputs[key]
+
+    def preprocess(self, frames: Sequence[np.ndarray], imgsz: int):
+        """letterbox ทุก frame ลง canvas เดียว → input tensor (B, 3, H, W) float 0-1"""
+        torch = self.torch
+
+        same_shape = len({f.shape for f in frames}) == 1
+        params = [letterbox_params(f.shape[:2], imgsz, self.stride, auto=same_shape) for f in frames]
+
+        # buffer จองและเขียนใน inference mode เสมอ (inference tensor แก้ in-place นอก mode ไม่ได้)
+        with torch.inference_mode():
+            height, width = params[0]["input_shape"]
+            inp = self._input(len(frames), (height, width))
+
+            with self.buffers.lease((len(frames), height, width, 3)) as canvas:
+                for i, (frame, p) in enumerate(zip(frames, params)):
+                    letterbox_into(canvas[i], frame, p)
+
+                # uint8 → device ก่อน แล้ว BHWC→BCHW, BGR→RGB, /255 ลง tensor ที่จองไว้ (เหมือน predictor)
+                im = torch.from_numpy(canvas).to(self.device).permute(0, 3, 1, 2).flip(1)
+                inp.copy_(im)
+            inp.div_(255)
+        return inp, params
+
+    def infer(self, frames: Sequence[np.ndarray], conf: float, imgsz: int = 640,
+              return_boxes: bool = True) -> List[Detections]:
+        """
+        Forward pass เดียวของทั้ง batch คืน (xyxy, conf) ของคนต่อ frame
+
+        return_boxes=False ข้ามการแปลง box กลับเป็นพิกัดภาพเต็ม (xyxy คืนเป็น shape (N, 0))
+        """
+        return [(xyxy, scores) for xyxy, scores, _ in
+                self.infer_labeled(frames, conf, imgsz, (self.class_id,), return_boxes)]
+
+    def infer_labeled(self, frames: Sequence[np.ndarray], conf: float, imgsz: int = 640,
+                      classes: Optional[Sequence[int]] = None, return_boxes: bool = True) -> List[Labeled]:
+        """
+        เหมือน infer แต่เก็บทุก class ใน classes (default = person) คืน (xyxy, conf, cls) ต่อ frame
+
+        NMS แยกตาม class (offset box ด้วย class * MAX_WH แบบ ultralytics) จึงได้ box ของคน
+        เท่ากับตอนกรอง person อย่างเดียว
+        """
+        if not frames:
+            return []
+        torch = self.torch
+        with torch.inference_mode():
+            wanted = torch.tensor(list(classes or (self.class_id,)), device=self.device)
+            inp, params = self.preprocess(frames, imgsz)
+            out = self.net(inp)
+            preds = out[0] if isinstance(out, (list, tuple)) else out
+            return [self._postprocess(preds[i], frame.shape[:2], p, conf, wanted, return_boxes)
+                    for i, (frame, p) in enumerate(zip(frames, params))]
+
+    def count(self, frames: Sequence[np.ndarray], conf: float, imgsz: int = 640) -> List[int]:
+        """จำนวนคนต่อ frame (ไม่แปลง box)"""
+        return [len(scores) for _, scores in self.infer(frames, conf, imgsz, return_boxes=False)]
+
+    def _postprocess(self, pred, shape: Tuple[int, int], p: dict, conf: float, wanted,
+                     return_boxes: bool) -> Labeled:
+        torch = self.torch
+        if self.end2end:
+            # (max_det, 6): x1, y1, x2, y2, conf, cls — head ทำ NMS มาแล้ว
+            keep = (pred[:, 4] > conf) & torch.isin(pred[:, 5].long(), wanted)
+            boxes, scores, cls = pred[keep, :4], pred[keep, 4], pred[keep, 5].long()
+        else:
+            # (4 + nc, N): xywh + class scores; class ที่ดีที่สุดของ box ต้องอยู่ใน classes ที่ต้องการ
+            best, best_cls = pred[4:].max(0)
+            keep = torch.nonzero((best > conf) & torch.isin(best_cls, wanted)).view(-1)
+            if keep.numel() == 0:
+                return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+            scores, cls = best[keep], best_cls[keep]
+            if keep.numel() > self.MAX_NMS:
+                order = scores.argsort(descending=True)[:self.MAX_NMS]
+                keep, scores, cls = keep[order], scores[order], cls[order]
+            xywh = pred[:4, keep].T
+            boxes = torch.cat((xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2), 1)
+            idx = self._suppress(boxes + cls[:, None] * self.MAX_WH, scores)
+            boxes, scores, cls = boxes[idx], scores[idx], cls[idx]
+
+        scores = scores.float().cpu().numpy()
+        cls = cls.cpu().numpy().astype(np.int64)
+        if not return_boxes:
+            return np.empty((len(scores), 0), dtype=np.float32), scores, cls
+
+        xyxy = boxes.float().cpu().numpy()
+        gain_x, gain_y = p["gain"]
+        xyxy -= np.array([p["left"], p["top"], p["left"], p["top"]], dtype=np.float32)
+        xyxy /= np.array([gain_x, gain_y, gain_x, gain_y], dtype=np.float32)
+        h, w = shape
+        np.clip(xyxy[:, 0::2], 0, w, out=xyxy[:, 0::2])
+        np.clip(xyxy[:, 1::2], 0, h, out=xyxy[:, 1::2])
+        return xyxy, scores, cls
+
+    def _suppress(self, boxes, scores):
+        """index ของ box ที่เหลือหลัง NMS (เรียงตาม score) ไม่เกิน max_det"""
+        if self._nms is not None:
+            return self._nms(boxes, scores, self.iou)[:self.max_det]
+        from tiling import nms
+        idx = nms(boxes.cpu().numpy(), scores.cpu().numpy(), self.iou, metric="iou")[:self.max_det]
+        return self.torch.as_tensor(idx, dtype=self.torch.long, device=boxes.device)
+
+
+def predict_counts(yolo, frames: Sequence[np.ndarray], conf: float, imgsz: int, device: str,
+                   class_id: int = 0) -> List[int]:
+    """จำนวนคนจาก model.predict (reference)"""
+    results = yolo.predict(list(frames), device=device, conf=conf, imgsz=imgsz, classes=[class_id], verbose=False)
+    return [len(r.boxes) if r.boxes is not None else 0 for r in results]
+
+
+def validate_against_predict(lean: LeanCounter, yolo, frames: Sequence[np.ndarray],
+                             confidences: Sequence[float], imgsz: int, device: str) -> List[dict]:
+    """
+    เทียบจำนวนคนของ lean path กับ predict ทีละ frame ทีละ confidence
+
+    คืนรายการที่ไม่ตรงกัน (ว่าง = ผ่าน)
+    """
+    mismatches = []
+    for conf in confidences:
+        expected = [predict_counts(yolo, [f], conf, imgsz, device, lean.class_id)[0] for f in frames]
+        got = [lean.count([f], conf, imgsz)[0] for f in frames]
+        got_batch = lean.count(frames, conf, imgsz)
+        for i, (e, g, gb) in enumerate(zip(expected, got, got_batch)):
+            if e != g or (len({f.shape for f in frames}) == 1 and e != gb):
+                mismatches.append({"frame": i, "conf": conf, "predict": e, "lean": g, "lean_batch": gb})
+    return mismatches
+
+
+def benchmark(lean: LeanCounter, yolo, frames: Sequence[np.ndarray], conf: float, imgsz: int, device: str,
+              iterations: int = 10) -> dict:
+    """
+    ms ต่อ frame (median) ของ predict, lean และ forward pass อย่างเดียว
+
+    สลับลำดับทุกรอบ ไม่ให้ CPU throttling / cache ลำเอียงไปทางใดทางหนึ่ง
+    ส่วนต่างจาก forward คือ overhead ของ pre/post-process ที่แต่ละทางจ่าย
+    """
+    torch = lean.torch
+
+    def run_predict(frame):
+        predict_counts(yolo, [frame], conf, imgsz, device, lean.class_id)
+
+    def run_lean(frame):
+        lean.count([frame], conf, imgsz)
+
+    def run_forward(frame):
+        with torch.inference_mode():
+            inp, _ = lean.preprocess([frame], imgsz)
+            lean.net(inp)
+
+    runs = [("predict", run_predict), ("lean", run_lean), ("forward", run_forward)]
+    samples: Dict[str, List[float]] = {name: [] for name, _ in runs}
+    for _, fn in runs:
+        fn(frames[0])  # warm-up
+    for i in range(iterations):
+        for frame in frames:
+            order = runs[i % len(runs):] + runs[:i % len(runs)]
+            for name, fn in order:
+                t0 = time.perf_counter()
+                fn(frame)
+                samples[name].append((time.perf_counter() - t0) * 1000)
+
+    predict_ms, lean_ms, forward_ms = (float(np.median(samples[name])) for name, _ in runs)
+    return {
+        "predict_ms": round(predict_ms, 2),
+        "lean_ms": round(lean_ms, 2),
+        "forward_ms": round(forward_ms, 2),
+        "saved_ms": round(predict_ms - lean_ms, 2),
+        "predict_overhead_ms": round(predict_ms - forward_ms, 2),
+        "lean_overhead_ms": round(lean_ms - forward_ms, 2),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description="Validate / benchmark the lean count-only inference path")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--images", default="", help="folder of sample frames (default: ultralytics assets)")
+    parser.add_argument("--conf", type=float, nargs="+", default=[0.25, 0.4, 0.6])
+    parser.add_argument("--validate", action="store_true")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from ultralytics import YOLO
+    from autotune import sample_frames
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    yolo = YOLO(args.model)
+    frames = sample_frames(args.images, count=4)
+    predict_counts(yolo, frames[:1], args.conf[0], args.imgsz, args.device)  # สร้าง predictor (fuse) ก่อน
+    lean = LeanCounter.from_yolo(yolo, device=args.device)
+
+    status = 0
+    if args.validate or not args.bench:
+        mismatches = validate_against_predict(lean, yolo, frames, args.conf, args.imgsz, args.device)
+        if mismatches:
+            status = 1
+            for m in mismatches:
+                logger.info(f"❌ frame {m['frame']} conf={m['conf']}: predict={m['predict']} "
+                            f"lean={m['lean']} lean_batch={m['lean_batch']}")
+        else:
+            logger.info(f"✅ Lean counts identical to predict ({len(frames)} frames x {len(args.conf)} thresholds)")
+    if args.bench:
+        b = benchmark(lean, yolo, frames, args.conf[0], args.imgsz, args.device, args.iterations)
+        logger.info(f"⏱️  per frame: predict {b['predict_ms']:.1f} ms, lean {b['lean_ms']:.1f} ms "
+                    f"(forward {b['forward_ms']:.1f} ms) → saved {b['saved_ms']:.1f} ms")
+        logger.info(f"   overhead outside forward: predict {b['predict_overhead_ms']:.1f} ms, "
+                    f"lean {b['lean_overhead_ms']:.1f} ms")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,21 +18,51 @@ rtsp://user:pass@ip:554/Streaming/tracks/201?starttime=YYYYMMDDtHHMMSSz&endtime=
 
 import os
 import sys
+import hmac
 import time
+import shutil
 import signal
 import logging
+import importlib
+import threading
 import subprocess
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
+from functools import partial
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Optional, Any
-from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Any, Sequence, Tuple, Callable
+from dataclasses import dataclass, field, asdict, replace
 from pathlib import Path
 
 import yaml
-import cv2
 import numpy as np
 import requests
-from ultralytics import YOLO
+
+import health
+from resources import (
+    ResourceConfig, ResourcePlan, StageMeter,
+    plan_resources, apply_process_plan, apply_torch_plan, pin_current_thread, log_plan
+)
+from snapshots import AsyncSnapshotPoller, SnapshotSource, decode_jpeg_scaled
+from mjpeg import available_reader, read_mjpeg_frames
+from tiling import TilingConfig, make_tiles, nms, seam_boxes
+from windows import RollingAggregator, RollupResult, align_floor, grid_windows
+from ondemand import OnDemandConfig, OnDemandCounter, PriorityLock
+from heatmap import HeatmapConfig, HeatmapStore, OccupancyHeatmap
+from breaker import BreakerConfig, CameraBreakers, CLOSED
+from sources import CameraView, SourceGroup, group_cameras
+from autotune import AutotuneConfig, Autotuner, TuneResult, hardware_fingerprint, sample_frames
+from lean import Detections, Labeled, LeanCounter, validate_against_predict
+from framestore import FrameStore, FrameStoreConfig, to_epoch
+from analytics import AnalyticsConfig, AnalyticsPipeline, FrameContext, WindowAnalytics
+from membudget import FrameBudget, FrameLease, MemoryBudgetConfig, frames_nbytes
+from alerts import AlertSender, CrowdAlertConfig, CrowdAlertMonitor
+from hotswap import HotSwapConfig, ModelSpec, ModelSwapper, model_allowed, spec_with
+from decoders import DecoderPool, DecoderWorkerConfig
+from sampling import AdaptiveSamplingConfig, SequentialEstimate, WindowFeed
+from bufpool import BufferPool, BufferPoolConfig
+from detlog import DetectionLog, DetectionLogConfig, FrameDetections, WindowDetections
 
 # Prometheus metrics (optional)
 PROMETHEUS_AVAILABLE = False
@@ -45,6 +75,14 @@ PLAYBACK_FETCH_TIME = None
 INFERENCE_TIME = None
 ERRORS_TOTAL = None
 BACKEND_SEND_TIME = None
+TILED_FRAMES = None
+CASCADE_FRAMES = None
+CASCADE_ESCALATIONS = None
+CASCADE_ESCALATION_RATE = None
+WINDOWS_SKIPPED = None
+PEOPLE_ROLLUP_MAX = None
+PEOPLE_ROLLUP_AVG = None
+SAMPLING_FRAMES = None
 start_http_server = None
 
 try:
@@ -60,6 +98,14 @@ try:
     INFERENCE_TIME = Histogram('inference_seconds', 'YOLOv8 inference time per frame', ['camera_id'])
     ERRORS_TOTAL = Counter('errors_total', 'Total errors', ['camera_id', 'error_type'])
     BACKEND_SEND_TIME = Histogram('backend_send_seconds', 'Time to send data to backend', ['camera_id'])
+    TILED_FRAMES = Counter('tiled_frames_total', 'Frames re-inferred with tiled (sliced) inference', ['camera_id'])
+    CASCADE_FRAMES = Counter('cascade_frames_total', 'Frames seen by the fast cascade model', ['camera_id'])
+    CASCADE_ESCALATIONS = Counter('cascade_escalations_total', 'Frames escalated to the accurate model', ['camera_id', 'reason'])
+    CASCADE_ESCALATION_RATE = Gauge('cascade_escalation_rate', 'Share of frames escalated to the accurate model', ['camera_id'])
+    WINDOWS_SKIPPED = Counter('windows_skipped_total', 'Grid windows not analyzed in continuous mode', ['camera_id', 'reason'])
+    PEOPLE_ROLLUP_MAX = Gauge('people_rollup_max', 'Max people in rolled-up window', ['camera_id', 'period_minutes'])
+    PEOPLE_ROLLUP_AVG = Gauge('people_rollup_avg', 'Average people in rolled-up window', ['camera_id', 'period_minutes'])
+    SAMPLING_FRAMES = Counter('adaptive_sampling_frames_total', 'Frames planned vs used under adaptive sampling', ['camera_id', 'kind'])
 except ImportError:
     pass
 
@@ -71,6 +117,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ==================== Lazy Heavy Imports ====================
+class _LazyModule:
+    """
+    Proxy ที่ import module หนักๆ (cv2, ultralytics/torch) ตอนใช้งานครั้งแรก
+
+    ทำให้ service เริ่มได้ทันที (โหลด config, เปิด health server, เริ่ม fetch)
+    โดยไม่ต้องรอ import หลายวินาทีตอน startup
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    self._module = importlib.import_module(self._name)
+                    logger.info(f"📦 Imported {self._name} in {time.perf_counter() - start:.2f}s")
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+
+cv2 = _LazyModule("cv2")
+_torch = _LazyModule("torch")
+_ultralytics = _LazyModule("ultralytics")
+
+
+# ==================== Startup Timing ====================
+class StartupTimer:
+    """จับเวลาแต่ละ phase ตอน startup แล้ว log + รายงานผ่าน health server"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = round(elapsed, 3)
+            health.record_startup_phase(name, elapsed)
+            logger.info(f"⏱️ Startup phase '{name}': {elapsed:.2f}s "
+                        f"(total {time.perf_counter() - self.started_at:.2f}s)")
+
+
 # ==================== Data Classes ====================
 @dataclass
 class PlaybackConfig:
@@ -83,6 +182,22 @@ class PlaybackConfig:
     sampling_fps: float = 1.0
     timeout_seconds: int = 120
     verify_ssl: bool = False
+    acquisition_mode: str = "stream"  # "stream" | "snapshot" | "auto" (snapshot เมื่อ sampling_fps ≤ 1)
+    max_frames: int = 60  # จำนวน frame สูงสุดต่อ window
+    continuous: bool = False  # window ต่อเนื่องบน clock grid (ไม่มีช่องว่าง ไม่อ่านซ้ำ)
+    rollup_minutes: List[int] = field(default_factory=lambda: [5, 15])
+    max_catchup_windows: int = 10  # จำนวน window ค้างสูงสุดต่อกล้องต่อรอบ
+    ingest: str = "ts"  # "ts" (decode H.264 เอง) | "mjpeg" (go2rtc แปลงเป็น JPEG ฝั่ง server)
+    mjpeg_fps: float = 0.0  # fps ที่ขอจาก go2rtc (0 = sampling_fps)
+    mjpeg_width: int = 0  # ให้ go2rtc ย่อภาพเหลือกว้างเท่านี้ (0 = ขนาดเดิม)
+
+
+@dataclass
+class HikvisionConfig:
+    """Configuration สำหรับ Hikvision ISAPI snapshot"""
+    enabled: bool = False
+    timeout: int = 10
+    verify_ssl: bool = False
 
 
 @dataclass
@@ -97,6 +212,10 @@ class CameraConfig:
     confidence: float = 0.4
     enabled: bool = True
     rtsp_url: str = ""  # RTSP URL ที่ register ไว้ใน go2rtc (optional)
+    snapshot_url: str = ""  # Hikvision ISAPI /picture endpoint (optional)
+    snapshot_username: str = ""
+    snapshot_password: str = ""
+    roi: List[List[float]] = field(default_factory=list)  # polygon [[x, y], ...] normalized 0-1 (ว่าง = ทั้งภาพ)
 
 
 @dataclass
@@ -105,9 +224,27 @@ class ServiceConfig:
     model: str = "yolov8n.pt"
     device: str = "cpu"
     confidence: float = 0.4
+    imgsz: int = 640  # ขนาด input ของ model
+    batch_size: int = 1  # จำนวน frame ต่อ forward pass
+    lean_inference: bool = False  # นับคนผ่าน forward pass ตรง ไม่สร้าง Results ของ ultralytics
     backend_endpoint: str = ""
     backend_api_key: str = ""
-    metrics_port: int = 8080
+    metrics_port: int = 8080  # 0 = ให้ health server ตอบ /metrics (เมื่อชนกับ health_port)
+    health_port: int = 8081
+    model_cache_dir: str = "~/.cache/ultralytics"  # เก็บ weights ไว้ใช้ซ้ำ ไม่ต้องดาวน์โหลดใหม่
+    background_warmup: bool = True  # warm-up model ใน background ระหว่างเริ่ม fetch รอบแรก
+
+
+@dataclass
+class CascadeConfig:
+    """Configuration สำหรับ model cascade (model เล็กทุก frame → model ใหญ่เฉพาะ frame ที่ไม่แน่ใจ)"""
+    enabled: bool = False
+    model: str = "yolov8s.pt"          # model ใหญ่สำหรับ frame ที่ escalate
+    low_margin: float = 0.15           # box ที่ conf < threshold + low_margin ถือว่าไม่แน่ใจ
+    min_low_margin_boxes: int = 3      # จำนวน box ไม่แน่ใจที่ทำให้ escalate
+    alert_thresholds: List[int] = field(default_factory=lambda: [50])
+    alert_margin: int = 5              # count ห่างจาก alert threshold ไม่เกินนี้ → escalate
+    disagreement: int = 5              # count ต่างจาก frame ก่อนหน้าเกินนี้ → escalate
 
 
 @dataclass
@@ -123,6 +260,15 @@ class WindowResult:
     sampling_fps: float = 1.0
     source_type: str = "playback"
     frame_counts: List[int] = field(default_factory=list)
+    heatmap: Optional[OccupancyHeatmap] = None
+    analytics: Dict[str, Any] = field(default_factory=dict)  # field จาก analytics stages (รวมเข้า payload)
+    sampling: Dict[str, Any] = field(default_factory=dict)  # frame ที่ใช้ + error bound ของ adaptive sampling
+    coverage: float = 1.0  # สัดส่วนของ window ที่ frame ครอบคลุมจริง (fetch ถูกตัด → เฉพาะช่วงต้น window)
+    covered_end: Optional[datetime] = None  # เวลาสุดท้ายที่ frame ครอบคลุม (None = ถึง window_end)
+
+
+# frame ที่ fetcher เก็บ → False = หยุดดึง window นี้
+FrameCallback = Callable[[np.ndarray], bool]
 
 
 # ==================== Configuration Loader ====================
@@ -161,12 +307,26 @@ class ConfigLoader:
     def get_service_config(self) -> ServiceConfig:
         """Get service configuration"""
         svc = self.raw_config.get('service', {})
+        health_port = int(os.environ.get('PORT', svc.get('health_port', 8081)))
+        metrics_port = int(svc.get('metrics_port', 8080))
+        if metrics_port == health_port:
+            # Railway ตั้ง PORT เป็น 8080 บ่อย: health server bind ก่อน → metrics server ขึ้นไม่ได้
+            logger.warning(f"⚠️ metrics_port {metrics_port} is the health server port (PORT): "
+                           f"serving /metrics from the health server instead")
+            metrics_port = 0
         return ServiceConfig(
-            model=svc.get('model', 'yolov8n.pt'),
-            device=svc.get('device', 'cpu'),
+            model=os.environ.get('MODEL_PATH', svc.get('model', 'yolov8n.pt')),
+            device=os.environ.get('DEVICE', svc.get('device', 'cpu')),
             confidence=svc.get('confidence', 0.4),
+            imgsz=svc.get('imgsz', 640),
+            batch_size=svc.get('batch_size', 1),
+            lean_inference=svc.get('lean_inference', False) or os.environ.get('LEAN_INFERENCE', '').lower() in ('1', 'true'),
             backend_endpoint=svc.get('backend_endpoint', ''),
-            backend_api_key=svc.get('backend_api_key', '')
+            backend_api_key=svc.get('backend_api_key', ''),
+            metrics_port=metrics_port,
+            health_port=health_port,
+            model_cache_dir=os.environ.get('MODEL_CACHE_DIR', svc.get('model_cache_dir', '~/.cache/ultralytics')),
+            background_warmup=svc.get('background_warmup', True)
         )
     
     def get_playback_config(self) -> PlaybackConfig:
@@ -180,7 +340,226 @@ class ConfigLoader:
             interval_minutes=pb.get('interval_minutes', 5),
             sampling_fps=pb.get('sampling_fps', 1.0),
             timeout_seconds=pb.get('timeout_seconds', 120),
-            verify_ssl=pb.get('verify_ssl', False)
+            verify_ssl=pb.get('verify_ssl', False),
+            acquisition_mode=pb.get('acquisition_mode', 'stream'),
+            max_frames=pb.get('max_frames', 60),
+            continuous=pb.get('continuous', False),
+            rollup_minutes=list(pb.get('rollup_minutes', [5, 15])),
+            max_catchup_windows=pb.get('max_catchup_windows', 10),
+            ingest=pb.get('ingest', 'ts'),
+            mjpeg_fps=pb.get('mjpeg_fps', 0.0),
+            mjpeg_width=pb.get('mjpeg_width', 0)
+        )
+    
+    def get_tiling_config(self) -> TilingConfig:
+        """Get adaptive tiling configuration"""
+        tl = self.raw_config.get('tiling', {})
+        return TilingConfig(
+            enabled=tl.get('enabled', False),
+            density_threshold=tl.get('density_threshold', 30),
+            tile_size=tl.get('tile_size', 640),
+            overlap=tl.get('overlap', 0.2),
+            max_tiles=tl.get('max_tiles', 16),
+            nms_iou=tl.get('nms_iou', 0.5),
+            seam_ios=tl.get('seam_ios', 0.5),
+            seam_margin=tl.get('seam_margin', 4)
+        )
+    
+    def get_cascade_config(self) -> CascadeConfig:
+        """Get model cascade configuration"""
+        cc = self.raw_config.get('cascade', {})
+        return CascadeConfig(
+            enabled=cc.get('enabled', False),
+            model=cc.get('model', 'yolov8s.pt'),
+            low_margin=cc.get('low_margin', 0.15),
+            min_low_margin_boxes=cc.get('min_low_margin_boxes', 3),
+            alert_thresholds=list(cc.get('alert_thresholds', [50])),
+            alert_margin=cc.get('alert_margin', 5),
+            disagreement=cc.get('disagreement', 5)
+        )
+    
+    def get_ondemand_config(self) -> OnDemandConfig:
+        """Get on-demand count API configuration"""
+        od = self.raw_config.get('ondemand', {})
+        return OnDemandConfig(
+            enabled=od.get('enabled', True),
+            cache_ttl_s=od.get('cache_ttl_s', 10.0),
+            timeout_s=od.get('timeout_s', 30.0),
+            api_key=os.environ.get('ONDEMAND_API_KEY', od.get('api_key', ''))
+        )
+    
+    def get_heatmap_config(self) -> HeatmapConfig:
+        """Get occupancy heatmap configuration"""
+        hm = self.raw_config.get('heatmap', {})
+        return HeatmapConfig(
+            enabled=hm.get('enabled', False),
+            grid_width=hm.get('grid_width', 32),
+            grid_height=hm.get('grid_height', 18),
+            send=hm.get('send', True)
+        )
+    
+    def get_frame_store_config(self) -> FrameStoreConfig:
+        """Get on-disk frame ring buffer configuration"""
+        fs = self.raw_config.get('frame_store', {})
+        return FrameStoreConfig(
+            enabled=fs.get('enabled', False),
+            directory=os.environ.get('FRAME_STORE_DIR', fs.get('directory', '~/.cache/forlp/frames')),
+            retention_hours=fs.get('retention_hours', 6),
+            max_frames_per_camera=fs.get('max_frames_per_camera', 0),
+            frame_width=fs.get('frame_width', 640),
+            frame_height=fs.get('frame_height', 360)
+        )
+    
+    def get_analytics_config(self) -> AnalyticsConfig:
+        """Get analytics stages configuration"""
+        an = self.raw_config.get('analytics', {})
+        vehicles = an.get('vehicles', {})
+        occupancy = an.get('occupancy', {})
+        dwell = an.get('dwell', {})
+        defaults = AnalyticsConfig()
+        return AnalyticsConfig(
+            stages=list(an.get('stages') or []),
+            vehicle_classes={int(k): str(v) for k, v in (vehicles.get('classes') or defaults.vehicle_classes).items()},
+            vehicle_confidence=vehicles.get('confidence', 0.4),
+            capacity={str(k): int(v) for k, v in (occupancy.get('capacity') or {}).items()},
+            default_capacity=occupancy.get('default_capacity', 0),
+            dwell_match_distance=dwell.get('match_distance', 0.08),
+            dwell_max_gap_s=dwell.get('max_gap_s', 10),
+            dwell_min_frames=dwell.get('min_frames', 2)
+        )
+    
+    def get_memory_budget_config(self) -> MemoryBudgetConfig:
+        """Get frame memory budget configuration (env FRAME_MEMORY_BUDGET_MB)"""
+        mb = self.raw_config.get('memory_budget', {})
+        return MemoryBudgetConfig(
+            enabled=mb.get('enabled', True),
+            budget_mb=float(os.environ.get('FRAME_MEMORY_BUDGET_MB', mb.get('budget_mb', 0))),
+            fraction=mb.get('fraction', 0.35),
+            wait_timeout_s=mb.get('wait_timeout_s', 600)
+        )
+    
+    def get_crowd_alert_config(self) -> CrowdAlertConfig:
+        """Get crowd alert fast path configuration"""
+        ca = self.raw_config.get('crowd_alerts', {})
+        return CrowdAlertConfig(
+            enabled=ca.get('enabled', False),
+            warning=ca.get('warning', 0),
+            critical=ca.get('critical', 0),
+            cameras={str(cam): dict(levels or {}) for cam, levels in (ca.get('cameras') or {}).items()},
+            hysteresis=ca.get('hysteresis', 0.1),
+            min_duration_s=ca.get('min_duration_s', 10),
+            clear_duration_s=ca.get('clear_duration_s', 30),
+            max_gap_s=ca.get('max_gap_s', 60),
+            endpoint=ca.get('endpoint', ''),
+            timeout_s=ca.get('timeout_s', 5),
+            retries=ca.get('retries', 3),
+            queue_size=ca.get('queue_size', 256)
+        )
+    
+    def get_hot_swap_config(self) -> HotSwapConfig:
+        """Get model hot swap configuration"""
+        hs = self.raw_config.get('hot_swap', {})
+        return HotSwapConfig(
+            enabled=hs.get('enabled', True),
+            validation_frames=hs.get('validation_frames', 8),
+            max_count_delta=hs.get('max_count_delta', 0.5),
+            max_slowdown=hs.get('max_slowdown', 3.0),
+            keep_previous=hs.get('keep_previous', False)
+        )
+    
+    def get_decoder_worker_config(self) -> DecoderWorkerConfig:
+        """Get supervised decoder worker configuration"""
+        dw = self.raw_config.get('decoder_workers', {})
+        return DecoderWorkerConfig(
+            enabled=dw.get('enabled', True),
+            read_deadline_s=dw.get('read_deadline_s', 30),
+            max_windows=dw.get('max_windows', 50),
+            max_rss_mb=dw.get('max_rss_mb', 1024),
+            retries=dw.get('retries', 1)
+        )
+    
+    def get_buffer_pool_config(self) -> BufferPoolConfig:
+        """Get frame / model input buffer pool configuration"""
+        bp = self.raw_config.get('buffer_pool', {})
+        return BufferPoolConfig(
+            enabled=bp.get('enabled', True),
+            max_free_mb=bp.get('max_free_mb', 256.0)
+        )
+    
+    def get_detection_log_config(self) -> DetectionLogConfig:
+        """Get columnar detection log configuration (env DETECTION_LOG_DIR)"""
+        dl = self.raw_config.get('detection_log', {})
+        return DetectionLogConfig(
+            enabled=dl.get('enabled', False),
+            directory=os.environ.get('DETECTION_LOG_DIR', dl.get('directory', '~/.cache/forlp/detections')),
+            format=dl.get('format', 'npz'),
+            retention_hours=dl.get('retention_hours', 168),
+            queue_windows=dl.get('queue_windows', 256)
+        )
+    
+    def get_adaptive_sampling_config(self) -> AdaptiveSamplingConfig:
+        """Get adaptive sampling (per-window early stopping) configuration"""
+        ad = self.raw_config.get('adaptive_sampling', {})
+        return AdaptiveSamplingConfig(
+            enabled=ad.get('enabled', False),
+            confidence=ad.get('confidence', 0.9),
+            abs_error=ad.get('abs_error', 0.5),
+            rel_error=ad.get('rel_error', 0.1),
+            min_frames=ad.get('min_frames', 8),
+            max_frames=ad.get('max_frames', 120),
+            batch_frames=ad.get('batch_frames', 0)
+        )
+    
+    def get_autotune_config(self) -> AutotuneConfig:
+        """Get startup autotune configuration (env AUTOTUNE=1 เปิด, AUTOTUNE=force sweep ใหม่)"""
+        at = self.raw_config.get('autotune', {})
+        env = os.environ.get('AUTOTUNE', '').lower()
+        return AutotuneConfig(
+            enabled=at.get('enabled', False) or env in ('1', 'true', 'force'),
+            imgsz=list(at.get('imgsz', [640])),
+            batch_sizes=list(at.get('batch_sizes', [1, 2, 4, 8])),
+            threads=at.get('threads', 'auto'),
+            max_batch_latency_ms=at.get('max_batch_latency_ms', 2000),
+            max_memory_mb=at.get('max_memory_mb', 0),
+            iterations=at.get('iterations', 5),
+            sample_dir=at.get('sample_dir', ''),
+            cache_path=at.get('cache_path', '~/.cache/ultralytics/autotune.json'),
+            force=env == 'force'
+        )
+    
+    def get_breaker_config(self) -> BreakerConfig:
+        """Get per-camera circuit breaker configuration"""
+        cb = self.raw_config.get('circuit_breaker', {})
+        return BreakerConfig(
+            enabled=cb.get('enabled', True),
+            failure_threshold=cb.get('failure_threshold', 2),
+            open_seconds=cb.get('open_seconds', 300),
+            max_open_seconds=cb.get('max_open_seconds', 1800),
+            probe=cb.get('probe', 'snapshot'),
+            probe_timeout=cb.get('probe_timeout', 5),
+            probe_workers=cb.get('probe_workers', 8),
+            report_status=cb.get('report_status', True)
+        )
+    
+    def get_hikvision_config(self) -> HikvisionConfig:
+        """Get Hikvision ISAPI configuration"""
+        hik = self.raw_config.get('hikvision', {})
+        return HikvisionConfig(
+            enabled=hik.get('enabled', False),
+            timeout=hik.get('timeout', 10),
+            verify_ssl=hik.get('verify_ssl', False)
+        )
+    
+    def get_resource_config(self) -> ResourceConfig:
+        """Get CPU resource planning configuration"""
+        res = self.raw_config.get('resources', {})
+        return ResourceConfig(
+            enabled=res.get('enabled', True),
+            decode_workers=res.get('decode_workers', 'auto'),
+            decode_threads=res.get('decode_threads', 1),
+            inference_threads=res.get('inference_threads', 'auto'),
+            reserve_cores=res.get('reserve_cores', 0),
+            pin_cpus=res.get('pin_cpus', False)
         )
     
     def get_cameras(self) -> List[CameraConfig]:
@@ -198,7 +577,12 @@ class ConfigLoader:
                     rtsp_password=cam.get('rtsp_password', ''),
                     track_id=str(cam.get('track_id', '201')),
                     confidence=cam.get('confidence', 0.4),
-                    enabled=cam.get('enabled', True)
+                    enabled=cam.get('enabled', True),
+                    rtsp_url=cam.get('rtsp_url', ''),
+                    snapshot_url=cam.get('snapshot_url', ''),
+                    snapshot_username=cam.get('snapshot_auth', {}).get('username', cam.get('rtsp_username', 'admin')),
+                    snapshot_password=cam.get('snapshot_auth', {}).get('password', cam.get('rtsp_password', '')),
+                    roi=cam.get('roi', [])
                 ))
         
         # Fallback: Load from 'streams' section
@@ -213,7 +597,12 @@ class ConfigLoader:
                         rtsp_username=self._extract_user_from_rtsp(rtsp_url),
                         rtsp_password=self._extract_pass_from_rtsp(rtsp_url),
                         track_id=self._extract_track_from_rtsp(rtsp_url),
-                        confidence=stream.get('confidence', 0.4)
+                        confidence=stream.get('confidence', 0.4),
+                        rtsp_url=rtsp_url,
+                        snapshot_url=stream.get('snapshot_url', ''),
+                        snapshot_username=stream.get('snapshot_auth', {}).get('username', ''),
+                        snapshot_password=stream.get('snapshot_auth', {}).get('password', ''),
+                        roi=stream.get('roi', [])
                     ))
         
         return cameras
@@ -267,11 +656,33 @@ class PlaybackFetcher:
     2. ดึงหลาย frames ตาม sampling rate
     """
     
-    def __init__(self, config: PlaybackConfig):
+    def __init__(self, config: PlaybackConfig, hikvision: Optional[HikvisionConfig] = None,
+                 target_size: int = 640, buffers: Optional[BufferPool] = None):
         self.config = config
+        self.hikvision = hikvision or HikvisionConfig()
+        self.target_size = target_size
         self.base_url = config.go2rtc_base_url.rstrip('/')
         self.session = requests.Session()
         self.session.verify = config.verify_ssl
+        # เรียกหลัง read สำเร็จทุกครั้ง (decode worker ใช้เป็น heartbeat ของ watchdog)
+        self.progress: Optional[Callable[[], None]] = None
+        # frame ที่เก็บ decode ลง buffer ของ pool (ผู้ใช้ frame คืนเมื่อจบ window)
+        self.buffers = buffers or BufferPool("frames", BufferPoolConfig(enabled=False))
+    
+    def _progress(self):
+        if self.progress is not None:
+            self.progress()
+    
+    def _retrieve(self, cap, buffer: Optional[np.ndarray]) -> Tuple[bool, Optional[np.ndarray]]:
+        """decode frame ที่ grab ไว้เป็น BGR ลง buffer (OpenCV จองใหม่เองถ้า shape ไม่ตรง → คืน buffer)"""
+        ret, frame = cap.retrieve(buffer) if buffer is not None else cap.retrieve()
+        if buffer is not None and frame is not buffer:
+            self.buffers.release([buffer])
+        return ret, frame
+    
+    def release_frames(self, frames: List[np.ndarray]):
+        """คืน frame ที่ fetch_frames ส่งออกไปให้ pool (ผู้เรียกต้องไม่ใช้ frame นั้นต่อ)"""
+        self.buffers.release(frames)
     
     def build_playback_rtsp_url(self, camera: CameraConfig, start_time: datetime, end_time: datetime) -> str:
         """
@@ -323,10 +734,8 @@ class PlaybackFetcher:
             response = self.session.get(snapshot_url, timeout=15)
             
             if response.status_code == 200:
-                # Decode JPEG to numpy array
-                img_array = np.frombuffer(response.content, dtype=np.uint8)
-                frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-                return frame
+                # Decode JPEG ลดขนาดให้ใกล้ขนาด inference
+                return decode_jpeg_scaled(response.content, self.target_size)
             else:
                 logger.warning(f"[{camera.camera_id}] Snapshot error: HTTP {response.status_code}")
                 return None
@@ -338,18 +747,81 @@ class PlaybackFetcher:
             logger.error(f"[{camera.camera_id}] Snapshot error: {e}")
             return None
     
-    def fetch_frames_via_snapshots(self, camera: CameraConfig, start_time: datetime, end_time: datetime) -> List[np.ndarray]:
+    def snapshot_source(self, camera: CameraConfig) -> SnapshotSource:
+        """
+        เลือก URL สำหรับ snapshot mode
+        
+        Priority:
+        1. Hikvision ISAPI /picture (ถ้าเปิด hikvision; ใช้ snapshot_url หรือสร้างจาก rtsp_ip/track_id)
+        2. go2rtc /api/frame.jpeg ของ live RTSP
+        """
+        go2rtc_url = self.build_go2rtc_snapshot_url(self.build_live_rtsp_url(camera))
+        isapi_url = camera.snapshot_url
+        if not isapi_url and camera.rtsp_ip:
+            isapi_url = f"http://{camera.rtsp_ip}/ISAPI/Streaming/channels/{camera.track_id}/picture"
+        if self.hikvision.enabled and isapi_url:
+            return SnapshotSource(
+                camera_id=camera.camera_id,
+                url=isapi_url,
+                source="isapi",
+                username=camera.snapshot_username or camera.rtsp_username,
+                password=camera.snapshot_password or camera.rtsp_password,
+                fallback_url=go2rtc_url
+            )
+        return SnapshotSource(camera_id=camera.camera_id, url=go2rtc_url)
+    
+    def probe(self, camera: CameraConfig, timeout: float, method: str = "snapshot") -> bool:
+        """
+        ตรวจว่ากล้องกลับมาแล้วหรือยัง (ถูกกว่าเปิด stream เต็ม)
+        
+        - snapshot: GET ภาพ 1 ใบจาก snapshot source (ISAPI หรือ go2rtc frame.jpeg)
+        - head: HTTP HEAD ไปที่ snapshot source (status < 400 ถือว่ายังอยู่)
+        """
+        source = self.snapshot_source(camera)
+        auth = None
+        verify = self.config.verify_ssl
+        if source.source == "isapi":
+            auth = requests.auth.HTTPDigestAuth(source.username, source.password)
+            verify = self.hikvision.verify_ssl
+        
+        for url in filter(None, (source.url, source.fallback_url)):
+            try:
+                if method == "head":
+                    response = self.session.head(url, timeout=timeout, auth=auth, verify=verify)
+                    if response.status_code < 400:
+                        return True
+                else:
+                    response = self.session.get(url, timeout=timeout, auth=auth, verify=verify)
+                    if response.status_code == 200 and response.content:
+                        return True
+            except requests.RequestException:
+                pass
+            auth, verify = None, self.config.verify_ssl  # fallback เป็น go2rtc เสมอ
+        return False
+    
+    def _stream_rtsp_url(self, camera: CameraConfig, start_time: datetime, end_time: datetime,
+                         use_playback: bool) -> str:
+        if use_playback:
+            return self.build_playback_rtsp_url(camera, start_time, end_time)
+        return self.build_live_rtsp_url(camera)
+    
+    def fetch_frames_via_snapshots(self, camera: CameraConfig, start_time: datetime, end_time: datetime,
+                                   use_playback: bool = False, on_frame: Optional[FrameCallback] = None,
+                                   max_frames: Optional[int] = None) -> List[np.ndarray]:
         """
         ดึง frames โดยใช้ go2rtc stream.ts API
         
         หมายเหตุ: stream.mp4 ส่งภาพดำมา ต้องใช้ stream.ts แทน
+        use_playback=True จะดึงวิดีโอย้อนหลังช่วง start_time → end_time แทน live
+        on_frame(frame) ถูกเรียกทุก frame ที่เก็บ คืน False = หยุดดึง (adaptive sampling)
         """
         frames = []
         cap = None
+        buffer = None
         
         try:
-            # สร้าง RTSP URL สำหรับ live stream
-            rtsp_url = self.build_live_rtsp_url(camera)
+            # สร้าง RTSP URL (live หรือ playback)
+            rtsp_url = self._stream_rtsp_url(camera, start_time, end_time, use_playback)
             encoded_rtsp = urllib.parse.quote(rtsp_url, safe='')
             
             # ใช้ stream.ts endpoint (stream.mp4 ส่งภาพดำ)
@@ -357,7 +829,7 @@ class PlaybackFetcher:
             
             duration_seconds = (end_time - start_time).total_seconds()
             target_frames = int(duration_seconds * self.config.sampling_fps)
-            target_frames = min(target_frames, 60)  # Limit frames
+            target_frames = min(target_frames, max_frames or self.config.max_frames)  # Limit frames
             
             if target_frames <= 0:
                 target_frames = 30
@@ -386,9 +858,11 @@ class PlaybackFetcher:
                 logger.info(f"[{camera.camera_id}] 📐 Video: {width}x{height} @ {fps:.1f}fps")
             
             # Skip first 30 frames to wait for keyframe (avoid black frames)
+            # grab() ไม่แปลงเป็น BGR / ไม่จอง array
             logger.info(f"[{camera.camera_id}] ⏳ Skipping initial frames (waiting for keyframe)...")
             for _ in range(30):
-                cap.read()
+                cap.grab()
+                self._progress()
             
             # Calculate frame interval for sampling
             frame_interval = max(1, int(fps / self.config.sampling_fps))
@@ -396,30 +870,43 @@ class PlaybackFetcher:
             frame_count = 0
             read_count = 0
             black_count = 0
+            logged_size = width > 0 and height > 0
+            # buffer ของ frame ที่ sample ถัดไป (frame ดำใช้ buffer เดิมซ้ำ)
+            buffer = self.buffers.acquire((height, width, 3)) if logged_size else None
             
             while frame_count < target_frames:
-                ret, frame = cap.read()
-                
-                if not ret:
+                if not cap.grab():
                     if frame_count == 0:
                         logger.warning(f"[{camera.camera_id}] ⚠️ No frames from stream")
                     break
                 
+                self._progress()
                 read_count += 1
                 
-                # Log first frame info
-                if read_count == 1 and (width == 0 or height == 0):
-                    h, w = frame.shape[:2]
-                    logger.info(f"[{camera.camera_id}] 📐 Frame size: {w}x{h}")
-                
-                # Sample frames according to interval
+                # Sample frames according to interval (decode เป็น BGR เฉพาะ frame ที่ถึงรอบ)
                 if read_count % frame_interval == 0:
+                    ret, frame = self._retrieve(cap, buffer)
+                    if not ret:
+                        break
+                    buffer = None
+                    
+                    # Log first frame info
+                    if not logged_size:
+                        h, w = frame.shape[:2]
+                        logger.info(f"[{camera.camera_id}] 📐 Frame size: {w}x{h}")
+                        logged_size = True
+                    
                     # Check if frame is not black (mean > 5)
                     mean_val = np.mean(frame)
                     if mean_val > 5:
-                        frames.append(frame.copy())
+                        frames.append(frame)
                         frame_count += 1
+                        buffer = self.buffers.acquire(frame.shape, frame.dtype)
+                        if on_frame is not None and not on_frame(frame):
+                            logger.info(f"[{camera.camera_id}] ⏹️ Estimate converged after {frame_count} frames")
+                            break
                     else:
+                        buffer = frame
                         black_count += 1
                         # Skip too many black frames
                         if black_count > 20:
@@ -450,19 +937,24 @@ class PlaybackFetcher:
         finally:
             if cap:
                 cap.release()
+            if buffer is not None:
+                self.buffers.release([buffer])
         
         return frames
     
-    def fetch_frames_via_go2rtc(self, camera: CameraConfig, start_time: datetime, end_time: datetime) -> List[np.ndarray]:
+    def fetch_frames_via_go2rtc(self, camera: CameraConfig, start_time: datetime, end_time: datetime,
+                                use_playback: bool = False, on_frame: Optional[FrameCallback] = None,
+                                max_frames: Optional[int] = None) -> List[np.ndarray]:
         """
         ดึง frames ผ่าน go2rtc stream API
         """
         frames = []
         cap = None
+        buffer = None
         
         try:
-            # ลองใช้ live stream ผ่าน go2rtc
-            rtsp_url = self.build_live_rtsp_url(camera)
+            # ลองใช้ stream ผ่าน go2rtc (live หรือ playback)
+            rtsp_url = self._stream_rtsp_url(camera, start_time, end_time, use_playback)
             encoded_rtsp = urllib.parse.quote(rtsp_url, safe='')
             
             # ลอง WebRTC stream
@@ -486,24 +978,29 @@ class PlaybackFetcher:
             
             duration_seconds = (end_time - start_time).total_seconds()
             frame_interval = max(1, int(fps / self.config.sampling_fps))
-            max_frames = int(duration_seconds * self.config.sampling_fps)
-            max_frames = min(max_frames, 100)
+            max_frames = min(int(duration_seconds * self.config.sampling_fps), max_frames or self.config.max_frames)
             
             start_fetch = time.time()
             frame_count = 0
             read_count = 0
+            buffer = self.buffers.acquire((height, width, 3)) if width > 0 and height > 0 else None
             
             while frame_count < max_frames:
-                ret, frame = cap.read()
-                
-                if not ret:
+                if not cap.grab():
                     break
                 
+                self._progress()
                 read_count += 1
                 
                 if read_count % frame_interval == 0:
-                    frames.append(frame.copy())
+                    ret, frame = self._retrieve(cap, buffer)
+                    if not ret:
+                        break
+                    frames.append(frame)
                     frame_count += 1
+                    buffer = self.buffers.acquire(frame.shape, frame.dtype)
+                    if on_frame is not None and not on_frame(frame):
+                        break
                 
                 if time.time() - start_fetch > self.config.timeout_seconds:
                     break
@@ -518,29 +1015,119 @@ class PlaybackFetcher:
         finally:
             if cap:
                 cap.release()
+            if buffer is not None:
+                self.buffers.release([buffer])
         
         return frames
     
-    def fetch_frames(self, camera: CameraConfig, start_time: datetime, end_time: datetime) -> List[np.ndarray]:
+    def build_go2rtc_mjpeg_url(self, rtsp_url: str) -> str:
+        """
+        สร้าง go2rtc /api/stream.mjpeg URL ที่ให้ ffmpeg ของ go2rtc แปลงเป็น JPEG
+        ที่ fps ต่ำ (และย่อภาพ) ฝั่ง server
+        """
+        fps = self.config.mjpeg_fps or self.config.sampling_fps
+        src = f"ffmpeg:{rtsp_url}#video=mjpeg"
+        if self.config.mjpeg_width > 0:
+            src += f"#width={self.config.mjpeg_width}"
+        src += f"#raw=-r {fps:g}"
+        return f"{self.base_url}/api/stream.mjpeg?src={urllib.parse.quote(src, safe='')}"
+    
+    def fetch_frames_via_mjpeg(self, camera: CameraConfig, start_time: datetime, end_time: datetime,
+                               use_playback: bool = False, on_frame: Optional[FrameCallback] = None,
+                               max_frames: Optional[int] = None) -> List[np.ndarray]:
+        """
+        ดึง frames จาก go2rtc stream.mjpeg (ไม่ต้อง decode H.264 ฝั่งนี้)
+        
+        go2rtc ส่ง JPEG ที่ fps ต่ำตาม mjpeg_fps; แยก part จาก buffer เดียว
+        และ decode ลดขนาดเฉพาะ frame ที่ถึงรอบ sample (ดู mjpeg.py)
+        """
+        frames: List[np.ndarray] = []
+        response = None
+        try:
+            rtsp_url = self._stream_rtsp_url(camera, start_time, end_time, use_playback)
+            stream_url = self.build_go2rtc_mjpeg_url(rtsp_url)
+            
+            duration_seconds = (end_time - start_time).total_seconds()
+            target_frames = min(int(duration_seconds * self.config.sampling_fps), max_frames or self.config.max_frames)
+            if target_frames <= 0:
+                target_frames = 30
+            
+            logger.info(f"[{camera.camera_id}] 🎬 Fetching {target_frames} frames via go2rtc stream.mjpeg")
+            start_fetch = time.time()
+            
+            response = self.session.get(stream_url, stream=True, timeout=(15, self.config.timeout_seconds))
+            if response.status_code != 200:
+                logger.warning(f"[{camera.camera_id}] ⚠️ go2rtc stream.mjpeg: HTTP {response.status_code}")
+                return []
+            
+            frames, stats = read_mjpeg_frames(
+                available_reader(response.raw),
+                sampling_fps=self.config.sampling_fps,
+                max_frames=target_frames,
+                timeout_s=self.config.timeout_seconds,
+                target_size=self.target_size,
+                camera_id=camera.camera_id,
+                progress=self.progress,
+                on_frame=on_frame
+            )
+            fetch_time = time.time() - start_fetch
+            
+            if PROMETHEUS_AVAILABLE:
+                PLAYBACK_FETCH_TIME.labels(camera_id=camera.camera_id).observe(fetch_time)
+            
+            if frames:
+                logger.info(f"[{camera.camera_id}] ✅ MJPEG: {len(frames)} frames in {fetch_time:.1f}s "
+                            f"(decoded {stats.decoded}/{stats.parts} parts, {stats.bytes / 1e6:.1f} MB, "
+                            f"skipped {stats.black} black frames)")
+            else:
+                logger.warning(f"[{camera.camera_id}] ⚠️ No valid frames from stream.mjpeg")
+            
+        except Exception as e:
+            logger.error(f"[{camera.camera_id}] ❌ MJPEG fetch error: {e}")
+            if PROMETHEUS_AVAILABLE:
+                ERRORS_TOTAL.labels(camera_id=camera.camera_id, error_type='stream_error').inc()
+        finally:
+            if response is not None:
+                response.close()
+        
+        return frames
+    
+    def fetch_frames(self, camera: CameraConfig, start_time: datetime, end_time: datetime,
+                     use_playback: bool = False, on_frame: Optional[FrameCallback] = None,
+                     max_frames: Optional[int] = None) -> List[np.ndarray]:
         """
         ดึง frames - ลองหลายวิธี
         
         Priority:
+        0. go2rtc stream.mjpeg (เมื่อ ingest: mjpeg)
         1. go2rtc snapshot API (เสถียรที่สุด)
         2. go2rtc stream API
+        
+        on_frame / max_frames: ดู fetch_frames_via_snapshots (fallback เกิดเฉพาะเมื่อวิธีก่อนไม่ได้ frame เลย
+        จึงไม่มี frame ซ้ำใน on_frame)
         """
+        if self.config.ingest == "mjpeg":
+            frames = self.fetch_frames_via_mjpeg(camera, start_time, end_time, use_playback, on_frame, max_frames)
+            if frames:
+                return frames
+            logger.info(f"[{camera.camera_id}] 🔄 Falling back to go2rtc stream.ts...")
+        
         # ใช้ snapshot API เป็นหลัก (เสถียรกว่า)
-        frames = self.fetch_frames_via_snapshots(camera, start_time, end_time)
+        frames = self.fetch_frames_via_snapshots(camera, start_time, end_time, use_playback, on_frame, max_frames)
         
         # Fallback to stream
         if not frames:
             logger.info(f"[{camera.camera_id}] 🔄 Trying go2rtc stream...")
-            frames = self.fetch_frames_via_go2rtc(camera, start_time, end_time)
+            frames = self.fetch_frames_via_go2rtc(camera, start_time, end_time, use_playback, on_frame, max_frames)
         
         return frames
 
 
 # ==================== YOLOv8 People Detector ====================
+class ModelNotReadyError(RuntimeError):
+    """model ยังโหลด/warm-up ไม่เสร็จหรือโหลดไม่สำเร็จ: ไม่มีผล detection (ห้ามนับเป็น 0 คน)"""
+
+
 class PeopleDetector:
     """
     ตรวจจับคนด้วย YOLOv8
@@ -551,13 +1138,98 @@ class PeopleDetector:
     """
     
     PERSON_CLASS_ID = 0  # COCO class ID for person
+    READY_TIMEOUT_S = 600  # รอ model โหลด/warm-up ใน background ได้นานสุดเท่านี้
     
-    def __init__(self, model_path: str = "yolov8n.pt", device: str = "cpu", confidence: float = 0.4):
+    def __init__(self, model_path: str = "yolov8n.pt", device: str = "cpu", confidence: float = 0.4,
+                 cache_dir: str = "~/.cache/ultralytics", background: bool = False,
+                 timer: Optional[StartupTimer] = None, resource_plan: Optional[ResourcePlan] = None,
+                 imgsz: int = 640, tiling: Optional[TilingConfig] = None, label: str = "",
+                 batch_size: int = 1, autotune: Optional[AutotuneConfig] = None, lean: bool = False,
+                 extra_classes: Tuple[int, ...] = (), input_buffers: Optional[BufferPool] = None):
         self.model_path = model_path
+        self.label = label  # prefix ของชื่อ startup phase เมื่อโหลดหลาย model
         self.device = device
         self.confidence = confidence
+        self.imgsz = imgsz
+        self.batch_size = max(1, batch_size)
+        self.autotune = autotune or AutotuneConfig()
+        self.tune_result: Optional[TuneResult] = None
+        self.model_file: Optional[Path] = None
+        self.lean_requested = lean
+        self.lean: Optional[LeanCounter] = None
+        self.input_buffers = input_buffers  # canvas ของ lean letterbox (ใช้ร่วมกันทุก detector)
+        # class อื่นนอกจาก person ที่ analytics stage ต้องการ (ขยายใน forward pass เดียวกันของ detect_views)
+        self.extra_classes = tuple(c for c in extra_classes if c != self.PERSON_CLASS_ID)
+        self.tiling = tiling or TilingConfig()
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.timer = timer or StartupTimer()
+        self.resource_plan = resource_plan
         self.model = None
-        self._load_model()
+        self.load_error: Optional[Exception] = None
+        self._ready = threading.Event()
+        # batch ถือ lock ทีละ frame; on-demand ใช้ priority=True แซงคิวได้
+        self.inference_lock = PriorityLock()
+        
+        if background:
+            # โหลด + warm-up ใน background thread ให้ fetch รอบแรกเริ่มไปพร้อมกันได้
+            threading.Thread(target=self._load_in_background, name=f"{label}model-loader", daemon=True).start()
+        else:
+            self._load_model()
+    
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self.model is not None
+    
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """รอจน model พร้อมใช้งาน (คืน False ถ้าโหลดไม่สำเร็จหรือ timeout)"""
+        self._ready.wait(timeout)
+        return self.ready
+    
+    def require_model(self):
+        """รอ model ได้ถึง READY_TIMEOUT_S แล้ว raise ModelNotReadyError ถ้ายังไม่มี model"""
+        if not self._ready.is_set():
+            self.wait_until_ready(self.READY_TIMEOUT_S)
+        if self.model is None:
+            reason = f"load failed: {self.load_error}" if self.load_error else "still loading"
+            raise ModelNotReadyError(f"Model {self.model_path} is not ready ({reason})")
+    
+    def _load_in_background(self):
+        try:
+            self._load_model()
+        except Exception as e:
+            self.load_error = e
+            if not self.label:
+                health.update_status(status="error", ready=False)
+            self._ready.set()
+    
+    def resolve_model_file(self) -> Optional[Path]:
+        """
+        หา weights ในเครื่อง (ไม่ต่อ network)
+        
+        Priority: path ตรงๆ → โฟลเดอร์ ai-service → /app → model cache dir
+        """
+        name = Path(self.model_path).name
+        candidates = [
+            Path(self.model_path).expanduser(),
+            Path(__file__).parent.parent / self.model_path,
+            Path("/app") / self.model_path,
+            self.cache_dir / name,
+        ]
+        for path in candidates:
+            if path.is_file():
+                return path
+        return None
+    
+    def _cache_model_file(self, source: Path):
+        """copy weights ที่ดาวน์โหลดมาเก็บใน cache dir สำหรับ restart ครั้งถัดไป"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            target = self.cache_dir / source.name
+            if source.resolve() != target.resolve():
+                shutil.copy2(source, target)
+                logger.info(f"   Cached model weights at {target}")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not cache model weights: {e}")
     
     def _load_model(self):
         """Load YOLOv8 model"""
@@ -565,80 +1237,263 @@ class PeopleDetector:
             logger.info(f"🤖 Loading YOLOv8 model: {self.model_path}")
             logger.info(f"   Device: {self.device}")
             
-            # Check if model file exists
-            model_paths = [
-                self.model_path,
-                Path(__file__).parent.parent / self.model_path,
-                Path("/app") / self.model_path
-            ]
-            
-            model_file = None
-            for path in model_paths:
-                if Path(path).exists():
-                    model_file = str(path)
-                    break
-            
-            if model_file:
-                self.model = YOLO(model_file)
-            else:
-                # Download from ultralytics
-                logger.info(f"   Downloading {self.model_path} from Ultralytics...")
-                self.model = YOLO(self.model_path)
+            with self.timer.phase(f"{self.label}model_resolve"):
+                model_file = self.model_file = self.resolve_model_file()
+                if model_file:
+                    # มี weights ในเครื่องแล้ว → ปิด online check ของ ultralytics
+                    os.environ.setdefault("YOLO_OFFLINE", "1")
+            
+            with self.timer.phase(f"{self.label}import_ultralytics"):
+                yolo_cls = _ultralytics.YOLO
+                if self.resource_plan:
+                    apply_torch_plan(self.resource_plan, _torch, cv2)
+            
+            with self.timer.phase(f"{self.label}model_load"):
+                if model_file:
+                    logger.info(f"   Using cached weights: {model_file}")
+                    self.model = yolo_cls(str(model_file))
+                else:
+                    # Download from ultralytics
+                    logger.info(f"   Downloading {self.model_path} from Ultralytics...")
+                    self.model = yolo_cls(self.model_path)
+                    downloaded = Path(self.model_path)
+                    if downloaded.is_file():
+                        self._cache_model_file(downloaded)
+            
+            # lean path ต้องพร้อมก่อน autotune เพื่อให้ sweep วัดทางที่ใช้จริง
+            if self.lean_requested:
+                with self.timer.phase(f"{self.label}model_lean"):
+                    self.setup_lean()
+            
+            # เลือก imgsz / batch / threads ตามเครื่อง (cache ไว้ ไม่ sweep ทุกครั้ง)
+            if self.autotune.enabled and not self.label:
+                with self.timer.phase("model_autotune"):
+                    self.apply_autotune(force=self.autotune.force)
             
             # Warm up model
-            logger.info("   Warming up model...")
-            dummy = np.zeros((640, 640, 3), dtype=np.uint8)
-            self.model.predict(dummy, device=self.device, verbose=False)
+            with self.timer.phase(f"{self.label}model_warmup"):
+                logger.info("   Warming up model...")
+                dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+                self._infer([dummy], self.confidence, self.imgsz)
             
-            logger.info("✅ YOLOv8 model loaded successfully")
+            self._ready.set()
+            if not self.label:
+                health.update_status(ready=True)
+            logger.info(f"✅ YOLOv8 model loaded successfully ({self.model_path})")
             
         except Exception as e:
             logger.error(f"❌ Failed to load YOLOv8 model: {e}")
             raise
     
-    def detect(self, frame: np.ndarray, confidence: Optional[float] = None) -> int:
+    def setup_lean(self) -> bool:
+        """
+        สร้าง lean count-only path แล้วตรวจกับ predict บนภาพตัวอย่าง
+        
+        จำนวนคนไม่ตรง (เช่น model head แบบที่ไม่รองรับ) → ใช้ predict ตามเดิม
+        """
+        try:
+            frames = sample_frames(self.autotune.sample_dir, count=2)
+            # predict 1 ครั้งให้ predictor สร้าง + fuse model; lean ใช้ module ตัวเดียวกัน
+            self.model.predict(frames[0], device=self.device, imgsz=self.imgsz, verbose=False)
+            lean = LeanCounter.from_yolo(self.model, device=self.device, class_id=self.PERSON_CLASS_ID,
+                                         buffers=self.input_buffers)
+            mismatches = validate_against_predict(lean, self.model, frames, [self.confidence],
+                                                  self.imgsz, self.device)
+        except Exception as e:
+            logger.warning(f"⚠️ Lean inference unavailable ({e}), using model.predict")
+            return False
+        if mismatches:
+            logger.warning(f"⚠️ Lean inference disagrees with predict on {len(mismatches)} sample(s), "
+                           f"using model.predict")
+            return False
+        self.lean = lean
+        logger.info("   ⚡ Lean count-only inference enabled (validated against predict)")
+        return True
+    
+    def apply_autotune(self, force: bool = False) -> Optional[TuneResult]:
+        """
+        ใช้ค่าจาก autotune cache (หรือ sweep ใหม่ถ้าไม่มี / force) แล้วตั้ง imgsz, batch_size, torch threads
+        """
+        fingerprint = hardware_fingerprint(str(self.model_file or self.model_path), self.device, _torch)
+        tuner = Autotuner(self.autotune, fingerprint)
+        result = None if force else tuner.load_cached()
+        
+        if result is not None:
+            logger.info(f"🔧 Autotune (cached {tuner.key}): imgsz={result.imgsz} batch={result.batch_size} "
+                        f"threads={result.threads} ({result.fps:.1f} fps)")
+        else:
+            logger.info(f"🔧 Autotune sweep on this host ({fingerprint['cpu']}, {fingerprint['cpus']} cpus)...")
+            previous_threads = _torch.get_num_threads()
+            
+            def predict(batch: List[np.ndarray], imgsz: int):
+                self._infer(batch, self.confidence, imgsz)
+            
+            trials = tuner.sweep(predict, _torch.set_num_threads, sample_frames(self.autotune.sample_dir),
+                                 torch_module=_torch, device=self.device)
+            result = tuner.choose(trials)
+            if result is None:
+                logger.warning("⚠️ Autotune: no combination within the latency/memory budget, keeping defaults")
+                _torch.set_num_threads(previous_threads)
+                return None
+            tuner.save(result, trials)
+            logger.info(f"🔧 Autotune picked imgsz={result.imgsz} batch={result.batch_size} "
+                        f"threads={result.threads} ({result.fps:.1f} fps, p95 {result.latency_ms:.0f} ms)")
+        
+        self.imgsz = result.imgsz
+        self.batch_size = result.batch_size
+        _torch.set_num_threads(result.threads)
+        if self.resource_plan:
+            self.resource_plan.inference_threads = result.threads
+        self.tune_result = result
+        return result
+    
+    def retune(self) -> Optional[TuneResult]:
+        """Re-tune ขณะ service รันอยู่ (หยุด batch inference ระหว่าง sweep)"""
+        with self.inference_lock.hold(priority=False):
+            return self.apply_autotune(force=True)
+    
+    def detect(self, frame: np.ndarray, confidence: Optional[float] = None, camera_id: str = "unknown",
+               heatmap: Optional[OccupancyHeatmap] = None) -> int:
         """
         ตรวจจับคนใน frame
         
+        ถ้าเปิด tiling และ coarse pass นับได้ ≥ density_threshold
+        จะ infer ซ้ำแบบ tile แล้วรวมผลด้วย cross-tile NMS
+        
         Args:
             frame: BGR image (numpy array)
             confidence: Override confidence threshold
+            camera_id: For logging and metrics
+            heatmap: ถ้าระบุ จะสะสมตำแหน่งเท้าของคนที่พบลง heatmap
             
         Returns:
             จำนวนคนที่ตรวจพบ
-        """
-        if self.model is None:
-            return 0
         
+        Raises:
+            ModelNotReadyError: model ไม่พร้อม (ไม่ใช่ 0 คน)
+        """
+        self.require_model()
         conf = confidence or self.confidence
         
         try:
-            results = self.model.predict(
-                frame,
-                device=self.device,
-                conf=conf,
-                classes=[self.PERSON_CLASS_ID],  # Only detect persons
-                verbose=False
-            )
-            
-            if results and len(results) > 0:
-                boxes = results[0].boxes
-                if boxes is not None:
-                    return len(boxes)
-            
-            return 0
+            xyxy, _ = self.detect_boxes(frame, conf, camera_id)
+            if heatmap is not None:
+                heatmap.add(xyxy, frame.shape[:2])
+            return int(len(xyxy))
             
         except Exception as e:
             logger.error(f"Detection error: {e}")
             return 0
     
-    def detect_batch(self, frames: List[np.ndarray], camera_id: str = "unknown") -> List[int]:
+    def working_set_bytes(self) -> int:
+        """byte โดยประมาณของ input ต่อ forward pass (uint8 canvas + float32 tensor) รวม tile ถ้าเปิด tiling"""
+        per_pixel = 3 * (1 + 4)
+        total = self.batch_size * self.imgsz * self.imgsz * per_pixel
+        if self.tiling.enabled:
+            total += self.tiling.max_tiles * self.tiling.tile_size ** 2 * per_pixel
+        return total
+    
+    def detect_boxes(self, frame: np.ndarray, conf: float, camera_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        """box ของคนที่พบ (N, 4) xyxy พิกัดภาพเต็ม + confidence (N,) หลัง tiling/NMS แล้ว"""
+        return self._finish(frame, conf, self._predict(frame, conf), camera_id)
+    
+    def _predict(self, frame: np.ndarray, conf: float) -> Detections:
+        """Single-pass inference คืน (xyxy, conf) ของ frame"""
+        return self._predict_batch([frame], conf)[0]
+    
+    def _predict_batch(self, frames: List[np.ndarray], conf: float) -> List[Detections]:
+        """Forward pass เดียวของหลาย frame คืน (xyxy, conf) ต่อ frame"""
+        return self._infer(frames, conf, self.imgsz)
+    
+    def _infer(self, frames: List[np.ndarray], conf: float, imgsz: int) -> List[Detections]:
+        """person เท่านั้น (xyxy, conf) ต่อ frame"""
+        return [(xyxy, scores) for xyxy, scores, _ in
+                self._infer_labeled(frames, conf, imgsz, (self.PERSON_CLASS_ID,))]
+    
+    def _infer_labeled(self, frames: List[np.ndarray], conf: float, imgsz: int,
+                       classes: Tuple[int, ...]) -> List[Labeled]:
+        """lean path ถ้าเปิดไว้ ไม่งั้น model.predict (แปลง Boxes เป็น NumPy) คืน (xyxy, conf, cls) ต่อ frame"""
+        if self.lean is not None:
+            return self.lean.infer_labeled(frames, conf, imgsz, classes)
+        results = self.model.predict(
+            frames,
+            device=self.device,
+            conf=conf,
+            imgsz=imgsz,
+            classes=list(classes),  # ปกติ person อย่างเดียว
+            verbose=False
+        )
+        empty = (np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64))
+        detections = [(res.boxes.xyxy.cpu().numpy(), res.boxes.conf.cpu().numpy(),
+                       res.boxes.cls.cpu().numpy().astype(np.int64))
+                      if res.boxes is not None else empty for res in results or []]
+        return detections + [empty] * (len(frames) - len(detections))
+    
+    def _finish(self, frame: np.ndarray, conf: float, coarse: Detections,
+                camera_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        """หลัง forward pass: tiling (ถ้าหนาแน่น) → box + score สุดท้าย"""
+        return self._locate(frame, conf, coarse, camera_id)
+    
+    def _locate(self, frame: np.ndarray, conf: float, coarse: Detections,
+                camera_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        """box + score จากผล single-pass (สลับไป tiled inference ถ้าหนาแน่น)"""
+        if self.tiling.enabled and len(coarse[1]) >= self.tiling.density_threshold:
+            return self._detect_tiled(frame, conf, coarse, camera_id)
+        return coarse
+    
+    def _detect_tiled(self, frame: np.ndarray, conf: float, coarse: Detections,
+                      camera_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sliced inference สำหรับ frame ที่คนหนาแน่น
+        
+        1. ตัด frame เป็น tile ที่ overlap กัน (crop เป็น view ไม่ copy)
+        2. infer ทุก tile เป็น batch เดียว
+        3. เลื่อน box กลับเป็นพิกัดภาพเต็ม รวมกับ box จาก coarse pass
+        4. NMS รวมด้วย IoU; intersection-over-smaller เฉพาะคู่ข้าม tile ที่ box ถูกตัดที่ขอบ tile
+           (คนที่ถูกบังกลางฝูงชนมี IoS สูงกับคนข้างๆ แต่ไม่ถูกตัดทิ้ง)
+        """
+        coarse_xyxy, coarse_conf = coarse
+        
+        h, w = frame.shape[:2]
+        tiles = make_tiles(h, w, self.tiling.tile_size, self.tiling.overlap, self.tiling.max_tiles)
+        if len(tiles) <= 1:
+            return coarse_xyxy, coarse_conf
+        
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+        tile_results = self._infer(crops, conf, self.tiling.tile_size)
+        
+        all_boxes = [coarse_xyxy]
+        all_scores = [coarse_conf]
+        all_sources = [np.full(len(coarse_conf), -1, dtype=np.int64)]
+        for index, ((x1, y1, _, _), (tile_xyxy, tile_conf)) in enumerate(zip(tiles, tile_results)):
+            if len(tile_conf) == 0:
+                continue
+            all_boxes.append(tile_xyxy + np.array([x1, y1, x1, y1], dtype=np.float32))
+            all_scores.append(tile_conf)
+            all_sources.append(np.full(len(tile_conf), index, dtype=np.int64))
+        
+        boxes = np.concatenate(all_boxes)
+        scores = np.concatenate(all_scores)
+        sources = np.concatenate(all_sources)
+        seam = seam_boxes(boxes, sources, tiles, (h, w), self.tiling.seam_margin)
+        keep = nms(boxes, scores, self.tiling.nms_iou, metric="iou", sources=sources, seam=seam,
+                   seam_threshold=self.tiling.seam_ios)
+        
+        if PROMETHEUS_AVAILABLE:
+            TILED_FRAMES.labels(camera_id=camera_id).inc()
+        logger.debug(f"[{camera_id}] 🧩 Tiled {len(tiles)} tiles: coarse={len(coarse_xyxy)} → {len(keep)}")
+        
+        return boxes[keep], scores[keep]
+    
+    def detect_batch(self, frames: List[np.ndarray], camera_id: str = "unknown",
+                     heatmap: Optional[OccupancyHeatmap] = None) -> List[int]:
         """
         ตรวจจับคนใน batch ของ frames
         
         Args:
             frames: List of BGR images
             camera_id: For logging and metrics
+            heatmap: สะสมตำแหน่งคนของทุก frame (optional)
             
         Returns:
             List of people counts per frame
@@ -648,7 +1503,8 @@ class PeopleDetector:
         for i, frame in enumerate(frames):
             start_time = time.time()
             
-            count = self.detect(frame)
+            with self.inference_lock.hold(priority=False):
+                count = self.detect(frame, camera_id=camera_id, heatmap=heatmap)
             counts.append(count)
             
             inference_time = time.time() - start_time
@@ -662,6 +1518,163 @@ class PeopleDetector:
                 logger.info(f"[{camera_id}] 🔍 Processed {i+1}/{len(frames)} frames...")
         
         return counts
+    
+    def detect_views(self, frames: List[np.ndarray], views: List[CameraView],
+                     label: str = "unknown", analytics: Optional[WindowAnalytics] = None,
+                     on_batch: Optional[Callable[[int, Dict[str, List[int]]], None]] = None,
+                     first_index: int = 0,
+                     detections: Optional[List[FrameDetections]] = None,
+                     offsets: Optional[Sequence[float]] = None) -> Dict[str, List[int]]:
+        """
+        Detection ร่วมของกล้องหลายตัวที่ใช้ stream เดียวกัน
+        
+        infer ครั้งเดียวต่อ frame ที่ confidence ต่ำสุดของกลุ่ม แล้วแต่ละ view
+        กรองด้วย confidence / ROI ของตัวเอง
+        
+        ถ้าระบุ analytics: forward pass เดียวกันขยาย classes เป็น person + extra_classes
+        แล้วส่ง frame + คนของกล้อง + object อื่นใน ROI ให้ทุก stage ของแต่ละกล้อง
+        
+        on_batch(offset, {camera_id: counts ของ batch}) ถูกเรียกทันทีหลังแต่ละ batch
+        (crowd alert ไม่ต้องรอจบ window)
+        
+        first_index: ลำดับใน window ของ frames[0] เมื่อ window ถูก infer ทีละส่วน (adaptive sampling)
+        
+        detections: ถ้าระบุ ต่อท้ายด้วย (xyxy, scores, (h, w)) ของคนทุก frame ก่อนกรอง ROI
+        ที่ confidence ของ inference (สำหรับ detection log)
+        
+        offsets: เวลาจริงของ frames (วินาทีจากต้น window) สำหรับ FrameContext.t ของ analytics
+        ไม่ระบุ = กระจายเท่าๆ กันทั้ง window
+        
+        Returns:
+            {camera_id: counts ต่อ frame}
+        
+        Raises:
+            ModelNotReadyError: model ไม่พร้อม (window นั้นต้องถูกข้าม ไม่ใช่ส่งเป็น 0 คน)
+            Exception: inference error ของ batch ใด (ส่งต่อเหมือนกัน window นั้นต้องถูกข้าม)
+        """
+        counts: Dict[str, List[int]] = {view.camera_id: [] for view in views}
+        self.require_model()
+        
+        conf = min(view.confidence for view in views)
+        classes = (self.PERSON_CLASS_ID,) + (self.extra_classes if analytics is not None else ())
+        for offset in range(0, len(frames), self.batch_size):
+            chunk = frames[offset:offset + self.batch_size]
+            start_time = time.time()
+            
+            try:
+                # lock ต่อ batch: on-demand รออย่างมาก 1 batch
+                with self.inference_lock.hold(priority=False):
+                    batch = []
+                    for frame, (xyxy, scores, cls) in zip(chunk, self._infer_labeled(chunk, conf, self.imgsz, classes)):
+                        person = cls == self.PERSON_CLASS_ID
+                        people = self._finish(frame, conf, (xyxy[person], scores[person]), label)
+                        batch.append((people, (xyxy[~person], scores[~person], cls[~person])))
+            except Exception as e:
+                # ไม่แทนด้วย 0 คน: infer_group ข้าม window (ไม่ส่ง / ไม่ clear alert / ไม่ log / ไม่นับเป็น success)
+                logger.error(f"[{label}] Detection error: {e}")
+                raise
+            
+            inference_time = (time.time() - start_time) / len(chunk)
+            
+            for index, (frame, ((xyxy, scores), objects)) in enumerate(zip(chunk, batch), start=first_index + offset):
+                if detections is not None:
+                    detections.append((xyxy, scores, frame.shape[:2]))
+                for view in views:
+                    mask = view.select(xyxy, scores, frame.shape[:2])
+                    counts[view.camera_id].append(int(np.count_nonzero(mask)))
+                    if view.heatmap is not None:
+                        view.heatmap.add(xyxy[mask], frame.shape[:2])
+                    if analytics is not None:
+                        inside = view.inside(objects[0], frame.shape[:2])
+                        t = offsets[index - first_index] if offsets is not None else analytics.frame_time(index)
+                        analytics.observe(view.camera_id, FrameContext(
+                            index=index, t=t, image=frame,
+                            people_xyxy=xyxy[mask], people_scores=scores[mask],
+                            object_xyxy=objects[0][inside], object_scores=objects[1][inside],
+                            object_classes=objects[2][inside]
+                        ))
+            
+            if PROMETHEUS_AVAILABLE:
+                for view in views:
+                    for _ in chunk:
+                        INFERENCE_TIME.labels(camera_id=view.camera_id).observe(inference_time)
+                    FRAMES_PROCESSED.labels(camera_id=view.camera_id).inc(len(chunk))
+            
+            if on_batch is not None:
+                try:
+                    on_batch(first_index + offset, {camera_id: values[offset:] for camera_id, values in counts.items()})
+                except Exception as e:
+                    logger.error(f"[{label}] ❌ Batch callback error: {e}")
+            
+            done = offset + len(chunk)
+            if done // 50 > offset // 50:
+                logger.info(f"[{label}] 🔍 Processed {done}/{len(frames)} frames...")
+        
+        return counts
+
+
+# ==================== Model Cascade ====================
+class CascadeDetector(PeopleDetector):
+    """
+    Model cascade: model เล็ก (เช่น yolov8n) ทุก frame แล้วส่งเฉพาะ frame ที่ไม่แน่ใจ
+    ไปให้ model ใหญ่ (เช่น yolov8s/m) นับซ้ำ
+    
+    Triggers:
+    - low_margin: มี box ที่ confidence เฉียด threshold หลายตัว
+    - near_alert: count ใกล้ alert threshold (ค่าผิดนิดเดียวเปลี่ยนการแจ้งเตือน)
+    - disagreement: count กระโดดจาก frame ก่อนหน้าของกล้องเดียวกัน
+    
+    ทั้งสอง model โหลดค้างไว้ใน memory; ถ้า model ใหญ่ยังไม่พร้อมจะใช้ผล model เล็ก
+    """
+    
+    def __init__(self, cascade: CascadeConfig, accurate: Optional[PeopleDetector] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.cascade = cascade
+        # model ใหญ่นับเฉพาะคน (object ของ analytics มาจาก forward pass ของ model เล็ก)
+        # hot swap ของ model เล็กส่ง accurate ตัวเดิมมาใช้ต่อ ไม่ต้องโหลดซ้ำ
+        accurate_kwargs = dict(kwargs, model_path=cascade.model, label="cascade_", extra_classes=())
+        self.accurate = accurate or PeopleDetector(**accurate_kwargs)
+        self._previous: Dict[str, int] = {}
+        self._frames: Dict[str, int] = {}
+        self._escalated: Dict[str, int] = {}
+    
+    def escalation_reason(self, count: int, scores: np.ndarray, conf: float, camera_id: str) -> Optional[str]:
+        """คืนชื่อ trigger ที่ทำให้ต้อง escalate (หรือ None)"""
+        c = self.cascade
+        if c.min_low_margin_boxes > 0 and int(np.count_nonzero(scores < conf + c.low_margin)) >= c.min_low_margin_boxes:
+            return "low_margin"
+        if any(abs(count - t) <= c.alert_margin for t in c.alert_thresholds):
+            return "near_alert"
+        previous = self._previous.get(camera_id)
+        if previous is not None and abs(count - previous) > c.disagreement:
+            return "disagreement"
+        return None
+    
+    def escalation_rate(self, camera_id: str) -> float:
+        frames = self._frames.get(camera_id, 0)
+        return self._escalated.get(camera_id, 0) / frames if frames else 0.0
+    
+    def _finish(self, frame: np.ndarray, conf: float, coarse: Detections,
+                camera_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        xyxy, scores = self._locate(frame, conf, coarse, camera_id)
+        coarse_scores = coarse[1]
+        
+        self._frames[camera_id] = self._frames.get(camera_id, 0) + 1
+        reason = self.escalation_reason(len(xyxy), coarse_scores, conf, camera_id)
+        if reason and self.accurate.ready:
+            fast_count = len(xyxy)
+            xyxy, scores = self.accurate.detect_boxes(frame, conf, camera_id)
+            self._escalated[camera_id] = self._escalated.get(camera_id, 0) + 1
+            logger.debug(f"[{camera_id}] ⬆️ Cascade escalation ({reason}): {fast_count} → {len(xyxy)}")
+            if PROMETHEUS_AVAILABLE:
+                CASCADE_ESCALATIONS.labels(camera_id=camera_id, reason=reason).inc()
+        
+        if PROMETHEUS_AVAILABLE:
+            CASCADE_FRAMES.labels(camera_id=camera_id).inc()
+            CASCADE_ESCALATION_RATE.labels(camera_id=camera_id).set(self.escalation_rate(camera_id))
+        
+        self._previous[camera_id] = len(xyxy)
+        return xyxy, scores
 
 
 # ==================== Backend Sender ====================
@@ -682,9 +1695,10 @@ class BackendSender:
     }
     """
     
-    def __init__(self, endpoint: str, api_key: str = ""):
+    def __init__(self, endpoint: str, api_key: str = "", send_heatmap: bool = False):
         self.endpoint = endpoint
         self.api_key = api_key
+        self.send_heatmap = send_heatmap
         self.session = requests.Session()
         
         # Set default headers
@@ -722,6 +1736,14 @@ class BackendSender:
             "source_type": result.source_type,
             "timestamp": datetime.now(timezone.utc).isoformat() + "Z"
         }
+        payload.update(result.analytics)
+        if result.sampling:
+            payload["sampling"] = result.sampling
+        if result.covered_end is not None:
+            payload["coverage"] = {"fraction": round(result.coverage, 3),
+                                   "covered_end": result.covered_end.isoformat() + "Z"}
+        if self.send_heatmap and result.heatmap is not None:
+            payload["heatmap"] = result.heatmap.to_payload()
         
         try:
             start_time = time.time()
@@ -756,6 +1778,23 @@ class BackendSender:
                 ERRORS_TOTAL.labels(camera_id=result.camera_id, error_type='backend_error').inc()
             return False
     
+    def send_camera_status(self, statuses: List[dict]) -> bool:
+        """
+        ส่งสถานะกล้องทั้งหมด (1 request) ไป /api/ai/camera-status → ตาราง ai_camera_status
+        """
+        if not self.endpoint or not statuses:
+            return False
+        
+        url = self.endpoint.rsplit('/people-count', 1)[0] + '/camera-status'
+        try:
+            response = self.session.post(url, json={"statuses": statuses}, timeout=10)
+            if response.status_code != 200:
+                logger.warning(f"⚠️ Camera status push failed: {response.status_code} - {response.text[:100]}")
+            return response.status_code == 200
+        except Exception as e:
+            logger.warning(f"⚠️ Camera status push failed: {e}")
+            return False
+    
     def send_simple(self, camera_id: str, count: int, timestamp: Optional[str] = None) -> bool:
         """
         ส่งค่า count แบบง่าย (สำหรับ backward compatibility)
@@ -778,6 +1817,52 @@ class BackendSender:
 
 
 # ==================== Playback Window Processor ====================
+@dataclass
+class GroupWork:
+    """state ของการวิเคราะห์ 1 window ของ stream ที่ infer ทีละส่วน (ตามที่ frame มาถึง)"""
+    cameras: List[CameraConfig]
+    start_time: datetime
+    end_time: datetime
+    total: int  # จำนวน frame ที่กระจายทั้ง window (เวลาของ frame สำหรับ analytics / alert)
+    planned: int  # จำนวน frame ที่ window ปกติใช้ (เทียบกับ frames_used ของ adaptive sampling)
+    views: List[CameraView]
+    detector: PeopleDetector  # ทั้ง window ใช้ model เดียว แม้ hot swap เสร็จระหว่างนี้
+    interval_s: float = 1.0  # ระยะห่างของ frame ใน footage (1 / sampling_fps)
+    analytics: Optional[WindowAnalytics] = None
+    on_batch: Optional[Callable[[int, Dict[str, List[int]]], None]] = None
+    frames: List[np.ndarray] = field(default_factory=list)
+    offsets: List[float] = field(default_factory=list)  # วินาทีจาก start_time ของแต่ละ frame
+    counts: Dict[str, List[int]] = field(default_factory=dict)
+    estimates: Dict[str, SequentialEstimate] = field(default_factory=dict)
+    detections: Optional[List[FrameDetections]] = None  # box ราย frame สำหรับ detection log (None = ปิด)
+    detect_time: float = 0.0
+    failed: bool = False
+    error: str = ""  # สาเหตุที่ window ไม่มีผล (ไม่มี frame / model ไม่พร้อม / inference error)
+    
+    @property
+    def label(self) -> str:
+        return "+".join(cam.camera_id for cam in self.cameras)
+    
+    @property
+    def converged(self) -> bool:
+        return bool(self.estimates) and all(e.converged() for e in self.estimates.values())
+    
+    @property
+    def duration_s(self) -> float:
+        return (self.end_time - self.start_time).total_seconds()
+    
+    @property
+    def covered_s(self) -> float:
+        """ช่วงต้น window ที่ frame ครอบคลุม (frame สุดท้าย + 1 ช่วง sample)"""
+        if not self.offsets:
+            return 0.0
+        return min(self.duration_s, self.offsets[-1] + self.interval_s)
+    
+    @property
+    def coverage(self) -> float:
+        return self.covered_s / self.duration_s if self.duration_s > 0 else 1.0
+
+
 class PlaybackProcessor:
     """
     ประมวลผล Playback Window
@@ -790,28 +1875,202 @@ class PlaybackProcessor:
     5. ส่งไป Backend
     """
     
+    FULL_COVERAGE = 0.99  # frame ครอบคลุม ≥ สัดส่วนนี้ของ window = ทั้ง window
+    
     def __init__(
         self,
         playback_config: PlaybackConfig,
         service_config: ServiceConfig,
-        cameras: List[CameraConfig]
+        cameras: List[CameraConfig],
+        timer: Optional[StartupTimer] = None,
+        resource_plan: Optional[ResourcePlan] = None,
+        hikvision: Optional[HikvisionConfig] = None,
+        tiling: Optional[TilingConfig] = None,
+        cascade: Optional[CascadeConfig] = None,
+        heatmap: Optional[HeatmapConfig] = None,
+        breaker: Optional[BreakerConfig] = None,
+        autotune: Optional[AutotuneConfig] = None,
+        frame_store: Optional[FrameStoreConfig] = None,
+        analytics: Optional[AnalyticsConfig] = None,
+        memory_budget: Optional[MemoryBudgetConfig] = None,
+        crowd_alerts: Optional[CrowdAlertConfig] = None,
+        hot_swap: Optional[HotSwapConfig] = None,
+        decoder_workers: Optional[DecoderWorkerConfig] = None,
+        adaptive_sampling: Optional[AdaptiveSamplingConfig] = None,
+        buffer_pool: Optional[BufferPoolConfig] = None,
+        detection_log: Optional[DetectionLogConfig] = None
     ):
         self.playback_config = playback_config
         self.service_config = service_config
         self.cameras = cameras
+        self.heatmap_config = heatmap or HeatmapConfig()
+        self.heatmaps = HeatmapStore()
+        self.breakers = CameraBreakers(breaker or BreakerConfig(enabled=False))
+        self.analytics = AnalyticsPipeline(analytics)
+        self.frame_budget = FrameBudget(memory_budget or MemoryBudgetConfig(enabled=False))
+        if self.frame_budget.enabled:
+            limit = self.frame_budget.limit_bytes
+            logger.info(f"🧠 Frame memory budget: {self.frame_budget.budget / 1e6:.0f} MB"
+                        + (f" (memory limit {limit / 1e6:.0f} MB)" if limit else ""))
+        if self.analytics.enabled:
+            logger.info(f"🧮 Analytics stages: {', '.join(s.name for s in self.analytics.stages)} "
+                        f"(extra classes {list(self.analytics.classes) or '-'} in the same forward pass)")
+        self.frame_store: Optional[FrameStore] = None
+        if frame_store and frame_store.enabled:
+            self.frame_store = FrameStore(frame_store, playback_config.sampling_fps)
+            logger.info(f"🗃️ Frame store: last {frame_store.retention_hours:g}h "
+                        f"({self.frame_store.capacity} frames, ≤{self.frame_store.bytes_per_camera / 1e9:.2f} GB) "
+                        f"per stream in {self.frame_store.directory}")
+        self.detection_log: Optional[DetectionLog] = None
+        if detection_log and detection_log.enabled:
+            self.detection_log = DetectionLog(detection_log)
+            logger.info(f"🧾 Detection log: per-frame boxes as {self.detection_log.format} in "
+                        f"{self.detection_log.directory} (keep {detection_log.retention_hours:g}h)")
+        for group in group_cameras([cam for cam in cameras if cam.enabled]):
+            if len(group.cameras) > 1:
+                ip, port, track = group.key
+                logger.info(f"🔗 {', '.join(group.camera_ids)} share stream {ip}:{port}/{track} "
+                            f"→ fetched and inferred once")
+        self.resource_plan = resource_plan
+        self.stage_meter = StageMeter(resource_plan) if resource_plan else None
+        
+        # Continuous mode state: cursor ต่อกล้อง + rollup aggregator
+        self._cursors: Dict[str, datetime] = {}
+        self._aggregators: Dict[str, RollingAggregator] = {}
+        self.latest_rollups: Dict[tuple, RollupResult] = {}
+        self._decode_pool: Optional[ThreadPoolExecutor] = None
+        if resource_plan and resource_plan.decode_workers > 1:
+            self._decode_pool = ThreadPoolExecutor(
+                max_workers=resource_plan.decode_workers,
+                thread_name_prefix="decode",
+                initializer=pin_current_thread,
+                initargs=(resource_plan.decode_cpus,)
+            )
+        
+        # Buffer pools: frame ที่ decode (คืนเมื่อ lease ของ window ถูกคืน) และ canvas ของ lean inference
+        pool_config = buffer_pool or BufferPoolConfig()
+        self.frame_pool = BufferPool("frames", pool_config)
+        self.input_pool = BufferPool("inputs", pool_config)
         
         # Initialize components
-        self.fetcher = PlaybackFetcher(playback_config)
-        self.detector = PeopleDetector(
-            model_path=service_config.model,
-            device=service_config.device,
-            confidence=service_config.confidence
+        self.fetcher = PlaybackFetcher(playback_config, hikvision, target_size=service_config.imgsz,
+                                       buffers=self.frame_pool)
+        self.snapshot_mode = self._use_snapshot_mode(playback_config) and not playback_config.continuous
+        # Adaptive sampling: infer ระหว่างที่ frame ยังมา แล้วหยุดดึงเมื่อค่าประมาณนิ่ง (interval stream mode)
+        self.adaptive: Optional[AdaptiveSamplingConfig] = None
+        if adaptive_sampling and adaptive_sampling.enabled and not self.snapshot_mode and not playback_config.continuous:
+            self.adaptive = adaptive_sampling
+            if self._decode_pool is None:  # fetch ต้องอยู่คนละ thread กับ inference
+                self._decode_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decode")
+            logger.info(f"🎯 Adaptive sampling: stop at ±max({adaptive_sampling.abs_error:g}, "
+                        f"{adaptive_sampling.rel_error:.0%}) avg @ {adaptive_sampling.confidence:.0%} confidence, "
+                        f"{adaptive_sampling.min_frames}-{adaptive_sampling.max_frames} frames per window")
+        # stream decode ใน process แยกที่มี watchdog (snapshot mode ไม่มี stream ให้ decode)
+        self.decoders: Optional[DecoderPool] = None
+        if decoder_workers and decoder_workers.enabled and not self.snapshot_mode:
+            self.decoders = DecoderPool(
+                decoder_workers,
+                partial(PlaybackFetcher, playback_config, hikvision, target_size=service_config.imgsz,
+                        buffers=self.frame_pool),  # pickle → pool ว่างของแต่ละ process
+                workers=resource_plan.decode_workers if resource_plan else 1,
+                timeout_s=playback_config.timeout_seconds,
+                cpus=resource_plan.decode_cpus if resource_plan else None,
+                buffers=self.frame_pool
+            )
+            logger.info(f"🛡️ Decoder workers: {self.decoders.size} process(es), read deadline "
+                        f"{decoder_workers.read_deadline_s:g}s, recycle after {decoder_workers.max_windows} windows "
+                        f"or {decoder_workers.max_rss_mb:g} MB RSS")
+        self.snapshot_poller = AsyncSnapshotPoller(
+            timeout=hikvision.timeout if hikvision else 10,
+            verify_ssl=playback_config.verify_ssl,
+            target_size=service_config.imgsz
+        ) if self.snapshot_mode else None
+        self._detector_kwargs = dict(
+            confidence=service_config.confidence,
+            cache_dir=service_config.model_cache_dir,
+            background=service_config.background_warmup,
+            timer=timer,
+            resource_plan=resource_plan,
+            tiling=tiling,
+            batch_size=service_config.batch_size,
+            extra_classes=self.analytics.classes,
+            autotune=autotune,
+            input_buffers=self.input_pool
         )
+        self._cascade = cascade if cascade and cascade.enabled else None
+        spec = ModelSpec(model=service_config.model, lean=service_config.lean_inference,
+                         device=service_config.device, imgsz=service_config.imgsz)
+        autotune_dir = (autotune or AutotuneConfig()).sample_dir
+        # detector อยู่ใน ModelSwapper เพื่อเปลี่ยน model ได้ขณะรัน (self.detector = ตัวที่ใช้อยู่)
+        self.models = ModelSwapper(hot_swap or HotSwapConfig(), self._build_swap_detector, self.build_detector(spec),
+                                   spec, fallback_frames=lambda: sample_frames(autotune_dir, count=4))
         self.sender = BackendSender(
             endpoint=service_config.backend_endpoint,
-            api_key=service_config.backend_api_key
+            api_key=service_config.backend_api_key,
+            send_heatmap=self.heatmap_config.enabled and self.heatmap_config.send
+        )
+        
+        # Crowd alert fast path: ตรวจ threshold ทุก batch, ส่งผ่าน channel แยกจากผลของ window
+        self.alert_sender: Optional[AlertSender] = None
+        alert_config = crowd_alerts or CrowdAlertConfig()
+        if alert_config.enabled:
+            self.alert_sender = AlertSender(alert_config, service_config.backend_endpoint,
+                                            service_config.backend_api_key)
+        self.alert_monitor = CrowdAlertMonitor(
+            alert_config, self.alert_sender.push if self.alert_sender else (lambda event: None)
         )
     
+    @property
+    def detector(self) -> PeopleDetector:
+        """detector ที่ใช้อยู่ (อ่านครั้งเดียวต่อ window - hot swap มีผลกับ window ถัดไป)"""
+        return self.models.current
+    
+    def build_detector(self, spec: ModelSpec, **overrides) -> PeopleDetector:
+        """สร้าง detector (หรือ cascade) ของ spec ด้วยค่าอื่นๆ เหมือนตอน startup"""
+        kwargs = dict(self._detector_kwargs, model_path=spec.model, device=spec.device, imgsz=spec.imgsz,
+                      lean=spec.lean, **overrides)
+        if self._cascade is not None:
+            return CascadeDetector(self._cascade, **kwargs)
+        return PeopleDetector(**kwargs)
+    
+    def _build_swap_detector(self, spec: ModelSpec) -> PeopleDetector:
+        """
+        detector สำหรับ hot swap: โหลดใน thread ของ swapper (ไม่ใช่ startup → ไม่แตะ readiness / autotune)
+        ใช้ batch size ของ detector ปัจจุบัน และ model ใหญ่ของ cascade ตัวเดิม
+        
+        cascade ที่ใช้ model ใหญ่ร่วมกันต้องใช้ inference lock ตัวเดียวกันด้วย (LeanCounter / buffer ของ
+        model ใหญ่ไม่ thread-safe) - validation และ window ที่กำลังรันจึงไม่ forward pass ซ้อนกัน
+        ผล autotune ยังใช้ต่อเมื่อ imgsz ไม่เปลี่ยน (SIGHUP ถัดไปไม่ทับ imgsz ที่ tune ไว้ด้วยค่าใน config)
+        """
+        current = self.detector
+        overrides: Dict[str, Any] = dict(background=False, timer=StartupTimer(), label="swap_",
+                                         batch_size=current.batch_size)
+        if isinstance(current, CascadeDetector):
+            overrides["accurate"] = current.accurate
+        detector = self.build_detector(spec, **overrides)
+        if isinstance(current, CascadeDetector):
+            detector.inference_lock = current.inference_lock
+        tuned = current.tune_result
+        if tuned is not None and tuned.imgsz == detector.imgsz:
+            detector.tune_result = replace(tuned, batch_size=detector.batch_size)
+        return detector
+    
+    def request_model_swap(self, model: Optional[str] = None, lean: Optional[bool] = None,
+                           device: Optional[str] = None, imgsz: Optional[int] = None) -> bool:
+        """เริ่ม hot swap (ค่าที่ไม่ระบุใช้ของ model ปัจจุบัน, imgsz = ค่าที่ใช้อยู่จริงหลัง autotune)"""
+        if not self.models.config.enabled:
+            return False
+        base = spec_with(self.models.spec, imgsz=self.detector.imgsz)
+        target = spec_with(base, model=model, lean=lean, device=device, imgsz=imgsz)
+        return target != base and self.models.request(target)
+    
+    @staticmethod
+    def _use_snapshot_mode(config: PlaybackConfig) -> bool:
+        mode = (config.acquisition_mode or "stream").lower()
+        if mode == "auto":
+            return config.sampling_fps <= 1
+        return mode == "snapshot"
+    
     def calculate_time_window(self) -> tuple:
         """
         คำนวณ time window สำหรับ playback
@@ -834,55 +2093,330 @@ class PlaybackProcessor:
         
         return start_time, end_time
     
-    def process_camera(self, camera: CameraConfig) -> Optional[WindowResult]:
+    @contextmanager
+    def _stage(self, stage: str):
+        if self.stage_meter:
+            with self.stage_meter.measure(stage) as usage:
+                yield usage
+        else:
+            yield None
+    
+    def fetch_window(self, camera: CameraConfig, start_time: datetime, end_time: datetime,
+                     use_playback: bool = False, on_frame: Optional[FrameCallback] = None) -> List[np.ndarray]:
         """
-        ประมวลผล 1 กล้อง
+        Step 1: ดึง frames ของ window (รันใน decode worker ได้)
         
-        Returns:
-            WindowResult or None if failed
+        on_frame ได้แต่ละ frame ทันทีที่เก็บ (คืน False = หยุดดึง) ใช้กับ adaptive sampling
         """
-        start_time, end_time = self.calculate_time_window()
-        
         logger.info(f"")
         logger.info(f"{'='*60}")
         logger.info(f"[{camera.camera_id}] 🎥 Processing Playback Window")
         logger.info(f"[{camera.camera_id}]    Time: {start_time.strftime('%Y-%m-%d %H:%M:%S')} → {end_time.strftime('%H:%M:%S')} UTC")
         logger.info(f"{'='*60}")
         
+        try:
+            max_frames = self.adaptive.max_frames if self.adaptive else None
+            with self._stage("decode") as usage:
+                if self.decoders is None:
+                    return self.fetcher.fetch_frames(camera, start_time, end_time, use_playback, on_frame, max_frames)
+                started = time.perf_counter()
+                frames, cpu_s = self.decoders.fetch(camera.camera_id, (camera, start_time, end_time, use_playback),
+                                                    {"max_frames": max_frames}, on_frame)
+                if usage is not None:
+                    usage.external_cpu += cpu_s
+                if PROMETHEUS_AVAILABLE:
+                    PLAYBACK_FETCH_TIME.labels(camera_id=camera.camera_id).observe(time.perf_counter() - started)
+                return frames
+        except Exception as e:
+            logger.error(f"[{camera.camera_id}] ❌ Fetch error: {e}")
+            if PROMETHEUS_AVAILABLE:
+                ERRORS_TOTAL.labels(camera_id=camera.camera_id, error_type='processing_error').inc()
+            return []
+    
+    def window_frame_count(self, start_time: datetime, end_time: datetime, limit: Optional[int] = None) -> int:
+        """
+        จำนวน frame สูงสุดที่ fetcher เก็บใน window (ใช้ประมาณ memory ที่ต้องจอง)
+        
+        limit: เพดานจำนวน frame (ไม่ระบุ = max_frames ที่ fetcher ใช้จริง รวม adaptive sampling)
+        """
+        if limit is None:
+            limit = self.adaptive.max_frames if self.adaptive else self.playback_config.max_frames
+        target = min(int((end_time - start_time).total_seconds() * self.playback_config.sampling_fps), limit)
+        return target if target > 0 else 30
+    
+    def fetch_window_leased(self, camera: CameraConfig, start_time: datetime, end_time: datetime,
+                            use_playback: bool = False, ticket: Optional[int] = None,
+                            on_frame: Optional[FrameCallback] = None) -> Tuple[List[np.ndarray], FrameLease]:
+        """
+        fetch_window ภายใต้ frame memory budget: จอง memory ของ window ก่อนเปิด stream
+        (รอถ้า budget เต็ม) แล้วปรับเป็นขนาดจริง ผู้เรียกคืน lease หลังวิเคราะห์เสร็จ (with lease: ...)
+        """
+        estimate = self.frame_budget.estimate(camera.camera_id, self.window_frame_count(start_time, end_time))
+        lease = self.frame_budget.acquire(estimate, camera.camera_id, ticket)
+        try:
+            frames = self.fetch_window(camera, start_time, end_time, use_playback, on_frame)
+        except BaseException:
+            lease.release()
+            raise
+        self.frame_budget.observe(camera.camera_id, frames)
+        lease.resize(frames_nbytes(frames))
+        lease.on_release = partial(self.frame_pool.release, frames)  # frame กลับเข้า pool เมื่อวิเคราะห์จบ
+        return frames, lease
+    
+    def process_group(self, group: SourceGroup) -> List[WindowResult]:
+        """
+        ประมวลผล 1 stream (กล้อง logical ทุกตัวที่ใช้ stream นี้)
+        
+        Returns:
+            WindowResult ของกล้องที่สำเร็จ
+        """
+        start_time, end_time = self.calculate_time_window()
+        frames, lease = self.fetch_window_leased(group.primary, start_time, end_time)
+        with lease:
+            return self.analyze_group(group.cameras, start_time, end_time, frames)
+    
+    def analyze_window(self, camera: CameraConfig, start_time: datetime, end_time: datetime,
+                       frames: List[np.ndarray], send: bool = True,
+                       offsets: Optional[Sequence[float]] = None,
+                       errors: Optional[List[str]] = None) -> Optional[WindowResult]:
+        """
+        Step 2-4 ของกล้องเดียว: inference + สรุปผล + ส่ง backend (send=False สำหรับงาน offline/CLI)
+        
+        errors: ถ้าระบุ ต่อท้ายด้วยสาเหตุเมื่อไม่มีผล
+        
+        Returns:
+            WindowResult or None if failed
+        """
+        results = self.analyze_group([camera], start_time, end_time, frames, send, offsets, errors)
+        return results[0] if results else None
+    
+    def analyze_group(self, cameras: List[CameraConfig], start_time: datetime, end_time: datetime,
+                      frames: List[np.ndarray], send: bool = True,
+                      offsets: Optional[Sequence[float]] = None,
+                      errors: Optional[List[str]] = None) -> List[WindowResult]:
+        """
+        Step 2-4: detection ร่วมครั้งเดียวต่อ stream แล้วแยกผลให้กล้อง logical แต่ละตัว
+        (กรองด้วย confidence / ROI ของตัวเอง) สรุปผล และส่ง backend
+        
+        offsets: วินาทีจาก start_time ของแต่ละ frame (ไม่ระบุ = ตาม schedule ของ stream fetcher
+        ทุก 1 / sampling_fps ของ footage จากต้น window)
+        
+        errors: ถ้าระบุ ต่อท้ายด้วยสาเหตุเมื่อมีกล้องที่ไม่ได้ผล (ไม่มี frame / model ไม่พร้อม / inference error)
+        
+        Returns:
+            WindowResult ของกล้องที่สำเร็จ (ว่างถ้าไม่มี frame หรือ error)
+        """
+        work = self.begin_group(cameras, start_time, end_time, len(frames), send=send)
+        if frames:
+            logger.info(f"[{work.label}] 🔍 Running YOLOv8 on {len(frames)} frames...")
+            self.infer_group(work, frames, offsets)
+        results = self.finish_group(work, send)
+        if errors is not None and len(results) < len(cameras):
+            errors.append(work.error or "Could not summarize the window (see service log)")
+        return results
+    
+    def begin_group(self, cameras: List[CameraConfig], start_time: datetime, end_time: datetime,
+                    total: int, planned: Optional[int] = None, send: bool = True,
+                    adaptive: bool = False) -> GroupWork:
+        """เริ่มวิเคราะห์ window: view / analytics / alert ของแต่ละกล้อง (frame จะตามมาทีละส่วน)"""
+        views = []
+        for camera in cameras:
+            heatmap = None
+            if self.heatmap_config.enabled:
+                heatmap = OccupancyHeatmap.from_config(self.heatmap_config)
+                heatmap.window_start, heatmap.window_end = start_time, end_time
+            views.append(CameraView.from_camera(camera, heatmap))
+        
+        work = GroupWork(cameras=cameras, start_time=start_time, end_time=end_time, total=total,
+                         planned=planned if planned is not None else total, views=views, detector=self.detector,
+                         interval_s=1.0 / max(self.playback_config.sampling_fps, 1e-6),
+                         counts={cam.camera_id: [] for cam in cameras})
+        if self.analytics.enabled:
+            work.analytics = self.analytics.begin([cam.camera_id for cam in cameras], start_time, end_time, total)
+        if send and self.alert_monitor.enabled:
+            def on_batch(offset: int, batch: Dict[str, List[int]]):
+                # เวลาจริงของ frame ใน batch (infer_group บันทึก offsets ก่อนเรียก detect_views)
+                for camera_id, values in batch.items():
+                    self.alert_monitor.observe_window(camera_id, start_time,
+                                                      work.offsets[offset:offset + len(values)], values)
+            work.on_batch = on_batch
+        if adaptive and self.adaptive:
+            work.estimates = {cam.camera_id: SequentialEstimate(self.adaptive) for cam in cameras}
+        if self.detection_log is not None:
+            work.detections = []
+        return work
+    
+    def infer_group(self, work: GroupWork, frames: List[np.ndarray],
+                    offsets: Optional[Sequence[float]] = None) -> bool:
+        """
+        Step 2: detection ของ frame ชุดถัดไปของ window (ครั้งเดียวต่อ stream)
+        
+        offsets: เวลาของ frames (วินาทีจาก start_time) ไม่ระบุ = frame ถัดไปตาม schedule ของ stream
+        fetcher (ทุก interval_s จากต้น window: fetch ที่ถูกตัด / หยุดก่อนครอบคลุมเฉพาะช่วงต้น)
+        
+        Returns:
+            True เมื่อไม่ต้องการ frame เพิ่ม (ค่าประมาณของทุกกล้องนิ่งแล้ว หรือ inference error)
+        """
+        if work.failed or not frames:
+            return work.failed or work.converged
+        first_index = len(work.frames)
+        work.frames.extend(frames)
+        if offsets is None:
+            offsets = [(first_index + i) * work.interval_s for i in range(len(frames))]
+        offsets = [float(t) for t in offsets]
+        work.offsets.extend(offsets)
+        try:
+            start_detect = time.time()
+            with self._stage("inference"), self.frame_budget.charge(work.detector.working_set_bytes(), work.label):
+                counts = work.detector.detect_views(frames, work.views, work.label, work.analytics,
+                                                    work.on_batch, first_index, work.detections, offsets)
+            work.detect_time += time.time() - start_detect
+        except ModelNotReadyError as e:
+            logger.warning(f"[{work.label}] ⏳ {e}, skipping window (not sent)")
+            if PROMETHEUS_AVAILABLE:
+                for camera in work.cameras:
+                    ERRORS_TOTAL.labels(camera_id=camera.camera_id, error_type='model_not_ready').inc()
+            work.failed, work.error = True, str(e)
+            return True
+        except Exception as e:
+            logger.error(f"[{work.label}] ❌ Processing error: {e}")
+            if PROMETHEUS_AVAILABLE:
+                for camera in work.cameras:
+                    ERRORS_TOTAL.labels(camera_id=camera.camera_id, error_type='processing_error').inc()
+            work.failed, work.error = True, f"Inference failed: {e}"
+            return True
+        
+        for camera_id, values in counts.items():
+            work.counts[camera_id].extend(values)
+            if camera_id in work.estimates:
+                work.estimates[camera_id].add(values)
+        return work.converged
+    
+    def finish_group(self, work: GroupWork, send: bool = True) -> List[WindowResult]:
+        """Step 3-4: สรุปผลของทุกกล้องใน window และส่ง backend"""
+        cameras, start_time, end_time = work.cameras, work.start_time, work.end_time
+        if not work.frames:
+            work.error = "No frames captured"
+            for camera in cameras:
+                logger.warning(f"[{camera.camera_id}] ⚠️ No frames captured, skipping window")
+                if PROMETHEUS_AVAILABLE:
+                    ERRORS_TOTAL.labels(camera_id=camera.camera_id, error_type='no_frames').inc()
+                self.breakers.record_failure(camera.camera_id, "no frames captured")
+            return []
+        
+        if work.failed:  # ไม่มีผล detection: ไม่ส่ง / ไม่เก็บ / ไม่ log
+            return []
+        if self.frame_store is not None:
+            self.store_frames(cameras, start_time, work.frames, work.offsets)
+        self.models.recent.add(work.frames)
+        
+        results = []
+        analytics = work.analytics
+        for camera, view in zip(cameras, work.views):
+            fields = analytics.finish(camera.camera_id) if analytics is not None else {}
+            estimate = work.estimates.get(camera.camera_id)
+            sampling = estimate.summary(work.planned, work.covered_s) if estimate is not None else None
+            if sampling is not None and PROMETHEUS_AVAILABLE:
+                SAMPLING_FRAMES.labels(camera_id=camera.camera_id, kind="planned").inc(work.planned)
+                SAMPLING_FRAMES.labels(camera_id=camera.camera_id, kind="used").inc(estimate.n)
+            result = self._summarize(camera, start_time, end_time, work.counts[camera.camera_id],
+                                     view.heatmap, work.detect_time, send, fields, sampling, work.coverage)
+            if result:
+                results.append(result)
+        if self.detection_log is not None:
+            self.log_detections(work)
+        if analytics is not None:
+            analytics.record()
+            logger.info(f"[{work.label}] 🧮 Analytics stage time (ms): "
+                        + ", ".join(f"{name}={ms:g}" for name, ms in analytics.timings_ms().items()))
+        return results
+    
+    def log_detections(self, work: GroupWork):
+        """ส่ง box / score ราย frame ของ window เข้าคิวของ detection log (เขียนลงดิสก์ใน thread ของ log)"""
+        if not work.detections or len(work.detections) != len(work.frames):
+            return  # model ยังไม่พร้อม: count เป็น 0 โดยไม่มี detection
+        try:
+            meta = {
+                "infer_confidence": min(view.confidence for view in work.views),
+                "model": work.detector.model_path,
+                "imgsz": work.detector.imgsz,
+                "sampling_fps": self.playback_config.sampling_fps,
+                "stream_cameras": [cam.camera_id for cam in work.cameras],
+            }
+            base = WindowDetections.from_frames(work.cameras[0].camera_id, work.start_time, work.end_time,
+                                                work.offsets, work.detections, [], meta)
+            for camera in work.cameras:  # กล้องที่ใช้ stream เดียวกันได้ box ชุดเดียวกัน ต่างกันที่ count / ROI
+                self.detection_log.submit(replace(
+                    base, camera_id=camera.camera_id,
+                    count=np.asarray(work.counts[camera.camera_id], dtype=np.int32),
+                    meta=dict(base.meta, camera_id=camera.camera_id, camera_confidence=camera.confidence,
+                              roi=[list(map(float, p)) for p in camera.roi] if len(camera.roi) >= 3 else [])
+                ))
+        except Exception as e:
+            logger.warning(f"[{work.label}] ⚠️ Could not log detections: {e}")
+    
+    def store_frames(self, cameras: List[CameraConfig], start_time: datetime, frames: List[np.ndarray],
+                     offsets: Sequence[float]):
+        """
+        เก็บ frame ของ window ลง ring buffer บนดิสก์ที่เวลาจริงของแต่ละ frame (start_time + offset)
+        (ดิสก์เต็ม/error ไม่ทำให้รอบนั้นล้ม)
+        """
+        try:
+            t0 = to_epoch(start_time)
+            self.frame_store.record([cam.camera_id for cam in cameras], frames, [t0 + t for t in offsets])
+        except Exception as e:
+            logger.warning(f"[{cameras[0].camera_id}] ⚠️ Could not store frames: {e}")
+    
+    def _summarize(self, camera: CameraConfig, start_time: datetime, end_time: datetime, counts: List[int],
+                   heatmap: Optional[OccupancyHeatmap], detect_time: float, send: bool,
+                   analytics: Optional[Dict[str, Any]] = None,
+                   sampling: Optional[Dict[str, Any]] = None,
+                   coverage: float = 1.0) -> Optional[WindowResult]:
+        """
+        Step 3-4 ของกล้อง logical 1 ตัว
+        
+        coverage < 1: frame ครอบคลุมเฉพาะช่วงต้น window (ถูกตัดด้วย max_frames / timeout / หยุดก่อน)
+        → payload บอกช่วงที่ครอบคลุมจริงใน coverage
+        """
         result = WindowResult(
             camera_id=camera.camera_id,
             window_start=start_time,
             window_end=end_time,
-            sampling_fps=self.playback_config.sampling_fps
+            sampling_fps=self.playback_config.sampling_fps,
+            analytics=analytics or {},
+            sampling=sampling or {},
+            coverage=min(1.0, coverage)
         )
+        if coverage < self.FULL_COVERAGE:
+            result.covered_end = start_time + (end_time - start_time) * max(0.0, coverage)
         
         try:
-            # Step 1: Fetch frames from playback
-            frames = self.fetcher.fetch_frames(camera, start_time, end_time)
-            
-            if not frames:
-                logger.warning(f"[{camera.camera_id}] ⚠️ No frames captured, skipping window")
-                if PROMETHEUS_AVAILABLE:
-                    ERRORS_TOTAL.labels(camera_id=camera.camera_id, error_type='no_frames').inc()
-                return None
-            
-            # Step 2: Detect people in each frame
-            logger.info(f"[{camera.camera_id}] 🔍 Running YOLOv8 on {len(frames)} frames...")
-            
-            start_detect = time.time()
-            counts = self.detector.detect_batch(frames, camera.camera_id)
-            detect_time = time.time() - start_detect
-            
             # Step 3: Calculate statistics
             result.frame_counts = counts
             result.frames_processed = len(counts)
             result.max_people = max(counts) if counts else 0
             result.min_people = min(counts) if counts else 0
             result.avg_people = sum(counts) / len(counts) if counts else 0
+            if heatmap is not None:
+                result.heatmap = heatmap
+                self.heatmaps.put(camera.camera_id, heatmap)
+            self.breakers.record_success(camera.camera_id, result.max_people)
             
             logger.info(f"[{camera.camera_id}] 📊 Results:")
             logger.info(f"[{camera.camera_id}]    Frames: {result.frames_processed}")
             logger.info(f"[{camera.camera_id}]    Max: {result.max_people} | Avg: {result.avg_people:.1f} | Min: {result.min_people}")
+            if result.analytics:
+                logger.info(f"[{camera.camera_id}]    Analytics: "
+                            + ", ".join(f"{k}={v}" for k, v in result.analytics.items()))
+            if result.sampling:
+                error = result.sampling["avg_error"]
+                logger.info(f"[{camera.camera_id}]    Sampling: {result.sampling['frames_used']}/"
+                            f"{result.sampling['frames_planned']} frames, avg ±{error if error is not None else '?'} "
+                            f"@ {result.sampling['confidence']:.0%}"
+                            + ("" if result.sampling["converged"] else " (not converged)"))
+            if result.covered_end is not None:
+                logger.info(f"[{camera.camera_id}]    Coverage: {result.coverage:.0%} of window "
+                            f"(frames up to {result.covered_end.strftime('%H:%M:%S')})")
             logger.info(f"[{camera.camera_id}]    Detection time: {detect_time:.1f}s")
             
             # Update Prometheus metrics
@@ -893,7 +2427,8 @@ class PlaybackProcessor:
                 WINDOWS_PROCESSED.labels(camera_id=camera.camera_id).inc()
             
             # Step 4: Send to backend
-            self.sender.send(result)
+            if send:
+                self.sender.send(result)
             
             return result
             
@@ -911,14 +2446,331 @@ class PlaybackProcessor:
             List of WindowResults
         """
         results = []
+        cameras = [cam for cam in self.cameras if cam.enabled]
+        
+        if self.playback_config.continuous:
+            return self.process_continuous(cameras)
+        
+        cameras = self.admit_cameras(cameras)
+        if not cameras:
+            return results
+        
+        # กล้องที่ชี้ไป stream เดียวกัน ดึง/decode/inference ครั้งเดียว
+        groups = group_cameras(cameras)
+        
+        if self.snapshot_mode:
+            return self.process_all_via_snapshots(groups)
+        
+        if self.adaptive is not None:
+            return self.process_adaptive(groups)
+        
+        if self._decode_pool is None:
+            for group in groups:
+                results.extend(self.process_group(group))
+            return results
+        
+        # Pipeline: decode workers ดึง frames พร้อมกัน, inference รันใน thread นี้
+        # ตามลำดับที่ fetch เสร็จ (ใช้ torch threads ตาม resource plan)
+        # worker รอ frame memory budget ก่อนเปิด stream → frame ที่กองรอ inference มีขอบเขต
+        start_time, end_time = self.calculate_time_window()
+        futures = {
+            self._decode_pool.submit(self.fetch_window_leased, group.primary, start_time, end_time,
+                                     False, self.frame_budget.ticket()): group
+            for group in groups
+        }
+        try:
+            for future in as_completed(futures):
+                group = futures[future]
+                frames, lease = future.result()
+                with lease:
+                    results.extend(self.analyze_group(group.cameras, start_time, end_time, frames))
+        finally:
+            self._release_pending(futures)
+        
+        return results
+    
+    def process_adaptive(self, groups: List[SourceGroup]) -> List[WindowResult]:
+        """
+        Pipeline ของ adaptive sampling: decode workers ส่ง frame เข้า WindowFeed ของแต่ละ window
+        thread นี้ infer ทีละ batch_frames ของ window ไหนก็ได้ที่พร้อม และสั่งหยุดดึงเมื่อ
+        ค่าประมาณ avg / max ของทุกกล้องใน stream นิ่งแล้ว (ไม่นิ่ง → ดึงต่อถึง adaptive.max_frames)
+        """
+        start_time, end_time = self.calculate_time_window()
+        planned = self.window_frame_count(start_time, end_time, self.playback_config.max_frames)
+        total = self.window_frame_count(start_time, end_time)
+        batch = self.adaptive.batch_frames or self.detector.batch_size
+        notify = threading.Event()
+        
+        def fetch_into(feed: WindowFeed, camera: CameraConfig, ticket: int) -> Tuple[List[np.ndarray], FrameLease]:
+            try:
+                return self.fetch_window_leased(camera, start_time, end_time, False, ticket, on_frame=feed.put)
+            finally:
+                feed.close()
+        
+        jobs = {}
+        for group in groups:
+            feed = WindowFeed(notify)
+            work = self.begin_group(group.cameras, start_time, end_time, total, planned, adaptive=True)
+            future = self._decode_pool.submit(fetch_into, feed, group.primary, self.frame_budget.ticket())
+            future.add_done_callback(lambda _: notify.set())
+            jobs[future] = (work, feed)
+        
+        results = []
+        try:
+            while jobs:
+                notify.wait(1.0)
+                notify.clear()
+                for future, (work, feed) in list(jobs.items()):
+                    if feed.ready(batch) and self.infer_group(work, feed.take()):
+                        feed.stop()
+                    if feed.finished and future.done():
+                        del jobs[future]
+                        _, lease = future.result()
+                        with lease:
+                            results.extend(self.finish_group(work))
+        finally:
+            self._release_pending(jobs)
+        
+        return results
+    
+    @staticmethod
+    def _release_pending(futures):
+        """คืน budget ของ window ที่ดึงแล้วแต่ไม่ได้วิเคราะห์ (รอบถูกตัดกลางคัน)"""
+        for future in futures:
+            try:
+                future.result()[1].release()
+            except Exception:
+                pass
+    
+    def admit_cameras(self, cameras: List[CameraConfig]) -> List[CameraConfig]:
+        """กรองกล้องที่ circuit open ออก (probe กล้องที่ครบ cooldown แล้ว)"""
+        method = self.breakers.config.probe
+        return self.breakers.admit(
+            cameras,
+            key=lambda cam: cam.camera_id,
+            probe=lambda cam, timeout: self.fetcher.probe(cam, timeout, method)
+        )
+    
+    def camera_statuses(self) -> List[dict]:
+        """สถานะกล้องสำหรับ ai_camera_status ของ backend"""
+        statuses = []
+        for circuit in self.breakers.circuits():
+            status = {
+                "camera_id": circuit.camera_id,
+                "status": "online" if circuit.state == CLOSED else "offline",
+                "circuit_state": circuit.state,
+                "error_message": circuit.last_error or None,
+                "last_seen_at": circuit.last_success_at.isoformat().replace("+00:00", "Z")
+                if circuit.last_success_at else None
+            }
+            if circuit.last_count is not None:
+                status["last_count"] = circuit.last_count
+            statuses.append(status)
+        return statuses
+    
+    def report_camera_status(self):
+        if self.breakers.config.report_status:
+            self.sender.send_camera_status(self.camera_statuses())
+    
+    def window_horizon(self) -> datetime:
+        """ขอบ grid ล่าสุดที่ recording เสร็จแล้ว (now - delay ปัดลง)"""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return align_floor(now - timedelta(minutes=self.playback_config.delay_minutes),
+                           self.playback_config.window_duration_minutes)
+    
+    def seconds_until_next_window(self) -> float:
+        """เวลาที่ต้องรอจน window ถัดไปบน grid พร้อมให้อ่าน"""
+        next_ready = (self.window_horizon()
+                      + timedelta(minutes=self.playback_config.window_duration_minutes)
+                      + timedelta(minutes=self.playback_config.delay_minutes))
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return max(1.0, (next_ready - now).total_seconds())
+    
+    def pending_windows(self, camera: CameraConfig, horizon: datetime) -> List[tuple]:
+        """
+        window บน grid ที่กล้องนี้ยังไม่ได้อ่าน (cursor → horizon)
+        
+        ครั้งแรกเริ่มจาก window ล่าสุด; ถ้าค้างเกิน max_catchup_windows
+        จะข้าม window เก่าสุด (นับเป็น skipped) เพื่อไม่ให้ตามหลังไปเรื่อยๆ
+        """
+        minutes = self.playback_config.window_duration_minutes
+        cursor = self._cursors.get(camera.camera_id, horizon - timedelta(minutes=minutes))
+        windows = grid_windows(cursor, horizon, minutes)
         
-        for camera in self.cameras:
-            if not camera.enabled:
+        overflow = len(windows) - self.playback_config.max_catchup_windows
+        if overflow > 0:
+            logger.warning(f"[{camera.camera_id}] ⚠️ {len(windows)} windows behind, skipping {overflow} oldest")
+            if PROMETHEUS_AVAILABLE:
+                WINDOWS_SKIPPED.labels(camera_id=camera.camera_id, reason='backlog').inc(overflow)
+            aggregator = self._aggregator(camera.camera_id)
+            for start, end in windows[:overflow]:
+                self._emit_rollups(aggregator.add_missing(start, end))
+            windows = windows[overflow:]
+        return windows
+    
+    def _aggregator(self, camera_id: str) -> RollingAggregator:
+        if camera_id not in self._aggregators:
+            self._aggregators[camera_id] = RollingAggregator(
+                camera_id=camera_id,
+                window_minutes=self.playback_config.window_duration_minutes,
+                periods=self.playback_config.rollup_minutes
+            )
+        return self._aggregators[camera_id]
+    
+    def _emit_rollups(self, rollups: List[RollupResult]):
+        for rollup in rollups:
+            self.latest_rollups[(rollup.camera_id, rollup.period_minutes)] = rollup
+            flag = "" if rollup.complete else " (partial)"
+            logger.info(f"[{rollup.camera_id}] 🧮 {rollup.period_minutes}-min rollup "
+                        f"{rollup.window_start.strftime('%H:%M')}→{rollup.window_end.strftime('%H:%M')}: "
+                        f"max={rollup.max_people} avg={rollup.avg_people:.1f} min={rollup.min_people}{flag}")
+            if PROMETHEUS_AVAILABLE:
+                period = str(rollup.period_minutes)
+                PEOPLE_ROLLUP_MAX.labels(camera_id=rollup.camera_id, period_minutes=period).set(rollup.max_people)
+                PEOPLE_ROLLUP_AVG.labels(camera_id=rollup.camera_id, period_minutes=period).set(rollup.avg_people)
+    
+    def process_continuous(self, cameras: List[CameraConfig]) -> List[WindowResult]:
+        """
+        Continuous mode: ประมวลผลทุก window บน grid ที่ยังไม่ได้อ่านของทุกกล้อง
+        
+        - ทุกกล้องใช้ horizon เดียวกัน → ขอบ window ตรงกันทุกกล้อง/ทุกรอบ
+        - ดึงแบบ playback ตรงช่วง window (ไม่อ่าน footage ซ้ำ)
+        - cursor เลื่อนหลังอ่านแต่ละ window ไม่ว่าจะสำเร็จหรือไม่
+        - กล้องที่ใช้ stream เดียวกันดึงครั้งเดียว (cursor เลื่อนไปพร้อมกัน)
+        """
+        horizon = self.window_horizon()
+        admitted = {cam.camera_id for cam in self.admit_cameras(cameras)}
+        jobs = []
+        for group in group_cameras(cameras):
+            pending = {cam.camera_id: self.pending_windows(cam, horizon) for cam in group.cameras}
+            windows = pending[group.primary.camera_id]
+            if any(cam.camera_id in admitted for cam in group.cameras):
+                jobs.extend((group, start, end) for start, end in windows)
                 continue
-            
-            result = self.process_camera(camera)
+            for camera in group.cameras:
+                windows = pending[camera.camera_id]
+                if not windows:
+                    continue
+                # circuit open: ข้าม window แต่เลื่อน cursor (rollup ถูก mark ว่าไม่ครบ)
+                if PROMETHEUS_AVAILABLE:
+                    WINDOWS_SKIPPED.labels(camera_id=camera.camera_id, reason='circuit_open').inc(len(windows))
+                aggregator = self._aggregator(camera.camera_id)
+                for start, end in windows:
+                    self._emit_rollups(aggregator.add_missing(start, end))
+                self._cursors[camera.camera_id] = windows[-1][1]
+        if not jobs:
+            return []
+        
+        logger.info(f"🧭 Continuous: {len(jobs)} window(s) up to {horizon.strftime('%H:%M:%S')} UTC")
+        
+        def fetch(group: SourceGroup, start: datetime, end: datetime,
+                  ticket: Optional[int]) -> Tuple[List[np.ndarray], FrameLease]:
+            # stream ที่ circuit เพิ่ง open ระหว่างรอบ ไม่ต้องดึง window ที่เหลือ (ยังต้องผ่านคิว budget)
+            if all(self.breakers.is_open(camera_id) for camera_id in group.camera_ids):
+                return [], self.frame_budget.acquire(0, group.label, ticket)
+            return self.fetch_window_leased(group.primary, start, end, True, ticket)
+        
+        # ticket ตามลำดับ job = ลำดับที่ loop ด้านล่างรอผล → worker ไม่จอง budget ข้ามหน้า window ที่ต้องวิเคราะห์ก่อน
+        futures = []
+        if self._decode_pool is not None:
+            futures = [self._decode_pool.submit(fetch, group, start, end, self.frame_budget.ticket())
+                       for group, start, end in jobs]
+            fetched = (future.result() for future in futures)
+        else:
+            fetched = (fetch(group, start, end, None) for group, start, end in jobs)
+        
+        # ประมวลผลตามลำดับเวลาของแต่ละกล้อง เพื่อให้ rollup ได้ window เรียงกัน
+        results = []
+        try:
+            for (group, start, end), (frames, lease) in zip(jobs, fetched):
+                with lease:
+                    results.extend(self._analyze_continuous(group, start, end, frames))
+        finally:
+            self._release_pending(futures)
+        
+        return results
+    
+    def _analyze_continuous(self, group: SourceGroup, start: datetime, end: datetime,
+                            frames: List[np.ndarray]) -> List[WindowResult]:
+        """วิเคราะห์ 1 window ของ continuous mode แล้วเลื่อน cursor / rollup ของทุกกล้องในกลุ่ม"""
+        results = []
+        by_camera = {r.camera_id: r for r in self.analyze_group(group.cameras, start, end, frames)}
+        for camera in group.cameras:
+            result = by_camera.get(camera.camera_id)
+            aggregator = self._aggregator(camera.camera_id)
             if result:
                 results.append(result)
+                rollups = aggregator.add(start, end, result.max_people, result.avg_people,
+                                         result.min_people, result.frames_processed)
+            else:
+                if PROMETHEUS_AVAILABLE:
+                    WINDOWS_SKIPPED.labels(camera_id=camera.camera_id, reason='no_frames').inc()
+                rollups = aggregator.add_missing(start, end)
+            self._emit_rollups(rollups)
+            self._cursors[camera.camera_id] = end
+        
+        return results
+    
+    def process_all_via_snapshots(self, groups: List[SourceGroup]) -> List[WindowResult]:
+        """
+        Snapshot mode: poll JPEG ของทุก stream พร้อมกันตลอด window (live)
+        
+        ถ้า frame ของทุกกล้องรวมกันเกิน frame memory budget จะ poll เป็นชุด (wave) ทีละชุด
+        (รอบนานขึ้นแทนที่ memory จะโตตามจำนวนกล้อง)
+        window_start/window_end = เวลาที่ดึง snapshot จริง
+        """
+        duration_s = self.playback_config.window_duration_minutes * 60
+        ticks = max(1, min(int(duration_s * self.playback_config.sampling_fps), self.playback_config.max_frames))
+        # decode แบบลดขนาดได้ด้านยาว < 2 x imgsz (16:9)
+        imgsz = self.service_config.imgsz
+        default_bytes = (2 * imgsz) * (2 * imgsz * 9 // 16) * 3
+        
+        results = []
+        remaining = list(groups)
+        while remaining:
+            # วางแผนใหม่ทุก wave: ขนาด frame จริงของ wave ก่อนหน้าทำให้ประมาณ wave ถัดไปแม่นขึ้น
+            sizes = [self.frame_budget.estimate(group.primary.camera_id, ticks, default_bytes) for group in remaining]
+            waves = self.frame_budget.plan_waves(sizes)
+            if len(waves) > 1:
+                logger.warning(f"🧠 Frame memory budget: {len(remaining)} camera(s) need ~{len(waves)} waves "
+                               f"(~{sum(sizes) / 1e6:.0f} MB of frames > {self.frame_budget.budget / 1e6:.0f} MB budget)")
+            wave = waves[0]
+            results.extend(self._poll_snapshot_wave([remaining[i] for i in wave], sum(sizes[i] for i in wave),
+                                                    duration_s))
+            remaining = remaining[len(wave):]
+        return results
+    
+    def _poll_snapshot_wave(self, groups: List[SourceGroup], estimate: int, duration_s: float) -> List[WindowResult]:
+        """poll snapshot ของกลุ่มกล้องชุดเดียวตลอด window แล้ววิเคราะห์ (คืน memory ทีละกล้อง)"""
+        sources = [self.fetcher.snapshot_source(group.primary) for group in groups]
+        
+        logger.info(f"📸 Polling {len(sources)} camera(s) via snapshots for {duration_s}s "
+                    f"@ {self.playback_config.sampling_fps} fps")
+        
+        results = []
+        with self.frame_budget.acquire(estimate, "snapshots", kind="snapshot") as lease:
+            window_start = datetime.now(timezone.utc).replace(tzinfo=None)
+            with self._stage("decode"):
+                captured = self.snapshot_poller.poll(
+                    sources,
+                    sampling_fps=self.playback_config.sampling_fps,
+                    duration_s=duration_s,
+                    max_frames=self.playback_config.max_frames
+                )
+            window_end = datetime.now(timezone.utc).replace(tzinfo=None)
+            for camera_id, samples in captured.items():
+                self.frame_budget.observe(camera_id, [frame for _, frame in samples])
+            lease.resize(sum(frames_nbytes([frame for _, frame in samples]) for samples in captured.values()))
+            
+            for group in groups:
+                samples = captured.pop(group.primary.camera_id, [])
+                logger.info(f"[{group.label}] 📸 Captured {len(samples)} snapshots")
+                start_time = samples[0][0] if samples else window_start
+                end_time = samples[-1][0] if samples else window_end
+                frames = [frame for _, frame in samples]
+                offsets = [(ts - start_time).total_seconds() for ts, _ in samples]
+                results.extend(self.analyze_group(group.cameras, start_time, end_time, frames, offsets=offsets))
+                lease.resize(lease.nbytes - frames_nbytes(frames))
         
         return results
 
@@ -936,23 +2788,278 @@ class PeopleCountingService:
     
     def __init__(self):
         self.running = False
-        self.config_loader = ConfigLoader()
+        self.timer = StartupTimer()
+        
+        with self.timer.phase("config"):
+            self.config_loader = ConfigLoader(os.environ.get('CONFIG_PATH', 'config.yaml'))
+            
+            # Load configurations
+            self.service_config = self.config_loader.get_service_config()
+            self.playback_config = self.config_loader.get_playback_config()
+            self.cameras = self.config_loader.get_cameras()
         
-        # Load configurations
-        self.service_config = self.config_loader.get_service_config()
-        self.playback_config = self.config_loader.get_playback_config()
-        self.cameras = self.config_loader.get_cameras()
+        # Health server ต้องขึ้นก่อนโหลด model เพื่อให้ Railway เห็นสถานะ "starting"
+        try:
+            health.start_health_server(self.service_config.health_port)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not start health server: {e}")
+        health.update_status(status="starting", ready=False, cameras=len(self.cameras))
+        
+        # แบ่ง CPU ก่อน import torch/cv2 (OMP threads อ่านค่าตอน import)
+        self.resource_plan: Optional[ResourcePlan] = None
+        resource_config = self.config_loader.get_resource_config()
+        if resource_config.enabled:
+            with self.timer.phase("resource_plan"):
+                self.resource_plan = plan_resources(resource_config, len(self.cameras))
+                apply_process_plan(self.resource_plan)
         
         # Initialize processor
-        self.processor = PlaybackProcessor(
-            playback_config=self.playback_config,
-            service_config=self.service_config,
-            cameras=self.cameras
-        )
+        with self.timer.phase("processor_init"):
+            self.processor = PlaybackProcessor(
+                playback_config=self.playback_config,
+                service_config=self.service_config,
+                cameras=self.cameras,
+                timer=self.timer,
+                resource_plan=self.resource_plan,
+                hikvision=self.config_loader.get_hikvision_config(),
+                tiling=self.config_loader.get_tiling_config(),
+                cascade=self.config_loader.get_cascade_config(),
+                heatmap=self.config_loader.get_heatmap_config(),
+                breaker=self.config_loader.get_breaker_config(),
+                autotune=self.config_loader.get_autotune_config(),
+                frame_store=self.config_loader.get_frame_store_config(),
+                analytics=self.config_loader.get_analytics_config(),
+                memory_budget=self.config_loader.get_memory_budget_config(),
+                crowd_alerts=self.config_loader.get_crowd_alert_config(),
+                hot_swap=self.config_loader.get_hot_swap_config(),
+                decoder_workers=self.config_loader.get_decoder_worker_config(),
+                adaptive_sampling=self.config_loader.get_adaptive_sampling_config(),
+                buffer_pool=self.config_loader.get_buffer_pool_config(),
+                detection_log=self.config_loader.get_detection_log_config()
+            )
+        health.register_route("/circuits", lambda path, query, headers: (200, {
+            "cameras": self.processor.breakers.snapshot()
+        }))
+        health.register_route("/memory", lambda path, query, headers: (200, self.processor.frame_budget.summary()))
+        health.register_route("/decoders", lambda path, query, headers: (200, (
+            self.processor.decoders.summary() if self.processor.decoders else {"enabled": False}
+        )))
+        health.register_route("/buffers", lambda path, query, headers: (200, {
+            "frames": self.processor.frame_pool.summary(),
+            "inputs": self.processor.input_pool.summary()
+        }))
+        health.register_route("/detections", lambda path, query, headers: (200, (
+            self.processor.detection_log.summary() if self.processor.detection_log else {"enabled": False}
+        )))
+        health.register_route("/alerts", lambda path, query, headers: (200, {
+            "enabled": self.processor.alert_monitor.enabled,
+            "active": self.processor.alert_monitor.active()
+        }))
+        
+        # Heatmap ล่าสุดของแต่ละกล้อง (/heatmap/<camera_id>)
+        if self.processor.heatmap_config.enabled:
+            health.register_route("/heatmap/", self._handle_heatmap)
+        
+        # สรุป ring buffer ของ frame (/frames/<camera_id>)
+        if self.processor.frame_store is not None:
+            health.register_route("/frames", self._handle_frames)
+        
+        # On-demand count API (/count/<camera_id>) บน health server
+        self.ondemand_config = self.config_loader.get_ondemand_config()
+        self.ondemand: Optional[OnDemandCounter] = None
+        if self.ondemand_config.enabled and not self.ondemand_config.api_key:
+            # health server อยู่บน PORT สาธารณะ: ไม่มี key = ใครก็สั่ง NVR fetch + inference แซงคิวได้
+            logger.warning("⚠️ On-demand count API disabled: set ondemand.api_key (env ONDEMAND_API_KEY) to enable")
+        elif self.ondemand_config.enabled:
+            self._setup_ondemand()
+        
+        # ดู (GET) / สั่ง re-tune (POST) ค่า imgsz / batch / threads
+        self._retune_thread: Optional[threading.Thread] = None
+        health.register_route("/autotune", self._handle_autotune)
+        health.register_route("/autotune", self._handle_retune, method="POST")
+        
+        # ดู (GET) / สั่ง (POST) hot swap ของ model (/model?swap=1&model=...)
+        health.register_route("/model", self._handle_model)
+        health.register_route("/model", self._handle_model_swap, method="POST")
         
         # Setup signal handlers
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._reload_model_handler)
+    
+    def _setup_ondemand(self):
+        """ผูก OnDemandCounter กับ fetcher/detector ของ processor แล้ว register route"""
+        cameras = {cam.camera_id: cam for cam in self.cameras}
+        
+        def fetch_frame(camera_id: str) -> Optional[np.ndarray]:
+            return self.processor.fetcher.fetch_single_snapshot(cameras[camera_id])
+        
+        def count_frame(frame: np.ndarray, camera_id: str) -> int:
+            view = CameraView.from_camera(cameras[camera_id])
+            detector = self.processor.detector
+            with detector.inference_lock.hold(priority=True):
+                xyxy, scores = detector.detect_boxes(frame, view.confidence, camera_id)
+            return int(np.count_nonzero(view.select(xyxy, scores, frame.shape[:2])))
+        
+        self.ondemand = OnDemandCounter(self.ondemand_config, fetch_frame, count_frame)
+        
+        def handle_count(camera_id: str, query: Dict[str, List[str]], headers) -> tuple:
+            denied = self._check_api_key(headers)
+            if denied:
+                return denied
+            camera_id = urllib.parse.unquote(camera_id.strip('/'))
+            if camera_id not in cameras:
+                return 404, {"error": f"Unknown camera: {camera_id}", "cameras": sorted(cameras)}
+            if not self.processor.detector.ready:
+                return 503, {"error": "Model is not ready yet"}
+            if self.processor.breakers.is_open(camera_id):
+                return 503, {"error": f"Camera {camera_id} is offline (circuit open)"}
+            max_age = None
+            if 'max_age' in query:
+                try:
+                    max_age = float(query['max_age'][0])
+                except ValueError:
+                    max_age = -1.0
+                if not (0 <= max_age < float('inf')):
+                    return 400, {"error": f"max_age must be a non-negative number of seconds: {query['max_age'][0]!r}"}
+            try:
+                return 200, self.ondemand.get(camera_id, max_age)
+            except (TimeoutError, FuturesTimeoutError):
+                return 504, {"error": "Timed out waiting for inference"}
+            except RuntimeError as e:
+                return 502, {"error": str(e)}
+        
+        health.register_route("/count/", handle_count)
+    
+    def _handle_heatmap(self, camera_id: str, query: Dict[str, List[str]], headers) -> tuple:
+        """
+        GET /heatmap/<camera_id>             payload บีบอัด (เหมือนที่ส่ง backend)
+        GET /heatmap/<camera_id>?format=grid  density (คน/frame ต่อ cell) เป็น list ซ้อน
+        """
+        camera_id = urllib.parse.unquote(camera_id.strip('/'))
+        if not camera_id:
+            return 200, {"cameras": self.processor.heatmaps.camera_ids()}
+        heatmap = self.processor.heatmaps.get(camera_id)
+        if heatmap is None:
+            return 404, {"error": f"No heatmap yet for camera: {camera_id}"}
+        body = heatmap.to_payload()
+        if query.get('format', [''])[0] == 'grid':
+            del body["data"]
+            body["encoding"] = "json"
+            body["density"] = np.round(heatmap.density(), 3).tolist()
+        body["camera_id"] = camera_id
+        return 200, body
+    
+    def _handle_frames(self, path: str, query: Dict[str, List[str]], headers) -> tuple:
+        """
+        GET /frames               กล้องที่มี frame เก็บไว้
+        GET /frames/<camera_id>   จำนวน frame, ช่วงเวลาที่มี (oldest/newest), ขนาดบนดิสก์
+        """
+        store = self.processor.frame_store
+        camera_id = urllib.parse.unquote(path.strip('/'))
+        if not camera_id:
+            return 200, {"cameras": store.camera_ids(), "capacity": store.capacity}
+        summary = store.summary(camera_id)
+        if summary is None:
+            return 404, {"error": f"No stored frames for camera: {camera_id}"}
+        return 200, summary
+    
+    def _handle_autotune(self, path: str, query: Dict[str, List[str]], headers) -> tuple:
+        """GET /autotune   ค่าที่ใช้อยู่ (imgsz / batch / threads) - สั่ง sweep ใหม่ด้วย POST"""
+        if 'retune' in query:
+            return 405, {"error": "Use POST /autotune?retune=1 to start a re-tune"}
+        detector = self.processor.detector
+        return 200, {
+            "imgsz": detector.imgsz,
+            "batch_size": detector.batch_size,
+            "threads": _torch.get_num_threads() if detector.ready else None,
+            "tuned": asdict(detector.tune_result) if detector.tune_result else None,
+            "retuning": bool(self._retune_thread and self._retune_thread.is_alive())
+        }
+    
+    def _handle_retune(self, path: str, query: Dict[str, List[str]], headers) -> tuple:
+        """POST /autotune?retune=1   sweep ใหม่ใน background (ต้องมี X-API-Key ของ ondemand.api_key)"""
+        denied = self._check_api_key(headers)
+        if denied:
+            return denied
+        if query.get('retune', ['0'])[0] not in ('1', 'true'):
+            return 400, {"error": "Specify retune=1"}
+        detector = self.processor.detector
+        if not detector.ready:
+            return 503, {"error": "Model is not ready yet"}
+        if self._retune_thread and self._retune_thread.is_alive():
+            return 409, {"error": "Re-tune already running"}
+        self._retune_thread = threading.Thread(target=detector.retune, name="autotune", daemon=True)
+        self._retune_thread.start()
+        return 202, {"status": "retuning"}
+    
+    def _check_api_key(self, headers) -> Optional[tuple]:
+        """
+        endpoint ที่สั่งงานหนัก / เปลี่ยนสถานะ service (/count, swap / rollback, retune): ต้องตั้ง
+        ondemand.api_key (env ONDEMAND_API_KEY) และส่ง X-API-Key ตรงกัน - ไม่ได้ตั้ง key = ปิด (403)
+        """
+        api_key = self.ondemand_config.api_key
+        if not api_key:
+            return 403, {"error": "Disabled: set ondemand.api_key (env ONDEMAND_API_KEY) to enable"}
+        if not hmac.compare_digest(headers.get('X-API-Key', '').encode(), api_key.encode()):
+            return 401, {"error": "Invalid or missing API key"}
+        return None
+    
+    def _handle_model(self, path: str, query: Dict[str, List[str]], headers) -> tuple:
+        """GET /model   model ที่ใช้อยู่ / ก่อนหน้า / ผล swap ล่าสุด (สั่ง swap / rollback ด้วย POST)"""
+        if 'swap' in query or 'rollback' in query:
+            return 405, {"error": "Use POST /model to swap or roll back the model"}
+        return 200, self.processor.models.status()
+    
+    def _handle_model_swap(self, path: str, query: Dict[str, List[str]], headers) -> tuple:
+        """
+        POST /model?swap=1&model=yolov8s.pt[&lean=1][&device=cpu][&imgsz=640]   hot swap ใน background
+        POST /model?rollback=1                                                   กลับไปใช้ model ก่อนหน้าทันที
+        ต้องมี X-API-Key (ondemand.api_key); model = ชื่อไฟล์เปล่าหรือ path ใต้ service.model_cache_dir
+        """
+        denied = self._check_api_key(headers)
+        if denied:
+            return denied
+        models = self.processor.models
+        swap = query.get('swap', ['0'])[0] in ('1', 'true')
+        rollback = query.get('rollback', ['0'])[0] in ('1', 'true')
+        if not (swap or rollback):
+            return 400, {"error": "Specify swap=1 or rollback=1"}
+        if not models.config.enabled:
+            return 403, {"error": "Hot swap is disabled (hot_swap.enabled)"}
+        if models.busy:
+            return 409, {"error": "Model swap already running", "pending": models.status()["pending"]}
+        if rollback:
+            if not models.rollback():
+                return 409, {"error": "No previous model to roll back to"
+                                      + ("" if models.config.keep_previous else " (hot_swap.keep_previous is off)")}
+            return 200, models.status()
+        if not self.processor.detector.ready:
+            return 503, {"error": "Model is not ready yet"}
+        model = query.get('model', [None])[0]
+        if model is not None and not model_allowed(model, Path(self.service_config.model_cache_dir)):
+            return 403, {"error": f"Model must be a file name or a path under {self.service_config.model_cache_dir}"}
+        lean = query['lean'][0] in ('1', 'true') if 'lean' in query else None
+        imgsz = int(query['imgsz'][0]) if 'imgsz' in query else None
+        if not self.processor.request_model_swap(model=model, lean=lean,
+                                                 device=query.get('device', [None])[0], imgsz=imgsz):
+            return 409, {"error": "Requested model is already serving", "current": models.status()["current"]}
+        return 202, {"status": "loading", **models.status()}
+    
+    def _reload_model_handler(self, signum, frame):
+        """SIGHUP: อ่าน service.* ใน config.yaml ใหม่แล้ว hot swap ถ้า model / backend เปลี่ยน"""
+        try:
+            service = ConfigLoader(self.config_loader.config_path).get_service_config()
+        except Exception as e:
+            logger.error(f"❌ SIGHUP: could not reload config: {e}")
+            return
+        # imgsz ที่ autotune เลือกไว้ใช้ต่อ (config เปลี่ยน imgsz มีผลเมื่อไม่ได้ autotune)
+        imgsz = service.imgsz if self.processor.detector.tune_result is None else None
+        logger.info("🔁 SIGHUP: reloading model settings from config")
+        if not self.processor.request_model_swap(model=service.model, lean=service.lean_inference,
+                                                 device=service.device, imgsz=imgsz):
+            logger.info("   Model unchanged (or a swap is already running / hot swap disabled)")
     
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals"""
@@ -967,15 +3074,44 @@ class PeopleCountingService:
         logger.info("=" * 70)
         logger.info("")
         logger.info("📋 Configuration:")
-        logger.info(f"   Model: {self.service_config.model}")
+        logger.info(f"   Model: {self.processor.models.spec.model}")
+        if isinstance(self.processor.detector, CascadeDetector):
+            logger.info(f"   Cascade: {self.service_config.model} → {self.processor.detector.cascade.model}")
         logger.info(f"   Device: {self.service_config.device}")
         logger.info(f"   Confidence: {self.service_config.confidence}")
+        logger.info(f"   Inference: {'lean count-only' if self.service_config.lean_inference else 'model.predict'}")
+        if self.processor.analytics.enabled:
+            logger.info(f"   Analytics: {', '.join(s.name for s in self.processor.analytics.stages)}")
         logger.info("")
         logger.info("⏰ Playback Settings:")
         logger.info(f"   Window Duration: {self.playback_config.window_duration_minutes} minutes")
         logger.info(f"   Delay: {self.playback_config.delay_minutes} minute(s)")
-        logger.info(f"   Interval: Every {self.playback_config.interval_minutes} minutes")
+        if self.playback_config.continuous:
+            logger.info(f"   Interval: Continuous (grid-aligned, rollups {self.playback_config.rollup_minutes} min)")
+        else:
+            logger.info(f"   Interval: Every {self.playback_config.interval_minutes} minutes")
         logger.info(f"   Sampling FPS: {self.playback_config.sampling_fps}")
+        logger.info(f"   Acquisition: {'snapshot' if self.processor.snapshot_mode else 'stream'}"
+                    f"{' (mjpeg ingest)' if self.playback_config.ingest == 'mjpeg' and not self.processor.snapshot_mode else ''}")
+        if self.processor.decoders is not None:
+            logger.info(f"   Decoder workers: {self.processor.decoders.size} supervised process(es)")
+        if self.processor.adaptive is not None:
+            adaptive = self.processor.adaptive
+            logger.info(f"   Adaptive sampling: {adaptive.min_frames}-{adaptive.max_frames} frames, "
+                        f"±max({adaptive.abs_error:g}, {adaptive.rel_error:.0%}) @ {adaptive.confidence:.0%}")
+        if self.processor.frame_budget.enabled:
+            logger.info(f"   Frame memory budget: {self.processor.frame_budget.budget / 1e6:.0f} MB")
+        if self.processor.frame_pool.enabled:
+            logger.info(f"   Buffer pools: frames + model inputs (≤{self.processor.frame_pool.config.max_free_mb:g} MB idle each)")
+        if self.processor.detection_log is not None:
+            detection_log = self.processor.detection_log
+            logger.info(f"   Detection log: {detection_log.format} → {detection_log.directory} "
+                        f"(keep {detection_log.config.retention_hours:g}h)")
+        alerts = self.processor.alert_monitor.config
+        if alerts.enabled:
+            logger.info(f"   Crowd alerts: warning={alerts.warning or '-'} critical={alerts.critical or '-'} "
+                        f"(+{len(alerts.cameras)} per-camera, ≥{alerts.min_duration_s:g}s, "
+                        f"hysteresis {alerts.hysteresis:.0%}) → {self.processor.alert_sender.url or 'no endpoint'}")
         logger.info("")
         logger.info("📹 Cameras:")
         for cam in self.cameras:
@@ -985,6 +3121,9 @@ class PeopleCountingService:
         logger.info("🔗 Backend:")
         logger.info(f"   Endpoint: {self.service_config.backend_endpoint or 'Not configured'}")
         logger.info("")
+        if self.resource_plan:
+            log_plan(self.resource_plan, len(self.cameras))
+            logger.info("")
         logger.info("=" * 70)
         logger.info("")
     
@@ -993,6 +3132,13 @@ class PeopleCountingService:
         logger.info("🔄 Starting processing cycle...")
         results = self.processor.process_all_cameras()
         logger.info(f"✅ Processed {len(results)} cameras")
+        self.processor.report_camera_status()
+        detector = self.processor.detector
+        health.update_status(
+            status="running" if detector.ready else ("error" if detector.load_error else "starting"),
+            cameras=len(self.cameras),
+            processed=health.service_status["total_processed"] + len(results)
+        )
         return results
     
     def run(self):
@@ -1012,33 +3158,45 @@ class PeopleCountingService:
             return
         
         # Start Prometheus metrics server
-        if PROMETHEUS_AVAILABLE:
+        if PROMETHEUS_AVAILABLE and not self.service_config.metrics_port:
+            health.serve_metrics()
+            logger.info(f"📊 Prometheus metrics at :{self.service_config.health_port}/metrics (health server)")
+        elif PROMETHEUS_AVAILABLE:
             try:
                 start_http_server(self.service_config.metrics_port)
                 logger.info(f"📊 Prometheus metrics at :{self.service_config.metrics_port}/metrics")
             except Exception as e:
-                logger.warning(f"⚠️ Could not start metrics server: {e}")
+                logger.error(f"❌ Could not start metrics server on port {self.service_config.metrics_port}: {e} "
+                             f"- Prometheus metrics are unavailable (set service.metrics_port to a free port)")
         
         self.running = True
-        interval_seconds = self.playback_config.interval_minutes * 60
         
-        logger.info(f"🏃 Service started! Processing every {self.playback_config.interval_minutes} minutes...")
+        if self.playback_config.continuous:
+            logger.info(f"🏃 Service started! Continuous {self.playback_config.window_duration_minutes}-minute grid windows...")
+        else:
+            logger.info(f"🏃 Service started! Processing every {self.playback_config.interval_minutes} minutes...")
         logger.info("")
         
-        # Run first cycle immediately
+        # Run first cycle immediately (model อาจยัง warm-up อยู่ใน background)
+        logger.info(f"⏱️ Service up in {time.perf_counter() - self.timer.started_at:.2f}s "
+                    f"(model ready: {self.processor.detector.ready})")
         self.run_once()
         
         # Main loop
         while self.running:
             try:
-                # Wait for next interval
-                logger.info(f"💤 Sleeping for {self.playback_config.interval_minutes} minutes...")
+                # Wait for next interval (continuous: จนถึงขอบ grid ถัดไป)
+                if self.playback_config.continuous:
+                    wait_seconds = self.processor.seconds_until_next_window()
+                    logger.info(f"💤 Next grid window in {wait_seconds:.0f}s...")
+                else:
+                    wait_seconds = self.playback_config.interval_minutes * 60
+                    logger.info(f"💤 Sleeping for {self.playback_config.interval_minutes} minutes...")
                 
                 # Sleep in small chunks to respond to signals faster
-                for _ in range(interval_seconds):
-                    if not self.running:
-                        break
-                    time.sleep(1)
+                deadline = time.monotonic() + wait_seconds
+                while self.running and time.monotonic() < deadline:
+                    time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
                 
                 if self.running:
                     self.run_once()
@@ -1050,6 +3208,12 @@ class PeopleCountingService:
                 logger.error(f"❌ Loop error: {e}")
                 time.sleep(60)  # Wait before retry
         
+        if self.processor.alert_sender is not None:
+            self.processor.alert_sender.flush()
+        if self.processor.detection_log is not None:
+            self.processor.detection_log.flush()
+        if self.processor.decoders is not None:
+            self.processor.decoders.close()
         logger.info("👋 Service stopped")
 
 
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Frame Memory Budget - จำกัด byte ของ frame / tensor ที่ค้างอยู่ใน memory พร้อมกันทั้ง service
+
+ปัญหา: 1 window เก็บ frame ความละเอียดเต็มได้ถึง max_frames ภาพ (1080p x 60 ≈ 370 MB)
+และเมื่อ decode workers ดึงหลายกล้องพร้อมกันเร็วกว่า inference กิน frame ก็กองรอจนเกิน memory ของ container
+
+แนวทาง:
+- จอง byte โดยประมาณของ window ก่อนเปิด stream (รอถ้า budget เต็ม = backpressure ไปที่ fetcher)
+  แล้วปรับเป็นขนาดจริงหลังดึงเสร็จ คืนเมื่อวิเคราะห์ window นั้นจบ
+- จองตามลำดับคิว (ticket) ที่ผู้ส่งงานออกให้ → งานที่ผู้บริโภครอก่อนได้ memory ก่อนเสมอ (ไม่ deadlock)
+- งานเดียวที่ใหญ่กว่า budget ทั้งก้อนผ่านได้เมื่อไม่มีอะไรค้างอยู่ (memory ≤ max(budget, 1 window))
+- tensor ของ inference ถูกนับ (charge) โดยไม่รอ: frame ที่กองอยู่ต้องผ่าน inference ถึงจะคืน budget ได้
+- budget อัตโนมัติ = fraction x memory limit ของ container (cgroup) หรือ RAM ของเครื่อง
+"""
+import math
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+FRAME_MEMORY_BUDGET = None
+FRAME_MEMORY_IN_USE = None
+FRAME_MEMORY_UTILIZATION = None
+FRAME_MEMORY_WAIT = None
+FRAME_MEMORY_TIMEOUTS = None
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+    PROMETHEUS_AVAILABLE = True
+    FRAME_MEMORY_BUDGET = Gauge('frame_memory_budget_bytes', 'Service-wide budget for in-flight frames and tensors')
+    FRAME_MEMORY_IN_USE = Gauge('frame_memory_in_use_bytes', 'Bytes of in-flight frames and tensors')
+    FRAME_MEMORY_UTILIZATION = Gauge('frame_memory_utilization', 'In-flight frame bytes / budget')
+    FRAME_MEMORY_WAIT = Histogram('frame_memory_wait_seconds', 'Time a fetch waited for frame memory budget', ['kind'])
+    FRAME_MEMORY_TIMEOUTS = Counter('frame_memory_wait_timeouts_total', 'Reservations admitted after the wait timeout', ['kind'])
+except ImportError:
+    pass
+
+FULL_HD_BYTES = 1920 * 1080 * 3  # ขนาด frame สมมติของกล้องที่ยังไม่เคยเห็น (BGR 1080p)
+
+
+@dataclass
+class MemoryBudgetConfig:
+    """Configuration สำหรับ frame memory budget"""
+    enabled: bool = True
+    budget_mb: float = 0.0        # 0 = อัตโนมัติจาก memory limit x fraction
+    fraction: float = 0.35        # สัดส่วนของ memory limit ที่ให้ frame/tensor (ที่เหลือ = model, torch, python)
+    wait_timeout_s: float = 600.0  # รอนานกว่านี้ให้ผ่านไปเลย (กันค้างถาวรถ้าคิวเสีย) + นับ metric
+
+
+def memory_limit_bytes() -> Optional[int]:
+    """memory limit ของ container (cgroup v2 แล้ว v1) หรือ RAM ทั้งเครื่อง"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value != "max" and int(value) < 1 << 60:  # v1 ไม่จำกัด = ค่าใหญ่มาก
+                return int(value)
+        except (OSError, ValueError):
+            continue
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def frames_nbytes(frames: Sequence[np.ndarray]) -> int:
+    return int(sum(frame.nbytes for frame in frames))
+
+
+class FrameLease:
+    """byte ที่จองไว้ของงาน 1 ชิ้น; ใช้เป็น context manager เพื่อคืนเมื่อจบ"""
+
+    def __init__(self, budget: "FrameBudget", nbytes: int, label: str = ""):
+        self.budget = budget
+        self.nbytes = nbytes
+        self.label = label
+        self.released = False
+        self.on_release: Optional[Callable[[], None]] = None  # เช่นคืน buffer ของ frame ให้ pool
+
+    def resize(self, nbytes: int):
+        """ปรับเป็นขนาดจริง (ลด = คืน budget ทันที, เพิ่ม = นับเพิ่มโดยไม่รอ เพราะอยู่ใน memory แล้ว)"""
+        if not self.released:
+            self.budget._adjust(int(nbytes) - self.nbytes)
+            self.nbytes = int(nbytes)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.budget._adjust(-self.nbytes)
+            self.nbytes = 0
+            if self.on_release is not None:
+                self.on_release()
+
+    def __enter__(self) -> "FrameLease":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FrameBudget:
+    """
+    ตัวนับ byte ของ frame / tensor ที่ค้างอยู่ทั้ง service (thread-safe)
+
+    ใช้:
+        ticket = budget.ticket()                    # ตอนส่งงาน (ตามลำดับที่จะบริโภค)
+        lease = budget.acquire(estimate, "cam", ticket)  # ใน fetch worker: รอจนถึงคิวและ budget พอ
+        lease.resize(frames_nbytes(frames))
+        with lease:
+            analyze(frames)
+    """
+
+    def __init__(self, config: Optional[MemoryBudgetConfig] = None):
+        self.config = config or MemoryBudgetConfig()
+        self.limit_bytes = memory_limit_bytes()
+        if not self.config.enabled:
+            self.budget = math.inf
+        elif self.config.budget_mb > 0:
+            self.budget = int(self.config.budget_mb * 1e6)
+        else:
+            self.budget = int((self.limit_bytes or 2 * 1024 ** 3) * self.config.fraction)
+        self.used = 0
+        self.peak = 0
+        self.waiting = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self._issued = 0
+        self._head = 0
+        self._skipped: set = set()
+        self._frame_bytes: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        if PROMETHEUS_AVAILABLE and self.config.enabled:
+            FRAME_MEMORY_BUDGET.set(self.budget)
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def ticket(self) -> int:
+        """ลำดับคิว ออกตอนส่งงานตามลำดับที่ผู้บริโภคจะรอผล"""
+        with self._cond:
+            ticket = self._issued
+            self._issued += 1
+            return ticket
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.used + nbytes <= self.budget or self.used == 0
+
+    def _admit(self, ticket: int):
+        self._skipped.add(ticket)
+        while self._head in self._skipped:
+            self._skipped.remove(self._head)
+            self._head += 1
+
+    def acquire(self, nbytes: int, label: str = "", ticket: Optional[int] = None,
+                kind: str = "fetch") -> FrameLease:
+        """จอง nbytes (รอถ้ายังไม่ถึงคิวหรือ budget ไม่พอ)"""
+        nbytes = int(nbytes)
+        start = time.monotonic()
+        with self._cond:
+            if ticket is None:
+                ticket = self._issued
+                self._issued += 1
+            if self.enabled:
+                deadline = start + self.config.wait_timeout_s
+                self.waiting += 1
+                try:
+                    while not (ticket == self._head and self._fits(nbytes)):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            logger.warning(f"[{label}] ⚠️ Frame memory budget wait timed out after "
+                                           f"{self.config.wait_timeout_s:g}s, admitting {nbytes / 1e6:.0f} MB anyway")
+                            if PROMETHEUS_AVAILABLE:
+                                FRAME_MEMORY_TIMEOUTS.labels(kind=kind).inc()
+                            break
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self._admit(ticket)
+            self._adjust_locked(nbytes)
+            self._cond.notify_all()
+            waited = time.monotonic() - start
+            self.wait_seconds += waited
+        if waited > 1:
+            logger.info(f"[{label}] 🧠 Waited {waited:.1f}s for frame memory budget")
+        if PROMETHEUS_AVAILABLE:
+            FRAME_MEMORY_WAIT.labels(kind=kind).observe(waited)
+        return FrameLease(self, nbytes, label)
+
+    def cancel(self, ticket: int):
+        """ticket ที่จะไม่ถูก acquire (งานถูกยกเลิก) ไม่ให้คิวค้าง"""
+        with self._cond:
+            self._admit(ticket)
+            self._cond.notify_all()
+
+    def charge(self, nbytes: int, label: str = "") -> FrameLease:
+        """นับ byte ที่จองแล้วโดยไม่รอ (tensor ของ inference / ข้อมูลที่อยู่ใน memory อยู่แล้ว)"""
+        self._adjust(int(nbytes))
+        return FrameLease(self, int(nbytes), label)
+
+    def _adjust(self, delta: int):
+        with self._cond:
+            self._adjust_locked(delta)
+            self._cond.notify_all()
+
+    def _adjust_locked(self, delta: int):
+        self.used = max(0, self.used + delta)
+        self.peak = max(self.peak, self.used)
+        if PROMETHEUS_AVAILABLE:
+            FRAME_MEMORY_IN_USE.set(self.used)
+            if self.enabled:
+                FRAME_MEMORY_UTILIZATION.set(self.used / self.budget if self.budget else 0)
+
+    def observe(self, label: str, frames: Sequence[np.ndarray]):
+        """จำขนาด frame จริงของกล้อง ใช้ประมาณการจองรอบถัดไป"""
+        if frames:
+            self._frame_bytes[label] = max(frame.nbytes for frame in frames)
+
+    def estimate(self, label: str, frames: int, default_frame_bytes: int = FULL_HD_BYTES) -> int:
+        """byte ที่ต้องจองสำหรับ frames ภาพของกล้องนี้ (ยังไม่เคยเห็น = frame ใหญ่สุดที่เคยเห็น หรือ default)"""
+        frame_bytes = self._frame_bytes.get(label) or max(self._frame_bytes.values(), default=default_frame_bytes)
+        return int(frames) * frame_bytes
+
+    def plan_waves(self, sizes: Sequence[int]) -> List[List[int]]:
+        """แบ่ง index ของงานเป็นชุดที่แต่ละชุดรวมกันไม่เกิน budget (อย่างน้อยชุดละ 1 งาน)"""
+        waves: List[List[int]] = []
+        total = 0
+        for i, size in enumerate(sizes):
+            if waves and total + size <= self.budget:
+                waves[-1].append(i)
+                total += size
+            else:
+                waves.append([i])
+                total = size
+        return waves
+
+    def summary(self) -> dict:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "budget_mb": round(self.budget / 1e6, 1) if self.enabled else None,
+                "memory_limit_mb": round(self.limit_bytes / 1e6, 1) if self.limit_bytes else None,
+                "in_use_mb": round(self.used / 1e6, 1),
+                "peak_mb": round(self.peak / 1e6, 1),
+                "utilization": round(self.used / self.budget, 3) if self.enabled and self.budget else None,
+                "waiting": self.waiting,
+                "wait_seconds_total": round(self.wait_seconds, 1),
+                "wait_timeouts": self.timeouts,
+            }
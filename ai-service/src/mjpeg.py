@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+MJPEG Ingest - รับ frame จาก go2rtc /api/stream.mjpeg แทนการ decode H.264 เอง
+
+stream.ts / stream.mp4 บังคับให้ decode H.264 ทุก frame ที่ native fps (25 fps) เพื่อเก็บไว้ 1 ใน 75
+go2rtc แปลงเป็น MJPEG ฝั่ง server ที่ fps ต่ำได้ (ffmpeg source + -r) ฝั่งเราเหลือแค่:
+
+- แยก JPEG ออกจาก multipart/x-mixed-replace ด้วย buffer เดียวที่ใช้ซ้ำ (อ่านเท่าที่มีต่อท้าย buffer,
+  frame เป็น memoryview ของ buffer ไม่สร้าง bytes ต่อ frame)
+- ใช้ Content-Length ของแต่ละ part ถ้ามี (ไม่ต้อง scan) ไม่งั้นหา EOI marker
+- decode เฉพาะ frame ที่ถึงเวลา sample (server ส่งมาเร็วกว่าที่ขอก็ไม่เสีย CPU)
+  แบบลดขนาดตั้งแต่ IDCT (decode_jpeg_scaled)
+"""
+import time
+import logging
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from snapshots import decode_jpeg_scaled
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+MJPEG_FRAMES = None
+
+try:
+    from prometheus_client import Counter
+    PROMETHEUS_AVAILABLE = True
+    MJPEG_FRAMES = Counter('mjpeg_frames_total', 'JPEG parts received from MJPEG streams', ['camera_id', 'outcome'])
+except ImportError:
+    pass
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+MAX_HEADER_BYTES = 1024        # header ของ part ยาวกว่านี้ = ไม่ใช่ header (ไม่อ่าน Content-Length)
+MAX_GARBAGE_BYTES = 64 * 1024  # byte ที่ไม่มี SOI เกินนี้ทิ้งได้
+
+
+class MultipartJpegParser:
+    """
+    แยก JPEG จาก byte stream แบบ incremental ด้วย bytearray เดียว
+
+        parser.fill(available_reader(response.raw))   # อ่านต่อท้าย buffer
+        while (jpeg := parser.next_frame()) is not None:
+            ...                                       # memoryview ใช้ได้จนถึง fill() ครั้งถัดไป
+
+    buffer ถูก compact (ย้ายเฉพาะส่วนที่ยังไม่ครบ frame ไปต้น buffer) หรือขยาย 2 เท่าเมื่อเต็ม
+    """
+
+    def __init__(self, initial_bytes: int = 1 << 20, max_frame_bytes: int = 32 << 20):
+        self.max_frame_bytes = max_frame_bytes
+        self._buf = bytearray(initial_bytes)
+        self._start = 0       # byte แรกที่ยังไม่ได้ใช้
+        self._end = 0         # ท้ายข้อมูลใน buffer
+        self._eoi_from = 0    # หา EOI ต่อจากตรงนี้ (ไม่ scan ซ้ำระหว่างรอข้อมูล)
+        self.bytes_read = 0
+
+    def fill(self, readinto: Callable[[memoryview], Optional[int]]) -> int:
+        """อ่านข้อมูลต่อท้าย buffer คืนจำนวน byte (0 = stream จบ)"""
+        if self._end == len(self._buf):
+            self._make_room()
+        view = memoryview(self._buf)[self._end:]
+        try:
+            n = readinto(view) or 0
+        finally:
+            view.release()
+        self._end += n
+        self.bytes_read += n
+        return n
+
+    def _make_room(self):
+        pending = self._end - self._start
+        if self._start > 0:
+            self._buf[:pending] = self._buf[self._start:self._end]
+            self._eoi_from = max(0, self._eoi_from - self._start)
+            self._start, self._end = 0, pending
+        if self._end == len(self._buf):
+            if len(self._buf) >= self.max_frame_bytes:
+                raise ValueError(f"MJPEG part larger than {self.max_frame_bytes} bytes")
+            self._buf.extend(bytes(len(self._buf)))
+
+    def _part_length(self, header_start: int, soi: int) -> Optional[int]:
+        """Content-Length จาก header ของ part (ระหว่าง boundary กับ SOI)"""
+        if soi - header_start > MAX_HEADER_BYTES:
+            return None
+        header = bytes(self._buf[header_start:soi]).lower()
+        key = header.find(b"content-length:")
+        if key < 0:
+            return None
+        line_end = header.find(b"\r\n", key)
+        try:
+            return int(header[key + 15:line_end if line_end >= 0 else None].strip())
+        except ValueError:
+            return None
+
+    def next_frame(self) -> Optional[memoryview]:
+        """JPEG ถัดไปที่ครบแล้วใน buffer (None = ต้อง fill เพิ่ม)"""
+        soi = self._buf.find(SOI, self._start, self._end)
+        if soi < 0:
+            if self._end - self._start > MAX_GARBAGE_BYTES:
+                self._start = self._end - 1  # เก็บ byte สุดท้ายเผื่อ marker ถูกตัดครึ่ง
+            return None
+
+        end = -1
+        length = self._part_length(self._start, soi)
+        if length is not None:
+            if soi + length > self._end:
+                return None
+            if self._buf[soi + length - 2:soi + length] == EOI:
+                end = soi + length
+        if end < 0:
+            eoi = self._buf.find(EOI, max(soi + 2, self._eoi_from), self._end)
+            if eoi < 0:
+                self._eoi_from = max(soi + 2, self._end - 1)
+                return None
+            end = eoi + 2
+
+        self._start = self._eoi_from = end
+        return memoryview(self._buf)[soi:end]
+
+
+def available_reader(raw, chunk_bytes: int = 64 * 1024) -> Callable[[memoryview], int]:
+    """
+    readinto ที่คืนเท่าที่มาถึงแล้ว (urllib3 readinto/read(n) รอจนครบ n byte
+    ซึ่งทำให้ part มาเป็นก้อนและเวลาที่ใช้ sample เพี้ยน)
+    """
+    read1 = getattr(raw, "read1", None)  # urllib3 ≥ 2
+
+    def readinto(view: memoryview) -> int:
+        if read1 is not None:
+            data = read1(min(len(view), chunk_bytes))
+        else:
+            data = raw.read(min(len(view), 4096))
+        view[:len(data)] = data
+        return len(data)
+
+    return readinto
+
+
+@dataclass
+class MjpegStats:
+    parts: int = 0
+    decoded: int = 0
+    black: int = 0
+    bytes: int = 0
+
+
+def read_mjpeg_frames(readinto: Callable[[memoryview], Optional[int]], sampling_fps: float, max_frames: int,
+                      timeout_s: float, target_size: int = 640, camera_id: str = "unknown",
+                      clock: Callable[[], float] = time.monotonic,
+                      progress: Optional[Callable[[], None]] = None,
+                      on_frame: Optional[Callable[[np.ndarray], bool]] = None) -> Tuple[List[np.ndarray], MjpegStats]:
+    """
+    อ่าน MJPEG stream จนได้ max_frames ภาพ (หรือ stream จบ / หมดเวลา)
+
+    sample ตามตารางเวลา absolute (t0 + k/fps) ตามเวลาที่ part มาถึง: part ระหว่างรอบถูกข้าม
+    โดยไม่ decode; frame ดำ (mean ≤ 5) ไม่นับ เหมือน stream.ts
+    progress ถูกเรียกหลังอ่านข้อมูลได้ทุกครั้ง; on_frame(frame) คืน False = หยุดอ่าน
+    """
+    parser = MultipartJpegParser()
+    stats = MjpegStats()
+    frames: List[np.ndarray] = []
+    period = 1.0 / sampling_fps if sampling_fps > 0 else 0.0
+    started = clock()
+    next_due = started
+    stopped = False
+
+    while not stopped and len(frames) < max_frames and clock() - started < timeout_s:
+        if parser.fill(readinto) == 0:
+            break
+        if progress is not None:
+            progress()
+        while not stopped and len(frames) < max_frames:
+            jpeg = parser.next_frame()
+            if jpeg is None:
+                break
+            stats.parts += 1
+            now = clock()
+            if now < next_due:
+                jpeg.release()
+                continue
+            next_due += period * (int((now - next_due) / period) + 1) if period else 0
+            with jpeg:
+                frame = decode_jpeg_scaled(jpeg, target_size)
+            stats.decoded += 1
+            if frame is None or frame.mean() <= 5:
+                stats.black += 1
+                continue
+            frames.append(frame)
+            if on_frame is not None and not on_frame(frame):
+                stopped = True
+                break
+
+    stats.bytes = parser.bytes_read
+    if PROMETHEUS_AVAILABLE:
+        MJPEG_FRAMES.labels(camera_id=camera_id, outcome='decoded').inc(stats.decoded)
+        MJPEG_FRAMES.labels(camera_id=camera_id, outcome='skipped').inc(stats.parts - stats.decoded)
+    return frames, stats
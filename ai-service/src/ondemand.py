@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+On-Demand Count - นับคนสดๆ ต่อ request โดยไม่ต้องรอรอบ schedule
+
+- Request coalescing: หลาย request ของกล้องเดียวกันพร้อมกัน → inference ครั้งเดียว
+- TTL cache: ผลล่าสุดตอบซ้ำได้ภายใน ttl วินาที (ไม่ยิง NVR ถี่)
+- Priority lane: PriorityLock ให้ on-demand แซงคิว batch inference ระหว่าง frame
+"""
+import time
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+ONDEMAND_REQUESTS = None
+ONDEMAND_LATENCY = None
+
+try:
+    from prometheus_client import Counter, Histogram
+    PROMETHEUS_AVAILABLE = True
+    ONDEMAND_REQUESTS = Counter('ondemand_requests_total', 'On-demand count requests', ['camera_id', 'outcome'])
+    ONDEMAND_LATENCY = Histogram('ondemand_latency_seconds', 'On-demand fetch + inference time', ['camera_id'])
+except ImportError:
+    pass
+
+
+@dataclass
+class OnDemandConfig:
+    """Configuration สำหรับ on-demand count API"""
+    enabled: bool = True
+    cache_ttl_s: float = 10.0   # ตอบจาก cache ถ้าผลอายุไม่เกินนี้
+    timeout_s: float = 30.0     # request ที่รอ inference ของคนอื่นรอได้นานสุด
+    api_key: str = ""           # ถ้าตั้งไว้ ต้องส่ง X-API-Key มาด้วย
+
+
+@dataclass
+class CountSnapshot:
+    """ผลนับคนจาก frame เดียว"""
+    camera_id: str
+    count: int
+    captured_at: datetime
+    latency_s: float
+
+    def to_dict(self, cached: bool) -> dict:
+        age = (datetime.now(timezone.utc) - self.captured_at).total_seconds()
+        return {
+            "camera_id": self.camera_id,
+            "count": self.count,
+            "captured_at": self.captured_at.isoformat().replace("+00:00", "Z"),
+            "age_s": round(age, 2),
+            "latency_ms": round(self.latency_s * 1000, 1),
+            "cached": cached
+        }
+
+
+class PriorityLock:
+    """
+    Lock ที่ผู้รอแบบ priority ได้ก่อนผู้รอปกติเสมอ
+
+    batch inference ถือ lock ทีละ batch (priority=False, batch_size frame ต่อ forward pass) ดังนั้น
+    on-demand (priority=True) รออย่างมาก 1 batch ก็ได้ใช้ model
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._held = False
+        self._priority_waiting = 0
+
+    @contextmanager
+    def hold(self, priority: bool = False):
+        with self._cond:
+            if priority:
+                self._priority_waiting += 1
+                try:
+                    while self._held:
+                        self._cond.wait()
+                finally:
+                    self._priority_waiting -= 1
+            else:
+                while self._held or self._priority_waiting:
+                    self._cond.wait()
+            self._held = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._held = False
+                self._cond.notify_all()
+
+
+class OnDemandCounter:
+    """
+    นับคนของกล้อง 1 ตัวแบบสด พร้อม coalescing + TTL cache
+
+    fetch_frame(camera_id) -> frame หรือ None
+    count_frame(frame, camera_id) -> จำนวนคน (ควรใช้ priority lane ของ detector)
+    """
+
+    def __init__(self, config: OnDemandConfig,
+                 fetch_frame: Callable[[str], Optional[np.ndarray]],
+                 count_frame: Callable[[np.ndarray, str], int]):
+        self.config = config
+        self.fetch_frame = fetch_frame
+        self.count_frame = count_frame
+        self._cache: Dict[str, CountSnapshot] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, camera_id: str, max_age_s: Optional[float] = None) -> dict:
+        """
+        คืนผลนับคน (dict) ของกล้อง
+
+        Raises:
+            TimeoutError: รอ inference ที่กำลังรันอยู่นานเกิน timeout
+            RuntimeError: ดึงภาพจากกล้องไม่ได้
+        """
+        ttl = self.config.cache_ttl_s if max_age_s is None else max_age_s
+
+        with self._lock:
+            cached = self._cache.get(camera_id)
+            if cached and (time.time() - cached.captured_at.timestamp()) <= ttl:
+                self._record(camera_id, 'cache_hit')
+                return cached.to_dict(cached=True)
+
+            future = self._inflight.get(camera_id)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[camera_id] = future
+
+        if not leader:
+            # มีคนกำลังนับกล้องนี้อยู่ → รอผลเดียวกัน
+            self._record(camera_id, 'coalesced')
+            try:
+                return future.result(timeout=self.config.timeout_s).to_dict(cached=True)
+            except FuturesTimeoutError:  # Python < 3.11: ไม่ใช่ builtin TimeoutError
+                raise TimeoutError(f"timed out after {self.config.timeout_s:g}s waiting for {camera_id}") from None
+
+        try:
+            snapshot = self._count_now(camera_id)
+            with self._lock:
+                self._cache[camera_id] = snapshot
+            future.set_result(snapshot)
+            self._record(camera_id, 'fresh')
+            return snapshot.to_dict(cached=False)
+        except Exception as e:
+            future.set_exception(e)
+            self._record(camera_id, 'error')
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(camera_id, None)
+
+    def _count_now(self, camera_id: str) -> CountSnapshot:
+        start = time.perf_counter()
+        captured_at = datetime.now(timezone.utc)
+        frame = self.fetch_frame(camera_id)
+        if frame is None:
+            raise RuntimeError(f"could not fetch a frame from camera {camera_id}")
+        count = self.count_frame(frame, camera_id)
+        latency = time.perf_counter() - start
+        if PROMETHEUS_AVAILABLE:
+            ONDEMAND_LATENCY.labels(camera_id=camera_id).observe(latency)
+        return CountSnapshot(camera_id=camera_id, count=count, captured_at=captured_at, latency_s=latency)
+
+    @staticmethod
+    def _record(camera_id: str, outcome: str):
+        if PROMETHEUS_AVAILABLE:
+            ONDEMAND_REQUESTS.labels(camera_id=camera_id, outcome=outcome).inc()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+CPU Resource Planning สำหรับ decode / inference workers
+
+ปัญหา: torch intra-op threads, OpenCV threads และ ffmpeg decode threads
+ใช้ค่า default (= จำนวน core ทั้งหมด) พร้อมกันทุกตัว เมื่อประมวลผลหลายกล้อง
+จะ oversubscribe CPU และ throughput ตก
+
+แนวทาง:
+- ตรวจจำนวน core ที่ใช้ได้จริง (affinity + cgroup quota ของ container)
+- แบ่ง core ให้ decode workers และ inference ตามจำนวนกล้อง/worker ที่ config
+- ตั้ง env (OMP/MKL/ffmpeg) ก่อน import torch/cv2 และ pin CPU (optional)
+- วัด CPU saturation ของแต่ละ stage ระหว่าง runtime
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+STAGE_CPU_SECONDS = None
+STAGE_WALL_SECONDS = None
+STAGE_CPU_SATURATION = None
+STAGE_THREADS = None
+
+try:
+    from prometheus_client import Counter, Gauge
+    PROMETHEUS_AVAILABLE = True
+    STAGE_CPU_SECONDS = Counter('stage_cpu_seconds_total', 'CPU time consumed per pipeline stage', ['stage'])
+    STAGE_WALL_SECONDS = Counter('stage_wall_seconds_total', 'Wall time spent per pipeline stage', ['stage'])
+    STAGE_CPU_SATURATION = Gauge('stage_cpu_saturation', 'CPU time / (wall time x assigned threads) of last run', ['stage'])
+    STAGE_THREADS = Gauge('stage_assigned_threads', 'Threads assigned to each stage by the resource plan', ['stage'])
+except ImportError:
+    pass
+
+
+@dataclass
+class ResourceConfig:
+    """Configuration สำหรับการแบ่ง CPU"""
+    enabled: bool = True
+    decode_workers: Union[int, str] = "auto"   # จำนวนกล้องที่ fetch/decode พร้อมกัน
+    decode_threads: int = 1                     # ffmpeg threads ต่อ decode worker
+    inference_threads: Union[int, str] = "auto"  # torch intra-op threads
+    reserve_cores: int = 0                      # กัน core ไว้ให้ระบบ/health server
+    pin_cpus: bool = False                      # pin decode/inference ไว้คนละชุด core
+
+
+@dataclass
+class ResourcePlan:
+    """ผลการแบ่ง CPU ที่ใช้จริง"""
+    total_cores: int
+    available_cpus: List[int]
+    decode_workers: int
+    decode_threads: int
+    inference_threads: int
+    interop_threads: int = 1
+    cv2_threads: int = 1
+    decode_cpus: List[int] = field(default_factory=list)
+    inference_cpus: List[int] = field(default_factory=list)
+    pinned: bool = False
+
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    """อ่าน CPU quota ของ container (cgroup v2 แล้ว v1)"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+            if quota != "max":
+                return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def detect_cpus() -> List[int]:
+    """
+    คืนรายการ CPU ที่ process นี้ใช้ได้จริง
+
+    ถ้า container ถูกจำกัด quota (เช่น Railway 2 vCPU บน host 32 core)
+    จะตัดรายการให้เหลือเท่า quota
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = cpus[:max(1, int(limit))]
+    return cpus or [0]
+
+
+def _resolve(value: Union[int, str], auto: int) -> int:
+    if value in (None, "auto", 0):
+        return auto
+    return max(1, int(value))
+
+
+def plan_resources(config: ResourceConfig, num_cameras: int) -> ResourcePlan:
+    """
+    แบ่ง core ให้ decode และ inference
+
+    Logic:
+    - decode workers (auto) = min(จำนวนกล้อง, cores // 2) อย่างน้อย 1
+    - decode ใช้ decode_workers x decode_threads core
+    - inference ได้ core ที่เหลือ (อย่างน้อย 1)
+    - cv2 / torch inter-op ใช้ 1 thread เพื่อไม่ให้แย่ง core กับ intra-op
+    """
+    cpus = detect_cpus()
+    if config.reserve_cores and len(cpus) > config.reserve_cores:
+        cpus = cpus[:len(cpus) - config.reserve_cores]
+    cores = len(cpus)
+
+    decode_workers = _resolve(config.decode_workers, max(1, min(num_cameras, cores // 2)))
+    decode_workers = max(1, min(decode_workers, max(1, num_cameras)))
+    decode_threads = max(1, int(config.decode_threads))
+
+    decode_cores = min(decode_workers * decode_threads, max(0, cores - 1))
+    inference_threads = _resolve(config.inference_threads, max(1, cores - decode_cores))
+
+    plan = ResourcePlan(
+        total_cores=cores,
+        available_cpus=cpus,
+        decode_workers=decode_workers,
+        decode_threads=decode_threads,
+        inference_threads=inference_threads
+    )
+
+    if config.pin_cpus and cores > 1:
+        # inference ได้ core ต้นรายการ, decode ได้ core ที่เหลือ
+        plan.inference_cpus = cpus[:max(1, cores - decode_cores)]
+        plan.decode_cpus = cpus[len(plan.inference_cpus):] or cpus
+        plan.pinned = True
+
+    return plan
+
+
+def apply_process_plan(plan: ResourcePlan):
+    """
+    ตั้งค่าระดับ process - ต้องเรียกก่อน import torch/ultralytics
+
+    - OMP/MKL threads = inference_threads (torch อ่านตอน import)
+    - ffmpeg decode threads ผ่าน OPENCV_FFMPEG_CAPTURE_OPTIONS
+    - pin main thread ไว้ที่ inference cpus (threads ที่สร้างทีหลังจะ inherit)
+    """
+    threads = str(plan.inference_threads)
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(var, threads)
+    os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", f"threads;{plan.decode_threads}")
+
+    if plan.pinned:
+        pin_current_thread(plan.inference_cpus)
+
+    if PROMETHEUS_AVAILABLE:
+        STAGE_THREADS.labels(stage="decode").set(plan.decode_workers * plan.decode_threads)
+        STAGE_THREADS.labels(stage="inference").set(plan.inference_threads)
+
+
+def apply_torch_plan(plan: ResourcePlan, torch_module, cv2_module=None):
+    """ตั้งจำนวน thread ของ torch และ OpenCV หลัง import แล้ว"""
+    try:
+        torch_module.set_num_threads(plan.inference_threads)
+        torch_module.set_num_interop_threads(plan.interop_threads)
+    except RuntimeError as e:
+        # set_num_interop_threads เรียกได้ครั้งเดียวก่อนเริ่มงาน parallel
+        logger.debug(f"torch interop threads already set: {e}")
+    if cv2_module is not None:
+        cv2_module.setNumThreads(plan.cv2_threads)
+
+
+def pin_current_thread(cpus: List[int]):
+    """Pin thread ปัจจุบันไว้ที่ cpus (Linux เท่านั้น)"""
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        return
+    try:
+        os.sched_setaffinity(threading.get_native_id(), set(cpus))
+    except OSError as e:
+        logger.warning(f"⚠️ Could not set CPU affinity {cpus}: {e}")
+
+
+def log_plan(plan: ResourcePlan, num_cameras: int):
+    """Startup report"""
+    logger.info("🧮 Resource Plan:")
+    logger.info(f"   Cores available: {plan.total_cores} {plan.available_cpus}")
+    logger.info(f"   Cameras: {num_cameras}")
+    logger.info(f"   Decode: {plan.decode_workers} worker(s) x {plan.decode_threads} ffmpeg thread(s)"
+                + (f" on CPUs {plan.decode_cpus}" if plan.pinned else ""))
+    logger.info(f"   Inference: {plan.inference_threads} torch thread(s), interop {plan.interop_threads}"
+                + (f" on CPUs {plan.inference_cpus}" if plan.pinned else ""))
+    logger.info(f"   OpenCV threads: {plan.cv2_threads}")
+    oversub = plan.decode_workers * plan.decode_threads + plan.inference_threads
+    if oversub > plan.total_cores:
+        logger.warning(f"⚠️ Plan uses {oversub} threads on {plan.total_cores} cores (oversubscribed)")
+
+
+@dataclass
+class StageUsage:
+    """CPU ที่ stage ใช้นอก thread/process นี้ (เช่น decoder worker process)"""
+    external_cpu: float = 0.0
+
+
+class StageMeter:
+    """
+    วัด CPU saturation ของแต่ละ stage
+
+    saturation = CPU time / (wall time x threads ที่ได้รับ)
+    - decode: ใช้ thread CPU time ของ worker thread + CPU ของ decoder process ที่รายงานผ่าน usage
+    - inference: ใช้ process CPU time (torch ใช้ thread pool ของตัวเอง)
+      จึงเป็นค่าประมาณขอบบนถ้ามี decode ทำงานพร้อมกัน
+    """
+
+    def __init__(self, plan: ResourcePlan):
+        self.plan = plan
+        self.threads = {
+            "decode": plan.decode_threads,
+            "inference": plan.inference_threads,
+        }
+
+    @contextmanager
+    def measure(self, stage: str):
+        per_thread = stage == "decode"
+        cpu_clock = time.thread_time if per_thread else time.process_time
+        wall_start = time.perf_counter()
+        cpu_start = cpu_clock()
+        usage = StageUsage()
+        try:
+            yield usage
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = cpu_clock() - cpu_start + usage.external_cpu
+            if PROMETHEUS_AVAILABLE and wall > 0:
+                threads = self.threads.get(stage, 1)
+                STAGE_CPU_SECONDS.labels(stage=stage).inc(cpu)
+                STAGE_WALL_SECONDS.labels(stage=stage).inc(wall)
+                STAGE_CPU_SATURATION.labels(stage=stage).set(min(1.0, cpu / (wall * threads)))
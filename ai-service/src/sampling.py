@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Adaptive Sampling - หยุดดึง frame ของ window เมื่อค่าประมาณ avg/max คนนิ่งพอ
+
+เดิมทุก window ดึงและ infer min(duration x sampling_fps, max_frames) frame เสมอ
+แม้ภาพว่างหรือจำนวนคนคงที่ทั้ง window ที่นี่ inference วิ่งตาม frame ที่ดึงมาทีละ batch แล้ว:
+
+- avg: ช่วงความเชื่อมั่น (t, confidence) ของค่าเฉลี่ย โดยลด n เป็น effective n ตาม
+  autocorrelation lag-1 (frame ห่างกัน 1-3 วินาทีไม่อิสระต่อกัน) ต้องแคบกว่า
+  max(abs_error, rel_error x avg)
+- max: จำนวน frame ต่อท้ายที่ไม่มีค่าใหม่เกิน max ต้องถึง k = ceil(c / (1 - c)) (heuristic ว่า max นิ่งแล้ว)
+- ครบทั้งสองข้อ (และ ≥ min_frames) → หยุดอ่าน stream; ไม่ครบจนถึงจำนวนปกติ → ดึงต่อได้ถึง max_frames
+
+stream อ่านตามลำดับเวลา การหยุดก่อนจึงได้ frame เฉพาะช่วงต้น window: avg / max และช่วงความเชื่อมั่น
+เป็นของช่วงที่ครอบคลุมจริง (covered_s) ไม่ใช่การรับประกันของทั้ง window (frame ไม่ได้ sample
+แบบสุ่มทั่ว window และ count ของ frame ติดกันไม่สลับที่กันได้)
+"""
+import math
+import threading
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass
+class AdaptiveSamplingConfig:
+    """Configuration สำหรับ adaptive sampling (early stopping ต่อ window)"""
+    enabled: bool = False
+    confidence: float = 0.9     # ระดับความเชื่อมั่นของช่วง avg และ max
+    abs_error: float = 0.5      # ครึ่งความกว้างของช่วง avg ที่ยอมรับได้ (คน)
+    rel_error: float = 0.1      # หรือสัดส่วนของ avg (ใช้ค่าที่หลวมกว่า)
+    min_frames: int = 8         # ไม่หยุดก่อนจำนวนนี้
+    max_frames: int = 120       # เพดานของ scene ที่ผันผวน (เกิน playback.max_frames ได้)
+    batch_frames: int = 0       # frame ต่อการตัดสินใจ (0 = batch size ของ detector)
+
+
+def _betacf(a: float, b: float, x: float) -> float:
+    """continued fraction ของ incomplete beta (Lentz)"""
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 300):
+        for num in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                    -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + num * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + num / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1.0) < 1e-12:
+            break
+    return h
+
+
+def _betainc(a: float, b: float, x: float) -> float:
+    """regularized incomplete beta I_x(a, b)"""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log1p(-x))
+    if x < (a + 1) / (a + b + 2):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def t_cdf(t: float, dof: float) -> float:
+    """CDF ของ Student t (dof จริงใดๆ > 0)"""
+    tail = 0.5 * _betainc(dof / 2, 0.5, dof / (dof + t * t))
+    return 1.0 - tail if t > 0 else tail
+
+
+def t_quantile(p: float, dof: float) -> float:
+    """
+    quantile ของ Student t ไม่ต้องพึ่ง scipy
+
+    dof < 30: แก้ t_cdf(t) = p ตรงๆ (bisection) - Cornish-Fisher ต่ำเกินจริงมากที่ dof เล็ก
+    (dof 1, p 0.95: 5.57 แทน 6.31) ซึ่ง effective n ที่เหลือ 2-4 frame เกิดได้จริง
+    dof ≥ 30: Cornish-Fisher จาก normal (คลาดไม่ถึง 0.1%)
+    """
+    z = NormalDist().inv_cdf(p)
+    if dof <= 0 or math.isinf(dof):
+        return z
+    if dof >= 30:
+        return (z + (z ** 3 + z) / (4 * dof) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2)
+                + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * dof ** 3))
+    if p < 0.5:
+        return -t_quantile(1 - p, dof)
+    lo, hi = 0.0, max(1.0, 2 * z)
+    while t_cdf(hi, dof) < p:
+        lo, hi = hi, hi * 2
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if t_cdf(mid, dof) < p:
+            lo = mid
+        else:
+            hi = mid
+        if hi - lo <= 1e-9 * hi:
+            break
+    return (lo + hi) / 2
+
+
+class SequentialEstimate:
+    """ค่าประมาณ avg / max ของ count ราย frame ที่สะสมเพิ่มทีละ batch"""
+
+    def __init__(self, config: AdaptiveSamplingConfig):
+        self.config = config
+        self.counts: List[int] = []
+        self.required_stable = math.ceil(round(config.confidence / max(1e-9, 1 - config.confidence), 6))
+
+    def add(self, counts: Sequence[int]):
+        self.counts.extend(int(c) for c in counts)
+
+    @property
+    def n(self) -> int:
+        return len(self.counts)
+
+    @property
+    def mean(self) -> float:
+        return float(np.mean(self.counts)) if self.counts else 0.0
+
+    def effective_n(self) -> float:
+        """n หลังหักผลของ autocorrelation lag-1 (ρ ≤ 0 ถือว่าอิสระ)"""
+        x = np.asarray(self.counts, dtype=np.float64)
+        if len(x) < 3 or x.std() == 0:
+            return float(len(x))
+        d = x - x.mean()
+        rho = float(np.dot(d[1:], d[:-1]) / np.dot(d, d))
+        rho = min(max(rho, 0.0), 0.95)
+        return max(2.0, len(x) * (1 - rho) / (1 + rho))
+
+    def half_width(self) -> float:
+        """ครึ่งความกว้างของช่วงความเชื่อมั่นของ avg"""
+        if self.n < 2:
+            return math.inf
+        std = float(np.std(self.counts, ddof=1))
+        if std == 0:
+            return 0.0
+        n_eff = self.effective_n()
+        return t_quantile(0.5 + self.config.confidence / 2, n_eff - 1) * std / math.sqrt(n_eff)
+
+    def tolerance(self) -> float:
+        return max(self.config.abs_error, self.config.rel_error * self.mean)
+
+    def max_stable(self) -> int:
+        """จำนวน frame ต่อท้ายหลัง frame แรกที่ได้ค่า max"""
+        if not self.counts:
+            return 0
+        return self.n - 1 - int(np.argmax(self.counts))
+
+    def converged(self) -> bool:
+        return (self.n >= self.config.min_frames
+                and self.max_stable() >= self.required_stable
+                and self.half_width() <= self.tolerance())
+
+    def summary(self, planned: int, covered_s: Optional[float] = None) -> Dict[str, Any]:
+        """
+        field สำหรับ payload: frame ที่ใช้จริงและความคลาดเคลื่อนที่ได้
+
+        avg_error / max_stable_frames เป็นของ frame ที่อ่านแล้ว (ช่วง covered_s วินาทีแรกของ window)
+        ไม่ใช่ขอบเขตของทั้ง window
+        """
+        half_width = self.half_width()
+        body = {
+            "mode": "adaptive",
+            "frames_planned": planned,
+            "frames_used": self.n,
+            "converged": self.converged(),
+            "confidence": self.config.confidence,
+            "avg_error": round(half_width, 3) if math.isfinite(half_width) else None,
+            "max_stable_frames": self.max_stable() if self.counts else None,
+        }
+        if covered_s is not None:
+            body["covered_s"] = round(covered_s, 1)
+        return body
+
+
+class WindowFeed:
+    """
+    frame ของ 1 window จาก fetch thread ไปยัง thread ที่ infer ทีละ batch
+
+    fetcher เรียก put() ทุก frame ที่เก็บ (คืน False หลัง stop() → fetcher หยุดอ่าน stream)
+    และ close() เมื่อจบ; notify ถูก set ทุกครั้งที่มีอะไรเปลี่ยน (ใช้ร่วมกันหลาย feed ได้)
+    """
+
+    def __init__(self, notify: Optional[threading.Event] = None):
+        self.notify = notify or threading.Event()
+        self._lock = threading.Lock()
+        self._pending: List[np.ndarray] = []
+        self.received = 0
+        self.done = False
+        self.stopped = False
+
+    def put(self, frame: np.ndarray) -> bool:
+        with self._lock:
+            if self.stopped:
+                return False
+            self._pending.append(frame)
+            self.received += 1
+        self.notify.set()
+        return True
+
+    def close(self):
+        self.done = True
+        self.notify.set()
+
+    def stop(self):
+        """ไม่รับ frame เพิ่ม (frame ที่มาถึงระหว่าง infer batch สุดท้ายถูกทิ้ง)"""
+        with self._lock:
+            self.stopped = True
+            self._pending = []
+
+    def ready(self, batch: int) -> bool:
+        """มี frame ครบ batch หรือ fetch จบแล้วและยังเหลือ frame"""
+        with self._lock:
+            return len(self._pending) >= batch or (self.done and bool(self._pending))
+
+    def take(self) -> List[np.ndarray]:
+        with self._lock:
+            frames, self._pending = self._pending, []
+            return frames
+
+    @property
+    def finished(self) -> bool:
+        with self._lock:
+            return self.done and not self._pending
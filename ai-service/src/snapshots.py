@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Async Snapshot Acquisition (go2rtc frame.jpeg / Hikvision ISAPI)
+
+ที่ sampling_fps ≤ 1 การดึง JPEG ทีละภาพถูกกว่าการ decode H.264 ทั้ง stream มาก
+
+- poll ทุกกล้องพร้อมกันด้วย asyncio + httpx (keep-alive connection เดียวต่อ host)
+- ตั้งเวลาแบบ absolute (t0 + k/fps) ไม่สะสม drift
+- Digest auth สำหรับ Hikvision ISAPI (ใช้ challenge ซ้ำ ไม่ต้อง 401 ทุกครั้ง)
+- decode JPEG แบบลดขนาดตั้งแต่ DCT (IMREAD_REDUCED_*) ให้ใกล้ขนาด inference
+"""
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics (optional)
+PROMETHEUS_AVAILABLE = False
+SNAPSHOT_LATENCY = None
+SNAPSHOT_MISSED = None
+
+try:
+    from prometheus_client import Counter, Histogram
+    PROMETHEUS_AVAILABLE = True
+    SNAPSHOT_LATENCY = Histogram('snapshot_fetch_seconds', 'Time to fetch one JPEG snapshot', ['camera_id', 'source'])
+    SNAPSHOT_MISSED = Counter('snapshot_missed_total', 'Snapshot ticks without a usable frame', ['camera_id', 'reason'])
+except ImportError:
+    pass
+
+# JPEG Start-Of-Frame markers (baseline, extended, progressive, lossless)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+@dataclass
+class SnapshotSource:
+    """URL ที่ใช้ดึง snapshot ของกล้อง 1 ตัว"""
+    camera_id: str
+    url: str
+    source: str = "go2rtc"          # "isapi" หรือ "go2rtc"
+    username: str = ""
+    password: str = ""
+    fallback_url: str = ""          # go2rtc frame.jpeg เมื่อ ISAPI ใช้ไม่ได้
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """อ่าน (width, height) จาก SOF header โดยไม่ decode ภาพ"""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = (data[i + 2] << 8) | data[i + 3]
+        if marker in _SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+
+def reduced_decode_flag(width: int, height: int, target_size: int) -> int:
+    """
+    เลือก IMREAD_REDUCED_COLOR_{2,4,8} ที่เล็กที่สุดแต่ด้านยาวยัง ≥ target_size
+    (libjpeg ลดขนาดตอน IDCT จึงเร็วกว่า decode เต็มแล้ว resize)
+    """
+    import cv2
+
+    longest = max(width, height)
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                         (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if longest // factor >= target_size:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_jpeg_scaled(data: bytes, target_size: int = 640) -> Optional[np.ndarray]:
+    """Decode JPEG เป็น BGR โดยลดขนาดให้ใกล้ target_size"""
+    import cv2
+
+    flag = cv2.IMREAD_COLOR
+    size = jpeg_size(data)
+    if size and target_size > 0:
+        flag = reduced_decode_flag(size[0], size[1], target_size)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+
+
+class AsyncSnapshotPoller:
+    """
+    Poll snapshot ของหลายกล้องพร้อมกันตามตารางเวลา
+
+    ใช้:
+        poller = AsyncSnapshotPoller(timeout=10, verify_ssl=False, target_size=640)
+        frames = poller.poll(sources, sampling_fps=0.33, duration_s=60, max_frames=60)
+        # → {camera_id: [(timestamp_utc, frame), ...]}
+    """
+
+    def __init__(self, timeout: float = 10, verify_ssl: bool = False, target_size: int = 640,
+                 max_connections: int = 32):
+        self.timeout = timeout
+        self.verify_ssl = verify_ssl
+        self.target_size = target_size
+        self.max_connections = max_connections
+
+    def poll(self, sources: List[SnapshotSource], sampling_fps: float, duration_s: float,
+             max_frames: int = 60) -> Dict[str, List[Tuple[datetime, np.ndarray]]]:
+        """Sync wrapper - รัน event loop จนครบ window"""
+        return asyncio.run(self.poll_async(sources, sampling_fps, duration_s, max_frames))
+
+    async def poll_async(self, sources: List[SnapshotSource], sampling_fps: float, duration_s: float,
+                         max_frames: int = 60) -> Dict[str, List[Tuple[datetime, np.ndarray]]]:
+        import httpx
+
+        period = 1.0 / sampling_fps if sampling_fps > 0 else 1.0
+        ticks = max(1, min(int(duration_s * sampling_fps), max_frames))
+        limits = httpx.Limits(max_connections=self.max_connections,
+                              max_keepalive_connections=self.max_connections)
+
+        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout, limits=limits) as client:
+            t0 = time.monotonic()
+            results = await asyncio.gather(*[
+                self._poll_camera(client, src, t0, period, ticks) for src in sources
+            ])
+        return {src.camera_id: frames for src, frames in zip(sources, results)}
+
+    async def _poll_camera(self, client, src: SnapshotSource, t0: float, period: float,
+                           ticks: int) -> List[Tuple[datetime, np.ndarray]]:
+        import httpx
+
+        # DigestAuth เก็บ challenge ไว้ใช้ซ้ำ → 1 instance ต่อกล้อง
+        auth = httpx.DigestAuth(src.username, src.password) if src.username else None
+        frames: List[Tuple[datetime, np.ndarray]] = []
+        use_fallback = False
+
+        for k in range(ticks):
+            delay = t0 + k * period - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -period:
+                # request ก่อนหน้าช้ากว่า 1 period → ข้าม tick นี้ ไม่ยิงซ้อน
+                if PROMETHEUS_AVAILABLE:
+                    SNAPSHOT_MISSED.labels(camera_id=src.camera_id, reason='late').inc()
+                continue
+
+            captured_at = datetime.now(timezone.utc).replace(tzinfo=None)
+            frame = None
+            if not use_fallback:
+                frame = await self._fetch(client, src.camera_id, src.url, src.source, auth)
+                if frame is None and src.fallback_url:
+                    logger.info(f"[{src.camera_id}] 🔄 {src.source} snapshot failed, switching to go2rtc frame.jpeg")
+                    use_fallback = True
+            if use_fallback:
+                frame = await self._fetch(client, src.camera_id, src.fallback_url, "go2rtc", None)
+
+            if frame is None:
+                if PROMETHEUS_AVAILABLE:
+                    SNAPSHOT_MISSED.labels(camera_id=src.camera_id, reason='error').inc()
+                continue
+            if float(frame.mean()) <= 5:
+                if PROMETHEUS_AVAILABLE:
+                    SNAPSHOT_MISSED.labels(camera_id=src.camera_id, reason='black').inc()
+                continue
+            frames.append((captured_at, frame))
+
+        return frames
+
+    async def _fetch(self, client, camera_id: str, url: str, source: str, auth) -> Optional[np.ndarray]:
+        import httpx
+
+        start = time.perf_counter()
+        try:
+            response = await client.get(url, auth=auth) if auth else await client.get(url)
+            if response.status_code != 200:
+                logger.warning(f"[{camera_id}] Snapshot error ({source}): HTTP {response.status_code}")
+                return None
+            # decode ใน thread pool ไม่ block event loop ของกล้องอื่น
+            frame = await asyncio.to_thread(decode_jpeg_scaled, response.content, self.target_size)
+            if PROMETHEUS_AVAILABLE:
+                SNAPSHOT_LATENCY.labels(camera_id=camera_id, source=source).observe(time.perf_counter() - start)
+            return frame
+        except httpx.TimeoutException:
+            logger.warning(f"[{camera_id}] Snapshot timeout ({source})")
+            return None
+        except Exception as e:
+            logger.error(f"[{camera_id}] Snapshot error ({source}): {e}")
+            return None
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Source Deduplication - กล้องหลายชื่อที่ชี้ไปช่อง NVR เดียวกัน ประมวลผลครั้งเดียว
+
+- จัดกลุ่มกล้องตาม (rtsp_ip, rtsp_port, track_id)
+- ดึงภาพ/decode/inference ครั้งเดียวต่อกลุ่ม ที่ confidence ต่ำสุดของกลุ่ม
+- แต่ละกล้องกรองผลเองด้วย confidence และ ROI (polygon) ของตัวเอง หลัง detection ร่วม
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from heatmap import foot_points
+
+SourceKey = Tuple[str, int, str]
+
+
+def source_key(camera) -> SourceKey:
+    """key ของ physical stream (ช่อง NVR); กล้องที่ไม่มี rtsp_ip ไม่ถูกรวมกับตัวอื่น"""
+    if not camera.rtsp_ip:
+        return (f"camera:{camera.camera_id}", 0, "")
+    return (camera.rtsp_ip.strip().lower(), int(camera.rtsp_port), str(camera.track_id))
+
+
+@dataclass
+class SourceGroup:
+    """กล้อง logical ทุกตัวที่ใช้ stream เดียวกัน (ตัวแรกเป็นตัวดึงภาพ)"""
+    key: SourceKey
+    cameras: List[Any] = field(default_factory=list)
+
+    @property
+    def primary(self):
+        return self.cameras[0]
+
+    @property
+    def camera_ids(self) -> List[str]:
+        return [cam.camera_id for cam in self.cameras]
+
+    @property
+    def min_confidence(self) -> float:
+        return min(cam.confidence for cam in self.cameras)
+
+    @property
+    def label(self) -> str:
+        return "+".join(self.camera_ids)
+
+
+def group_cameras(cameras: Sequence) -> List[SourceGroup]:
+    """จัดกลุ่มตาม source_key (คงลำดับเดิมของกล้องตัวแรกในแต่ละกลุ่ม)"""
+    groups: Dict[SourceKey, SourceGroup] = {}
+    for camera in cameras:
+        key = source_key(camera)
+        if key not in groups:
+            groups[key] = SourceGroup(key=key)
+        groups[key].cameras.append(camera)
+    return list(groups.values())
+
+
+def points_in_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """
+    Ray casting แบบ vectorized: (N, 2) จุด กับ polygon (M, 2) → mask (N,)
+
+    loop เฉพาะขอบของ polygon (ไม่กี่ขอบ) ส่วนจุดทั้งหมดคำนวณพร้อมกัน
+    """
+    x, y = points[:, 0], points[:, 1]
+    inside = np.zeros(len(points), dtype=bool)
+    x2, y2 = polygon[-1]
+    for x1, y1 in polygon:
+        crosses = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = (x2 - x1) * (y - y1) / (y2 - y1) + x1
+        inside ^= crosses & (x < x_cross)
+        x2, y2 = x1, y1
+    return inside
+
+
+@dataclass
+class CameraView:
+    """มุมมองของกล้อง logical 1 ตัวบนผล detection ร่วม"""
+    camera_id: str
+    confidence: float
+    roi: Optional[np.ndarray] = None  # polygon (M, 2) พิกัด normalized 0-1
+    heatmap: Any = None
+
+    @classmethod
+    def from_camera(cls, camera, heatmap=None) -> "CameraView":
+        roi = np.asarray(camera.roi, dtype=np.float32) if len(camera.roi) >= 3 else None
+        return cls(camera_id=camera.camera_id, confidence=camera.confidence, roi=roi, heatmap=heatmap)
+
+    def select(self, xyxy: np.ndarray, scores: np.ndarray, frame_shape: Tuple[int, int]) -> np.ndarray:
+        """mask ของ box ที่กล้องนี้นับ (confidence ≥ ของตัวเอง และจุดเท้าอยู่ใน ROI)"""
+        return (scores >= self.confidence) & self.inside(xyxy, frame_shape)
+
+    def inside(self, xyxy: np.ndarray, frame_shape: Tuple[int, int]) -> np.ndarray:
+        """mask ของ box ที่จุดเท้าอยู่ใน ROI (ไม่มี ROI = ทุก box)"""
+        if self.roi is None or not len(xyxy):
+            return np.ones(len(xyxy), dtype=bool)
+        h, w = frame_shape
+        feet = foot_points(xyxy) / np.array([w, h], dtype=np.float32)
+        return points_in_polygon(feet, self.roi)
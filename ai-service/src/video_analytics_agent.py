@@ -1,191 +1,100 @@
 #!/usr/bin/env python3
 """
 AI Video Analytics Agent - People Counting from CCTV Playback
+
+CLI สำหรับวิเคราะห์ย้อนหลังหลายกล้อง หลายช่วงเวลา โดยใช้ engine เดียวกับ main.py
+(PlaybackFetcher / PeopleDetector / PlaybackProcessor)
+
+- กล้องมาจาก config.yaml (เลือกบางตัวได้ด้วย --camera)
+- ช่วงเวลาแบ่งเป็น window ย่อย แล้วดึงวิดีโอพร้อมกันหลาย worker
+- ผลลัพธ์เป็น JSON Lines ทีละ window (stdout หรือ --output) ส่วน log ออก stderr
+- --from-store อ่าน frame จาก ring buffer บนดิสก์ (frame_store) แทนการดึงจาก NVR
+  (ตรวจ count ซ้ำ / ลอง model ใหม่ ด้วยความเร็วดิสก์)
+
+ตัวอย่าง:
+    # วันเสาร์ 18:00-22:00 ทุกกล้อง, window ละ 15 นาที, ดึงพร้อมกัน 6 worker
+    python src/video_analytics_agent.py --range 2026-02-07T18:00/2026-02-07T22:00 \\
+        --window-minutes 15 --workers 6 --output saturday.jsonl --bench
+
+    # นับชั่วโมงล่าสุดซ้ำด้วย model อื่น จาก frame ที่ service เก็บไว้
+    python src/video_analytics_agent.py --from-store --model yolov8s.pt \
+        --range 2026-02-07T18:00/2026-02-07T19:00
 """
 
 import os
 import sys
 import json
 import time
-import urllib.parse
-from datetime import datetime, timedelta
-from pathlib import Path
-
-import cv2
-import numpy as np
-import requests
-from ultralytics import YOLO
-
-# Configuration
-GO2RTC_BASE_URL = "https://iocpiramid.com:8085"
-RTSP_USER = "admin"
-RTSP_PASS = "P1r@m1dnvrLpg"
-RTSP_IP = "10.0.10.3"
-RTSP_PORT = 554
-TRACK_ID = "201"
-CAMERA_ID = "CAM201"
-
-# YOLOv8 Settings
-MODEL_PATH = "yolov8n.pt"
-CONFIDENCE = 0.4
-PERSON_CLASS_ID = 0
-
-
-def get_time_range():
-    """คำนวณช่วงเวลา: current - 5 minutes ถึง current - 1 second"""
-    now = datetime.now()
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from main import (  # noqa: E402
+    ConfigLoader, CameraConfig, PlaybackProcessor, WindowResult, StartupTimer, logger
+)
+from framestore import FrameStore, to_epoch  # noqa: E402
+
+
+def get_time_range() -> Tuple[datetime, datetime]:
+    """ช่วงเวลา default: current - 5 minutes ถึง current - 1 second (UTC)"""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
     end_time = now - timedelta(seconds=1)
     start_time = now - timedelta(minutes=5)
     return start_time, end_time
 
 
-def build_playback_rtsp_url(start_time: datetime, end_time: datetime) -> str:
-    """สร้าง RTSP URL สำหรับ Playback"""
-    # Format: YYYYMMDDtHHMMSSz
-    start_str = start_time.strftime("%Y%m%dt%H%M%Sz")
-    end_str = end_time.strftime("%Y%m%dt%H%M%Sz")
-    
-    rtsp_url = (
-        f"rtsp://{RTSP_USER}:{RTSP_PASS}@{RTSP_IP}:{RTSP_PORT}"
-        f"/Streaming/tracks/{TRACK_ID}"
-        f"?starttime={start_str}&endtime={end_str}"
-    )
-    return rtsp_url
-
+def parse_time(value: str) -> datetime:
+    """
+    แปลงเวลา ISO 8601 เป็น UTC (naive) ตามที่ engine ใช้
 
-def build_go2rtc_stream_url(rtsp_url: str) -> str:
-    """สร้าง go2rtc stream URL"""
-    encoded_rtsp = urllib.parse.quote(rtsp_url, safe='')
-    return f"{GO2RTC_BASE_URL}/api/stream.mp4?src={encoded_rtsp}"
+    ถ้าไม่ระบุ timezone จะถือเป็นเวลาท้องถิ่นของเครื่อง
+    """
+    dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
 
 
-def fetch_frames_from_playback(start_time: datetime, end_time: datetime, sampling_fps: float = 0.5) -> list:
-    """ดึง frames จาก Playback API"""
-    frames = []
-    cap = None
-    
+def parse_range(value: str) -> Tuple[datetime, datetime]:
+    """แปลง 'START/END' เป็น (start, end)"""
     try:
-        rtsp_url = build_playback_rtsp_url(start_time, end_time)
-        stream_url = build_go2rtc_stream_url(rtsp_url)
-        
-        print(f"[INFO] Connecting to playback stream...")
-        print(f"[INFO] Time range: {start_time.strftime('%H:%M:%S')} -> {end_time.strftime('%H:%M:%S')}")
-        
-        cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, 3)
-        
-        if not cap.isOpened():
-            print("[ERROR] Cannot open playback stream")
-            return []
-        
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if fps <= 0 or fps > 60:
-            fps = 25
-        
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        print(f"[INFO] Video: {width}x{height} @ {fps:.1f}fps")
-        
-        # คำนวณจำนวน frames ที่ต้องการ
-        duration_seconds = (end_time - start_time).total_seconds()
-        target_frames = int(duration_seconds * sampling_fps)
-        target_frames = min(target_frames, 150)  # จำกัดไม่เกิน 150 frames
-        
-        frame_interval = max(1, int(fps / sampling_fps))
-        
-        print(f"[INFO] Fetching ~{target_frames} frames (sampling {sampling_fps} fps)...")
-        
-        frame_count = 0
-        read_count = 0
-        start_fetch = time.time()
-        timeout = 120  # 2 minutes timeout
-        
-        while frame_count < target_frames:
-            ret, frame = cap.read()
-            
-            if not ret:
-                break
-            
-            read_count += 1
-            
-            if read_count % frame_interval == 0:
-                frames.append(frame.copy())
-                frame_count += 1
-            
-            if time.time() - start_fetch > timeout:
-                print("[WARN] Timeout reached")
-                break
-        
-        fetch_time = time.time() - start_fetch
-        print(f"[INFO] Captured {len(frames)} frames in {fetch_time:.1f}s")
-        
-    except Exception as e:
-        print(f"[ERROR] Stream fetch error: {e}")
-    finally:
-        if cap:
-            cap.release()
-    
-    return frames
-
-
-def detect_people(model: YOLO, frames: list) -> dict:
-    """ตรวจจับคนในทุก frame และสรุปผล"""
-    counts = []
-    max_count = 0
-    
-    print(f"[INFO] Running YOLOv8 detection on {len(frames)} frames...")
-    
-    for i, frame in enumerate(frames):
-        try:
-            results = model.predict(
-                frame,
-                device="cpu",
-                conf=CONFIDENCE,
-                classes=[PERSON_CLASS_ID],
-                verbose=False
-            )
-            
-            count = 0
-            if results and len(results) > 0:
-                boxes = results[0].boxes
-                if boxes is not None:
-                    count = len(boxes)
-            
-            counts.append(count)
-            max_count = max(max_count, count)
-            
-            # Progress
-            if (i + 1) % 30 == 0:
-                print(f"[INFO] Processed {i+1}/{len(frames)} frames...")
-                
-        except Exception as e:
-            print(f"[ERROR] Detection error on frame {i}: {e}")
-            counts.append(0)
-    
-    # คำนวณสถิติ
-    if counts:
-        avg_count = sum(counts) / len(counts)
-        min_count = min(counts)
-    else:
-        avg_count = 0
-        min_count = 0
-    
-    return {
-        "max": max_count,
-        "avg": round(avg_count, 1),
-        "min": min_count,
-        "frames_analyzed": len(counts),
-        "all_counts": counts
-    }
+        start_str, end_str = value.split("/", 1)
+        start, end = parse_time(start_str), parse_time(end_str)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"invalid range '{value}' (expected START/END): {e}")
+    if end <= start:
+        raise argparse.ArgumentTypeError(f"range end must be after start: '{value}'")
+    return start, end
+
+
+def split_windows(start: datetime, end: datetime, window_minutes: float) -> List[Tuple[datetime, datetime]]:
+    """แบ่งช่วงเวลาเป็น window ย่อย (window สุดท้ายอาจสั้นกว่า)"""
+    step = timedelta(minutes=window_minutes)
+    windows = []
+    cursor = start
+    while cursor < end:
+        windows.append((cursor, min(cursor + step, end)))
+        cursor += step
+    return windows
 
 
 def determine_confidence(stats: dict) -> str:
-    """กำหนดระดับความมั่นใจ"""
+    """
+    กำหนดระดับความมั่นใจจากสัดส่วนของ window ที่ frame ครอบคลุม
+
+    fetch ถูกตัดที่ playback.max_frames / timeout_seconds → window ยาวได้ frame เฉพาะช่วงต้น
+    จำนวน frame อย่างเดียวจึงไม่บอกว่าผลแทนทั้ง window ได้
+    """
     frames = stats["frames_analyzed"]
-    
-    if frames >= 100:
+    coverage = stats.get("coverage", 1.0)
+
+    if coverage >= 0.9 and frames >= 20:
         return "high"
-    elif frames >= 50:
+    elif coverage >= 0.5 and frames >= 10:
         return "medium"
     else:
         return "low"
@@ -194,10 +103,10 @@ def determine_confidence(stats: dict) -> str:
 def generate_notes(stats: dict) -> str:
     """สร้างหมายเหตุจากผลการวิเคราะห์"""
     notes = []
-    
+
     max_count = stats["max"]
     avg_count = stats["avg"]
-    
+
     if max_count == 0:
         notes.append("No people detected in the scene")
     elif max_count >= 50:
@@ -208,95 +117,231 @@ def generate_notes(stats: dict) -> str:
         notes.append("Light foot traffic")
     else:
         notes.append("Very few people in the area")
-    
+
     # ตรวจสอบความแปรปรวน
     if max_count > 0 and avg_count > 0:
         variance = max_count / avg_count
         if variance > 2:
             notes.append("High movement variation observed")
-    
+
+    if "covered_end" in stats:
+        notes.append(f"Frames cover only the first {stats['coverage']:.0%} of the window "
+                     f"(until {stats['covered_end']}); use a shorter --window-minutes for full coverage")
+
     return ". ".join(notes)
 
 
-def run_people_counting():
-    """Main function - รัน People Counting"""
-    
-    # 1. คำนวณช่วงเวลา
-    start_time, end_time = get_time_range()
-    
-    print("=" * 60)
-    print("AI Video Analytics Agent - People Counting")
-    print("=" * 60)
-    print(f"Camera: {CAMERA_ID}")
-    print(f"Analysis Period: {start_time.strftime('%Y-%m-%dT%H:%M:%S')} -> {end_time.strftime('%Y-%m-%dT%H:%M:%S')}")
-    print("=" * 60)
-    
-    # 2. โหลด YOLOv8 model
-    print("[INFO] Loading YOLOv8 model...")
-    model_paths = [
-        MODEL_PATH,
-        Path(__file__).parent.parent / MODEL_PATH,
-        Path(__file__).parent / MODEL_PATH
-    ]
-    
-    model = None
-    for path in model_paths:
-        if Path(path).exists():
-            model = YOLO(str(path))
-            break
-    
-    if model is None:
-        print("[INFO] Downloading YOLOv8 model...")
-        model = YOLO(MODEL_PATH)
-    
-    print("[INFO] Model loaded successfully")
-    
-    # 3. ดึง frames จาก Playback
-    frames = fetch_frames_from_playback(start_time, end_time, sampling_fps=0.5)
-    
-    if not frames:
-        # ส่งผลลัพธ์ว่าไม่มีข้อมูล
-        result = {
-            "camera_id": CAMERA_ID,
-            "start_time": start_time.strftime("%Y-%m-%dT%H:%M:%S"),
-            "end_time": end_time.strftime("%Y-%m-%dT%H:%M:%S"),
-            "people_count": 0,
+def build_record(camera: CameraConfig, start_time: datetime, end_time: datetime,
+                 result: Optional[WindowResult], error: Optional[str] = None) -> dict:
+    """สร้าง JSON record ของ 1 window (ไม่มีผล → people_count เป็น null พร้อมสาเหตุใน notes)"""
+    record = {
+        "camera_id": camera.camera_id,
+        "start_time": start_time.isoformat() + "Z",
+        "end_time": end_time.isoformat() + "Z",
+    }
+
+    if result is None:
+        record.update({
+            "people_count": None,
             "confidence": "low",
-            "notes": "Unable to fetch video frames from playback API"
-        }
-        print("\n" + "=" * 60)
-        print("RESULT:")
-        print(json.dumps(result, indent=2))
-        return result
-    
-    # 4. ตรวจจับคน
-    stats = detect_people(model, frames)
-    
-    # 5. สร้างผลลัพธ์
-    confidence = determine_confidence(stats)
-    notes = generate_notes(stats)
-    
-    result = {
-        "camera_id": CAMERA_ID,
-        "start_time": start_time.strftime("%Y-%m-%dT%H:%M:%S"),
-        "end_time": end_time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "notes": error or "Window could not be analyzed"
+        })
+        return record
+
+    stats = {
+        "max": result.max_people,
+        "avg": round(result.avg_people, 1),
+        "min": result.min_people,
+        "frames_analyzed": result.frames_processed,
+        "coverage": round(result.coverage, 3)
+    }
+    if result.covered_end is not None:
+        stats["covered_end"] = result.covered_end.isoformat() + "Z"
+    record.update({
         "people_count": stats["max"],
-        "confidence": confidence,
-        "notes": notes,
-        "statistics": {
-            "max": stats["max"],
-            "avg": stats["avg"],
-            "min": stats["min"],
-            "frames_analyzed": stats["frames_analyzed"]
+        "confidence": determine_confidence(stats),
+        "notes": generate_notes(stats),
+        "statistics": stats
+    })
+    if result.analytics:
+        record["analytics"] = result.analytics
+    return record
+
+
+class JsonLinesWriter:
+    """เขียนผลทีละบรรทัด (flush ทันที) ให้ pipe ต่อไป jq/อื่นๆ ได้ระหว่างรัน"""
+
+    def __init__(self, path: Optional[str]):
+        self.stream = open(path, "a", encoding="utf-8") if path else sys.stdout
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        with self._lock:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.stream.flush()
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="People counting over CCTV playback for multiple cameras and time ranges"
+    )
+    parser.add_argument("--config", default=os.environ.get("CONFIG_PATH", "config.yaml"),
+                        help="path to config.yaml")
+    parser.add_argument("--camera", action="append", dest="cameras", metavar="CAMERA_ID",
+                        help="camera_id to analyze (repeatable, default: all enabled cameras)")
+    parser.add_argument("--range", action="append", dest="ranges", type=parse_range, metavar="START/END",
+                        help="ISO time range, e.g. 2026-02-07T18:00/2026-02-07T22:00 "
+                             "(repeatable, local time unless a UTC offset is given; default: last 5 minutes)")
+    parser.add_argument("--window-minutes", type=float, default=5.0,
+                        help="split each range into windows of this length (default: 5)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="concurrent playback fetches (default: 4)")
+    parser.add_argument("--sampling-fps", type=float, default=None,
+                        help="override playback.sampling_fps")
+    parser.add_argument("--max-frames", type=int, default=None,
+                        help="override playback.max_frames per window")
+    parser.add_argument("--model", default=None, help="override service.model")
+    parser.add_argument("--device", default=None, help="override service.device")
+    parser.add_argument("--output", default=None, help="append JSON lines to this file (default: stdout)")
+    parser.add_argument("--send", action="store_true", help="also send each window to the backend")
+    parser.add_argument("--from-store", action="store_true",
+                        help="read frames from the local frame_store ring buffer instead of the NVR")
+    parser.add_argument("--bench", action="store_true", help="report throughput when finished")
+    return parser
+
+
+def run_people_counting(argv: Optional[List[str]] = None) -> List[dict]:
+    """Main function - รัน People Counting ตาม argument"""
+    args = build_parser().parse_args(argv)
+
+    # 1. โหลด config + override จาก CLI
+    loader = ConfigLoader(args.config)
+    service_config = loader.get_service_config()
+    playback_config = loader.get_playback_config()
+    if args.model:
+        service_config.model = args.model
+    if args.device:
+        service_config.device = args.device
+    if args.sampling_fps:
+        playback_config.sampling_fps = args.sampling_fps
+    if args.max_frames:
+        playback_config.max_frames = args.max_frames
+
+    cameras = loader.get_cameras()
+    if args.cameras:
+        wanted = set(args.cameras)
+        cameras = [cam for cam in cameras if cam.camera_id in wanted]
+        missing = wanted - {cam.camera_id for cam in cameras}
+        if missing:
+            logger.warning(f"⚠️ Unknown camera(s): {', '.join(sorted(missing))}")
+    if not cameras:
+        logger.error("❌ No cameras to analyze")
+        return []
+
+    # 2. แบ่งช่วงเวลาเป็น window
+    ranges = args.ranges or [get_time_range()]
+    jobs = [
+        (camera, start, end)
+        for start_range, end_range in ranges
+        for start, end in split_windows(start_range, end_range, args.window_minutes)
+        for camera in cameras
+    ]
+    logger.info(f"🗂️ {len(jobs)} window(s): {len(cameras)} camera(s) x {len(ranges)} range(s), "
+                f"{args.window_minutes:g} min each, {args.workers} worker(s)")
+
+    # 3. Engine เดียวกับ service (model โหลดใน background ระหว่าง fetch ชุดแรก)
+    processor = PlaybackProcessor(
+        playback_config=playback_config,
+        service_config=service_config,
+        cameras=cameras,
+        timer=StartupTimer(),
+        hikvision=loader.get_hikvision_config(),
+        tiling=loader.get_tiling_config(),
+        cascade=loader.get_cascade_config(),
+        analytics=loader.get_analytics_config(),
+        memory_budget=loader.get_memory_budget_config()
+    )
+
+    store = None
+    if args.from_store:
+        store_config = loader.get_frame_store_config()
+        store = FrameStore(store_config, playback_config.sampling_fps, readonly=True)
+        logger.info(f"🗃️ Reading frames from {store.directory}")
+
+    writer = JsonLinesWriter(args.output)
+    records = []
+    total_frames = 0
+    fetch_seconds = 0.0
+    inference_seconds = 0.0
+    started = time.perf_counter()
+
+    def fetch(job):
+        camera, start, end = job
+        t0 = time.perf_counter()
+        offsets = None
+        if store is not None:
+            # view บน memmap (ไม่ copy) - frame ที่ service ยังเขียนอยู่ไม่อยู่ในช่วงย้อนหลัง
+            timestamps, frames = store.read(camera.camera_id, start, end)
+            lease = processor.frame_budget.charge(0, camera.camera_id)  # page cache ของ memmap ไม่นับ
+            if not frames:
+                logger.warning(f"[{camera.camera_id}] ⚠️ No stored frames for {start.isoformat()} → {end.isoformat()}")
+            else:
+                offsets = (timestamps - to_epoch(start)).tolist()  # เวลาจริงที่เก็บไว้ ไม่ใช่ schedule ของ stream
+        else:
+            # รอ frame memory budget ก่อนดึง → worker ไม่ดึงล้ำหน้า inference จน memory เต็ม
+            frames, lease = processor.fetch_window_leased(camera, start, end, use_playback=True)
+        return frames, offsets, lease, time.perf_counter() - t0
+
+    # 4. ดึงพร้อมกันหลาย worker, inference ใน thread นี้ตามลำดับที่ดึงเสร็จ
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="playback") as pool:
+            futures = {pool.submit(fetch, job): job for job in jobs}
+            for future in as_completed(futures):
+                camera, start, end = futures[future]
+                frames, offsets, lease, fetch_time = future.result()
+                fetch_seconds += fetch_time
+
+                t0 = time.perf_counter()
+                errors: List[str] = []
+                with lease:
+                    result = processor.analyze_window(camera, start, end, frames, send=args.send, offsets=offsets,
+                                                      errors=errors)
+                inference_seconds += time.perf_counter() - t0
+                total_frames += result.frames_processed if result else 0
+
+                if not frames:
+                    error = "No stored frames in frame_store" if store is not None \
+                        else "Unable to fetch video frames from playback API"
+                else:
+                    error = errors[0] if errors else None
+                record = build_record(camera, start, end, result, error)
+                writer.write(record)
+                records.append(record)
+    finally:
+        writer.close()
+
+    # 5. Benchmark
+    if args.bench:
+        wall = time.perf_counter() - started
+        bench = {
+            "windows": len(jobs),
+            "windows_with_frames": sum(1 for r in records if "statistics" in r),
+            "frames": total_frames,
+            "wall_seconds": round(wall, 2),
+            "fetch_seconds": round(fetch_seconds, 2),
+            "inference_seconds": round(inference_seconds, 2),
+            "windows_per_second": round(len(jobs) / wall, 3) if wall > 0 else 0,
+            "frames_per_second": round(total_frames / wall, 2) if wall > 0 else 0,
+            "inference_fps": round(total_frames / inference_seconds, 2) if inference_seconds > 0 else 0,
+            "workers": args.workers
         }
-    }
-    
-    print("\n" + "=" * 60)
-    print("RESULT:")
-    print(json.dumps(result, indent=2))
-    print("=" * 60)
-    
-    return result
+        print(json.dumps({"bench": bench}), file=sys.stderr)
+
+    return records
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Continuous Window Scheduling - window ต่อเนื่องไม่มีช่องว่าง บน clock grid เดียวกัน
+
+ปัญหาเดิม:
+- window_duration 1 นาที แต่รันทุก 2 นาที → วิเคราะห์แค่ครึ่งหนึ่งของเวลาจริง
+- แต่ละกล้องคำนวณ now เอง → ขอบ window เลื่อนไปเรื่อยๆ ไม่ตรงกัน
+
+แนวทาง:
+- ขอบ window ตรงกับ grid (เช่น ทุก 1 นาทีตามนาฬิกา UTC) ทุกกล้องเหมือนกัน
+- แต่ละกล้องมี cursor = ขอบท้ายของ window ล่าสุดที่ประมวลผลแล้ว
+  รอบถัดไปจะประมวลผลทุก window ตั้งแต่ cursor ถึง horizon → แต่ละช่วงเวลาถูกอ่านครั้งเดียว
+- รวม window ย่อยเป็น rollup (เช่น 5/15 นาที) ทันทีที่ครบ bucket
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def align_floor(dt: datetime, minutes: float) -> datetime:
+    """ปัดเวลา (UTC naive) ลงให้ตรงขอบ grid ขนาด minutes"""
+    step = minutes * 60
+    seconds = (dt - EPOCH).total_seconds()
+    return EPOCH + timedelta(seconds=seconds - (seconds % step))
+
+
+def grid_windows(cursor: datetime, horizon: datetime, minutes: float) -> List[Tuple[datetime, datetime]]:
+    """window ทั้งหมดบน grid ระหว่าง cursor → horizon (ไม่ซ้อนกัน ไม่มีช่องว่าง)"""
+    step = timedelta(minutes=minutes)
+    windows = []
+    start = align_floor(cursor, minutes)
+    while start + step <= horizon:
+        windows.append((start, start + step))
+        start += step
+    return windows
+
+
+@dataclass
+class RollupResult:
+    """ผลรวมของหลาย window ย่อยใน bucket เดียว"""
+    camera_id: str
+    period_minutes: int
+    window_start: datetime
+    window_end: datetime
+    max_people: int = 0
+    avg_people: float = 0.0
+    min_people: int = 0
+    frames_processed: int = 0
+    windows: int = 0
+    complete: bool = True  # False ถ้า window ย่อยไม่ครบ bucket (หาย หรือเริ่มกลาง bucket)
+
+
+@dataclass
+class _Bucket:
+    start: datetime
+    end: datetime
+    max_people: int = 0
+    min_people: Optional[int] = None
+    weighted_sum: float = 0.0
+    frames: int = 0
+    windows: int = 0
+
+
+@dataclass
+class RollingAggregator:
+    """
+    รวม window ย่อยของกล้องเดียวเป็น rollup หลายขนาด (เช่น [5, 15] นาที)
+
+    add() คืน rollup ที่ครบ bucket แล้ว (emit แบบ incremental)
+    avg ถ่วงน้ำหนักด้วยจำนวน frame ของแต่ละ window
+    """
+    camera_id: str
+    window_minutes: float = 1
+    periods: List[int] = field(default_factory=lambda: [5, 15])
+    _buckets: Dict[int, _Bucket] = field(default_factory=dict)
+
+    def _bucket(self, period: int, window_start: datetime) -> _Bucket:
+        start = align_floor(window_start, period)
+        bucket = self._buckets.get(period)
+        if bucket is None or bucket.start != start:
+            bucket = _Bucket(start=start, end=start + timedelta(minutes=period))
+            self._buckets[period] = bucket
+        return bucket
+
+    def add(self, window_start: datetime, window_end: datetime, max_people: int, avg_people: float,
+            min_people: int, frames: int) -> List[RollupResult]:
+        """เพิ่ม window ที่ประมวลผลสำเร็จ"""
+        return self._add(window_start, window_end, (max_people, avg_people, min_people, frames))
+
+    def add_missing(self, window_start: datetime, window_end: datetime) -> List[RollupResult]:
+        """บันทึก window ที่ดึงภาพไม่ได้ (rollup จะถูก mark ว่าไม่ครบ)"""
+        return self._add(window_start, window_end, None)
+
+    def _add(self, window_start: datetime, window_end: datetime, stats) -> List[RollupResult]:
+        emitted = []
+        for period in self.periods:
+            bucket = self._bucket(period, window_start)
+            if stats is not None:
+                max_people, avg_people, min_people, frames = stats
+                bucket.max_people = max(bucket.max_people, max_people)
+                bucket.min_people = min_people if bucket.min_people is None else min(bucket.min_people, min_people)
+                bucket.weighted_sum += avg_people * frames
+                bucket.frames += frames
+                bucket.windows += 1
+            if window_end >= bucket.end:
+                if bucket.windows:
+                    emitted.append(RollupResult(
+                        camera_id=self.camera_id,
+                        period_minutes=period,
+                        window_start=bucket.start,
+                        window_end=bucket.end,
+                        max_people=bucket.max_people,
+                        avg_people=bucket.weighted_sum / bucket.frames if bucket.frames else 0.0,
+                        min_people=bucket.min_people or 0,
+                        frames_processed=bucket.frames,
+                        windows=bucket.windows,
+                        complete=bucket.windows * self.window_minutes >= period
+                    ))
+                del self._buckets[period]
+        return emitted
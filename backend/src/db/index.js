@@ -40,6 +40,17 @@ export async function initDatabase() {
         console.log('Creating new database...');
     }
 
+    // crowd_alerts.camera_id (alert ต่อกล้องจาก AI Service)
+    try {
+        const alertColumns = db.prepare("PRAGMA table_info(crowd_alerts)").all();
+        if (alertColumns.length > 0 && !alertColumns.some(col => col.name === 'camera_id')) {
+            db.exec('ALTER TABLE crowd_alerts ADD COLUMN camera_id TEXT');
+            console.log('✓ Added crowd_alerts.camera_id column');
+        }
+    } catch (e) {
+        // Table doesn't exist yet, will be created by schema
+    }
+
     // Execute schema (CREATE IF NOT EXISTS is safe)
     const schemaPath = join(__dirname, 'schema.sql');
     const schema = readFileSync(schemaPath, 'utf-8');
@@ -213,6 +224,59 @@ export const queries = {
         `).run(status, errorMessage, id);
     },
 
+    // ==================== AI CAMERA STATUS ====================
+    // บันทึกสถานะกล้องจาก AI Service (หลายกล้องใน transaction เดียว)
+    upsertCameraStatuses: (statuses) => {
+        const stmt = getDb().prepare(`
+            INSERT INTO ai_camera_status (camera_id, camera_name, last_count, status, last_seen_at, error_message, updated_at)
+            VALUES (@camera_id, @camera_name, @last_count, @status, @last_seen_at, @error_message, datetime('now'))
+            ON CONFLICT(camera_id) DO UPDATE SET
+                camera_name = COALESCE(excluded.camera_name, camera_name),
+                last_count = COALESCE(excluded.last_count, last_count),
+                status = excluded.status,
+                last_seen_at = COALESCE(excluded.last_seen_at, last_seen_at),
+                error_message = excluded.error_message,
+                updated_at = excluded.updated_at
+        `);
+        const upsertMany = getDb().transaction((items) => {
+            for (const item of items) {
+                stmt.run({
+                    camera_id: item.camera_id,
+                    camera_name: item.camera_name ?? null,
+                    last_count: item.last_count ?? null,
+                    status: item.status,
+                    last_seen_at: item.last_seen_at ?? null,
+                    error_message: item.error_message ?? null
+                });
+            }
+        });
+        upsertMany(statuses);
+        return statuses.length;
+    },
+
+    getCameraStatuses: () => {
+        return getDb().prepare('SELECT * FROM ai_camera_status ORDER BY camera_id').all();
+    },
+
+    // ==================== CROWD ALERTS ====================
+    insertCrowdAlert: ({ alert_level, people_count, threshold, camera_id, message, created_at }) => {
+        const result = getDb().prepare(`
+            INSERT INTO crowd_alerts (alert_level, people_count, threshold, camera_id, message, created_at)
+            VALUES (?, ?, ?, ?, ?, COALESCE(?, datetime('now')))
+        `).run(alert_level, people_count, threshold, camera_id ?? null, message ?? null, created_at ?? null);
+        return result.lastInsertRowid;
+    },
+
+    markCrowdAlertSent: (id) => {
+        return getDb().prepare(`
+            UPDATE crowd_alerts SET is_sent_line = 1, sent_at = datetime('now') WHERE id = ?
+        `).run(id);
+    },
+
+    getRecentCrowdAlerts: (limit = 50) => {
+        return getDb().prepare('SELECT * FROM crowd_alerts ORDER BY id DESC LIMIT ?').all(limit);
+    },
+
     // ==================== SYSTEM SETTINGS ====================
     getSetting: (key) => {
         const result = getDb().prepare('SELECT setting_value FROM system_settings WHERE setting_key = ?').get(key);
@@ -210,6 +210,7 @@ CREATE TABLE IF NOT EXISTS crowd_alerts (
   alert_level TEXT NOT NULL,  -- warning / critical
   people_count INTEGER NOT NULL,
   threshold INTEGER NOT NULL,
+  camera_id TEXT,             -- กล้องที่เกิน threshold (alert จาก AI Service fast path), NULL = ทั้งตลาด
   message TEXT,
   is_sent_line INTEGER DEFAULT 0,
   sent_at TEXT,
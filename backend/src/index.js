@@ -7,7 +7,7 @@
 import express from 'express';
 import cors from 'cors';
 import { config, validateConfig } from './config/index.js';
-import { initDatabase } from './db/index.js';
+import { initDatabase, queries } from './db/index.js';
 import { peopleCountService } from './services/peopleCountService.js';
 import { weatherService } from './services/weatherService.js';
 import { dailyReportService } from './services/dailyReportService.js';
@@ -539,6 +539,106 @@ app.post('/api/ai/people-count/batch', aiAuthMiddleware, (req, res) => {
     });
 });
 
+// POST /api/ai/camera-status - รับสถานะกล้องจาก AI Service (circuit breaker)
+app.post('/api/ai/camera-status', aiAuthMiddleware, (req, res) => {
+    const statuses = Array.isArray(req.body.statuses) ? req.body.statuses : [req.body];
+    const VALID_STATUSES = ['online', 'offline', 'error'];
+    
+    const valid = statuses.filter(item =>
+        item && typeof item.camera_id === 'string' && VALID_STATUSES.includes(item.status)
+    );
+    if (valid.length === 0) {
+        return res.status(400).json({
+            success: false,
+            error: 'statuses must contain camera_id and status (online / offline / error)'
+        });
+    }
+    
+    try {
+        const updated = queries.upsertCameraStatuses(valid);
+        const offline = valid.filter(item => item.status !== 'online').map(item => item.camera_id);
+        if (offline.length > 0) {
+            console.log(`[AI Status] Offline cameras: ${offline.join(', ')}`);
+        }
+        res.json({
+            success: true,
+            data: { updated, offline }
+        });
+    } catch (error) {
+        console.error('[AI Status] Error:', error.message);
+        res.status(500).json({
+            success: false,
+            error: 'Failed to update camera status'
+        });
+    }
+});
+
+// POST /api/ai/crowd-alert - Crowd alert ต่อกล้องจาก AI Service (fast path, ไม่รอจบ window)
+app.post('/api/ai/crowd-alert', aiAuthMiddleware, (req, res) => {
+    const { camera_id, level, state = 'raised', people_count, threshold, frame_time } = req.body;
+    
+    if (typeof camera_id !== 'string' || !['warning', 'critical'].includes(level)
+        || !['raised', 'cleared'].includes(state)
+        || typeof people_count !== 'number' || people_count < 0 || typeof threshold !== 'number') {
+        return res.status(400).json({
+            success: false,
+            error: 'crowd alert must contain camera_id, level (warning / critical), state (raised / cleared), people_count and threshold'
+        });
+    }
+    
+    const alert = { ...req.body, state };
+    let alertId = null;
+    try {
+        if (state === 'raised') {
+            alertId = queries.insertCrowdAlert({
+                alert_level: level,
+                people_count,
+                threshold,
+                camera_id,
+                message: `${camera_id}: ${people_count} people >= ${threshold}`
+            });
+        }
+    } catch (error) {
+        console.error('[AI Alert] Error:', error.message);
+        return res.status(500).json({
+            success: false,
+            error: 'Failed to record crowd alert'
+        });
+    }
+    console.log(`[AI Alert] Camera ${camera_id}: ${level} ${state} (${people_count} people, threshold ${threshold})`);
+    
+    // ตอบ AI Service ทันที แล้วส่ง LINE ตามหลัง
+    res.json({
+        success: true,
+        data: { id: alertId, camera_id, level, state }
+    });
+    
+    earlyWarningService.processCameraAlert(alert).then(result => {
+        if (alertId && result?.success) {
+            queries.markCrowdAlertSent(alertId);
+        }
+    }).catch(err => {
+        console.error('[AI Alert] LINE send error:', err.message);
+    });
+});
+
+// GET /api/people/crowd-alerts - crowd alert ล่าสุด
+app.get('/api/people/crowd-alerts', (req, res) => {
+    const limit = Math.min(parseInt(req.query.limit) || 50, 500);
+    res.json({
+        success: true,
+        data: queries.getRecentCrowdAlerts(limit)
+    });
+});
+
+// GET /api/people/camera-status - สถานะกล้องล่าสุด (สำหรับ Dashboard)
+app.get('/api/people/camera-status', (req, res) => {
+    res.json({
+        success: true,
+        data: queries.getCameraStatuses()
+    });
+});
+
 // GET /api/ai/config - ดึง Configuration สำหรับ AI Service
 app.get('/api/ai/config', aiAuthMiddleware, (req, res) => {
     res.json({
@@ -547,6 +647,8 @@ app.get('/api/ai/config', aiAuthMiddleware, (req, res) => {
             ingest_endpoint: '/api/ai/people-count',
             batch_endpoint: '/api/ai/people-count/batch',
             cameras_endpoint: '/api/ai/cameras',
+            camera_status_endpoint: '/api/ai/camera-status',
+            crowd_alert_endpoint: '/api/ai/crowd-alert',
             polling_interval_seconds: 5,
             model_recommended: 'yolov8n',
             detection_class: 0,  // person class in COCO
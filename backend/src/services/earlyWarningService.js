@@ -5,6 +5,7 @@
    ตาม PROMPT:
    1. Rain Forecast: ส่งแจ้งเตือนเมื่อพยากรณ์ฝนภายใน 60 นาที
    2. Crowd Warning: ส่งทันทีเมื่อคน >= 300 (warning) หรือ >= 600 (critical)
+      + alert ต่อกล้องจาก AI Service (ตรวจราย frame, ไม่รอจบ window)
    3. Daily Report: ส่งทุกเสาร์-อาทิตย์ 23:00 น. (Asia/Bangkok)
    ===================================================== */
 
@@ -266,7 +267,7 @@ export function createCrowdWarningMessage(crowdData) {
     const message = `📢 แจ้งเตือนความหนาแน่น — กาดกองต้า
 
 สถานะ: ${crowdData.status_label} (ประมาณ ${crowdData.count.toLocaleString()} คน)
-อัปเดตล่าสุด: ${time} น.
+${crowdData.camera_id ? `กล้อง: ${crowdData.camera_id}\n` : ''}อัปเดตล่าสุด: ${time} น.
 
 💡 คำแนะนำ:
 • โปรดพิจารณาเพิ่มเจ้าหน้าที่
@@ -287,7 +288,7 @@ export function createCrowdCriticalMessage(crowdData) {
     const message = ` ด่วน! พื้นที่หนาแน่นมาก — กาดกองต้า
 
 สถานะ: ${crowdData.status_label} (ประมาณ ${crowdData.count.toLocaleString()} คน)
-อัปเดตล่าสุด: ${time} น.
+${crowdData.camera_id ? `กล้อง: ${crowdData.camera_id}\n` : ''}อัปเดตล่าสุด: ${time} น.
 
  คำแนะนำเร่งด่วน:
 • แจ้งเจ้าหน้าที่ทันที
@@ -478,6 +479,27 @@ export async function processCrowdCheck() {
     return { success: true, alert_sent: false };
 }
 
+/**
+ * Alert ต่อกล้องจาก AI Service (POST /api/ai/crowd-alert)
+ * raised → ส่ง LINE ทันที (cooldown ร่วมกับ processCrowdCheck ไม่ส่งซ้ำ), cleared → log อย่างเดียว
+ */
+export async function processCameraAlert(alert) {
+    if (alert.state === 'cleared') {
+        console.log(`[EarlyWarning] Camera ${alert.camera_id} ${alert.level} cleared (${alert.people_count} people)`);
+        return { success: true, alert_sent: false };
+    }
+    
+    const crowdData = {
+        count: alert.people_count,
+        status_label: alert.level === 'critical' ? 'หนาแน่นมาก' : 'ค่อนข้างหนาแน่น',
+        camera_id: alert.camera_id,
+        timestamp: alert.frame_time || new Date().toISOString()
+    };
+    return alert.level === 'critical'
+        ? await sendCrowdCritical(crowdData)
+        : await sendCrowdWarning(crowdData);
+}
+
 /**
  * สร้างและส่ง Daily Report (เรียกทุกเสาร์-อาทิตย์ 23:00)
  */
@@ -641,6 +663,7 @@ export const earlyWarningService = {
     // Scheduled Tasks
     processRainCheck,
     processCrowdCheck,
+    processCameraAlert,
     processDailyReport,
     
     // Testing